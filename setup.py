@@ -22,5 +22,8 @@ setup(
     "python-dotenv>=1.2.1",
     "streamlit>=1.51.0",
     ],
+    extras_require={
+        "export": ["pyarrow>=17.0.0"],  # export.py: transcripts -> Parquet
+    },
     # optionally add other metadata ...
 )
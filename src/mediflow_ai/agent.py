@@ -1,510 +1,323 @@
-# Standard / built-in libraries 
+# Standard / built-in libraries only at import time.
+# google-adk / genai, aiosqlite and dotenv are imported inside the factories below,
+# so "import mediflow_ai" (or mediflow_ai.sqlite_store) stays cheap and has no side effects.
 import os           # for environment variables, file paths etc.
-import time         # for timing / delays, if needed
-import json         # for JSON serialization / parsing
-import logging      # for logging events, debug info
-from datetime import datetime  # for timestamps, logging or date + time usage
-from logging.handlers import RotatingFileHandler  # optional file-based logging with rotation
-import asyncio      # for async tasks if you use async tools or LLM calls
-from dotenv import load_dotenv  # to load API keys / env vars from .env
+import importlib    # for the lazy sibling-module imports
+from dataclasses import dataclass, field
+from typing import Any, Optional
 
-# Google ADK core: Agents, Tools, Runner, Sessions, Memory, Events, etc.
-from google.adk.tools import preload_memory, google_search, exit_loop  # built-in tools example
-from google.adk.tools.agent_tool import AgentTool  # low-level tool base class
-from google.adk.tools import FunctionTool  # for custom Python function tools
 
-from google.adk.agents import LlmAgent, LoopAgent, SequentialAgent, BaseAgent  # ADK agent classes
-from google.adk.runners import Runner  # runner to execute agents
-from google.adk.sessions import InMemorySessionService, Session  # session management (in-memory example)
-from google.adk.memory import InMemoryMemoryService  # simple memory storage
-from google.adk.events import Event, EventActions  # event system for agent actions
+def _local(name: str):
+    """Import a sibling module as mediflow_ai.<name> (package / ADK Web) or <name> (python src/mediflow_ai/agent.py)."""
+    if __package__:
+        return importlib.import_module(f".{name}", __package__)
+    return importlib.import_module(name)
 
-from google.genai.types import Content, Part  # GenAI content types (for user/assistant messages)
 
+_config = _local("config")
+MediFlowConfig = _config.MediFlowConfig
 
 # ================= SEETING APP NAME , USER ID , MODEL NAME  =================
-APP_NAME = "MediFlow_AI"
-USER_ID = "medi_flow_user"
-MODEL = "gemini-2.0-flash"
-
-# ============================================================
-# Create logs directory
-# ============================================================
-log_dir = 'logs'
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-# Get the root logger
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)  # Capture everything
-
-# Create formatter
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s')
-
-# 'a' for append , 'w' for overwrite. This 'universal_mode' variable can be used to set the mode for all handlers if needed.
-universal_mode = 'a'
-
-# ============================================================
-# DEBUG LEVEL - logs/debug.log
-# ============================================================
-debug_handler = logging.FileHandler(os.path.join(log_dir, 'debug.log'), mode=universal_mode)
-debug_handler.setLevel(logging.DEBUG)
-debug_handler.setFormatter(formatter)
-logger.addHandler(debug_handler)
-
-# ============================================================
-# INFO LEVEL - logs/info.log
-# ============================================================
-info_handler = logging.FileHandler(os.path.join(log_dir, 'info.log'), mode=universal_mode)
-info_handler.setLevel(logging.INFO)
-info_handler.setFormatter(formatter)
-logger.addHandler(info_handler)
-
-# ============================================================
-# WARNING LEVEL - logs/warning.log
-# ============================================================
-warning_handler = logging.FileHandler(os.path.join(log_dir, 'warning.log'), mode=universal_mode)
-warning_handler.setLevel(logging.WARNING)
-warning_handler.setFormatter(formatter)
-logger.addHandler(warning_handler)
-
-# ============================================================
-# ERROR LEVEL - logs/error.log
-# ============================================================
-error_handler = logging.FileHandler(os.path.join(log_dir, 'error.log'), mode=universal_mode)
-error_handler.setLevel(logging.ERROR)
-error_handler.setFormatter(formatter)
-logger.addHandler(error_handler)
-
-# ============================================================
-# CRITICAL LEVEL - logs/critical.log
-# ============================================================
-critical_handler = logging.FileHandler(os.path.join(log_dir, 'critical.log'), mode=universal_mode)
-critical_handler.setLevel(logging.CRITICAL)
-critical_handler.setFormatter(formatter)
-logger.addHandler(critical_handler)
-
-
-
-# load the env file
-load_dotenv()
-
-
-# ============================================================
-# GOOGLE SEARCH AGENT --> 
-# ============================================================
-
-google_search_agent = LlmAgent(
-    name="google_search_agent",
-    model=os.environ.get("GOOGLE_GENAI_MODEL"),
-    description='''
-    You are the dedicated Google Search Agent for Tara (triage_doctor_finder_agent).
-    Your job is to perform precise, context-aware search queries requested by Tara
-    and return only the essential, factual information required for medical triage.
-
-    You do NOT speak to the user.
-    You do NOT interpret symptoms or provide recommendations.
-    You only fetch information using Google Search and pass it back to Tara.
-    ''',
-    instruction='''
-    You are the MediFlow Google Search Agent.
-
-    Your task:
-    - Receive a specific, well-formed search query from Tara.
-    - Execute the query using the google_search tool.
-    - Extract and return ONLY the essential factual data relevant to triage.
-    - Never include extra commentary, advice, or interpretation.
-
-    Follow these rules exactly:
-
-    -----------------------------------------------------------
-    1) WHAT YOU SEARCH FOR
-    You will commonly be asked to retrieve:
-    - Current weather, temperature, humidity, rainfall, and AQI for the user's location.
-    - Local disease outbreaks (dengue, flu, COVID, etc.).
-    - Pollen levels or allergen trends in the user's area.
-    - Medical causes related to the user's symptoms.
-    - Nearby doctors or clinics (if requested by Tara).
-    - Safe home remedies from reputable sources (NOT medical prescriptions).
-
-    -----------------------------------------------------------
-    2) HOW TO USE google_search TOOL
-    - Always call the tool with the exact query string provided.
-    - Never modify or extend the query unless Tara explicitly instructs you.
-    - Always return the raw results extracted from the search tool.
-    - If no results found, return: "No relevant results found."
-
-    -----------------------------------------------------------
-    3) OUTPUT FORMAT
-    Your output must be short, factual, and structured:
-
-    - Provide a bulleted or newline-separated list of the key extracted facts.
-    - Keep each fact to 1 sentence maximum.
-    - No explanations, no opinions, no diagnosis.
-    - No medical advice and no URLs beyond what the search returns.
-
-    Example format:
-    - Temperature: 32°C, Humidity: 70%
-    - AQI: 158 (Unhealthy for sensitive groups)
-    - Recent outbreak: Dengue cases rising in Mumbai
-    - Pollen: High levels of grass pollen
-
-    -----------------------------------------------------------
-    4) SAFETY RULES
-    - Do NOT generate medical recommendations, interpretations, or warnings.
-    - Do NOT fabricate search results.
-    - Only report what is directly observed in the search output.
-    - If search output is unclear, summarize the most relevant info conservatively.
-
-    -----------------------------------------------------------
-    5) IMPORTANT
-    You NEVER interact with the user directly.
-    You only serve Tara (triage_doctor_finder_agent).
-    Return only the final extracted results.
-    ''',
-    tools=[google_search],
-    output_key= "google_search results"
-)
+APP_NAME = _config.APP_NAME
+USER_ID = _config.USER_ID
+MODEL = _config.MODEL
 
+# ================= DATABASE PATH  =================
+DB_PATH = _config.DB_PATH
 
 
 # ============================================================
-# TRIAGE DOCTOR FINDER AGENT -->
+# AGENTS -->
 # ============================================================
+def resolve_model(name: str):
+    """
+    Model name -> what LlmAgent(model=...) takes. "stub" / "stub:<ms>" is the local StubLlm,
+    a comma separated chain ("primary,fallback") a RoutedLlm (model_routing.py).
+    """
+    return _local("model_routing").build_model(name)
+
+
+def build_agents(
+    config: MediFlowConfig, search_cache=None, prompt_cache=None, model=None, directory=None, governor=None
+) -> tuple[Any, Any]:
+    """
+    Build (google_search_agent, triage_doctor_finder_agent).
+    model: an already built BaseLlm to use for both agents instead of their routes (evals.py record / replay).
+    Otherwise each agent gets its own route (config.model for Tara, config.search_model for the
+    search agent), with per-call deadlines, fallback tiers and hedging (model_routing.py).
+    With a governor (OutboundGovernor), every model call of both agents waits on it for a slot.
+    With a directory (DoctorDirectory), PHASE 7 looks doctors up locally before searching.
+    Tara reaches the search agent through CachedAgentTool (cached with a search_cache, timed either way).
+    With a prompt_cache (PromptCacheRegistry), both agents send their static instruction as a cached content.
+    """
+    from google.adk.agents import LlmAgent
+    from google.adk.tools import google_search, preload_memory
+
+    prompts = _local("prompts")
+    enrichment = _local("enrichment")
+    emergency_screen = _local("emergency_screen")
+    if model is not None:
+        tara_model = search_model = model
+    else:
+        routing = _local("model_routing")
+        tara_model = routing.build_model(
+            config.model, agent="triage_doctor_finder_agent", deadline_seconds=config.model_deadline,
+            prompt_cache=prompt_cache, governor=governor,
+        )
+        # the search agent only pulls a few facts out of the results: a faster route, a tight deadline, hedged
+        search_model = routing.build_model(
+            config.search_model or config.model, agent="google_search_agent", deadline_seconds=config.search_model_deadline,
+            hedge_percentile=config.search_hedge_percentile, prompt_cache=prompt_cache, governor=governor,
+        )
+    # first in line, so the latency covers everything up to and including the model call
+    before_model_metrics, after_model_metrics = _local("metrics").make_model_metrics_callbacks()
+
+    # static instruction + tools go to the provider once, requests only carry the cache name
+    cache_callbacks = search_cache_callbacks = ([], [])
+    if prompt_cache is not None:
+        make_callbacks = _local("prompt_cache").make_prompt_cache_callbacks
+        before_cache, on_cache_error = make_callbacks(prompt_cache, tara_model)
+        cache_callbacks = ([before_cache], [on_cache_error])
+        before_cache, on_cache_error = make_callbacks(prompt_cache, search_model)
+        search_cache_callbacks = ([before_cache], [on_cache_error])
+
+    # ================= GOOGLE SEARCH AGENT =================
+    google_search_agent = LlmAgent(
+        name="google_search_agent",
+        model=search_model,
+        description=prompts.GOOGLE_SEARCH_AGENT_DESCRIPTION,
+        instruction=prompts.GOOGLE_SEARCH_AGENT_INSTRUCTION,
+        tools=[google_search],
+        output_key= "google_search results",
+        before_model_callback=[before_model_metrics, *search_cache_callbacks[0]],
+        after_model_callback=after_model_metrics,
+        on_model_error_callback=search_cache_callbacks[1] or None
+    )
 
-triage_doctor_finder_agent = LlmAgent(
-    name="triage_doctor_finder_agent",
-    model = os.environ.get("GOOGLE_GENAI_MODEL"),
-    description = '''
-    You are "Tara" — the single MediFlow Agent (Patient Intake, Triage, Doctor Finder, and Report Maker).
-    Your job is end-to-end patient intake and triage: run an empathetic interview, collect symptoms in a loop until the user confirms they are finished, detect emergencies immediately, enrich patient context with real-time data via Google Search (weather, AQI, pollen, local outbreaks, reputable home-remedy sources), analyze symptoms to produce likely conditions with confidence scores, optionally find nearby doctors when the user requests, and produce both a machine-readable triage JSON and a concise, user-facing summary report.
-
-    Capabilities:
-    - Natural-language conversation with follow-ups and clarifying questions.
-    - Use the Google Search tool for contextual enrichment and safe home-remedy lookup.
-    - Produce a validated triage JSON and a short plain-text summary (both returned to the user).
-    - Escalate immediately on emergency signs with clear instructions.
-    ''',
-    instruction = '''
-    You are the MediFlow single-agent assistant. Follow this exact workflow and formatting rules. 
-    Keep messages short, empathetic, and plain-language. Always include a clear medical disclaimer where appropriate.
-
-    You have to follow 8 PHASE workflow:
-      PHASE 1 — Greeting
-      Introduce yourself as Tara and reassure the user that their information is private.
-
-      PHASE 2 — Symptom Interview
-      Collect patient details and symptoms step-by-step, looping until the user confirms they are satisfied.
-
-      PHASE 3 — Emergency Detection
-      Immediately stop the process and output the emergency JSON if any critical danger signs appear.
-
-      PHASE 4 — Contextual Enrichment
-      Use Google Search to gather weather, AQI, pollen, outbreaks, and symptom-related medical context.
-
-      PHASE 5 — Condition Analysis
-      Generate up to five likely conditions using weighted reasoning and ask the user which (if any) matches them.
-
-      PHASE 6 — Recommendation Logic
-      Choose the final recommendation (home remedy, monitor, or consult doctor) and confirm whether the user wants a doctor.
-
-      PHASE 7 — Doctor Finder
-      If doctor consultation is needed or requested, search for nearby specialists and present top doctor options.
-
-      PHASE 8 — Final Report
-      Produce a clean, plain-text medical triage report summarizing patient details, context, conditions, and recommendations.
-
-    WORKFLOW OVERVIEW (single continuous interaction)
-    PHASE 1 : Greeting
-      - Start: "Hello — I'm Tara, MediFlow's triage assistant. I'll ask a few questions to understand your symptoms and suggest next steps."
-      - Offer brief privacy reassurance: "Your information stays in this conversation and will not be published."
-
-    PHASE 2 : Symptom Interview (Iterative loop)
-      - Collect these items ONE BY ONE. After each question wait for user's reply before asking the next.
-        1. Name
-        2. Location (city / area — ask for pincode if location too broad)
-        3. Age (or classification: Child/Teen/Adult/Elderly)
-        4. Gender
-        5. Symptoms — collect repeatedly in a loop. After each symptom, ask: "Anything else?" Keep collecting until user explicitly says "done" or "no more".
-        6. Symptom duration (how long)
-        7. Any recent diet/food changes
-        8. Existing medical conditions or allergies
-        9. Current medications
-        10. Any situation/task they think triggered symptoms (optional)
-      - If user gives very short answers, ask one clarifying follow-up (e.g., "Can you describe that a little more?")
-      - After collecting all above, confirm completion:
-        "Thanks for sharing. Are you satisfied with the information provided, or would you like to add anything else?"
-      - If user says "not satisfied" or "add more", return to symptom collection loop (step 5).
-      - If user says "satisfied" or "done" → proceed to next phase.
-      - Give user a space to share there Thoughts. Don't rush them.
-
-    PHASE 3 : Emergency detection (interrupt, immediate)
-      - At any point, if user reports ANY of:
-          • chest pain or pressure
-          • severe difficulty breathing or shortness of breath
-          • severe bleeding
-          • loss of consciousness or severe confusion
-          • stroke signs (face droop, arm weakness, slurred speech)
-          • suicidal ideation
-        → Immediately stop other steps and respond exactly with:
-          {"emergency": true, "recommendation": "CALL_911_IMMEDIATELY", "message": "Please call your local emergency services now (e.g., 112 / 108 / 911) or go to the nearest ER."}
-        - Do NOT continue analysis, searches, or recommendations after an emergency detection.
-
-    PHASE 4 : Contextual enrichment (use Google Search — log queries internally)
-      - After collection (and no emergency), run the following Google searches (log each query string):
-        a) "current weather [location] temperature humidity AQI"
-        b) "disease outbreak [location] [current year]" (or "[location] outbreak")
-        c) "pollen count [location] today"
-        d) "symptoms [combined symptom text] medical causes" (to cross-check likely etiologies)
-      - Extract minimal facts: temperature, humidity, AQI, pollen level, and any mention of recent local outbreaks. Keep extracts concise (one sentence each).
-
-    PHASE 5 : Weighted analysis → possible conditions
-      - Compute hypotheses using weighted factors:
-        • Symptoms and severity — 60%
-        • Environment (weather, outbreaks, pollen) — 25% (weather 10%, outbreaks 10%, pollen 5%)
-        • Patient profile (age, chronic conditions, meds) — 15%
-      - Produce up to 5 possible conditions. For each condition provide:
-        {
-          "condition": "string",
-          "confidence_percentage": number (0-100),
-          "rationale": "1-2 sentence explanation linking symptoms + context"
-        }
-        - Ask the user if they think any of the conditions suits them?
-        - If they select any conditions then ask them what made them think that? 
-
-    PHASE 6 : Recommendation logic (choose one)
-      - If top condition confidence > 70% AND symptoms mild → "Home Remedy"
-        • Use Google Search to fetch 3-5 safe, commonly accepted home remedies (cite source names in rationale, not URLs).
-      - If confidence 50-70% OR symptoms moderate → "Wait & Monitor" (advise monitoring timeframe: 24–48h).
-      - If confidence < 50% OR symptoms severe OR chronic comorbidity → "Consult Doctor" (advise booking within 24–48h).
-      - If multiple high-probability conditions or patient high-risk → "Consult Doctor (Urgent)" (advise within 24h).
-      - If any immediate life-threatening indicators → handled in Emergency detection above.
-      - Also ask the user about there opinion, Do they want to cosult with the doctor or not?
-      - If user does not lie in 'Consult a doctor' category but it still want to consult a doctor and Go to PHASE 7 and search a Doctor for user.
-
-    PHASE 7 : Doctor Finder (only if user lie in consult doctor category )
-      - Ask for more specific location/pincode if needed.
-      - Use Google Search queries like "[mapped_specialty] near [specific_location]" to find 3 top options.
-      - For each doctor return: name, clinic, address, approximate distance (if available), rating (if available), and Google Maps link text.
-      - Present options and ask user to choose, ask for "more", "expand", or "back".
-
-    PHASE 8 : Output formatting — REQUIRED: return a concise, user-facing report card (plain text)
-    FORMAT THE REPORT CARD LIKE THIS:
-    -----------------------------------
-    ⚠️ Medical Disclaimer: I am not a medical professional. This is not a diagnosis. Please consult a licensed healthcare provider.
-
-    **Patient Details**
-    - Name: ...
-    - Location: ...
-    - Age: ...
-    - Gender: ...
-
-    **Symptoms**
-    - Bullet list of symptoms
-    - Duration: ...
-
-    **Key Contextual Findings**
-    - Weather: ...
-    - AQI: ...
-    - Pollen: ...
-    - Recent outbreaks: ...
-
-    **Most Likely Conditions**
-    1) Condition — Confidence% — one-sentence rationale  
-    2) Condition — Confidence% — one-sentence rationale  
-    (up to 5)
-
-    **Final Recommendation**
-    - Action: (Home Remedy / Wait & Monitor / Consult Doctor / Urgent)
-    - Urgency: (Routine / Within 24–48h / Within 24h / Immediate)
-    - Next steps: 1–3 short bullet points
-
-    If Home Remedy:
-    - Remedy 1
-    - Remedy 2
-    - Remedy 3
-    (each short + safe)
-
-    If Doctor Requested:
-    **Nearby Doctors**
-    - Dr. Name — Specialty — Clinic — Area — Rating — Maps link (text only)
-    (up to 3)
-
-    **Summary**
-    1–3 short paragraphs summarizing the situation in simple language.
-
-
-    ------------------------------------------------------------
-    ADDITIONAL RULES
-    - Absolutely NO JSON in the final output (except emergency case).
-    - Keep all responses concise and empathetic.
-    - Do not invent medical facts or diagnoses.
-    - Ask for clarifications when needed.
-    - The report card must be the last thing you output after user is satisfied.
-
-    ------------------------------------------------------------
-    When and How to Use 'google_search_agent'
-    You should use the google_search_agent whenever you need real-time, factual context that supports accurate triage reasoning. 
-    The google_search_agent is your dedicated tool for retrieving verified information from Google Search. 
-    You never perform the search yourself — instead, you call the google_search_agent and receive the results in the variable 'google_search_results'.
-
-    Use the google_search_agent in these scenarios:
-
-    1) Environmental Context (Weather, AQI, Humidity, Pollen)
-      - When analyzing respiratory, allergy-related, or environment-linked symptoms.
-      - Search queries like:
-          "current weather [location] temperature humidity AQI"
-          "pollen count [location] today"
-
-    2) Local Outbreak Detection
-      - When symptoms may match seasonal or regional illnesses.
-      - Search queries like:
-          "disease outbreak [location] 2025"
-          "[location] viral fever outbreak"
-
-    3) Symptom-Cause Support (Cross-checking)
-      - When validating the likelihood of medical conditions based on symptoms.
-      - Search queries like:
-          "symptoms [user symptoms] medical causes"
-      - Helps refine confidence scores in PHASE 5.
-
-    4) Home Remedy Retrieval (Only if user qualifies for Home Remedy)
-      - When mild symptoms and high-confidence conditions suggest safe home care.
-      - Search queries like:
-          "safe home remedies for [condition]"
-          "natural relief for [symptom]"
-      - Only return simple, non-prescription remedies.
-
-    5) Doctor Finder (If user wants doctor OR is recommended to consult)
-      - When searching for nearby specialists.
-      - Search queries like:
-          "[specialty] near [specific_location]"
-          "best [specialty] doctor in [city/area]"
-
-    6) Risk Verification
-      - When the user mentions foods, exposures, or triggers that may be associated with known illnesses.
-      - Example:
-          "food poisoning outbreak [location]"
-          "air quality effects headache nausea"
-
-    Storage:
-    - All extracted search outputs from google_search_agent must be saved in 'google_search_results'.
-    - Use 'google_search_results' in PHASES 4–7 of your workflow.
-    - Never invent data; only use what the google_search_agent provides.
-
-    You must call the google_search_agent whenever:
-    - You need environmental, medical, or regional context,
-    - You need real-world factual information to improve accuracy,
-    - You need to generate home remedies safely,
-    - You need to find doctors or clinics near the user.
-
-    Never interact with Google Search directly — always use google_search_agent.
-
-    Interaction rules & clarifications:
-      - Always be empathetic and concise; if user replies are ambiguous, ask a single clarifying question.
-      - If user requests home remedies, provide only non-prescription, widely-accepted measures (hydration, rest, paracetamol if appropriate — but avoid dosage recommendations; instead advise "follow package or consult pharmacist/doctor").
-      - If user requests to change location or re-run doctor search, do so on demand.
-      - If user asks off-topic questions, politely defer: "I’m focused on health assessment — we can discuss that after the assessment."
-
-    Safety & mandatory language
-      - Precede any clinical suggestions with: "⚠️ Medical Disclaimer: I am not a medical professional. This is not a diagnosis. For medical advice, please consult a licensed healthcare provider."
-      - For emergency outputs use the exact emergency JSON (see step 3) and immediate plain-text instruction to call emergency services.
-    Observability (for debugging)
-      - In every run, keep an internal list `logged_search_queries` of all Google Search strings issued. Include this list in the metadata of the JSON output.
-
-    RESPONSE BEHAVIOR SUMMARY
-    - Tara uses the google_search_agent when she needs real-time external facts like weather, outbreaks, symptom-related causes, home remedies, or nearby doctors.  
-    - Tara sends a clear search query to the agent, which returns raw results inside "google_search_results".  
-    - These results help Tara improve her triage reasoning, strengthen condition analysis, and provide more accurate recommendations.
-    - Collect symptoms in a loop until user explicitly confirms they are finished (asked: "Are you satisfied with the information provided?").
-    - If user says satisfied → proceed to context enrichment, analysis, recommendations, doctor finder (if lie in category or user itself want to consult to the doctor), then output the and then a concise human summary.
-    - If user says not satisfied → continue symptom loop and re-run analysis once they confirm completion.
-
-    IMPORTANT: Do not store or transmit any user data outside this conversation. Always include the disclaimer and never present the analysis as a definitive diagnosis.
-    ''',
-    tools = [AgentTool(agent=google_search_agent) , preload_memory],
-    output_key = "triage_output"
-
-)
-
-
-# ================= ROOT AGENT =================
-root_agent = triage_doctor_finder_agent
+    # one (cached) search tool, shared by Tara and the PHASE 4 fan-out
+    google_search_tool = _local("search_cache").CachedAgentTool(agent=google_search_agent, cache=search_cache)
+    enrichment_tool = enrichment.build_enrichment_tool(
+        google_search_tool, timeout=config.search_timeout, year=config.enrichment_year
+    )
+    tara_tools = [google_search_tool, enrichment_tool, preload_memory]
+    if directory is not None:
+        tara_tools.append(_local("doctor_directory").build_directory_tool(directory))
+
+    # PHASE 3 danger signs are answered locally, without a model call
+    before_agent_callbacks = [emergency_screen.emergency_before_agent_callback]
+    before_model_callbacks = [before_model_metrics]
+    if config.context_keep_turns:
+        # long PHASE 2 interviews: last N turns verbatim, older ones folded into a running summary
+        before_model_callbacks.append(
+            _local("context_window").make_context_window_callback(keep_turns=config.context_keep_turns)
+        )
+    if config.intake_form:
+        # PHASE 1/2 questions come from code; the model only sees clarifications and PHASE 4+
+        intake = _local("intake")
+        before_agent_callbacks.append(intake.intake_before_agent_callback)
+        before_model_callbacks.append(intake.intake_before_model_callback)
+    # last: everything above only touches contents, the system instruction stays cacheable
+    before_model_callbacks.extend(cache_callbacks[0])
+
+    # ================= TRIAGE DOCTOR FINDER AGENT (TARA) =================
+    triage_doctor_finder_agent = LlmAgent(
+        name="triage_doctor_finder_agent",
+        model = tara_model,
+        description = prompts.TRIAGE_AGENT_DESCRIPTION,
+        instruction = prompts.TRIAGE_AGENT_INSTRUCTION,
+        tools = tara_tools,
+        output_key = "triage_output",
+        before_agent_callback = before_agent_callbacks,
+        before_model_callback = before_model_callbacks,
+        after_model_callback = after_model_metrics,
+        on_model_error_callback = cache_callbacks[1] or None
+    )
+    return google_search_agent, triage_doctor_finder_agent
+
+
+# ================= APP (AGENTS + SERVICES + RUNNER) =================
+@dataclass
+class MediFlowApp:
+    config: MediFlowConfig
+    session_service: Any
+    memory_service: Any
+    search_cache: Any
+    google_search_agent: Any
+    root_agent: Any
+    runner: Any
+    prompt_cache: Any = None
+    maintenance: Any = None
+    directory: Any = None
+    governor: Any = None
+    extras: dict = field(default_factory=dict)
+
+    async def close(self):
+        """Stop scheduled maintenance, flush pending writes and close the database connections."""
+        if self.maintenance is not None:
+            await self.maintenance.stop()
+        await self.session_service.close()
+
+
+def create_app(config: Optional[MediFlowConfig] = None, model=None, search_cache=None) -> MediFlowApp:
+    """
+    Wire up logging, the SQLite-backed services, both agents and a Runner.
+    Nothing here touches the network or opens the database yet; connections open on first use.
+    model / search_cache replace the configured model and the SQLite search cache (evals.py).
+    """
+    config = config or MediFlowConfig.from_env()
+
+    if config.configure_logging:
+        _local("logging_setup").configure_logging(log_dir=config.log_dir)
+
+    db_folder = os.path.dirname(config.db_path)
+    if db_folder and not os.path.exists(db_folder):
+        os.makedirs(db_folder)
+        print(f"Created database directory: {db_folder}")
+
+    from google.adk.runners import Runner
+
+    # sessions are persisted to SQLite (and resumed after a restart), hot ones stay cached in memory;
+    # with db_shards > 1 they are spread over that many files, one writer lock each
+    store = _local("sharding").session_store(config.db_path, config.db_shards)
+    session_service = _local("session_service").SqliteSessionService(store)
+    # preload_memory searches an FTS5 index over the same database, filled as sessions are saved
+    memory_service = _local("memory_service").SqliteMemoryService(session_service.store)
+    # repeated PHASE 4 / PHASE 7 searches (same city, same day) are answered from here
+    if search_cache is None:
+        search_cache = _local("search_cache").SearchCache(session_service.store)
+
+    # static instructions cached with the provider (the local stub backend for model "stub")
+    prompt_cache = None
+    if config.prompt_cache:
+        prompt_cache_module = _local("prompt_cache")
+        if _local("stub_model").is_stub_model(_local("model_routing").parse_route(config.model)[0]):
+            backend = _local("stub_model").StubCacheBackend()
+        else:
+            backend = prompt_cache_module.GenaiCacheBackend()
+        prompt_cache = prompt_cache_module.PromptCacheRegistry(
+            session_service.store, backend, ttl_seconds=config.prompt_cache_ttl
+        )
+
+    # PHASE 7 providers: bulk loaded + learnt from past doctor searches (maintenance feeds it)
+    directory = _local("doctor_directory").DoctorDirectory(session_service.store) if config.doctor_directory else None
+
+    # archive idle sessions, retention, vacuum + WAL checkpoint; the server starts its schedule
+    maintenance = _local("maintenance").DatabaseMaintenance(
+        session_service.store,
+        archive_after_days=config.archive_after_days,
+        delete_after_days=config.delete_after_days,
+        interval_seconds=config.maintenance_interval,
+        search_cache=search_cache,
+        directory=directory,
+    )
 
+    # Prometheus surface (GET /metrics); spans only when asked for
+    metrics = _local("metrics")
+    metrics.DB_QUEUE_DEPTH.set_function(lambda: session_service.store.queue_depth)
+    if config.otel_spans:
+        metrics.enable_tracing()
 
+    # one gate for all outbound model calls: rate, adaptive concurrency, priorities (not for a given model)
+    governor = _local("governor").build_governor(config) if model is None else None
 
-# ================= SESSION AND MEMORY  =================
-session_service = InMemorySessionService()
-memory_service = InMemoryMemoryService() 
+    google_search_agent, triage_doctor_finder_agent = build_agents(
+        config, search_cache=search_cache, prompt_cache=prompt_cache, model=model, directory=directory, governor=governor
+    )
+    runner = Runner(
+        agent=triage_doctor_finder_agent,
+        app_name=config.app_name,
+        session_service=session_service,
+        memory_service=memory_service,
+    )
+    return MediFlowApp(
+        config=config,
+        session_service=session_service,
+        memory_service=memory_service,
+        search_cache=search_cache,
+        google_search_agent=google_search_agent,
+        root_agent=triage_doctor_finder_agent,
+        runner=runner,
+        prompt_cache=prompt_cache,
+        maintenance=maintenance,
+        directory=directory,
+        governor=governor,
+    )
 
 
+# ================= ROOT AGENT (LAZY, FOR ADK WEB) =================
+_default_app: Optional[MediFlowApp] = None
 
+# module attributes that used to be globals, now built on first access
+_LAZY_ATTRIBUTES = {
+    "root_agent": "root_agent",
+    "triage_doctor_finder_agent": "root_agent",
+    "google_search_agent": "google_search_agent",
+    "session_service": "session_service",
+    "memory_service": "memory_service",
+    "search_cache": "search_cache",
+}
 
-# ================= IMPORTS FROM SQLITE_STORE.PY FILE  =================
-# Uncomment the below line when you running this file in CLI , Comment it when you are running in ADK Web
 
-#from sqlite_store import init_db, save_session_to_db, get_session_events
+def get_default_app() -> MediFlowApp:
+    """The process-wide app built from the environment (what ADK Web's root_agent comes from)."""
+    global _default_app
+    if _default_app is None:
+        _default_app = create_app()
+    return _default_app
 
 
-# ================= DATABASE PATH  =================
+def __getattr__(name: str):
+    if name in _LAZY_ATTRIBUTES:
+        return getattr(get_default_app(), _LAZY_ATTRIBUTES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-DB_PATH = "../../database/chat_history.db"
 
+# ================= TO RUN THE AGENTS (DO python src/mediflow_ai/agent.py from ROOT DIRECTORY) =================
+async def run_scenario(app: Optional[MediFlowApp] = None):
+    import asyncio
 
-db_folder = os.path.dirname(DB_PATH)
-if db_folder and not os.path.exists(db_folder):
-    os.makedirs(db_folder)
-    print(f"Created database directory: {db_folder}")
+    chat_service = _local("chat_service")
 
-# ================= TO RUN THE AGENTS (DO python src/mediflow_ai/agent.py from ROOT DIRECTORY) =================
-async def run_scenario():
     print("----- Initializing Runner -----")
-    runner = Runner(
-        agent=triage_doctor_finder_agent,
-        app_name=APP_NAME,
-        session_service=session_service,
-        memory_service=memory_service 
-    )
+    app = app or create_app()
+    chat = chat_service.ChatService(app)
+    session_service = app.session_service
+    app_name, user_id = app.config.app_name, app.config.user_id
 
-    print("----- Initializing Session ID, Creating Session -----")
+    print("----- Initializing Session ID, Creating or Resuming Session -----")
     session_id = "chat001"
-    await runner.session_service.create_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
-
+    await chat.ensure_session(user_id, session_id)
 
     while True:
-      usr_input = input("You (type 'stop' to stop): ")
+      # input() runs in a worker thread so the event loop (write-behind flushes, logging) keeps going
+      usr_input = await asyncio.to_thread(input, "You (type 'stop' to stop): ")
       if usr_input == 'stop':
          break
       print("----- Giving INPUT -----")
-      user_input = Content(parts=[Part(text=usr_input)], role="user")
-
       print("----- Taking Response ----- \n")
-      final_response_text = "(No final response)"
-      async for event in runner.run_async(user_id=USER_ID, session_id=session_id, new_message=user_input):
-          if event.is_final_response() and event.content and event.content.parts:
-              final_response_text = event.content.parts[0].text
-      print(f"Agent Response: {final_response_text}")
-
-      print("----- Obtaining Session -----")
-      completed_session = await runner.session_service.get_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
-
-      # --- initialize DB and save session events ---
-      print("\n--- Initializing DB & saving session to sqlite ---")
-      await init_db(DB_PATH)
-      await save_session_to_db(DB_PATH, completed_session)
-      print("---- Session saved to SQLite. ---- \n")
+      # PHASE 3 pre-screen + runner, reply printed as it streams in; for many sessions at once use server.py
+      print("Agent Response: ", end="", flush=True)
+      streamed = False
+      async for item in chat.stream_chat(user_id, session_id, usr_input):
+          if item["type"] == "delta":
+              streamed = True
+              print(item["text"], end="", flush=True)
+          elif not streamed:
+              print(item["reply"], end="")
+      print()
+      # every event of this turn was already queued for SQLite by SqliteSessionService.append_event
     
     '''
     # --- example: read back and print rows saved
     print("\n===== Events loaded from DB =====")
-    rows = await get_session_events(DB_PATH, session_id)
+    rows = await app.session_service.store.get_session_events(session_id)
     for r in rows:
         print(f"[{r['event_index']}] {r['role']}: { (r['text'] or '')[:200] } (saved at {r['timestamp']})")'''
 
     
     # code that prints session.events at the end 
-    session = await session_service.get_session(app_name=APP_NAME, user_id=USER_ID, session_id = session_id)
-    print("\n ======= This Session contains (original in-memory): ======= \n")
+    session = await session_service.get_session(app_name=app_name, user_id=user_id, session_id = session_id)
+    print("\n ======= This Session contains: ======= \n")
     for event in session.events:
       text = (
           event.content.parts[0].text[:100]
@@ -512,7 +325,9 @@ async def run_scenario():
           else "(empty)"
       )
       print(f"  {event.content.role}: {text}... ")
-    await init_db(DB_PATH)
+    # flushes the write-behind queue before closing the connections
+    await app.close()
 
 if __name__ == "__main__":
+  import asyncio
   asyncio.run(run_scenario())
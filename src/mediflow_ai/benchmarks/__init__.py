@@ -0,0 +1 @@
+# Benchmarks and regression guards. Run each with: python -m mediflow_ai.benchmarks.<name>
@@ -0,0 +1,27 @@
+# emergency_screen benchmark: per-message cost of the PHASE 3 pre-screen
+# python -m mediflow_ai.benchmarks.emergency_screen
+import timeit
+
+from mediflow_ai.emergency_screen import screen_text
+
+SAMPLES = [
+    "Hi, I'm Ravi from Pune",
+    "I have had a mild headache and runny nose for two days, no fever",
+    "I don't have chest pain, just a cough",
+    "My father has crushing pressure in his chest and is sweating",
+    "I feel like I can't breathe properly since morning",
+    "Honestly I want to end my life",
+    "Done, no more symptoms. I am satisfied with the information.",
+    "I've been eating more street food lately and had loose motions, mild cramps, feeling tired " * 4,
+]
+
+
+def main(number: int = 20000):
+    for sample in SAMPLES:
+        per_call = timeit.timeit(lambda: screen_text(sample), number=number) / number
+        result = screen_text(sample)
+        print(f"{per_call * 1e6:8.2f} us  {str(result.category if result else '-'):13}  {sample[:60]!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# Import-time regression guard (python -X importtime)
+# python -m mediflow_ai.benchmarks.import_time [--budget-ms 150]
+#
+# Fails (exit 1) when importing mediflow_ai.agent pulls in one of the heavy
+# dependency trees or takes longer than the budget.
+import argparse
+import os
+import subprocess
+import sys
+
+# module -> imports it must not pull in
+FORBIDDEN_PREFIXES = {
+    "mediflow_ai.agent": ("google.adk", "google.genai", "aiosqlite", "dotenv", "pydantic", "httpx"),
+    # tooling that only needs the store must not pay for the agent stack
+    "mediflow_ai.sqlite_store": ("google.adk", "google.genai", "dotenv", "pydantic", "httpx"),
+}
+
+DEFAULT_MODULES = tuple(FORBIDDEN_PREFIXES)
+DEFAULT_BUDGET_MS = float(os.environ.get("MEDIFLOW_IMPORT_BUDGET_MS", 150))
+
+
+def measure(module: str) -> list[tuple[int, int, str]]:
+    """Run a fresh interpreter with -X importtime; returns (self_us, cumulative_us, module) rows."""
+    src_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = {**os.environ, "PYTHONPATH": src_dir + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.strip()))
+    return rows
+
+
+def check(module: str, budget_ms: float) -> bool:
+    rows = measure(module)
+    total_ms = max((cumulative for _, cumulative, name in rows if name == module), default=0) / 1000
+    prefixes = FORBIDDEN_PREFIXES.get(module, FORBIDDEN_PREFIXES["mediflow_ai.agent"])
+    forbidden = sorted({name for _, _, name in rows if name.startswith(prefixes)})
+    print(f"{module}: {total_ms:.1f} ms cumulative (budget {budget_ms:g} ms), {len(rows)} modules")
+    for self_us, cumulative_us, name in sorted(rows, key=lambda r: r[0], reverse=True)[:8]:
+        print(f"    {self_us / 1000:7.2f} ms self  {cumulative_us / 1000:7.2f} ms cum  {name}")
+    ok = True
+    if forbidden:
+        print(f"  FAIL: heavy imports pulled in: {', '.join(forbidden[:10])}")
+        ok = False
+    if total_ms > budget_ms:
+        print(f"  FAIL: over budget by {total_ms - budget_ms:.1f} ms")
+        ok = False
+    return ok
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("modules", nargs="*", default=list(DEFAULT_MODULES))
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    args = parser.parse_args(argv)
+    results = [check(module, args.budget_ms) for module in args.modules]
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+# serve_load benchmark: chat-server throughput per core against the local stub model
+# python -m mediflow_ai.benchmarks.serve_load [--sessions 200] [--turns 5] [--clients 64] [--model stub:50]
+# --url http://host:port drives an already running server instead of the in-process one.
+# --stream uses the SSE endpoint and also reports time to first token.
+# --db-shards N spreads the sessions over N SQLite files (sharding.py).
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Optional
+
+import httpx
+
+from mediflow_ai.agent import create_app
+from mediflow_ai.config import MediFlowConfig
+from mediflow_ai.server import create_server
+
+MESSAGES = [
+    "Hi, I'm Asha from Pune",
+    "I have had a mild headache and runny nose for two days",
+    "No fever, but I feel tired and my throat is scratchy",
+    "I am 34, no allergies, not on any medicines",
+    "Done, no more symptoms.",
+]
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def _post_turn(client: httpx.AsyncClient, session_id: str, message: str, stream: bool) -> tuple[int, Optional[float]]:
+    """(status code, server-side time to first token in ms or None)."""
+    body = {"message": message, "user_id": "load"}
+    if not stream:
+        response = await client.post(f"/sessions/{session_id}/messages", json=body)
+        return response.status_code, None
+    # httpx.ASGITransport buffers the whole body, so use the timing the final event carries
+    first_token_ms = None
+    async with client.stream("POST", f"/sessions/{session_id}/messages/stream", json=body) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("data:") and '"final"' in line:
+                first_token_ms = json.loads(line[5:])["first_token_ms"]
+    return response.status_code, first_token_ms
+
+
+async def _drive(client: httpx.AsyncClient, sessions: int, turns: int, clients: int, stream: bool):
+    latencies: list[float] = []
+    first_token: list[float] = []
+    rejected = failed = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for n in range(sessions):
+        queue.put_nowait(f"load-{n:05d}")
+
+    async def client_loop():
+        nonlocal rejected, failed
+        while not queue.empty():
+            session_id = queue.get_nowait()
+            # one client plays one session start to finish, turns in order
+            for turn in range(turns):
+                started = time.perf_counter()
+                status, first_token_ms = await _post_turn(client, session_id, MESSAGES[turn % len(MESSAGES)], stream)
+                if status == 503:
+                    rejected += 1
+                elif status != 200:
+                    failed += 1
+                else:
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    if first_token_ms is not None:
+                        first_token.append(first_token_ms)
+
+    await asyncio.gather(*(client_loop() for _ in range(clients)))
+    return latencies, first_token, rejected, failed
+
+
+async def run(sessions: int, turns: int, clients: int, model: str, url: str = None, max_concurrent: int = None, stream: bool = False, db_shards: int = 1):
+    if url:
+        async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+            started, cpu_started = time.perf_counter(), time.process_time()
+            latencies, first_token, rejected, failed = await _drive(client, sessions, turns, clients, stream)
+    else:
+        db_dir = tempfile.mkdtemp(prefix="mediflow_load_")
+        config = MediFlowConfig(model=model, db_path=os.path.join(db_dir, "load.db"), configure_logging=False, db_shards=db_shards)
+        if max_concurrent:
+            config.max_concurrent_turns = max_concurrent
+        api = create_server(create_app(config))
+        # ASGITransport does not send lifespan events, run them here
+        async with api.router.lifespan_context(api):
+            transport = httpx.ASGITransport(app=api)
+            async with httpx.AsyncClient(transport=transport, base_url="http://mediflow", timeout=60) as client:
+                started, cpu_started = time.perf_counter(), time.process_time()
+                latencies, first_token, rejected, failed = await _drive(client, sessions, turns, clients, stream)
+                health = (await client.get("/healthz")).json()
+        print(f"server: {health}")
+
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    done = len(latencies)
+    print(f"{done} turns in {wall:.2f}s wall / {cpu:.2f}s CPU ({sessions} sessions x {turns} turns, {clients} clients)")
+    if done:
+        print(f"throughput: {done / wall:.1f} turns/s, {done / cpu:.1f} turns per CPU-second (per core)")
+        print(
+            f"latency ms: p50 {statistics.median(latencies):.1f}  p95 {_percentile(latencies, 0.95):.1f}"
+            f"  p99 {_percentile(latencies, 0.99):.1f}  max {max(latencies):.1f}"
+        )
+    if first_token:
+        print(f"time to first token ms: p50 {statistics.median(first_token):.1f}  p95 {_percentile(first_token, 0.95):.1f}")
+    print(f"rejected (503): {rejected}, failed: {failed}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--model", default="stub:50", help="stub or stub:<latency ms> (in-process only)")
+    parser.add_argument("--max-concurrent", type=int, default=None)
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--db-shards", type=int, default=1, help="session files (in-process only, see sharding.py)")
+    args = parser.parse_args()
+    asyncio.run(run(args.sessions, args.turns, args.clients, args.model, args.url, args.max_concurrent, args.stream, args.db_shards))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# shard_writes benchmark: session write throughput against the number of SQLite shard files
+# python -m mediflow_ai.benchmarks.shard_writes [--shards 1,2,4,8] [--sessions 64] [--events 40] [--write-behind]
+# Every session is written by its own task, one append_event (event + session state) per call,
+# which is what SqliteSessionService does for every event of a turn. Without --write-behind each
+# call is its own commit, so the single writer lock of one file is the bottleneck being measured.
+# --synchronous FULL fsyncs every commit (the store runs NORMAL): the disk-bound case, where
+# N files flushing in parallel matter most. On one core the CPU-bound NORMAL case scales less.
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from google.adk.events import Event
+from google.genai.types import Content, Part
+
+from mediflow_ai.sharding import session_store
+
+REPLY = "Based on the pollen count in Pune today, mild congestion is expected. " * 4
+
+
+def _events(count: int) -> list[Event]:
+    return [
+        Event(
+            author="user" if i % 2 == 0 else "triage_doctor_finder_agent",
+            invocation_id=f"inv-{i // 2}",
+            content=Content(role="user" if i % 2 == 0 else "model", parts=[Part(text=f"{i}: {REPLY}")]),
+        )
+        for i in range(count)
+    ]
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def run(shards: int, sessions: int, events: int, write_behind: bool, folder: str, synchronous: str = "NORMAL") -> dict:
+    store = session_store(os.path.join(folder, f"bench-{shards}-{synchronous.lower()}.db"), shards)
+    await store.open()
+    for shard in store.shards:
+        async with shard.write() as db:
+            await db.execute(f"PRAGMA synchronous={synchronous}")
+    if write_behind:
+        store.enable_write_behind()
+    payload = _events(events)
+    latencies: list[float] = []
+
+    async def writer(n: int):
+        session_id = f"bench-{n:05d}"
+        state = {"phase": 2, "city": "Pune"}
+        for event in payload:
+            started = time.perf_counter()
+            await store.append_event("bench", "load", session_id, event, state, time.time())
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(writer(n) for n in range(sessions)))
+    await store.flush()
+    elapsed = time.perf_counter() - started
+    stored = sum(len(rows) for rows in await asyncio.gather(*(store.get_session_events(f"bench-{n:05d}") for n in range(sessions))))
+    await store.close()
+    return {
+        "shards": shards,
+        "events": sessions * events,
+        "stored": stored,
+        "events_per_s": round(sessions * events / elapsed, 1),
+        "append_p50_ms": round(statistics.median(latencies), 2),
+        "append_p95_ms": round(_percentile(latencies, 0.95), 2),
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shards", default="1,2,4,8", help="comma separated shard counts")
+    parser.add_argument("--sessions", type=int, default=64, help="concurrent sessions (one writer task each)")
+    parser.add_argument("--events", type=int, default=40, help="events appended per session")
+    parser.add_argument("--write-behind", action="store_true", help="group-commit writer per shard, as the server runs")
+    parser.add_argument("--synchronous", choices=["NORMAL", "FULL"], default="NORMAL")
+    parser.add_argument("--dir", default=None, help="where the database files go (default: a temp folder)")
+    args = parser.parse_args()
+
+    folder = args.dir or tempfile.mkdtemp(prefix="mediflow-shards-")
+    results = []
+    try:
+        for shards in (int(n) for n in args.shards.split(",")):
+            results.append(asyncio.run(run(shards, args.sessions, args.events, args.write_behind, folder, args.synchronous)))
+            print(json.dumps(results[-1]))
+    finally:
+        if args.dir is None:
+            shutil.rmtree(folder, ignore_errors=True)
+    base = results[0]["events_per_s"]
+    for result in results:
+        print(f"{result['shards']:3d} shards  {result['events_per_s']:9.1f} events/s  x{result['events_per_s'] / base:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+# chat_service.py
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, Optional, Union
+
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.genai.types import Content, Part
+
+try:
+    from . import metrics
+    from .emergency_screen import emergency_short_circuit
+    from .governor import GovernorOverloaded, Priority, priority
+except ImportError:
+    import metrics
+    from emergency_screen import emergency_short_circuit
+    from governor import GovernorOverloaded, Priority, priority
+
+logger = logging.getLogger(__name__)
+
+# events looked at for an earlier emergency reply (follow-up turns keep emergency priority)
+EMERGENCY_LOOKBACK_EVENTS = 20
+
+
+class ChatOverloaded(Exception):
+    """Raised when a turn is refused by admission control or the outbound governor (the server maps it to 503)."""
+
+
+@dataclass
+class TurnResult:
+    session_id: str
+    reply: str
+    emergency: bool = False
+    events: int = 0
+    queued_ms: float = 0.0
+    elapsed_ms: float = 0.0
+    first_token_ms: Optional[float] = None  # stream_chat only
+
+
+def _turn_priority(session) -> Priority:
+    """EMERGENCY for sessions that already got an emergency reply, INTERACTIVE otherwise."""
+    for event in (session.events or [])[-EMERGENCY_LOOKBACK_EVENTS:] if session is not None else []:
+        if event.custom_metadata and event.custom_metadata.get("emergency_prescreen"):
+            return Priority.EMERGENCY
+    return Priority.INTERACTIVE
+
+
+def _text_of(event) -> str:
+    if not event.content or not event.content.parts:
+        return ""
+    return "".join(part.text for part in event.content.parts if part.text and not part.thought)
+
+
+@dataclass
+class ChatStats:
+    admitted: int = 0
+    rejected: int = 0
+    completed: int = 0
+    failed: int = 0
+    emergencies: int = 0
+    turn_ms_total: float = 0.0
+
+
+# ================= MANY SESSIONS OVER ONE RUNNER =================
+class ChatService:
+    """
+    Serves chat turns for any number of sessions through the app's single Runner.
+
+    - turns of the same session are serialized by a per-session asyncio.Lock
+      (ADK appends events to the session object, two turns at once would interleave)
+    - at most max_concurrent_turns turns run at the same time (semaphore)
+    - at most max_pending_turns are admitted (running + waiting); any more are
+      rejected right away with ChatOverloaded instead of queueing without bound
+    """
+
+    def __init__(
+        self,
+        app,
+        max_concurrent_turns: Optional[int] = None,
+        max_pending_turns: Optional[int] = None,
+    ):
+        self.app = app
+        self.runner = app.runner
+        self.session_service = app.session_service
+        self.app_name = app.config.app_name
+        # limits default to MediFlowConfig (MEDIFLOW_MAX_CONCURRENT_TURNS / MEDIFLOW_MAX_PENDING_TURNS)
+        self.max_concurrent_turns = max_concurrent_turns or app.config.max_concurrent_turns
+        self.max_pending_turns = max_pending_turns or app.config.max_pending_turns
+        self._slots = asyncio.Semaphore(self.max_concurrent_turns)
+        # (user_id, session_id) -> [lock, turns holding or waiting on it]; dropped when the count hits 0
+        self._session_locks: dict[tuple[str, str], list] = {}
+        self.pending = 0
+        self.running = 0
+        self.stats = ChatStats()
+        # read on every /metrics scrape; a newer ChatService replaces these
+        metrics.CHAT_TURNS_RUNNING.set_function(lambda: self.running)
+        metrics.CHAT_TURNS_PENDING.set_function(lambda: self.pending)
+
+    def _acquire_session_lock(self, key: tuple[str, str]) -> asyncio.Lock:
+        entry = self._session_locks.get(key)
+        if entry is None:
+            entry = self._session_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def _release_session_lock(self, key: tuple[str, str]):
+        entry = self._session_locks[key]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._session_locks[key]
+
+    def _admit(self):
+        if self.pending >= self.max_pending_turns:
+            self.stats.rejected += 1
+            metrics.TURNS.inc(outcome="rejected")
+            raise ChatOverloaded(f"{self.pending} turns pending (limit {self.max_pending_turns})")
+        self.pending += 1
+        self.stats.admitted += 1
+
+    async def ensure_session(self, user_id: str, session_id: str):
+        return await self.session_service.get_or_create_session(
+            app_name=self.app_name, user_id=user_id, session_id=session_id
+        )
+
+    @asynccontextmanager
+    async def _turn_slot(self, user_id: str, session_id: str, mode: str) -> AsyncIterator[float]:
+        """Admission, the session's lock and a concurrency slot around one turn. Yields the time spent queued (ms)."""
+        self._admit()
+        started = time.perf_counter()
+        key = (user_id, session_id)
+        lock = self._acquire_session_lock(key)
+        try:
+            async with lock, self._slots:
+                self.running += 1
+                try:
+                    yield (time.perf_counter() - started) * 1000
+                finally:
+                    self.running -= 1
+        except ChatOverloaded:
+            # shed by the outbound governor mid-turn: a rejection, not a failure
+            self.stats.rejected += 1
+            metrics.TURNS.inc(outcome="rejected")
+            raise
+        except Exception:
+            self.stats.failed += 1
+            metrics.TURNS.inc(outcome="failed")
+            metrics.TURN_SECONDS.observe(time.perf_counter() - started, mode=mode, outcome="failed")
+            logger.exception("Turn failed for session %s", session_id)
+            raise
+        finally:
+            self._release_session_lock(key)
+            self.pending -= 1
+
+    def _finish(self, result: TurnResult, queued_ms: float, started: float, mode: str) -> TurnResult:
+        elapsed = time.perf_counter() - started
+        result.queued_ms = round(queued_ms, 2)
+        result.elapsed_ms = round(elapsed * 1000, 2)
+        self.stats.completed += 1
+        self.stats.turn_ms_total += result.elapsed_ms
+        outcome = "emergency" if result.emergency else "ok"
+        metrics.TURNS.inc(outcome=outcome)
+        metrics.TURN_SECONDS.observe(elapsed, mode=mode, outcome=outcome)
+        metrics.TURN_QUEUE_SECONDS.observe(queued_ms / 1000)
+        return result
+
+    async def chat(self, user_id: str, session_id: str, text: str) -> TurnResult:
+        """Run one user turn and return Tara's final reply. Raises ChatOverloaded when shedding load."""
+        started = time.perf_counter()
+        async with self._turn_slot(user_id, session_id, "chat") as queued_ms:
+            with metrics.span("chat.turn", session_id=session_id, mode="chat"):
+                async for item in self._iter_turn(user_id, session_id, text, stream=False):
+                    result = item
+        return self._finish(result, queued_ms, started, mode="chat")
+
+    async def stream_chat(self, user_id: str, session_id: str, text: str) -> AsyncIterator[dict]:
+        """
+        Run one user turn with model streaming on. Yields {"type": "delta", "text": ...}
+        as partial text arrives, then {"type": "final", **TurnResult}. Only the final,
+        aggregated event is stored (partial events never reach the session service).
+        ChatOverloaded is raised on the first iteration when shedding load.
+        """
+        started = time.perf_counter()
+        first_token_ms = None
+        async with self._turn_slot(user_id, session_id, "stream") as queued_ms:
+            async for item in self._iter_turn(user_id, session_id, text, stream=True):
+                if isinstance(item, TurnResult):
+                    result = item
+                    continue
+                if first_token_ms is None:
+                    first_token_ms = round((time.perf_counter() - started) * 1000, 2)
+                yield {"type": "delta", "text": item}
+        result = self._finish(result, queued_ms, started, mode="stream")
+        # an emergency reply or a non-streaming model arrives in one piece
+        result.first_token_ms = first_token_ms if first_token_ms is not None else result.elapsed_ms
+        metrics.TURN_FIRST_TOKEN_SECONDS.observe(result.first_token_ms / 1000)
+        yield {"type": "final", **asdict(result)}
+
+    async def _iter_turn(self, user_id: str, session_id: str, text: str, stream: bool) -> AsyncIterator[Union[str, TurnResult]]:
+        """Yields partial reply text (stream=True only), then the TurnResult."""
+        session = await self.ensure_session(user_id, session_id)
+        new_message = Content(role="user", parts=[Part(text=text)])
+
+        # --- PHASE 3 pre-screen: emergencies never wait for a model slot ---
+        emergency_text = await emergency_short_circuit(
+            self.session_service, self.app_name, user_id, session_id, new_message, author=self.app.root_agent.name
+        )
+        if emergency_text is not None:
+            self.stats.emergencies += 1
+            yield TurnResult(session_id=session_id, reply=emergency_text, emergency=True, events=2)
+            return
+
+        run_config = RunConfig(streaming_mode=StreamingMode.SSE) if stream else None
+        reply, events = "(No final response)", 0
+        # the turn's model calls queue on the outbound governor with this priority
+        with priority(_turn_priority(session)):
+            try:
+                async for event in self.runner.run_async(
+                    user_id=user_id, session_id=session_id, new_message=new_message, run_config=run_config
+                ):
+                    if event.partial:
+                        delta = _text_of(event)
+                        if delta:
+                            yield delta
+                        continue
+                    events += 1
+                    if event.is_final_response() and event.content and event.content.parts:
+                        reply = "".join(part.text or "" for part in event.content.parts)
+            except GovernorOverloaded as exc:
+                raise ChatOverloaded(f"model calls are backed up: {exc}") from exc
+        yield TurnResult(session_id=session_id, reply=reply, events=events)
+
+    def snapshot(self) -> dict:
+        completed = self.stats.completed
+        return {
+            "running": self.running,
+            "pending": self.pending,
+            "active_sessions": len(self._session_locks),
+            "max_concurrent_turns": self.max_concurrent_turns,
+            "max_pending_turns": self.max_pending_turns,
+            "admitted": self.stats.admitted,
+            "rejected": self.stats.rejected,
+            "completed": completed,
+            "failed": self.stats.failed,
+            "emergencies": self.stats.emergencies,
+            "avg_turn_ms": round(self.stats.turn_ms_total / completed, 2) if completed else None,
+        }
+
+    async def close(self):
+        await self.app.close()
@@ -0,0 +1,96 @@
+# config.py
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+# ================= DEFAULTS =================
+APP_NAME = "MediFlow_AI"
+USER_ID = "medi_flow_user"
+MODEL = "gemini-2.0-flash"
+DB_PATH = "../../database/chat_history.db"
+
+
+@dataclass
+class MediFlowConfig:
+    """Everything create_app() needs. Build it by hand or with MediFlowConfig.from_env()."""
+
+    app_name: str = APP_NAME
+    user_id: str = USER_ID
+    model: str = MODEL                     # Tara's route: "primary" or "primary,faster fallback,..."
+    search_model: Optional[str] = None     # google_search_agent's route (None = same as model)
+    model_deadline: float = 0.0            # seconds per Tara model call across the route (0 = none)
+    search_model_deadline: float = 6.0     # seconds per search-agent model call, inside search_timeout
+    search_hedge_percentile: float = 0.95  # search calls slower than this percentile get a duplicate (0 = off)
+    db_path: str = DB_PATH
+    db_shards: int = 1                     # session files next to db_path, one writer each (sharding.py)
+    log_dir: Optional[str] = None          # None -> MEDIFLOW_LOG_DIR or "logs"
+    configure_logging: bool = True
+    search_timeout: float = 8.0            # per PHASE 4 sub-query
+    enrichment_year: Optional[int] = None  # year in the PHASE 4 outbreak query (None = this year; evals pin it)
+    max_concurrent_turns: int = 32         # chat server: turns running at once
+    max_pending_turns: int = 256           # chat server: admitted turns (running + waiting) before 503
+    context_keep_turns: int = 6            # turns sent verbatim, older ones are summarized (0 = send everything)
+    intake_form: bool = True               # PHASE 1/2 questions asked by code, not the model
+    prompt_cache: bool = True              # cache the static instructions with the model provider
+    prompt_cache_ttl: int = 3600           # seconds; refreshed before it runs out
+    archive_after_days: float = 30.0       # idle sessions move to the compressed archive (0 = never)
+    delete_after_days: float = 0.0         # archived sessions idle this long are deleted (0 = keep forever)
+    maintenance_interval: float = 3600.0   # seconds between archive/vacuum/checkpoint passes (0 = off)
+    doctor_directory: bool = True          # PHASE 7 answers from the local provider directory first
+    otel_spans: bool = False               # OpenTelemetry spans per turn / tool / DB call (metrics.py)
+    governor: bool = True                  # every model call waits on one outbound governor (governor.py)
+    governor_rate: float = 0.0             # outbound model calls per second (0 = no rate limit)
+    governor_burst: int = 20               # calls the rate limit lets through at once
+    governor_max_concurrency: int = 64     # ceiling of the adaptive concurrency limit
+    governor_queue: int = 256              # calls waiting for a slot before the least urgent is refused
+    governor_queue_timeout: float = 10.0   # seconds a call waits for a slot
+
+    @classmethod
+    def from_env(cls, load_env_file: bool = True) -> "MediFlowConfig":
+        """
+        Read .env (python-dotenv) and the environment:
+        GOOGLE_GENAI_MODEL, MEDIFLOW_SEARCH_MODEL (e.g. "gemini-2.0-flash-lite", comma separated fallbacks),
+        MEDIFLOW_MODEL_DEADLINE, MEDIFLOW_SEARCH_MODEL_DEADLINE, MEDIFLOW_SEARCH_HEDGE_PERCENTILE,
+        MEDIFLOW_DB_PATH, MEDIFLOW_DB_SHARDS, MEDIFLOW_LOG_DIR, MEDIFLOW_SEARCH_TIMEOUT,
+        MEDIFLOW_MAX_CONCURRENT_TURNS, MEDIFLOW_MAX_PENDING_TURNS, MEDIFLOW_CONTEXT_TURNS,
+        MEDIFLOW_INTAKE_FORM (0/false to let the model run the interview),
+        MEDIFLOW_PROMPT_CACHE (0/false to send the full prompt every call), MEDIFLOW_PROMPT_CACHE_TTL,
+        MEDIFLOW_ARCHIVE_AFTER_DAYS, MEDIFLOW_DELETE_AFTER_DAYS, MEDIFLOW_MAINTENANCE_INTERVAL,
+        MEDIFLOW_DOCTOR_DIRECTORY (0/false to always search for doctors),
+        MEDIFLOW_OTEL_SPANS (1/true to emit spans to the configured tracer provider),
+        MEDIFLOW_GOVERNOR (0/false to send model calls ungoverned), MEDIFLOW_GOVERNOR_RATE,
+        MEDIFLOW_GOVERNOR_BURST, MEDIFLOW_GOVERNOR_MAX_CONCURRENCY, MEDIFLOW_GOVERNOR_QUEUE,
+        MEDIFLOW_GOVERNOR_QUEUE_TIMEOUT.
+        """
+        if load_env_file:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+        return cls(
+            model=os.environ.get("GOOGLE_GENAI_MODEL") or MODEL,
+            search_model=os.environ.get("MEDIFLOW_SEARCH_MODEL") or None,
+            model_deadline=float(os.environ.get("MEDIFLOW_MODEL_DEADLINE", 0.0)),
+            search_model_deadline=float(os.environ.get("MEDIFLOW_SEARCH_MODEL_DEADLINE", 6.0)),
+            search_hedge_percentile=float(os.environ.get("MEDIFLOW_SEARCH_HEDGE_PERCENTILE", 0.95)),
+            db_path=os.environ.get("MEDIFLOW_DB_PATH", DB_PATH),
+            db_shards=int(os.environ.get("MEDIFLOW_DB_SHARDS", 1)),
+            log_dir=os.environ.get("MEDIFLOW_LOG_DIR"),
+            search_timeout=float(os.environ.get("MEDIFLOW_SEARCH_TIMEOUT", 8.0)),
+            max_concurrent_turns=int(os.environ.get("MEDIFLOW_MAX_CONCURRENT_TURNS", 32)),
+            max_pending_turns=int(os.environ.get("MEDIFLOW_MAX_PENDING_TURNS", 256)),
+            context_keep_turns=int(os.environ.get("MEDIFLOW_CONTEXT_TURNS", 6)),
+            intake_form=os.environ.get("MEDIFLOW_INTAKE_FORM", "1").lower() not in ("0", "false", "no"),
+            prompt_cache=os.environ.get("MEDIFLOW_PROMPT_CACHE", "1").lower() not in ("0", "false", "no"),
+            prompt_cache_ttl=int(os.environ.get("MEDIFLOW_PROMPT_CACHE_TTL", 3600)),
+            archive_after_days=float(os.environ.get("MEDIFLOW_ARCHIVE_AFTER_DAYS", 30.0)),
+            delete_after_days=float(os.environ.get("MEDIFLOW_DELETE_AFTER_DAYS", 0.0)),
+            maintenance_interval=float(os.environ.get("MEDIFLOW_MAINTENANCE_INTERVAL", 3600.0)),
+            doctor_directory=os.environ.get("MEDIFLOW_DOCTOR_DIRECTORY", "1").lower() not in ("0", "false", "no"),
+            otel_spans=os.environ.get("MEDIFLOW_OTEL_SPANS", "0").lower() in ("1", "true", "yes"),
+            governor=os.environ.get("MEDIFLOW_GOVERNOR", "1").lower() not in ("0", "false", "no"),
+            governor_rate=float(os.environ.get("MEDIFLOW_GOVERNOR_RATE", 0.0)),
+            governor_burst=int(os.environ.get("MEDIFLOW_GOVERNOR_BURST", 20)),
+            governor_max_concurrency=int(os.environ.get("MEDIFLOW_GOVERNOR_MAX_CONCURRENCY", 64)),
+            governor_queue=int(os.environ.get("MEDIFLOW_GOVERNOR_QUEUE", 256)),
+            governor_queue_timeout=float(os.environ.get("MEDIFLOW_GOVERNOR_QUEUE_TIMEOUT", 10.0)),
+        )
@@ -0,0 +1,233 @@
+# context_window.py
+import re
+from typing import Optional
+
+from google.genai.types import Content, Part
+
+try:
+    from .emergency_screen import _is_negated
+except ImportError:
+    from emergency_screen import _is_negated
+
+# ================= WHAT THE MODEL SEES EACH TURN =================
+# last KEEP_TURNS turns verbatim + one summary message for everything older:
+#   - patient slots (name, location, age, symptoms, duration, meds)
+#   - one short line per folded turn, newest MAX_SUMMARY_LINES kept
+# The summary lives in session state and only ever has the newly folded turns
+# added to it, so its cost does not grow with the length of the interview.
+KEEP_TURNS = 6
+MAX_SUMMARY_LINES = 24
+SUMMARY_LINE_CHARS = 160
+
+# session state keys (persisted with the session)
+CONTEXT_STATE_KEY = "context_window"
+PATIENT_STATE_KEY = "patient"
+
+# the first six are also extracted from free text below; intake.py fills the rest
+PATIENT_SLOTS = ("name", "location", "age", "gender", "symptoms", "duration", "diet", "conditions", "meds", "trigger")
+
+# ================= PATIENT SLOT EXTRACTION (USER TEXT ONLY) =================
+NAME_RE = re.compile(r"\b(?:[Mm]y name is|[Cc]all me|I'm|I am|[Tt]his is)\s+([A-Z][a-zA-Z'-]+(?: [A-Z][a-zA-Z'-]+)?)")
+NOT_NAMES = {"Not", "Feeling", "Having", "Sick", "Fine", "Ok", "Okay", "Done", "From", "In", "A", "The", "Suffering"}
+
+LOCATION_RE = re.compile(
+    r"\b(?:from|live in|living in|located in|based in|staying in|near|in)\s+([A-Z][a-zA-Z]+(?:[ -][A-Z][a-zA-Z]+){0,2})"
+)
+PINCODE_RE = re.compile(r"\b\d{6}\b")
+NOT_LOCATIONS = {
+    "January", "February", "March", "April", "May", "June", "July", "August",
+    "September", "October", "November", "December", "The", "My", "I",
+}
+
+AGE_RE = re.compile(
+    r"\b(\d{1,3})\s*(?:years?|yrs?)(?: old)?\b|\bage(?:d)?\s*(?:is\s*)?(\d{1,3})\b|\bI(?:'m| am)\s+(\d{1,3})\b",
+    re.IGNORECASE,
+)
+
+_AMOUNT = r"(?:\d+|a|an|one|two|three|four|five|six|seven|eight|nine|ten|few|a few|couple of|a couple of)"
+DURATION_RE = re.compile(
+    rf"\b(?:for|since|past|last|from)\s+(?:the\s+)?({_AMOUNT}\s+(?:hours?|days?|weeks?|months?|years?))"
+    r"|\bsince\s+(yesterday|last night|this morning|morning|last week)",
+    re.IGNORECASE,
+)
+
+SYMPTOM_TERMS = [
+    "fever", "cough", "dry cough", "headache", "migraine", "sore throat", "runny nose", "blocked nose",
+    "congestion", "sneezing", "cold", "chills", "fatigue", "tired", "weakness", "body ache", "body pain",
+    "joint pain", "back pain", "stomach pain", "abdominal pain", "cramps", "nausea", "vomiting",
+    "diarrhea", "diarrhoea", "loose motions", "constipation", "rash", "itching", "dizziness",
+    "loss of taste", "loss of smell", "ear pain", "eye pain", "red eyes", "watery eyes", "burning urination",
+]
+SYMPTOM_RE = re.compile(r"\b(?:" + "|".join(sorted(map(re.escape, SYMPTOM_TERMS), key=len, reverse=True)) + r")\b")
+
+MEDS_RE = re.compile(
+    r"\b(?:taking|took|been taking|using|prescribed|on medication(?:s)?(?: for \w+)?:?)\s+"
+    r"([a-z0-9][a-z0-9 -]{2,40}?)(?=[.,;!?]| and | for |$)",
+    re.IGNORECASE,
+)
+NO_MEDS_RE = re.compile(r"\b(?:no|not on any|not taking any|don'?t take any)\s+(?:medicines?|medications?|meds|tablets?)\b", re.IGNORECASE)
+
+
+def extract_patient_slots(text: str, slots: Optional[dict] = None) -> dict:
+    """
+    Merge whatever the patient said in text into slots (a new dict is returned).
+    Single-valued slots keep the latest value; symptoms accumulate.
+    """
+    slots = dict(slots or {})
+    if not text:
+        return slots
+
+    for match in NAME_RE.finditer(text):
+        name = match.group(1)
+        if name.split()[0] not in NOT_NAMES:
+            slots["name"] = name
+            break
+
+    pincode = PINCODE_RE.search(text)
+    for match in LOCATION_RE.finditer(text):
+        if match.group(1).split()[0] not in NOT_LOCATIONS:
+            slots["location"] = match.group(1) + (f" {pincode.group(0)}" if pincode else "")
+            break
+    else:
+        if pincode:
+            slots["location"] = pincode.group(0)
+
+    age = AGE_RE.search(text)
+    if age:
+        value = int(next(g for g in age.groups() if g))
+        if 0 < value < 120:
+            slots["age"] = value
+
+    duration = DURATION_RE.search(text)
+    if duration:
+        slots["duration"] = next(g for g in duration.groups() if g).lower()
+
+    lowered = text.lower()
+    found = [m.group(0) for m in SYMPTOM_RE.finditer(lowered) if not _is_negated(lowered, m.start(), m.end())]
+    if found:
+        slots["symptoms"] = list(dict.fromkeys([*slots.get("symptoms", []), *found]))
+
+    if NO_MEDS_RE.search(text):
+        slots["meds"] = "none"
+    else:
+        meds = MEDS_RE.search(text)
+        if meds:
+            slots["meds"] = meds.group(1).strip()
+    return slots
+
+
+# ================= TURNS =================
+def _is_user_text(content: Content) -> bool:
+    """A new turn starts at a user message with text (function responses are role user too)."""
+    return content.role == "user" and any(part.text for part in content.parts or [])
+
+
+def split_turns(contents: list[Content]) -> list[list[Content]]:
+    """
+    Group contents into turns. A user message right after another user content
+    stays in the same turn: that is how request-scoped context (preload_memory's
+    PAST_CONVERSATIONS block) sits in front of the current message.
+    """
+    turns: list[list[Content]] = []
+    for content in contents:
+        if not turns or (_is_user_text(content) and turns[-1][-1].role != "user"):
+            turns.append([content])
+        else:
+            turns[-1].append(content)
+    return turns
+
+
+def _patient_text(turn: list[Content]) -> str:
+    texts = []
+    for content in turn:
+        if content.role != "user":
+            break
+        texts.extend(part.text for part in content.parts or [] if part.text)
+    return " ".join(texts)
+
+
+def _clip(text: str) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= SUMMARY_LINE_CHARS else text[:SUMMARY_LINE_CHARS - 3] + "..."
+
+
+def summarize_turn(turn: list[Content]) -> list[str]:
+    """One line for what the patient said, one for Tara's last text reply, tool use noted."""
+    user_text = _patient_text(turn)
+    lines = [f"Patient: {_clip(user_text)}"] if user_text else []
+    tools, reply = [], ""
+    for content in turn[1:]:
+        for part in content.parts or []:
+            if part.function_call:
+                tools.append(part.function_call.name)
+            elif content.role == "model" and part.text and not part.thought:
+                reply = part.text
+    if tools:
+        lines.append(f"Tara used: {', '.join(dict.fromkeys(tools))}")
+    if reply:
+        lines.append(f"Tara: {_clip(reply)}")
+    return lines
+
+
+def summary_content(window: dict, patient: dict) -> Content:
+    known = [f"{slot}: {', '.join(patient[slot]) if isinstance(patient[slot], list) else patient[slot]}"
+             for slot in PATIENT_SLOTS if patient.get(slot)]
+    text = ["[Summary of the earlier conversation - these turns are not repeated below]"]
+    text.append("Patient details so far: " + ("; ".join(known) if known else "none collected yet"))
+    if window.get("omitted_lines"):
+        text.append(f"({window['omitted_lines']} older summary lines dropped)")
+    text.extend(window.get("lines", []))
+    return Content(role="user", parts=[Part(text="\n".join(text))])
+
+
+def _merge_slots(patient: dict, found: dict) -> dict:
+    """
+    Slots found in a newer turn replace what state has ("actually I'm in Mumbai now"), unless
+    nothing was found for them; new symptoms are added to the known ones.
+    Turns are folded oldest first, so the latest mention of a slot is the one kept.
+    """
+    merged = {**patient, **{slot: value for slot, value in found.items() if value not in (None, "", [])}}
+    if found.get("symptoms") and patient.get("symptoms"):
+        known = " ".join(patient["symptoms"]).lower()
+        merged["symptoms"] = [*patient["symptoms"], *(s for s in found["symptoms"] if s not in known)]
+    return merged
+
+
+# ================= BEFORE MODEL CALLBACK =================
+def make_context_window_callback(keep_turns: int = KEEP_TURNS, max_summary_lines: int = MAX_SUMMARY_LINES):
+    """
+    before_model_callback that bounds the history sent to the model.
+    Folding is incremental: state remembers how many turns are already in the
+    summary, so each call only summarizes turns that just left the window.
+    """
+
+    def context_window_callback(callback_context, llm_request) -> None:
+        turns = split_turns(llm_request.contents or [])
+        fold_upto = len(turns) - keep_turns
+        if fold_upto <= 0:
+            return None
+
+        state = callback_context.state
+        window = dict(state.get(CONTEXT_STATE_KEY) or {"folded_turns": 0, "lines": [], "omitted_lines": 0})
+        patient = dict(state.get(PATIENT_STATE_KEY) or {})
+
+        folded = min(window["folded_turns"], fold_upto)
+        if folded < fold_upto:
+            lines = list(window["lines"])
+            for turn in turns[folded:fold_upto]:
+                patient = _merge_slots(patient, extract_patient_slots(_patient_text(turn)))
+                lines.extend(summarize_turn(turn))
+            overflow = max(0, len(lines) - max_summary_lines)
+            window = {
+                "folded_turns": fold_upto,
+                "lines": lines[overflow:],
+                "omitted_lines": window["omitted_lines"] + overflow,
+            }
+            # recorded on the model response event, so the summary survives restarts
+            state[CONTEXT_STATE_KEY] = window
+            state[PATIENT_STATE_KEY] = patient
+
+        llm_request.contents = [summary_content(window, patient)] + [c for turn in turns[fold_upto:] for c in turn]
+        return None
+
+    return context_window_callback
@@ -0,0 +1,604 @@
+# doctor_directory.py
+# ================= LOCAL DOCTOR / CLINIC DIRECTORY FOR PHASE 7 =================
+# PHASE 7 used to send "[specialty] near [location]" through google_search_agent every time and
+# have the model re-read names, ratings and addresses out of raw search text. The directory keeps
+# providers in SQLite (same database as the sessions):
+#   providers          one row per provider, unique on (name, specialty, city)
+#   providers_rtree    R*Tree over (specialty id, lat, lon): "dermatologists within 5 km" is one index range scan
+#   directory_places   pincode / city -> coordinates, so "Pune 411001" can be placed on the map
+# It is filled by bulk loads (CSV / JSON) and incrementally from the doctor searches already
+# stored in search_cache. Tara's find_nearby_providers tool answers from here and only says
+# "no coverage" (fall back to google_search_agent) when the directory has nothing near.
+#
+# python -m mediflow_ai.doctor_directory load providers.csv | places places.json | ingest | query ...
+import argparse
+import asyncio
+import csv
+import json
+import math
+import re
+import time
+from typing import Iterable, Optional, Union
+
+try:
+    from . import metrics
+    from .search_cache import LOCATION_ALIASES
+    from .sqlite_store import SessionStore
+except ImportError:
+    import metrics
+    from search_cache import LOCATION_ALIASES
+    from sqlite_store import SessionStore
+
+EARTH_RADIUS_KM = 6371.0
+SEARCH_RADII_KM = (5.0, 15.0, 50.0)   # widened until k providers are found
+DEFAULT_K = 3
+MAX_CANDIDATES = 500                  # rows read from the R*Tree per radius
+NEUTRAL_RATING = 3.5                  # unrated providers rank as if they had this rating
+RATING_KM_PER_STAR = 2.0              # one rating star is worth this much extra distance
+INGEST_BATCH = 200                    # search_cache rows per ingest transaction
+
+PROVIDER_FIELDS = ("name", "specialty", "kind", "address", "city", "pincode", "phone", "rating", "reviews", "lat", "lon")
+
+# ================= SCHEMA =================
+CREATE_DIRECTORY_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS providers (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        name_key TEXT NOT NULL,
+        specialty TEXT NOT NULL,
+        kind TEXT,
+        address TEXT,
+        city TEXT,
+        pincode TEXT,
+        phone TEXT,
+        rating REAL,
+        reviews INTEGER,
+        lat REAL,
+        lon REAL,
+        approximate INTEGER NOT NULL DEFAULT 0,
+        source TEXT,
+        updated_at REAL,
+        UNIQUE (name_key, specialty, city)
+    );
+    """,
+    # the few providers without coordinates, looked up by pincode / city
+    "CREATE INDEX IF NOT EXISTS idx_providers_unplaced_pincode ON providers (specialty, pincode) WHERE lat IS NULL;",
+    "CREATE INDEX IF NOT EXISTS idx_providers_unplaced_city ON providers (specialty, city) WHERE lat IS NULL;",
+    "CREATE INDEX IF NOT EXISTS idx_providers_updated ON providers (updated_at);",
+    "CREATE TABLE IF NOT EXISTS directory_specialties (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);",
+    # specialty is the first dimension (min = max = its id), so the index filters on it too
+    "CREATE VIRTUAL TABLE IF NOT EXISTS providers_rtree USING rtree(id, min_spec, max_spec, min_lat, max_lat, min_lon, max_lon);",
+    """
+    CREATE TABLE IF NOT EXISTS directory_places (
+        place_key TEXT PRIMARY KEY,
+        lat REAL NOT NULL,
+        lon REAL NOT NULL,
+        source TEXT NOT NULL
+    ) WITHOUT ROWID;
+    """,
+    "CREATE TABLE IF NOT EXISTS directory_state (key TEXT PRIMARY KEY, value REAL) WITHOUT ROWID;",
+]
+
+UPSERT_PROVIDER_SQL = """
+INSERT INTO providers (name, name_key, specialty, kind, address, city, pincode, phone, rating, reviews, lat, lon, approximate, source, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (name_key, specialty, city) DO UPDATE SET
+    name = excluded.name,
+    kind = COALESCE(excluded.kind, providers.kind),
+    address = COALESCE(excluded.address, providers.address),
+    pincode = COALESCE(excluded.pincode, providers.pincode),
+    phone = COALESCE(excluded.phone, providers.phone),
+    rating = COALESCE(excluded.rating, providers.rating),
+    reviews = COALESCE(excluded.reviews, providers.reviews),
+    -- exact coordinates are never replaced by a pincode / city centroid
+    lat = CASE WHEN excluded.lat IS NOT NULL AND (providers.lat IS NULL OR providers.approximate OR NOT excluded.approximate)
+               THEN excluded.lat ELSE providers.lat END,
+    lon = CASE WHEN excluded.lon IS NOT NULL AND (providers.lon IS NULL OR providers.approximate OR NOT excluded.approximate)
+               THEN excluded.lon ELSE providers.lon END,
+    approximate = CASE WHEN excluded.lat IS NOT NULL AND (providers.lat IS NULL OR providers.approximate)
+                       THEN excluded.approximate ELSE providers.approximate END,
+    source = excluded.source,
+    updated_at = excluded.updated_at
+"""
+# after each batch: the rows it stamped with updated_at go into the R*Tree
+SYNC_SPECIALTIES_SQL = "INSERT OR IGNORE INTO directory_specialties (name) SELECT DISTINCT specialty FROM providers WHERE updated_at = ?"
+SYNC_RTREE_SQL = """
+INSERT OR REPLACE INTO providers_rtree (id, min_spec, max_spec, min_lat, max_lat, min_lon, max_lon)
+SELECT p.id, s.id, s.id, p.lat, p.lat, p.lon, p.lon
+FROM providers p JOIN directory_specialties s ON s.name = p.specialty
+WHERE p.updated_at = ? AND p.lat IS NOT NULL
+"""
+SELECT_SPECIALTY_SQL = "SELECT id FROM directory_specialties WHERE name = ?"
+
+# explicit places (load_places) win over centroids derived from the providers
+UPSERT_PLACE_SQL = """
+INSERT INTO directory_places (place_key, lat, lon, source) VALUES (?, ?, ?, ?)
+ON CONFLICT (place_key) DO UPDATE SET lat = excluded.lat, lon = excluded.lon, source = excluded.source
+WHERE directory_places.source = 'derived' OR excluded.source <> 'derived'
+"""
+DERIVED_PLACES_SQL = """
+SELECT key, AVG(lat), AVG(lon) FROM (
+    SELECT pincode AS key, lat, lon FROM providers WHERE pincode IS NOT NULL AND lat IS NOT NULL AND NOT approximate
+    UNION ALL
+    SELECT city AS key, lat, lon FROM providers WHERE city IS NOT NULL AND lat IS NOT NULL AND NOT approximate
+) GROUP BY key
+"""
+SELECT_PLACE_SQL = "SELECT lat, lon FROM directory_places WHERE place_key = ?"
+
+# one specialty inside a bounding box; CROSS JOIN keeps the R*Tree as the outer loop
+SELECT_NEARBY_SQL = f"""
+SELECT p.id, {", ".join("p." + name for name in PROVIDER_FIELDS)}, p.approximate, p.source
+FROM providers_rtree r CROSS JOIN providers p ON p.id = r.id
+WHERE r.min_spec >= ? AND r.max_spec <= ?
+  AND r.min_lat >= ? AND r.max_lat <= ? AND r.min_lon >= ? AND r.max_lon <= ?
+LIMIT {MAX_CANDIDATES}
+"""
+# providers learnt from searches whose location could not be placed on the map
+SELECT_UNPLACED_SQL = f"""
+SELECT p.id, {", ".join("p." + name for name in PROVIDER_FIELDS)}, p.approximate, p.source
+FROM providers p
+WHERE p.lat IS NULL AND ((p.specialty = ? AND p.pincode = ?) OR (p.specialty = ? AND p.city = ?))
+ORDER BY p.rating DESC
+LIMIT ?
+"""
+SELECT_NEW_SEARCHES_SQL = """
+SELECT created_at, query, result FROM search_cache
+WHERE category = 'doctor' AND created_at > ?
+ORDER BY created_at
+LIMIT ?
+"""
+STATS_SQL = "SELECT COUNT(*), COUNT(lat), COUNT(DISTINCT specialty) FROM providers"
+
+# ================= NORMALIZATION =================
+SPECIALTY_ALIASES = {
+    "general physician": ("gp", "general practitioner", "physician", "family doctor", "family physician", "general medicine"),
+    "pediatrician": ("paediatrician", "child specialist", "pediatrics", "paediatrics", "child doctor"),
+    "dermatologist": ("skin specialist", "skin doctor", "dermatology"),
+    "ent specialist": ("ent", "ear nose throat", "otolaryngologist", "ent doctor"),
+    "gynecologist": ("gynaecologist", "obgyn", "ob-gyn", "gynecology", "gynaecology", "obstetrician"),
+    "orthopedist": ("orthopaedic", "orthopedic", "bone specialist", "orthopaedician", "orthopedics"),
+    "ophthalmologist": ("eye specialist", "eye doctor", "ophthalmology"),
+    "dentist": ("dental", "dental clinic", "dental surgeon"),
+    "cardiologist": ("heart specialist", "cardiology", "heart doctor"),
+    "pulmonologist": ("chest specialist", "lung specialist", "pulmonology", "chest physician"),
+    "gastroenterologist": ("stomach specialist", "gastroenterology", "gastro"),
+    "neurologist": ("neurology", "nerve specialist"),
+    "endocrinologist": ("diabetologist", "endocrinology", "diabetes specialist"),
+    "psychiatrist": ("psychiatry", "mental health specialist"),
+    "urologist": ("urology",),
+    "allergist": ("allergy specialist", "immunologist"),
+}
+_SPECIALTY_LOOKUP = {alias: name for name, aliases in SPECIALTY_ALIASES.items() for alias in (name, *aliases)}
+SPECIALTY_NOISE_RE = re.compile(r"\b(?:best|top|good|doctors?|specialists?|clinics?|dr|near|me|nearby|in|a|the|for)\b")
+PINCODE_RE = re.compile(r"\b[1-9]\d{5}\b")
+NEAR_RE = re.compile(r"\b(?:near|in|around|at)\s+(.+)$", re.IGNORECASE)
+
+
+def _words(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s-]", " ", (text or "").lower()).split())
+
+
+def normalize_specialty(text: str) -> str:
+    """"Best skin specialist" -> "dermatologist"; unknown specialties keep their cleaned wording."""
+    words = _words(text)
+    if words in _SPECIALTY_LOOKUP:
+        return _SPECIALTY_LOOKUP[words]
+    cleaned = " ".join(SPECIALTY_NOISE_RE.sub(" ", words).split())
+    if cleaned in _SPECIALTY_LOOKUP:
+        return _SPECIALTY_LOOKUP[cleaned]
+    for alias in sorted(_SPECIALTY_LOOKUP, key=len, reverse=True):
+        if re.search(rf"\b{re.escape(alias)}\b", words):
+            return _SPECIALTY_LOOKUP[alias]
+    return cleaned or words
+
+
+def place_key(text: str) -> str:
+    """City / area names as stored in directory_places: lowercase, old names unified (bombay -> mumbai)."""
+    key = _words(text)
+    return LOCATION_ALIASES.get(key, key)
+
+
+def _location_keys(location: str) -> list[str]:
+    """
+    Place keys to try, most specific first: the pincode, the whole text, each comma separated
+    part, then the last word ("Koregaon Park Pune" -> "pune"). The last key is taken as the city.
+    """
+    keys = PINCODE_RE.findall(location or "")
+    text = PINCODE_RE.sub(" ", location or "")
+    keys.extend(place_key(part) for part in [text, *re.split(r"[,/]", text)])
+    words = _words(text).split()
+    if len(words) > 1:
+        keys.append(place_key(words[-1]))
+    return [key for key in dict.fromkeys(keys) if key]
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi, dlmb = phi2 - phi1, math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def _bounding_box(lat: float, lon: float, radius_km: float) -> tuple[float, float, float, float]:
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    dlon = math.degrees(radius_km / (EARTH_RADIUS_KM * max(math.cos(math.radians(lat)), 0.01)))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+# ================= PROVIDERS OUT OF SEARCH TEXT =================
+BULLET_RE = re.compile(r"^\s*(?:[-*•]+|\d+[.)])\s*")
+FACILITY_RE = re.compile(r"\b(?:clinic|hospitals?|medical (?:centre|center)|healthcare|nursing home|polyclinic|diagnostics)\b", re.IGNORECASE)
+DOCTOR_NAME_RE = re.compile(r"\bDr\.?\s+[A-Z][\w.'-]*(?:\s+[A-Z][\w.'-]*){0,3}")
+RATING_RE = re.compile(r"(?:rating|rated)?\s*[:\-]?\s*\b([0-5](?:\.\d)?)\s*(?:/\s*5|★|stars?)|\brating\s*[:\-]?\s*([0-5](?:\.\d)?)\b", re.IGNORECASE)
+REVIEWS_RE = re.compile(r"\(?\b(\d[\d,]*)\+?\s*(?:reviews?|ratings)\)?", re.IGNORECASE)
+PHONE_RE = re.compile(r"(?:\+91[\s-]?)?\b[6-9]\d{4}[\s-]?\d{5}\b|\b0\d{2,4}[\s-]\d{6,8}\b")
+NAME_SPLIT_RE = re.compile(r"\s+[-–—|]\s+|:\s+|,\s+")
+
+
+def parse_provider_listing(text: str) -> list[dict]:
+    """
+    Best effort: one provider per line / bullet of a google_search_agent answer. A line counts
+    when it names a doctor ("Dr. ...") or a facility (clinic, hospital, ...).
+    """
+    providers = []
+    for raw_line in (text or "").splitlines():
+        line = BULLET_RE.sub("", raw_line.replace("**", "").replace("__", "")).strip()
+        if not line:
+            continue
+        head = NAME_SPLIT_RE.split(line, maxsplit=1)[0]
+        if DOCTOR_NAME_RE.search(head):
+            name, kind = DOCTOR_NAME_RE.search(head).group(0).strip(), "doctor"
+        elif FACILITY_RE.search(head) and len(head.split()) <= 8:
+            name, kind = head.strip(" .-"), "clinic" if re.search(r"clinic", head, re.IGNORECASE) else "hospital"
+        else:
+            continue
+        rating_match = RATING_RE.search(line)
+        reviews_match = REVIEWS_RE.search(line)
+        phone_match = PHONE_RE.search(line)
+        pincode_match = PINCODE_RE.search(PHONE_RE.sub(" ", line))
+        rest = line[line.find(name) + len(name):]
+        for pattern in (RATING_RE, REVIEWS_RE, PHONE_RE):
+            rest = pattern.sub(" ", rest)
+        address = " ".join(re.sub(r"(?i)\b(?:address|phone|tel)\s*:", " ", rest).split()).strip(" ,.-–—|:()")
+        rating = next((float(g) for g in (rating_match.groups() if rating_match else ()) if g), None)
+        providers.append({
+            "name": name,
+            "kind": kind,
+            "address": address[:200] or None,
+            "pincode": pincode_match.group(0) if pincode_match else None,
+            "phone": phone_match.group(0) if phone_match else None,
+            "rating": rating,
+            "reviews": int(reviews_match.group(1).replace(",", "")) if reviews_match else None,
+        })
+    return providers
+
+
+def _split_search_query(query: str) -> tuple[str, str]:
+    """"cardiologist near Koregaon Park Pune 411001" -> ("cardiologist", "Koregaon Park Pune 411001")."""
+    match = NEAR_RE.search(query)
+    if match:
+        return normalize_specialty(query[:match.start()]), match.group(1).strip()
+    return normalize_specialty(query), ""
+
+
+# ================= THE DIRECTORY =================
+class DoctorDirectory:
+    """
+    Nearest providers by specialty, from a local SQLite directory.
+
+        directory = DoctorDirectory(store)
+        await directory.load_file("providers.csv")
+        result = await directory.find_nearby("skin specialist", "Pune 411001", k=3)
+    """
+
+    def __init__(self, store: Union[SessionStore, str]):
+        self.store = store if isinstance(store, SessionStore) else SessionStore(store)
+        self._ready = False
+        self.stats = {"lookups": 0, "covered": 0, "ingested_searches": 0, "ingested_providers": 0}
+
+    async def setup(self):
+        if self._ready:
+            return
+        async with self.store.write() as db:
+            for statement in CREATE_DIRECTORY_SQL:
+                await db.execute(statement)
+            await db.commit()
+        self._ready = True
+
+    # ---------- loading ----------
+    @staticmethod
+    def _values(row: dict, source: str, now: float, approximate: bool = False) -> tuple:
+        name = " ".join(str(row["name"]).split())
+        lat, lon = row.get("lat"), row.get("lon")
+        lat = float(lat) if lat not in (None, "") else None
+        lon = float(lon) if lon not in (None, "") else None
+        rating, reviews = row.get("rating"), row.get("reviews")
+        return (
+            name, _words(name), normalize_specialty(row.get("specialty") or "general physician"), row.get("kind"),
+            row.get("address") or None, place_key(row["city"]) if row.get("city") else None,
+            str(row["pincode"]).strip() if row.get("pincode") else None, row.get("phone") or None,
+            float(rating) if rating not in (None, "") else None, int(float(reviews)) if reviews not in (None, "") else None,
+            lat, lon, int(approximate and lat is not None), source, now,
+        )
+
+    async def _upsert(self, db, values: list[tuple], now: float):
+        await db.executemany(UPSERT_PROVIDER_SQL, values)
+        await db.execute(SYNC_SPECIALTIES_SQL, (now,))
+        await db.execute(SYNC_RTREE_SQL, (now,))
+
+    async def load_rows(self, rows: Iterable[dict], source: str = "bulk") -> int:
+        """Insert / update providers (fields: PROVIDER_FIELDS, name required) in one transaction."""
+        await self.setup()
+        now = time.time()
+        values = [self._values(row, source, now) for row in rows if row.get("name")]
+        async with self.store.write() as db:
+            await self._upsert(db, values, now)
+            await self._derive_places(db)
+            await db.commit()
+        return len(values)
+
+    async def load_file(self, path: str) -> int:
+        """A CSV with a header row, a JSON list of objects or JSON lines."""
+        return await self.load_rows(_read_rows(path))
+
+    async def load_places(self, rows: Iterable[dict]) -> int:
+        """Pincode / city / area coordinates ({"place": ..., "lat": ..., "lon": ...})."""
+        await self.setup()
+        values = [
+            (place_key(str(row["place"])) if not PINCODE_RE.fullmatch(str(row["place"]).strip()) else str(row["place"]).strip(),
+             float(row["lat"]), float(row["lon"]), "loaded")
+            for row in rows
+        ]
+        async with self.store.write() as db:
+            await db.executemany(UPSERT_PLACE_SQL, values)
+            await db.commit()
+        return len(values)
+
+    async def _derive_places(self, db):
+        cursor = await db.execute(DERIVED_PLACES_SQL)
+        derived = await cursor.fetchall()
+        await cursor.close()
+        await db.executemany(UPSERT_PLACE_SQL, [(key, lat, lon, "derived") for key, lat, lon in derived])
+
+    # ---------- incremental feed from past searches ----------
+    async def ingest_search_results(self, max_rows: int = 10 * INGEST_BATCH) -> int:
+        """
+        Parse doctor searches that reached search_cache since the last call and add the providers
+        they list. Returns providers added or updated. Cheap when nothing is new.
+        """
+        await self.setup()
+        async with self.store.read() as db:
+            cursor = await db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'search_cache'")
+            has_search_cache = await cursor.fetchone() is not None
+            await cursor.close()
+            if not has_search_cache:
+                return 0
+            cursor = await db.execute("SELECT value FROM directory_state WHERE key = 'search_cache_watermark'")
+            row = await cursor.fetchone()
+            await cursor.close()
+        watermark = row[0] if row else 0.0
+        added = 0
+        while max_rows > 0:
+            async with self.store.read() as db:
+                cursor = await db.execute(SELECT_NEW_SEARCHES_SQL, (watermark, min(INGEST_BATCH, max_rows)))
+                searches = await cursor.fetchall()
+                await cursor.close()
+            if not searches:
+                break
+            now = time.time()
+            async with self.store.write() as db:
+                values = []
+                for created_at, query, result in searches:
+                    values.extend(await self._search_values(db, query, result, now))
+                    watermark = created_at
+                await self._upsert(db, values, now)
+                added += len(values)
+                await db.execute(
+                    "INSERT OR REPLACE INTO directory_state (key, value) VALUES ('search_cache_watermark', ?)", (watermark,)
+                )
+                await db.commit()
+            self.stats["ingested_searches"] += len(searches)
+            max_rows -= len(searches)
+        self.stats["ingested_providers"] += added
+        return added
+
+    async def _search_values(self, db, query: str, result: str, now: float) -> list[tuple]:
+        specialty, location = _split_search_query(query or "")
+        providers = parse_provider_listing(result)
+        if not providers or not specialty:
+            return []
+        point = await self._resolve(db, location) if location else None
+        city_keys = [key for key in _location_keys(location) if not PINCODE_RE.fullmatch(key)]
+        searched_pincode = PINCODE_RE.search(location)
+        searched_pincode = searched_pincode.group(0) if searched_pincode else None
+        for provider in providers:
+            provider["specialty"] = specialty
+            provider["city"] = city_keys[-1] if city_keys else None
+            if provider["pincode"] is None:
+                provider["pincode"] = searched_pincode
+            # a search result has no coordinates: place it at its pincode, or at the searched area when
+            # it names no other pincode; an unknown pincode of its own leaves it unplaced
+            if provider["pincode"] and provider["pincode"] != searched_pincode:
+                own_point = await self._resolve(db, provider["pincode"])
+            else:
+                own_point = point
+            provider["lat"], provider["lon"] = (own_point or (None, None))[:2]
+        return [self._values(provider, "search", now, approximate=True) for provider in providers]
+
+    # ---------- lookups ----------
+    async def _resolve(self, db, location: str) -> Optional[tuple[float, float, str]]:
+        for key in _location_keys(location):
+            cursor = await db.execute(SELECT_PLACE_SQL, (key,))
+            row = await cursor.fetchone()
+            await cursor.close()
+            if row is not None:
+                return row[0], row[1], key
+        return None
+
+    async def find_nearby(
+        self, specialty: str, location: str, k: int = DEFAULT_K, lat: Optional[float] = None, lon: Optional[float] = None
+    ) -> dict:
+        """
+        Top-k providers of a specialty near a location (pincode / area / city, or lat+lon),
+        ranked by distance with a bonus per rating star. coverage=False means the directory
+        has nothing there and a live search is needed.
+        """
+        await self.setup()
+        started = time.perf_counter()
+        specialty_key = normalize_specialty(specialty)
+        self.stats["lookups"] += 1
+        async with self.store.read() as db:
+            cursor = await db.execute(SELECT_SPECIALTY_SQL, (specialty_key,))
+            specialty_row = await cursor.fetchone()
+            await cursor.close()
+            point = (lat, lon, "coordinates") if lat is not None and lon is not None else await self._resolve(db, location)
+            providers: list[dict] = []
+            radius_km = None
+            if point is not None and specialty_row is not None:
+                for radius_km in SEARCH_RADII_KM:
+                    cursor = await db.execute(SELECT_NEARBY_SQL, (specialty_row[0], specialty_row[0], *_bounding_box(point[0], point[1], radius_km)))
+                    rows = await cursor.fetchall()
+                    await cursor.close()
+                    providers = [_provider(row, point) for row in rows]
+                    providers = [p for p in providers if p["distance_km"] <= radius_km]
+                    if len(providers) >= k:
+                        break
+            if len(providers) < k and specialty_row is not None:
+                keys = _location_keys(location)
+                pincode = next((key for key in keys if PINCODE_RE.fullmatch(key)), None)
+                city = next((key for key in reversed(keys) if not PINCODE_RE.fullmatch(key)), None)
+                cursor = await db.execute(SELECT_UNPLACED_SQL, (specialty_key, pincode, specialty_key, city, k))
+                providers.extend(_provider(row, None) for row in await cursor.fetchall())
+                await cursor.close()
+        providers.sort(key=_rank)
+        result = {
+            "coverage": bool(providers),
+            "specialty": specialty_key,
+            "location": location,
+            "resolved_place": point[2] if point else None,
+            "radius_km": radius_km if providers and point else None,
+            "providers": providers[:k],
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        if providers:
+            self.stats["covered"] += 1
+        else:
+            result["fallback_query"] = f"{specialty} near {location}"
+        return result
+
+    async def directory_stats(self) -> dict:
+        await self.setup()
+        async with self.store.read() as db:
+            cursor = await db.execute(STATS_SQL)
+            providers, placed, specialties = await cursor.fetchone()
+            await cursor.close()
+        return {"providers": providers, "placed": placed, "specialties": specialties, **self.stats}
+
+
+def _provider(row: tuple, point: Optional[tuple]) -> dict:
+    provider = dict(zip(("id", *PROVIDER_FIELDS, "approximate", "source"), row))
+    lat, lon = provider.pop("lat"), provider.pop("lon")
+    provider["distance_km"] = round(haversine_km(point[0], point[1], lat, lon), 2) if point and lat is not None else None
+    provider["approximate_location"] = bool(provider.pop("approximate")) or lat is None
+    provider["maps_query"] = ", ".join(part for part in (provider["name"], provider["address"], provider["city"], provider["pincode"]) if part)
+    return provider
+
+
+def _rank(provider: dict) -> float:
+    distance = provider["distance_km"] if provider["distance_km"] is not None else SEARCH_RADII_KM[-1]
+    rating = provider["rating"] if provider["rating"] is not None else NEUTRAL_RATING
+    return distance - RATING_KM_PER_STAR * (rating - NEUTRAL_RATING)
+
+
+def _read_rows(path: str) -> Iterable[dict]:
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            yield from ({key.strip().lower(): value for key, value in row.items() if key} for row in csv.DictReader(f))
+        return
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    stripped = text.lstrip()
+    if stripped.startswith("["):
+        yield from json.loads(text)
+    else:
+        yield from (json.loads(line) for line in text.splitlines() if line.strip())
+
+
+# ================= FUNCTION TOOL FOR TARA =================
+def build_directory_tool(directory: DoctorDirectory, k: int = DEFAULT_K):
+    """Wrap DoctorDirectory.find_nearby as Tara's PHASE 7 function tool."""
+    from google.adk.tools import FunctionTool
+
+    async def find_nearby_providers(specialty: str, location: str) -> dict:
+        """
+        PHASE 7 doctor finder, from the local provider directory (answers in milliseconds).
+        Call this BEFORE searching for doctors with google_search_agent.
+
+        Args:
+          specialty: The mapped specialty, e.g. "dermatologist", "general physician", "ENT specialist".
+          location: The patient's area / city, with the pincode if known.
+
+        Returns:
+          dict with coverage (bool) and providers (name, kind, address, city, pincode, phone,
+          rating, reviews, distance_km, maps_query), nearest and best rated first. When
+          coverage is false, search google_search_agent with fallback_query instead.
+        """
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            with metrics.span("tool.find_nearby_providers", phase="PHASE 7"):
+                result = await directory.find_nearby(specialty, location, k=k)
+                if not result["coverage"]:
+                    # searches made since the last maintenance pass may cover it already
+                    if await directory.ingest_search_results():
+                        result = await directory.find_nearby(specialty, location, k=k)
+            outcome = "ok" if result["coverage"] else "no_coverage"
+            return result
+        finally:
+            metrics.TOOL_CALLS.inc(tool="find_nearby_providers", phase="PHASE 7", outcome=outcome)
+            metrics.TOOL_SECONDS.observe(time.perf_counter() - started, tool="find_nearby_providers", phase="PHASE 7")
+
+    return FunctionTool(find_nearby_providers)
+
+
+def main():
+    try:
+        from .config import MediFlowConfig
+    except ImportError:
+        from config import MediFlowConfig
+
+    config = MediFlowConfig.from_env()
+    parser = argparse.ArgumentParser(description="Load and query the local doctor / clinic directory.")
+    parser.add_argument("--db", default=config.db_path)
+    commands = parser.add_subparsers(dest="command", required=True)
+    load = commands.add_parser("load", help=f"providers from CSV / JSON ({', '.join(PROVIDER_FIELDS)})")
+    load.add_argument("path")
+    places = commands.add_parser("places", help="pincode / area coordinates from CSV / JSON (place, lat, lon)")
+    places.add_argument("path")
+    commands.add_parser("ingest", help="add providers from doctor searches in search_cache")
+    query = commands.add_parser("query")
+    query.add_argument("--specialty", required=True)
+    query.add_argument("--location", required=True)
+    query.add_argument("-k", type=int, default=DEFAULT_K)
+    commands.add_parser("stats")
+    args = parser.parse_args()
+
+    async def run():
+        async with SessionStore(args.db) as store:
+            directory = DoctorDirectory(store)
+            if args.command == "load":
+                print(json.dumps({"loaded": await directory.load_file(args.path)}))
+            elif args.command == "places":
+                print(json.dumps({"places": await directory.load_places(_read_rows(args.path))}))
+            elif args.command == "ingest":
+                print(json.dumps({"ingested_providers": await directory.ingest_search_results()}))
+            elif args.command == "query":
+                print(json.dumps(await directory.find_nearby(args.specialty, args.location, k=args.k), indent=2))
+            print(json.dumps(await directory.directory_stats()))
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# emergency_screen.py
+import re
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:  # google.genai is only needed once a reply is built, keep the screen cheap to import
+    from google.genai.types import Content
+
+# ================= EXACT PHASE 3 RESPONSE =================
+# must stay identical to the emergency JSON in Tara's instruction
+EMERGENCY_RESPONSE = '{"emergency": true, "recommendation": "CALL_911_IMMEDIATELY", "message": "Please call your local emergency services now (e.g., 112 / 108 / 911) or go to the nearest ER."}'
+
+# ================= DANGER SIGNS (PHASE 3) WITH SYNONYMS =================
+_CANT = r"(?:can'?t|cannot|can not|unable to|not able to|struggling to|hard to|trouble|difficulty|barely|hardly)"
+
+EMERGENCY_PATTERNS = {
+    "chest_pain": [
+        r"chest (?:pain|pressure|tightness|discomfort)",
+        r"(?:pain|pressure|tightness) in (?:\w+ )?chest",
+        r"crushing (?:\w+ )?in (?:\w+ )?chest",
+        r"heart attack",
+    ],
+    "breathing": [
+        rf"{_CANT} (?:breathe|breathing|breath)",
+        r"(?:can'?t|cannot|can not|unable to|not able to) (?:catch|get) my breath",
+        r"(?:can'?t|cannot|can not|unable to|not able to) get (?:enough )?air",
+        r"short(?:ness)? of breath",
+        r"breathless(?:ness)?",
+        r"(?:gasping|struggling) for (?:air|breath)",
+        r"labou?red breathing",
+        r"choking|suffocating",
+    ],
+    "bleeding": [
+        r"(?:severe|heavy|heavily|uncontrolled|profuse|lots? of) bleeding",
+        r"bleeding (?:heavily|a lot|badly|profusely)",
+        r"bleeding (?:that )?(?:won'?t|will not|doesn'?t|does not) stop",
+        r"(?:vomiting|coughing|throwing)(?: up)? blood",
+    ],
+    "consciousness": [
+        r"(?:lost|loss of|losing) consciousness",
+        r"passed out|blacked out|fainted|fainting",
+        r"unconscious|unresponsive",
+        r"(?:severe|extreme|sudden) confusion",
+    ],
+    "stroke": [
+        r"(?:face|facial) (?:droops?|drooping|is drooping)",
+        r"drooping (?:face|mouth)",
+        r"(?:arm|leg) (?:weakness|is weak|went weak)",
+        r"weakness (?:in|on) (?:one|my|the) (?:side|arm|leg)",
+        r"numb(?:ness)? on one side",
+        r"slurr(?:ed|ing) (?:speech|words)",
+        r"(?:having|signs of|symptoms of)(?: a)? stroke",
+    ],
+    "suicidal": [
+        r"suicid(?:e|al)",
+        r"kill(?:ing)? myself",
+        r"end(?:ing)? (?:my (?:own )?life|it all)",
+        r"take my own life",
+        r"want(?:ed)? to die",
+        r"(?:don'?t|do not) want to (?:live|be alive)",
+        r"self[- ]?harm(?:ing)?",
+        r"(?:want|wanting|going|thinking about|thoughts of|urge to) (?:to )?(?:hurt|harm|cut)(?:ing)? myself",
+    ],
+}
+
+# one compiled alternation, one named group per category -> a single scan per message.
+# Text is lower-cased once in screen_text, which is cheaper than re.IGNORECASE on every branch.
+EMERGENCY_RE = re.compile(
+    "|".join(f"(?P<{cat}>\\b(?:{'|'.join(pats)})\\b)" for cat, pats in EMERGENCY_PATTERNS.items())
+)
+
+# ================= WHAT CANCELS A MATCH =================
+# A cue cancels a match only when it governs it: same clause, and nothing but filler words
+# in between ("no chest pain", "don't have any shortness of breath", "I'm not suicidal").
+# "no energy and chest pain" keeps the chest pain: "and" / "with" start a new clause.
+NEGATION_RE = re.compile(
+    r"\b(?:no|not|never|without|denies|deny|denied|don'?t|doesn'?t|didn'?t|isn'?t|wasn'?t|haven'?t|hasn'?t|hadn'?t|aren'?t|free of|negative for|ruled out)\b",
+    re.IGNORECASE,
+)
+CLAUSE_BREAK_RE = re.compile(r"[.;:!?,]|\b(?:but|however|though|and|with)\b", re.IGNORECASE)
+NEGATION_WINDOW_WORDS = 3  # filler words allowed between the cue and the match
+NEGATION_FILLER_WORDS = frozenset(
+    "i have has had having been any a an experiencing experienced feel feeling felt get getting got "
+    "signs sign symptoms of history real significant new further more current currently recent".split()
+)
+# "never had chest pain this bad" / "... like this" / "... before": negated words, present pain
+STILL_PRESENT_RE = re.compile(
+    r"\s*(?:(?:this|that|so) (?:bad|severe|strong|intense|painful)|like (?:this|that)|before|until (?:now|today)|till (?:now|today))\b"
+)
+# someone else's past ("my dad had a heart attack last year", "family history of stroke"). Someone
+# else in danger now ("my dad is having a heart attack") still gets the emergency reply.
+SUBJECT_RE = re.compile(
+    r"(?P<self>\b(?:i|i'm|i've|i'd|me)\b)"
+    r"|(?P<other>\b(?:(?:my|his|her|their|our) (?:dad|father|mom|mother|mum|brother|sister|son|daughter|husband|wife|"
+    r"grand\w+|uncle|aunt|cousin|friend|partner|parents?|family|neighbou?r|colleague)|he|she|they|family history)\b)"
+)
+PAST_RE = re.compile(r"\b(?:had|was|were|died|passed away|history|used to|ago|last (?:year|month|week|night))\b")
+
+
+@dataclass(frozen=True)
+class EmergencyMatch:
+    category: str
+    matched_text: str
+
+
+def _clause(text: str, start: int, end: int) -> tuple[str, str]:
+    """The words before and after text[start:end] inside its clause."""
+    prefix = text[max(0, start - 80):start]
+    breaks = list(CLAUSE_BREAK_RE.finditer(prefix))
+    if breaks:
+        prefix = prefix[breaks[-1].end():]
+    suffix = text[end:end + 60]
+    next_break = CLAUSE_BREAK_RE.search(suffix)
+    if next_break:
+        suffix = suffix[:next_break.start()]
+    return prefix, suffix
+
+
+def _is_negated(text: str, start: int, end: Optional[int] = None) -> bool:
+    prefix, suffix = _clause(text, start, start if end is None else end)
+    for cue in NEGATION_RE.finditer(prefix):
+        between = prefix[cue.end():].split()
+        if len(between) <= NEGATION_WINDOW_WORDS and all(word in NEGATION_FILLER_WORDS for word in between):
+            return STILL_PRESENT_RE.match(suffix) is None
+    return False
+
+
+def _is_someone_elses_history(text: str, start: int, end: int) -> bool:
+    prefix, suffix = _clause(text, start, end)
+    subjects = list(SUBJECT_RE.finditer(prefix))
+    return bool(subjects) and subjects[-1].lastgroup == "other" and PAST_RE.search(f"{prefix} {suffix}") is not None
+
+
+def screen_text(text: str) -> Optional[EmergencyMatch]:
+    """Return the first danger sign in text that is neither negated nor someone else's history, or None."""
+    if not text:
+        return None
+    text = text.lower().replace("’", "'")
+    for match in EMERGENCY_RE.finditer(text):
+        if not (_is_negated(text, match.start(), match.end()) or _is_someone_elses_history(text, match.start(), match.end())):
+            return EmergencyMatch(category=match.lastgroup, matched_text=match.group(0))
+    return None
+
+
+def screen_content(content: Optional["Content"]) -> Optional[EmergencyMatch]:
+    """screen_text over every text part of a user message."""
+    if content is None or not content.parts:
+        return None
+    return screen_text(" . ".join(part.text for part in content.parts if getattr(part, "text", None)))
+
+
+def emergency_content() -> "Content":
+    from google.genai.types import Content, Part
+
+    return Content(role="model", parts=[Part(text=EMERGENCY_RESPONSE)])
+
+
+# ================= HOOKS INTO THE RUNNER PATH =================
+async def emergency_short_circuit(session_service, app_name: str, user_id: str, session_id: str, new_message: "Content", author: str) -> Optional[str]:
+    """
+    Call before runner.run_async. When the message shows a danger sign, record the
+    user message and the emergency reply in the session and return the reply text;
+    otherwise return None and let the agent run as usual.
+    """
+    match = screen_content(new_message)
+    if match is None:
+        return None
+    from google.adk.events import Event
+
+    session = await session_service.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+    if session is not None:
+        await session_service.append_event(session, Event(author="user", content=new_message))
+        await session_service.append_event(
+            session,
+            Event(author=author, content=emergency_content(), custom_metadata={"emergency_prescreen": match.category}),
+        )
+    return EMERGENCY_RESPONSE
+
+
+def emergency_before_agent_callback(callback_context) -> Optional["Content"]:
+    """before_agent_callback for Tara: skips the model entirely when the user message is an emergency (ADK Web path)."""
+    if screen_content(callback_context.user_content) is None:
+        return None
+    return emergency_content()
@@ -0,0 +1,126 @@
+# enrichment.py
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Optional
+
+from google.adk.tools import FunctionTool, ToolContext
+
+try:
+    from . import metrics
+    from .governor import Priority, priority
+except ImportError:
+    import metrics
+    from governor import Priority, priority
+
+# ================= PHASE 4 SUB-QUERIES =================
+# same four searches Tara's instruction lists for PHASE 4
+ENRICHMENT_QUERIES = {
+    "weather": "current weather {location} temperature humidity AQI",
+    "outbreaks": "disease outbreak {location} {year}",
+    "pollen": "pollen count {location} today",
+    "symptom_causes": "symptoms {symptoms} medical causes",
+}
+
+DEFAULT_QUERY_TIMEOUT = 8.0  # seconds, per sub-query
+
+SearchFn = Callable[[str], Awaitable[Any]]
+
+
+def build_enrichment_queries(location: str, symptoms: str, year: Optional[int] = None) -> dict[str, str]:
+    values = {"location": location.strip(), "symptoms": symptoms.strip(), "year": year or datetime.now().year}
+    return {key: template.format(**values) for key, template in ENRICHMENT_QUERIES.items()}
+
+
+async def run_enrichment(
+    search: SearchFn, location: str, symptoms: str, timeout: float = DEFAULT_QUERY_TIMEOUT, year: Optional[int] = None
+) -> dict:
+    """
+    Run every PHASE 4 query at once and merge the answers.
+    Each query gets its own timeout; a slow or failing one (or one the outbound
+    governor refused) is reported under "unavailable" and never holds back the others.
+    Their model calls queue behind interactive and emergency turns (Priority.ENRICHMENT).
+    """
+    queries = build_enrichment_queries(location, symptoms, year)
+    started = time.perf_counter()
+
+    async def one(query: str):
+        return await asyncio.wait_for(search(query), timeout)
+
+    with priority(Priority.ENRICHMENT):
+        # the gathered tasks copy the context, priority included
+        results = await asyncio.gather(*(one(q) for q in queries.values()), return_exceptions=True)
+
+    merged: dict[str, Any] = {"location": location, "symptoms": symptoms}
+    unavailable: dict[str, str] = {}
+    for key, result in zip(queries, results):
+        if isinstance(result, asyncio.TimeoutError):
+            unavailable[key] = f"timed out after {timeout:g}s"
+            merged[key] = None
+        elif isinstance(result, BaseException):
+            unavailable[key] = f"{type(result).__name__}: {result}"
+            merged[key] = None
+        else:
+            merged[key] = result if isinstance(result, str) else str(result)
+    merged["unavailable"] = unavailable
+    merged["logged_search_queries"] = list(queries.values())
+    merged["elapsed_ms"] = round((time.perf_counter() - started) * 1000)
+    return merged
+
+
+# ================= FUNCTION TOOL FOR TARA =================
+class _FanOutToolContext:
+    """
+    Tool context for one fan-out sub-query: everything comes from the real context except the
+    state, which is a private copy. AgentTool copies the sub-agent's state_delta into
+    tool_context.state, and all four searches write the same output_key; with the shared
+    context the session kept whichever finished last. The merged dict is the only result.
+    """
+
+    def __init__(self, tool_context: ToolContext):
+        from google.adk.sessions.state import State
+
+        self._tool_context = tool_context
+        self.state = State(value=dict(tool_context.state.to_dict()), delta={})
+
+    def __getattr__(self, name: str):
+        return getattr(self._tool_context, name)
+
+
+def build_enrichment_tool(search_tool, timeout: float = DEFAULT_QUERY_TIMEOUT, year: Optional[int] = None) -> FunctionTool:
+    """
+    Wrap run_enrichment as a function tool. search_tool is the (cached) AgentTool
+    around google_search_agent, so every sub-query goes through the search cache.
+    year pins the outbreak query (recorded eval cassettes must not depend on the date).
+    """
+
+    async def enrich_patient_context(location: str, symptoms: str, tool_context: ToolContext) -> dict:
+        """
+        PHASE 4 contextual enrichment in one call. Searches weather/AQI, local
+        disease outbreaks, pollen count and medical causes of the symptoms in
+        parallel and returns one merged result.
+
+        Args:
+          location: The patient's city / area (pincode if known).
+          symptoms: All reported symptoms as one comma separated string.
+
+        Returns:
+          dict with weather, outbreaks, pollen, symptom_causes (None when that
+          search was unavailable), unavailable (reasons) and logged_search_queries.
+        """
+
+        async def search(query: str):
+            return await search_tool.run_async(args={"request": query}, tool_context=_FanOutToolContext(tool_context))
+
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            with metrics.span("tool.enrich_patient_context", phase="PHASE 4"):
+                result = await run_enrichment(search, location, symptoms, timeout=timeout, year=year)
+            outcome = "partial" if result.get("unavailable") else "ok"
+            return result
+        finally:
+            metrics.TOOL_CALLS.inc(tool="enrich_patient_context", phase="PHASE 4", outcome=outcome)
+            metrics.TOOL_SECONDS.observe(time.perf_counter() - started, tool="enrich_patient_context", phase="PHASE 4")
+
+    return FunctionTool(enrich_patient_context)
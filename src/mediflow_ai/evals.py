@@ -0,0 +1,520 @@
+# evals.py
+# ================= OFFLINE EVAL RUNNER FOR tests/mediflow_evalset.json =================
+# Runs every eval case through ChatService (same path as the server: emergency pre-screen,
+# intake form, Tara) with up to --workers cases at once, each on its own temporary database.
+#
+#   --mode record   real model + Google Search; every model request/response and every search
+#                   result is written to the cassette store (content addressed: the file name is
+#                   the sha256 of the canonical request / normalized query)
+#   --mode replay   no network: model calls and searches are answered from the cassettes,
+#                   a request that was never recorded fails its case (CassetteMiss)
+#   --mode live     real calls, nothing recorded
+#   --golden        (with --mode record) no model at all: Tara answers with the evalset's own
+#                   expected tool calls and final responses (GoldenLlm), the search agent with the
+#                   expected search results; cassettes that pin the pipeline around the model
+#                   (intake, emergency screen, tools, context window) without an API key
+#
+# Scores follow tests/test_config.json: tool_trajectory_avg_score (exact name + args match per
+# invocation) and response_match_score (ROUGE-1 F1 against the expected final response).
+#
+# python -m mediflow_ai.evals --mode record   (once, with GOOGLE_API_KEY)
+# python -m mediflow_ai.evals                 (replay, seconds, offline)
+#
+# The committed tests/cassettes were recorded with --mode record --golden.
+import argparse
+import asyncio
+import dataclasses
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from typing import Any, AsyncGenerator, Optional
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai.types import Content, FunctionCall, Part
+
+try:
+    from .agent import create_app, resolve_model
+    from .chat_service import ChatService
+    from .config import MediFlowConfig
+    from .search_cache import normalize_query
+except ImportError:
+    from agent import create_app, resolve_model
+    from chat_service import ChatService
+    from config import MediFlowConfig
+    from search_cache import normalize_query
+
+EVALSET_PATH = os.path.join("tests", "mediflow_evalset.json")
+EVAL_CONFIG_PATH = os.path.join("tests", "test_config.json")
+CASSETTE_DIR = os.path.join("tests", "cassettes")
+DEFAULT_CRITERIA = {"tool_trajectory_avg_score": 1.0, "response_match_score": 0.8}
+DEFAULT_WORKERS = 8
+MODES = ("replay", "record", "live")
+# the PHASE 4 outbreak query names the year; recorded cassettes must not expire on January 1st
+EVAL_ENRICHMENT_YEAR = 2025
+
+# request config fields that differ between runs without changing the answer
+VOLATILE_CONFIG_FIELDS = ("http_options", "labels", "cached_content")
+# ADK gives function calls without a model supplied id a random "adk-<uuid>"
+CLIENT_CALL_ID_PREFIX = "adk-"
+# tool results that change from run to run (enrich_patient_context's wall time)
+VOLATILE_RESULT_FIELDS = ("elapsed_ms",)
+# preload_memory's recall block: timestamped, and whether the turn just saved is in it depends on timing
+PRELOADED_MEMORY_MARKER = "<PAST_CONVERSATIONS>"
+WORD_RE = re.compile(r"\w+")
+
+
+class CassetteMiss(KeyError):
+    """Replay mode: the request was never recorded."""
+
+
+# ================= CONTENT ADDRESSED CASSETTES =================
+def _strip_volatile(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {
+            key: _strip_volatile(item)
+            for key, item in value.items()
+            if not (key == "id" and isinstance(item, str) and item.startswith(CLIENT_CALL_ID_PREFIX))
+            and key not in VOLATILE_RESULT_FIELDS
+        }
+    if isinstance(value, list):
+        return [_strip_volatile(item) for item in value]
+    return value
+
+
+def canonical_request(llm_request: LlmRequest) -> dict:
+    """What the model's answer depends on: contents, system instruction, tools and generation config (recalled memory left out)."""
+    config = llm_request.config.model_dump(mode="json", exclude_none=True) if llm_request.config else {}
+    for name in VOLATILE_CONFIG_FIELDS:
+        config.pop(name, None)
+    contents = []
+    for content in llm_request.contents or []:
+        dumped = content.model_dump(mode="json", exclude_none=True)
+        dumped["parts"] = [part for part in dumped.get("parts", []) if PRELOADED_MEMORY_MARKER not in (part.get("text") or "")]
+        if dumped["parts"]:
+            contents.append(dumped)
+    return _strip_volatile({"contents": contents, "config": config})
+
+
+def content_key(payload: Any) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+class CassetteStore:
+    """
+    One JSON file per exchange: <root>/<kind>/<key[:2]>/<key>.json.
+    The same request recorded twice keeps the last answer; files are written atomically,
+    so concurrent cases can record into one store.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._loaded: dict[tuple[str, str], dict] = {}
+        self.stats = {"hits": 0, "misses": 0, "writes": 0}
+
+    def _path(self, kind: str, key: str) -> str:
+        return os.path.join(self.root, kind, key[:2], f"{key}.json")
+
+    def get(self, kind: str, key: str) -> Optional[dict]:
+        record = self._loaded.get((kind, key))
+        if record is None:
+            try:
+                with open(self._path(kind, key), encoding="utf-8") as f:
+                    record = json.load(f)
+            except FileNotFoundError:
+                self.stats["misses"] += 1
+                return None
+            self._loaded[(kind, key)] = record
+        self.stats["hits"] += 1
+        return record
+
+    def put(self, kind: str, key: str, record: dict):
+        path = self._path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{id(record)}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+        self._loaded[(kind, key)] = record
+        self.stats["writes"] += 1
+
+
+class RecordingLlm(BaseLlm):
+    """Passes every call to the real model and writes the request and its responses to the cassettes."""
+
+    inner: BaseLlm
+    cassettes: CassetteStore
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        request = canonical_request(llm_request)
+        responses = []
+        async for response in self.inner.generate_content_async(llm_request, stream=stream):
+            responses.append(response.model_dump(mode="json", exclude_none=True))
+            yield response
+        self.cassettes.put(
+            "model",
+            content_key(request),
+            {"model": self.inner.model, "source": type(self.inner).__name__, "request": request, "responses": responses},
+        )
+
+
+class ReplayLlm(BaseLlm):
+    """Answers from the cassettes only; never touches the network."""
+
+    cassettes: CassetteStore
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        key = content_key(canonical_request(llm_request))
+        record = self.cassettes.get("model", key)
+        if record is None:
+            raise CassetteMiss(f"no recorded model response for request {key[:12]} (run with --mode record)")
+        for response in record["responses"]:
+            yield LlmResponse.model_validate(response)
+
+
+class GoldenLlm(BaseLlm):
+    """
+    Plays the evalset's expected trajectory back as the model (--mode record --golden).
+    A request whose latest user message is an evalset turn gets that turn's expected tool
+    calls, then (once their results are in the request) its expected final response. Any
+    other request is a search agent query: answered with the expected search result for
+    that request, or a neutral "nothing found".
+    """
+
+    replies: dict  # user text -> (expected tool calls, expected final response text)
+    search_results: dict  # search agent request -> expected result text
+
+    @classmethod
+    def from_evalset(cls, evalset: dict, model: str) -> "GoldenLlm":
+        replies, search_results = {}, {}
+        for case in evalset["eval_cases"]:
+            conversation = case["conversation"]
+            for index, invocation in enumerate(conversation):
+                user_text = _text(invocation.get("user_content")).strip()
+                if not user_text:
+                    continue
+                final = invocation.get("final_response")
+                # an empty user turn right after holds the answer (see run_case)
+                if not final and index + 1 < len(conversation) and not _text(conversation[index + 1].get("user_content")).strip():
+                    final = conversation[index + 1].get("final_response")
+                replies[user_text] = (_expected_tools(invocation), _text(final))
+                responses = dict((name, parts) for name, parts in (invocation.get("intermediate_data") or {}).get("intermediate_responses") or [])
+                for tool in _expected_tools(invocation):
+                    if "request" in tool["args"] and tool["name"] in responses:
+                        search_results[tool["args"]["request"]] = "".join(part.get("text") or "" for part in responses[tool["name"]])
+        # named after the model it stands in for: ADK only attaches google_search for Gemini models
+        return cls(model=model, replies=replies, search_results=search_results)
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        contents = llm_request.contents or []
+        user_text, answered = "", False
+        for content in reversed(contents):
+            parts = content.parts or []
+            answered = answered or any(part.function_response for part in parts)
+            texts = [part.text.strip() for part in parts if part.text and PRELOADED_MEMORY_MARKER not in part.text]
+            if content.role == "user" and texts:
+                user_text = texts[-1]
+                break
+        if user_text in self.replies:
+            tool_calls, final_text = self.replies[user_text]
+            if tool_calls and not answered:
+                parts = [Part(function_call=FunctionCall(name=tool["name"], args=tool["args"])) for tool in tool_calls]
+            else:
+                parts = [Part(text=final_text)]
+        else:
+            parts = [Part(text=self.search_results.get(user_text) or f"No notable results for: {user_text}")]
+        yield LlmResponse(content=Content(role="model", parts=parts))
+
+
+class CassetteSearch:
+    """
+    Stands in for SearchCache in front of CachedAgentTool: in replay mode a recorded
+    google_search_agent result is returned without running the search agent, in record
+    mode every fresh result is written to the cassettes. Keyed by the normalized query.
+    """
+
+    def __init__(self, cassettes: CassetteStore, mode: str):
+        self.cassettes = cassettes
+        self.mode = mode
+
+    async def get(self, query: str) -> Optional[str]:
+        if self.mode != "replay":
+            return None
+        record = self.cassettes.get("search", content_key(normalize_query(query)))
+        return record["result"] if record else None
+
+    async def put(self, query: str, result: str) -> str:
+        if self.mode == "record":
+            self.cassettes.put("search", content_key(normalize_query(query)), {"query": query, "result": result})
+        return "cassette"
+
+    async def purge_expired(self) -> int:
+        return 0
+
+
+# ================= SCORES =================
+def rouge1_f1(expected: str, actual: str) -> float:
+    """Unigram overlap F1 (ROUGE-1 F-measure without stemming), case-insensitive."""
+    expected_words = Counter(WORD_RE.findall(expected.lower()))
+    actual_words = Counter(WORD_RE.findall(actual.lower()))
+    overlap = sum((expected_words & actual_words).values())
+    if not overlap:
+        return 0.0
+    precision = overlap / sum(actual_words.values())
+    recall = overlap / sum(expected_words.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def _text(content: Optional[dict]) -> str:
+    if not content:
+        return ""
+    return "".join(part.get("text") or "" for part in content.get("parts") or [])
+
+
+def _expected_tools(invocation: dict) -> list[dict]:
+    tool_uses = (invocation.get("intermediate_data") or {}).get("tool_uses") or []
+    return [{"name": tool["name"], "args": tool.get("args") or {}} for tool in tool_uses]
+
+
+def _mean(values: list[float]) -> Optional[float]:
+    return round(sum(values) / len(values), 4) if values else None
+
+
+# ================= ONE CASE =================
+@dataclass
+class TurnOutcome:
+    invocation_id: str
+    user_text: str
+    reply: str
+    tool_uses: list
+    latency_ms: float
+    tool_trajectory_score: Optional[float] = None
+    response_match_score: Optional[float] = None
+
+
+@dataclass
+class CaseResult:
+    eval_id: str
+    tool_trajectory_avg_score: Optional[float] = None
+    response_match_score: Optional[float] = None
+    latency_ms: float = 0.0
+    passed: bool = False
+    error: Optional[str] = None
+    turns: list = field(default_factory=list)
+
+
+async def run_case(case: dict, config: MediFlowConfig, model: Any, search_cache: Any, criteria: dict) -> CaseResult:
+    """Run one eval case on a fresh app; its database lives in config.db_path."""
+    result = CaseResult(eval_id=case["eval_id"])
+    app = create_app(config, model=model, search_cache=search_cache)
+    chat = ChatService(app)
+    session_input = case.get("session_input") or {}
+    user_id = session_input.get("user_id") or config.user_id
+    session_id = f"eval-{case['eval_id']}"
+    started = time.perf_counter()
+    try:
+        await app.session_service.create_session(
+            app_name=app.config.app_name, user_id=user_id, state=session_input.get("state") or {}, session_id=session_id
+        )
+        seen_events = 0
+        reply = ""
+        for invocation in case["conversation"]:
+            user_text = _text(invocation.get("user_content"))
+            tool_uses: list[dict] = []
+            turn_started = time.perf_counter()
+            # an empty user turn in the evalset holds the expected answer to the previous message
+            if user_text.strip():
+                reply = (await chat.chat(user_id, session_id, user_text)).reply
+                session = await app.session_service.get_session(
+                    app_name=app.config.app_name, user_id=user_id, session_id=session_id
+                )
+                for event in session.events[seen_events:]:
+                    if event.author == app.root_agent.name:
+                        tool_uses.extend({"name": call.name, "args": call.args or {}} for call in event.get_function_calls())
+                seen_events = len(session.events)
+            turn = TurnOutcome(
+                invocation_id=invocation.get("invocation_id", ""),
+                user_text=user_text,
+                reply=reply,
+                tool_uses=tool_uses,
+                latency_ms=round((time.perf_counter() - turn_started) * 1000, 2),
+                tool_trajectory_score=1.0 if tool_uses == _expected_tools(invocation) else 0.0,
+            )
+            if invocation.get("final_response"):
+                turn.response_match_score = round(rouge1_f1(_text(invocation["final_response"]), reply), 4)
+            result.turns.append(turn)
+    except Exception as exc:
+        result.error = f"{type(exc).__name__}: {exc}"
+    finally:
+        result.latency_ms = round((time.perf_counter() - started) * 1000, 2)
+        await chat.close()
+
+    result.tool_trajectory_avg_score = _mean([t.tool_trajectory_score for t in result.turns])
+    result.response_match_score = _mean([t.response_match_score for t in result.turns if t.response_match_score is not None])
+    result.passed = result.error is None and all(
+        score is None or score >= criteria[name]
+        for name, score in (
+            ("tool_trajectory_avg_score", result.tool_trajectory_avg_score),
+            ("response_match_score", result.response_match_score),
+        )
+    )
+    return result
+
+
+# ================= THE SUITE =================
+@dataclass
+class EvalReport:
+    eval_set_id: str
+    mode: str
+    workers: int
+    criteria: dict
+    cases: list
+    elapsed_ms: float = 0.0
+    cassettes: Optional[dict] = None
+
+    @property
+    def passed(self) -> bool:
+        return all(case.passed for case in self.cases)
+
+    def to_dict(self) -> dict:
+        return {
+            **asdict(self),
+            "passed": self.passed,
+            "tool_trajectory_avg_score": _mean([c.tool_trajectory_avg_score for c in self.cases if c.tool_trajectory_avg_score is not None]),
+            "response_match_score": _mean([c.response_match_score for c in self.cases if c.response_match_score is not None]),
+        }
+
+
+def load_criteria(path: str = EVAL_CONFIG_PATH) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return {**DEFAULT_CRITERIA, **json.load(f).get("criteria", {})}
+    except FileNotFoundError:
+        return dict(DEFAULT_CRITERIA)
+
+
+def _eval_model(config: MediFlowConfig, mode: str, cassettes: Optional[CassetteStore], golden: Optional[GoldenLlm] = None):
+    if mode == "replay":
+        return ReplayLlm(model=f"replay:{config.model}", cassettes=cassettes)
+    model = golden or resolve_model(config.model)
+    if not isinstance(model, BaseLlm):
+        from google.adk.models.registry import LLMRegistry
+
+        model = LLMRegistry.new_llm(model)
+    if mode == "record":
+        return RecordingLlm(model=model.model, inner=model, cassettes=cassettes)
+    return model
+
+
+async def run_evalset(
+    evalset_path: str = EVALSET_PATH,
+    mode: str = "replay",
+    cassette_dir: str = CASSETTE_DIR,
+    workers: int = DEFAULT_WORKERS,
+    config: Optional[MediFlowConfig] = None,
+    criteria: Optional[dict] = None,
+    case_ids: Optional[list[str]] = None,
+    golden: bool = False,
+) -> EvalReport:
+    """Run the eval cases, at most `workers` at a time, and score them. golden: record from GoldenLlm."""
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}, not {mode!r}")
+    if golden and mode != "record":
+        raise ValueError("golden only applies to --mode record")
+    with open(evalset_path, encoding="utf-8") as f:
+        evalset = json.load(f)
+    cases = [case for case in evalset["eval_cases"] if not case_ids or case["eval_id"] in case_ids]
+    criteria = criteria or load_criteria()
+    # provider prompt caches and the maintenance schedule would only add network calls / noise
+    base_config = dataclasses.replace(
+        config or MediFlowConfig.from_env(), configure_logging=False, prompt_cache=False, maintenance_interval=0,
+        enrichment_year=EVAL_ENRICHMENT_YEAR,
+    )
+    cassettes = CassetteStore(cassette_dir) if mode != "live" else None
+    model = _eval_model(base_config, mode, cassettes, GoldenLlm.from_evalset(evalset, base_config.model) if golden else None)
+    search_cache = CassetteSearch(cassettes, mode) if cassettes is not None else None
+
+    db_dir = tempfile.mkdtemp(prefix="mediflow_eval_")
+    slots = asyncio.Semaphore(max(1, workers))
+
+    async def one(index: int, case: dict) -> CaseResult:
+        async with slots:
+            case_config = dataclasses.replace(base_config, db_path=os.path.join(db_dir, f"case-{index:03d}.db"))
+            return await run_case(case, case_config, model, search_cache, criteria)
+
+    started = time.perf_counter()
+    try:
+        results = await asyncio.gather(*(one(index, case) for index, case in enumerate(cases)))
+    finally:
+        shutil.rmtree(db_dir, ignore_errors=True)
+    return EvalReport(
+        eval_set_id=evalset.get("eval_set_id", ""),
+        mode=mode,
+        workers=workers,
+        criteria=criteria,
+        cases=list(results),
+        elapsed_ms=round((time.perf_counter() - started) * 1000, 2),
+        cassettes=dict(cassettes.stats) if cassettes is not None else None,
+    )
+
+
+def _print_report(report: EvalReport):
+    print(f"{report.eval_set_id}: {len(report.cases)} cases, mode={report.mode}, workers={report.workers}")
+    print(f"{'case':<45} {'trajectory':>10} {'response':>9} {'ms':>9}  result")
+    for case in report.cases:
+        trajectory = "-" if case.tool_trajectory_avg_score is None else f"{case.tool_trajectory_avg_score:.2f}"
+        response = "-" if case.response_match_score is None else f"{case.response_match_score:.2f}"
+        verdict = "PASS" if case.passed else "FAIL" + (f" ({case.error})" if case.error else "")
+        print(f"{case.eval_id:<45} {trajectory:>10} {response:>9} {case.latency_ms:>9.1f}  {verdict}")
+    summary = report.to_dict()
+    print(
+        f"tool_trajectory_avg_score {summary['tool_trajectory_avg_score']} "
+        f"(>= {report.criteria['tool_trajectory_avg_score']}), response_match_score {summary['response_match_score']} "
+        f"(>= {report.criteria['response_match_score']}) in {report.elapsed_ms / 1000:.2f}s"
+    )
+    if report.cassettes is not None:
+        print(f"cassettes: {report.cassettes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the MediFlow evalset, recording or replaying model and search calls.")
+    parser.add_argument("--evalset", default=EVALSET_PATH)
+    parser.add_argument("--eval-config", default=EVAL_CONFIG_PATH)
+    parser.add_argument("--mode", choices=MODES, default="replay")
+    parser.add_argument("--cassettes", default=CASSETTE_DIR)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--case", action="append", dest="cases", help="only this eval_id (repeatable)")
+    parser.add_argument("--json", action="store_true", help="print the full report as JSON")
+    parser.add_argument("--golden", action="store_true", help="record mode: the evalset's expected answers stand in for the model")
+    args = parser.parse_args()
+    if args.golden and args.mode != "record":
+        parser.error("--golden needs --mode record")
+
+    report = asyncio.run(
+        run_evalset(
+            args.evalset, mode=args.mode, cassette_dir=args.cassettes, workers=args.workers,
+            criteria=load_criteria(args.eval_config), case_ids=args.cases, golden=args.golden,
+        )
+    )
+    if args.json:
+        print(json.dumps(report.to_dict(), indent=2, ensure_ascii=False, default=str))
+    else:
+        _print_report(report)
+    raise SystemExit(0 if report.passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+# export.py
+# ================= TRANSCRIPTS -> PARTITIONED PARQUET FOR ANALYTICS =================
+# python -m mediflow_ai.export --out exports/transcripts [--db PATH] [--chunk-rows 5000] [--full]
+#
+#   exports/transcripts/
+#       _export_state.json                       watermark (last messages.id exported)
+#       event_date=2025-01-31/part-1-48211.parquet
+#       event_date=2025-02-01/part-48212-50977.parquet   <- next incremental run
+#
+# messages is read in chunks of chunk_rows rows ordered by (session_id, event_index), keyset
+# paginated on the unique index, so memory stays flat however many rows there are. A run exports
+# the rows inserted since the watermark (messages.id is AUTOINCREMENT) up to MAX(id) at its start;
+# the watermark only moves once every file of the run is closed, so a failed run is simply redone
+# (same file names). Sessions restored from the archive get new ids and are exported again:
+# dedupe on (session_id, event_index). Archived-only sessions are not exported.
+#
+# A sharded store (sharding.py) is exported shard by shard into the same partitions, as
+# part-shard<i>of<n>-<first id>-<last id>.parquet, with one watermark per shard in the state
+# file (ids are per file). After re-sharding, start a new folder with --full.
+#
+# Needs pyarrow, the "export" extra (pip install "mediflow_ai[export]"); iter_frames() also needs pandas.
+import argparse
+import asyncio
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional, Union
+
+try:
+    from .sqlite_store import SessionStore
+except ImportError:
+    from sqlite_store import SessionStore
+
+DEFAULT_CHUNK_ROWS = 5000
+STATE_FILE = "_export_state.json"
+PARQUET_COMPRESSION = "zstd"
+UNKNOWN_DATE = "unknown"  # rows saved before event_time existed and without a usable timestamp
+
+EXPORT_COLUMNS = (
+    "id, session_id, event_index, event_time, author, role, invocation_id, text, metadata, "
+    "prompt_tokens, candidates_tokens, cached_tokens, total_tokens, event_json"
+)
+
+MAX_ID_SQL = "SELECT MAX(id) FROM messages"
+
+# full export: one walk over idx_messages_session_event
+SELECT_ALL_CHUNK_SQL = f"""
+SELECT {EXPORT_COLUMNS} FROM messages
+WHERE (session_id, event_index) > (?, ?) AND id <= ?
+ORDER BY session_id, event_index
+LIMIT ?
+"""
+
+# incremental export: the sessions with new rows (rowid range scan over the new rows only) ...
+SELECT_TOUCHED_SESSIONS_SQL = """
+SELECT session_id, MIN(event_index) FROM messages
+WHERE id > ? AND id <= ?
+GROUP BY session_id
+ORDER BY session_id
+"""
+
+# ... then each of them from its first new event_index on
+SELECT_SESSION_CHUNK_SQL = f"""
+SELECT {EXPORT_COLUMNS} FROM messages
+WHERE session_id = ? AND event_index >= ? AND id > ? AND id <= ?
+ORDER BY event_index
+LIMIT ?
+"""
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as exc:
+        raise RuntimeError(
+            'Parquet/Arrow export needs pyarrow, the "export" extra: pip install "mediflow_ai[export]"'
+        ) from exc
+    return pyarrow, pyarrow.parquet
+
+
+def arrow_schema(include_event_json: bool = False):
+    pa, _ = _pyarrow()
+    fields = [
+        ("session_id", pa.string()),
+        ("event_index", pa.int64()),
+        ("event_time", pa.timestamp("us", tz="UTC")),
+        ("author", pa.string()),
+        ("role", pa.string()),
+        ("invocation_id", pa.string()),
+        ("text", pa.string()),
+        ("prompt_tokens", pa.int64()),
+        ("candidates_tokens", pa.int64()),
+        ("cached_tokens", pa.int64()),
+        ("total_tokens", pa.int64()),
+        # decoded from event_json / metadata
+        ("function_calls", pa.list_(pa.string())),
+        ("function_responses", pa.list_(pa.string())),
+        ("finish_reason", pa.string()),
+        ("error_code", pa.string()),
+        ("emergency_category", pa.string()),
+        ("custom_metadata", pa.string()),  # anything else in custom_metadata, as JSON
+        ("saved_event_timestamp", pa.float64()),  # metadata.event_timestamp of rows saved before event_time
+    ]
+    if include_event_json:
+        fields.append(("event_json", pa.string()))
+    return pa.schema(fields)
+
+
+# ================= DECODING ONE CHUNK =================
+def _decode_row(row: tuple, include_event_json: bool) -> tuple[str, dict]:
+    """(event_date partition, column values) for one messages row."""
+    (_, session_id, event_index, event_time, author, role, invocation_id, text, metadata_json,
+     prompt_tokens, candidates_tokens, cached_tokens, total_tokens, event_json) = row
+    try:
+        metadata = json.loads(metadata_json) if metadata_json else {}
+        saved_timestamp = float(metadata["event_timestamp"]) if "event_timestamp" in metadata else None
+    except (TypeError, ValueError):
+        saved_timestamp = None
+    event = json.loads(event_json) if event_json else {}
+    parts = (event.get("content") or {}).get("parts") or []
+    custom = dict(event.get("custom_metadata") or {})
+    emergency = custom.pop("emergency_prescreen", None)
+
+    when = event_time if event_time is not None else saved_timestamp
+    values = {
+        "session_id": session_id,
+        "event_index": event_index,
+        "event_time": int(when * 1_000_000) if when is not None else None,
+        "author": author,
+        "role": role,
+        "invocation_id": invocation_id,
+        "text": text,
+        "prompt_tokens": prompt_tokens,
+        "candidates_tokens": candidates_tokens,
+        "cached_tokens": cached_tokens,
+        "total_tokens": total_tokens,
+        "function_calls": [p["function_call"].get("name") for p in parts if p.get("function_call")],
+        "function_responses": [p["function_response"].get("name") for p in parts if p.get("function_response")],
+        "finish_reason": event.get("finish_reason"),
+        "error_code": event.get("error_code"),
+        "emergency_category": emergency,
+        "custom_metadata": json.dumps(custom) if custom else None,
+        "saved_event_timestamp": saved_timestamp,
+    }
+    if include_event_json:
+        values["event_json"] = event_json
+    date = datetime.fromtimestamp(when, timezone.utc).strftime("%Y-%m-%d") if when is not None else UNKNOWN_DATE
+    return date, values
+
+
+def decode_chunk(rows: list[tuple], include_event_json: bool = False) -> dict[str, dict[str, list]]:
+    """event_date -> column name -> values, for one chunk of EXPORT_COLUMNS rows."""
+    by_date: dict[str, dict[str, list]] = {}
+    for row in rows:
+        date, values = _decode_row(row, include_event_json)
+        columns = by_date.get(date)
+        if columns is None:
+            columns = by_date[date] = {name: [] for name in values}
+        for name, value in values.items():
+            columns[name].append(value)
+    return by_date
+
+
+# ================= STREAMING READS =================
+async def iter_message_chunks(
+    store: SessionStore, since_id: int = 0, until_id: Optional[int] = None, chunk_rows: int = DEFAULT_CHUNK_ROWS
+) -> AsyncIterator[list[tuple]]:
+    """
+    messages rows with since_id < id <= until_id, chunk_rows at a time, ordered by
+    (session_id, event_index). Every chunk is its own short query on a pooled reader.
+    """
+    if until_id is None:
+        async with store.read() as db:
+            cursor = await db.execute(MAX_ID_SQL)
+            until_id = (await cursor.fetchone())[0] or 0
+            await cursor.close()
+    if until_id <= since_id:
+        return
+
+    async def fetch(sql: str, params: tuple) -> list[tuple]:
+        async with store.read() as db:
+            cursor = await db.execute(sql, params)
+            rows = await cursor.fetchall()
+            await cursor.close()
+        return rows
+
+    if since_id <= 0:
+        last = ("", -1)
+        while True:
+            rows = await fetch(SELECT_ALL_CHUNK_SQL, (*last, until_id, chunk_rows))
+            if rows:
+                yield rows
+            if len(rows) < chunk_rows:
+                return
+            last = (rows[-1][1], rows[-1][2])
+
+    # one row per session with new rows; the only part of a run that grows with the data (not per row)
+    chunk: list[tuple] = []
+    for session_id, first_index in await fetch(SELECT_TOUCHED_SESSIONS_SQL, (since_id, until_id)):
+        next_index = first_index
+        while True:
+            wanted = chunk_rows - len(chunk)
+            rows = await fetch(SELECT_SESSION_CHUNK_SQL, (session_id, next_index, since_id, until_id, wanted))
+            chunk.extend(rows)
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+            if len(rows) < wanted:
+                break
+            next_index = rows[-1][2] + 1
+    if chunk:
+        yield chunk
+
+
+async def iter_record_batches(
+    store: SessionStore, since_id: int = 0, until_id: Optional[int] = None,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS, include_event_json: bool = False,
+):
+    """
+    Arrow RecordBatches (one per chunk, all event dates together) for in-process analytics.
+    A sharded store is read shard after shard, since_id / until_id then apply to each shard's ids.
+    """
+    pa, _ = _pyarrow()
+    schema = arrow_schema(include_event_json)
+    for shard in store.shards:
+        async for rows in iter_message_chunks(shard, since_id, until_id, chunk_rows):
+            columns = {name: [] for name in schema.names}
+            for _, date_columns in decode_chunk(rows, include_event_json).items():
+                for name, values in date_columns.items():
+                    columns[name].extend(values)
+            yield pa.RecordBatch.from_pydict(columns, schema=schema)
+
+
+async def iter_frames(store: SessionStore, **kwargs):
+    """Same chunks as pandas DataFrames."""
+    async for batch in iter_record_batches(store, **kwargs):
+        yield batch.to_pandas()
+
+
+# ================= PARQUET EXPORT =================
+@dataclass
+class ExportReport:
+    since_id: int = 0
+    until_id: int = 0
+    rows: int = 0
+    chunks: int = 0
+    files: list[str] = field(default_factory=list)
+    elapsed_ms: float = 0.0
+    shards: list[dict] = field(default_factory=list)  # sharded store: since_id / until_id / rows of each shard
+
+
+def _read_state(out_dir: str) -> dict:
+    try:
+        with open(os.path.join(out_dir, STATE_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def read_watermark(out_dir: str) -> int:
+    """Last messages.id exported into out_dir (0 = nothing yet)."""
+    return int(_read_state(out_dir).get("last_id", 0))
+
+
+def read_shard_watermarks(out_dir: str, shards: int) -> list[int]:
+    """Last messages.id exported from each shard file into out_dir."""
+    state = _read_state(out_dir)
+    last_ids = state.get("shard_last_ids")
+    if last_ids is None:
+        if state.get("last_id"):
+            raise ValueError(f"{out_dir} holds a single-file export, export the sharded store into a new folder with --full")
+        return [0] * shards
+    if len(last_ids) != shards:
+        raise ValueError(f"{out_dir} was exported from {len(last_ids)} shards, not {shards}; use a new folder with --full")
+    return [int(last_id) for last_id in last_ids]
+
+
+def _write_state(out_dir: str, report: ExportReport, total_rows: int):
+    path = os.path.join(out_dir, STATE_FILE)
+    state = {"last_id": report.until_id, "total_rows": total_rows, "updated_at": time.time(), "last_export": asdict(report)}
+    if report.shards:
+        state["shard_last_ids"] = [shard["until_id"] for shard in report.shards]
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+class _PartitionWriters:
+    """One open ParquetWriter per event_date of a run; files appear under their final name on close()."""
+
+    def __init__(self, out_dir: str, since_id: int, until_id: int, include_event_json: bool, prefix: str = "part"):
+        self.pa, self.pq = _pyarrow()
+        self.schema = arrow_schema(include_event_json)
+        self.out_dir = out_dir
+        self.file_name = f"{prefix}-{since_id + 1}-{until_id}.parquet"
+        self.include_event_json = include_event_json
+        self._writers: dict[str, tuple] = {}
+
+    def write_chunk(self, rows: list[tuple]) -> int:
+        for date, columns in decode_chunk(rows, self.include_event_json).items():
+            entry = self._writers.get(date)
+            if entry is None:
+                folder = os.path.join(self.out_dir, f"event_date={date}")
+                os.makedirs(folder, exist_ok=True)
+                path = os.path.join(folder, self.file_name)
+                entry = self._writers[date] = (
+                    self.pq.ParquetWriter(path + ".tmp", self.schema, compression=PARQUET_COMPRESSION), path
+                )
+            # one row group per chunk and date
+            entry[0].write_table(self.pa.Table.from_pydict(columns, schema=self.schema))
+        return len(rows)
+
+    def close(self) -> list[str]:
+        paths = []
+        for writer, path in self._writers.values():
+            writer.close()
+            os.replace(path + ".tmp", path)
+            paths.append(path)
+        self._writers.clear()
+        return sorted(paths)
+
+    def abort(self):
+        for writer, path in self._writers.values():
+            writer.close()
+            os.remove(path + ".tmp")
+        self._writers.clear()
+
+
+async def export_parquet(
+    store: Union[SessionStore, str],
+    out_dir: str,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    incremental: bool = True,
+    include_event_json: bool = False,
+) -> ExportReport:
+    """
+    Export the messages saved since out_dir's watermark (everything with incremental=False)
+    as Parquet files partitioned by event_date. Returns what was written.
+    """
+    store = store if isinstance(store, SessionStore) else SessionStore(store)
+    started = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    shards = store.shards
+    if len(shards) == 1:
+        if incremental and "shard_last_ids" in _read_state(out_dir):
+            raise ValueError(f"{out_dir} holds a sharded export, export the single-file store into a new folder with --full")
+        since_ids = [read_watermark(out_dir) if incremental else 0]
+    else:
+        since_ids = read_shard_watermarks(out_dir, len(shards)) if incremental else [0] * len(shards)
+    await store.flush()
+    until_ids = []
+    for shard, since_id in zip(shards, since_ids):
+        async with shard.read() as db:
+            cursor = await db.execute(MAX_ID_SQL)
+            until_ids.append(max((await cursor.fetchone())[0] or 0, since_id))
+            await cursor.close()
+    report = ExportReport(since_id=since_ids[0], until_id=until_ids[0]) if len(shards) == 1 else ExportReport()
+    if all(until_id <= since_id for since_id, until_id in zip(since_ids, until_ids)):
+        return report
+
+    # every shard's files stay .tmp until all of them are written, so a failed run leaves nothing behind
+    all_writers = []
+    try:
+        for i, (shard, since_id, until_id) in enumerate(zip(shards, since_ids, until_ids)):
+            rows_before = report.rows
+            if until_id > since_id:
+                prefix = "part" if len(shards) == 1 else f"part-shard{i}of{len(shards)}"
+                writers = _PartitionWriters(out_dir, since_id, until_id, include_event_json, prefix=prefix)
+                all_writers.append(writers)
+                async for rows in iter_message_chunks(shard, since_id, until_id, chunk_rows):
+                    # decoding + compression off the event loop
+                    report.rows += await asyncio.to_thread(writers.write_chunk, rows)
+                    report.chunks += 1
+            if len(shards) > 1:
+                report.shards.append({"since_id": since_id, "until_id": until_id, "rows": report.rows - rows_before})
+        for writers in all_writers:
+            report.files += await asyncio.to_thread(writers.close)
+    except BaseException:
+        for writers in all_writers:
+            writers.abort()
+        raise
+    previous_rows = _read_state(out_dir).get("total_rows", 0) if incremental else 0
+    report.elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+    _write_state(out_dir, report, previous_rows + report.rows)
+    return report
+
+
+def main():
+    try:
+        from .config import MediFlowConfig
+        from .sharding import session_store
+    except ImportError:
+        from config import MediFlowConfig
+        from sharding import session_store
+
+    parser = argparse.ArgumentParser(description="Export chat transcripts to partitioned Parquet files.")
+    parser.add_argument("--db", default=None, help="defaults to MEDIFLOW_DB_PATH")
+    parser.add_argument("--out", required=True, help="output folder (holds the watermark too)")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--full", action="store_true", help="ignore the watermark and export everything")
+    parser.add_argument("--include-event-json", action="store_true")
+    parser.add_argument("--shards", type=int, default=None, help="defaults to MEDIFLOW_DB_SHARDS")
+    args = parser.parse_args()
+
+    async def run():
+        config = MediFlowConfig.from_env()
+        async with session_store(args.db or config.db_path, config.db_shards if args.shards is None else args.shards) as store:
+            report = await export_parquet(
+                store, args.out, chunk_rows=args.chunk_rows, incremental=not args.full,
+                include_event_json=args.include_event_json,
+            )
+        print(json.dumps(asdict(report), indent=2))
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+# governor.py
+# ================= OUTBOUND GOVERNOR: ONE GATE FOR EVERY MODEL CALL =================
+# Every model call the app makes (Tara's turns through the Runner, google_search_agent behind the
+# search tool and the PHASE 4 fan-out) passes through one OutboundGovernor before it leaves the process:
+#
+#   - token bucket: at most `rate` calls per second on average, `burst` at once (0 = no rate limit)
+#   - adaptive concurrency limit (AIMD): +1 per limit's worth of successful calls while the limit is
+#     in use, x0.5 on a 429 / RESOURCE_EXHAUSTED, x0.9 when latency climbs past twice its recent low
+#     (at most one decrease per round trip: only calls started after the last decrease count)
+#   - priority classes: EMERGENCY before INTERACTIVE turns before ENRICHMENT (PHASE 4 sub-queries);
+#     the class comes from a contextvar, set by ChatService and run_enrichment
+#   - bounded wait queue: calls wait at most queue_timeout seconds and at most max_queue of them wait;
+#     a full queue turns away the least urgent call (GovernorOverloaded) instead of growing
+#
+# The governor never retries. A refused call fails fast, so a burst of sessions reaching PHASE 4
+# together queues here for a slot instead of hammering the provider into 429s and retries.
+# Search cache hits never reach a model, so they never wait here either.
+#
+# Against a stub provider that 429s beyond 8 calls in flight, with clients retrying 429s:
+#   python -m mediflow_ai.governor --model "stub:200#8" --waves 5 --burst 60 --retries 3
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import AsyncIterator, Iterator, Optional
+
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+INITIAL_LIMIT = 16
+MIN_LIMIT = 1
+RATE_LIMITED_BACKOFF = 0.5    # limit multiplier on a 429
+LATENCY_BACKOFF = 0.9         # limit multiplier when latency climbs
+LATENCY_TOLERANCE = 2.0       # "climbs": more than this times the recent low ...
+LATENCY_SLACK = 0.05          # ... and more than this many seconds above it (scheduling jitter is not load)
+LATENCY_WINDOW = 200          # successful calls the recent low is taken over
+BASELINE_PERCENTILE = 0.1
+
+
+class Priority(IntEnum):
+    EMERGENCY = 0
+    INTERACTIVE = 1
+    ENRICHMENT = 2
+
+
+class GovernorOverloaded(Exception):
+    """An outbound call was refused: the wait queue was full, or it waited past its timeout."""
+
+
+_priority: ContextVar[Priority] = ContextVar("mediflow_outbound_priority", default=Priority.INTERACTIVE)
+
+
+@contextmanager
+def priority(level: Priority) -> Iterator[None]:
+    """Calls made inside (and in tasks started inside) queue with this priority."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> Priority:
+    return _priority.get()
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """429 / RESOURCE_EXHAUSTED from google-genai, google-api-core, litellm or the stub."""
+    if getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429:
+        return True
+    text = str(error)
+    return "429" in text or "RESOURCE_EXHAUSTED" in text
+
+
+# ================= THE GOVERNOR =================
+class OutboundGovernor:
+    """
+    Token bucket + adaptive concurrency limit + priority wait queue, shared by all model calls.
+
+        governor = OutboundGovernor(rate=20, burst=10, max_concurrency=64)
+        async with governor.slot():
+            ...  # one model call
+    """
+
+    def __init__(
+        self,
+        rate: float = 0.0,
+        burst: int = 20,
+        max_concurrency: int = 64,
+        initial_limit: int = INITIAL_LIMIT,
+        max_queue: int = 256,
+        queue_timeout: float = 10.0,
+    ):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_concurrency = max(MIN_LIMIT, max_concurrency)
+        self.limit = float(min(max(MIN_LIMIT, initial_limit), self.max_concurrency))
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._refill_timer: Optional[asyncio.TimerHandle] = None
+        # (priority, seq, future); futures that timed out stay in the heap until popped
+        self._waiters: list = []
+        self._queued = 0
+        self._seq = itertools.count()
+        self._latency: deque = deque(maxlen=LATENCY_WINDOW)
+        self._last_decrease = 0.0
+        self.stats = {"admitted": 0, "waited": 0, "rejected": 0, "timed_out": 0, "rate_limited": 0, "latency_backoffs": 0}
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    def export_metrics(self):
+        """Expose this governor's limit / in-flight / queue on /metrics (a newer governor replaces it)."""
+        metrics.GOVERNOR_LIMIT.set_function(lambda: self.limit)
+        metrics.GOVERNOR_IN_FLIGHT.set_function(lambda: self.in_flight)
+        metrics.GOVERNOR_QUEUED.set_function(lambda: self._queued)
+
+    # ---------- token bucket ----------
+    def _take_token(self) -> bool:
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        if self._refill_timer is None:
+            delay = (1 - self._tokens) / self.rate
+            self._refill_timer = asyncio.get_running_loop().call_later(delay, self._on_refill)
+        return False
+
+    def _on_refill(self):
+        self._refill_timer = None
+        self._dispatch()
+
+    # ---------- queue ----------
+    def _has_capacity(self) -> bool:
+        return self.in_flight < max(MIN_LIMIT, int(self.limit))
+
+    def _dispatch(self):
+        """Hand free slots (and tokens) to the most urgent waiters."""
+        while self._waiters and self._has_capacity():
+            if self._waiters[0][2].done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._take_token():
+                return
+            _, _, future = heapq.heappop(self._waiters)
+            self._queued -= 1
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _make_room(self, level: Priority) -> bool:
+        """Queue full: turn away the least urgent, newest waiter if it is less urgent than level."""
+        worst = None
+        for entry in self._waiters:
+            if not entry[2].done() and (worst is None or entry[:2] > worst[:2]):
+                worst = entry
+        if worst is None or worst[0] <= level:
+            return False
+        self._queued -= 1
+        worst[2].set_exception(GovernorOverloaded(f"displaced by a {level.name.lower()} call ({self.max_queue} waiting)"))
+        metrics.GOVERNOR_ADMISSIONS.inc(priority=Priority(worst[0]).name.lower(), outcome="displaced")
+        self.stats["rejected"] += 1
+        return True
+
+    async def acquire(self, level: Optional[Priority] = None, timeout: Optional[float] = None):
+        """
+        Wait for a slot. Raises GovernorOverloaded when the queue is full or timeout runs out;
+        timeout=0 takes a free slot or fails at once, without queueing (hedged requests).
+        """
+        level = current_priority() if level is None else level
+        label = level.name.lower()
+        if not self._queued and self._has_capacity() and self._take_token():
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+            metrics.GOVERNOR_ADMISSIONS.inc(priority=label, outcome="immediate")
+            return
+        if timeout == 0:
+            metrics.GOVERNOR_ADMISSIONS.inc(priority=label, outcome="shed")
+            raise GovernorOverloaded("no free outbound slot")
+        if self._queued >= self.max_queue and not self._make_room(level):
+            self.stats["rejected"] += 1
+            metrics.GOVERNOR_ADMISSIONS.inc(priority=label, outcome="rejected")
+            raise GovernorOverloaded(f"{self._queued} outbound calls waiting (limit {self.max_queue})")
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(level), next(self._seq), future))
+        self._queued += 1
+        self.stats["waited"] += 1
+        self._dispatch()
+        started = time.perf_counter()
+        timeout = self.queue_timeout if timeout is None else timeout
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except BaseException as exc:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # granted just as the wait ended: give the slot back
+                self._release()
+            elif not future.done():
+                future.cancel()
+                self._queued -= 1
+            if isinstance(exc, asyncio.TimeoutError):
+                self.stats["timed_out"] += 1
+                metrics.GOVERNOR_ADMISSIONS.inc(priority=label, outcome="timeout")
+                raise GovernorOverloaded(f"no outbound slot within {timeout:g}s ({label})") from None
+            raise
+        finally:
+            metrics.GOVERNOR_WAIT_SECONDS.observe(time.perf_counter() - started, priority=label)
+        self.stats["admitted"] += 1
+        metrics.GOVERNOR_ADMISSIONS.inc(priority=label, outcome="queued")
+
+    def _release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    # ---------- limit ----------
+    def _baseline(self) -> Optional[float]:
+        if not self._latency:
+            return None
+        ordered = sorted(self._latency)
+        return ordered[int(len(ordered) * BASELINE_PERCENTILE)]
+
+    def _decrease(self, factor: float, started: float) -> bool:
+        # one decrease per round trip: calls already in flight at the last decrease saw the old load
+        if started <= self._last_decrease:
+            return False
+        self.limit = max(float(MIN_LIMIT), self.limit * factor)
+        self._last_decrease = time.monotonic()
+        return True
+
+    def on_success(self, seconds: float, started: float, in_flight: int):
+        baseline = self._baseline()
+        self._latency.append(seconds)
+        if baseline is not None and seconds > baseline * LATENCY_TOLERANCE and seconds - baseline > LATENCY_SLACK:
+            if self._decrease(LATENCY_BACKOFF, started):
+                self.stats["latency_backoffs"] += 1
+                metrics.GOVERNOR_SIGNALS.inc(signal="latency")
+            return
+        # grow only while the limit is actually what holds calls back
+        if in_flight * 2 >= self.limit:
+            self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+
+    def on_rate_limited(self, started: float):
+        self.stats["rate_limited"] += 1
+        metrics.GOVERNOR_SIGNALS.inc(signal="rate_limited")
+        self._decrease(RATE_LIMITED_BACKOFF, started)
+
+    def on_slow_cancel(self, seconds: float, started: float):
+        """A call cancelled by its deadline: evidence of slowness only, never of spare capacity."""
+        baseline = self._baseline()
+        if baseline is not None and seconds > baseline * LATENCY_TOLERANCE and seconds - baseline > LATENCY_SLACK:
+            if self._decrease(LATENCY_BACKOFF, started):
+                self.stats["latency_backoffs"] += 1
+                metrics.GOVERNOR_SIGNALS.inc(signal="latency")
+
+    @asynccontextmanager
+    async def slot(self, level: Optional[Priority] = None, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """One outbound call: wait for a slot, then feed its latency / 429 back into the limit."""
+        await self.acquire(level, timeout)
+        started = time.monotonic()
+        in_flight = self.in_flight
+        try:
+            yield
+        except Exception as exc:
+            if is_rate_limited(exc):
+                self.on_rate_limited(started)
+            raise
+        except BaseException:
+            # cancelled (deadline, lost hedge, closed stream)
+            self.on_slow_cancel(time.monotonic() - started, started)
+            raise
+        else:
+            self.on_success(time.monotonic() - started, started, in_flight)
+        finally:
+            self._release()
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": self._queued,
+            "rate": self.rate,
+            "baseline_ms": round(self._baseline() * 1000, 1) if self._latency else None,
+            **self.stats,
+        }
+
+
+def build_governor(config) -> Optional[OutboundGovernor]:
+    """The app's governor from MediFlowConfig (None when config.governor is off)."""
+    if not config.governor:
+        return None
+    governor = OutboundGovernor(
+        rate=config.governor_rate,
+        burst=config.governor_burst,
+        max_concurrency=config.governor_max_concurrency,
+        max_queue=config.governor_queue,
+        queue_timeout=config.governor_queue_timeout,
+    )
+    governor.export_metrics()
+    return governor
+
+
+# ================= CLI: BURSTS AGAINST A RATE-LIMITED PROVIDER =================
+async def _run(model: str, governed: bool, waves: int, burst: int, interval: float, retries: int, enrichment_share: float, rate: float) -> dict:
+    from google.adk.models.llm_request import LlmRequest
+    from google.genai.types import Content, Part
+
+    try:
+        from .model_routing import RoutedLlm
+    except ImportError:
+        from model_routing import RoutedLlm
+
+    governor = OutboundGovernor(rate=rate, burst=max(1, burst // 4)) if governed else None
+    llm = RoutedLlm.from_route(model, agent="governor_probe", governor=governor)
+    latencies: dict[str, list] = {"interactive": [], "enrichment": []}
+    outcome = {"ok": 0, "failed": 0, "refused": 0, "provider_calls": 0, "provider_429s": 0}
+
+    async def one(n: int, level: Priority):
+        request = LlmRequest(model=llm.model, contents=[Content(role="user", parts=[Part(text=f"pollen count in Pune, call {n}")])])
+        started = time.perf_counter()
+        with priority(level):
+            for attempt in range(retries + 1):
+                outcome["provider_calls"] += 1
+                try:
+                    async for _ in llm.generate_content_async(request):
+                        pass
+                except GovernorOverloaded:
+                    outcome["provider_calls"] -= 1
+                    outcome["refused"] += 1
+                    return
+                except Exception as exc:
+                    if not is_rate_limited(exc):
+                        raise
+                    outcome["provider_429s"] += 1
+                    if attempt < retries:
+                        # what an ungoverned client does: back off a little and try again
+                        await asyncio.sleep(0.05 * 2 ** attempt * (0.5 + random.random()))
+                    continue
+                latencies[level.name.lower()].append((time.perf_counter() - started) * 1000)
+                outcome["ok"] += 1
+                return
+        outcome["failed"] += 1
+
+    started = time.perf_counter()
+    tasks = []
+    for wave in range(waves):
+        for n in range(burst):
+            level = Priority.ENRICHMENT if random.random() < enrichment_share else Priority.INTERACTIVE
+            tasks.append(asyncio.create_task(one(wave * burst + n, level)))
+        await asyncio.sleep(interval)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    def p(values: list, pct: float):
+        values = sorted(values)
+        return round(values[min(len(values) - 1, int(len(values) * pct))], 1) if values else None
+
+    return {
+        "governed": governed,
+        "calls": waves * burst,
+        **outcome,
+        "goodput_per_s": round(outcome["ok"] / elapsed, 1),
+        "p50_ms": {level: p(values, 0.5) for level, values in latencies.items()},
+        "p95_ms": {level: p(values, 0.95) for level, values in latencies.items()},
+        "governor": governor.snapshot() if governor is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bursts of model calls with and without the outbound governor.")
+    parser.add_argument("--model", default="stub:200#8", help='"stub:<ms>#<calls in flight before 429s>" or a real model')
+    parser.add_argument("--waves", type=int, default=5)
+    parser.add_argument("--burst", type=int, default=60, help="calls started at once per wave")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between waves")
+    parser.add_argument("--retries", type=int, default=3, help="client retries on a 429")
+    parser.add_argument("--enrichment-share", type=float, default=0.5)
+    parser.add_argument("--rate", type=float, default=0.0, help="governor token bucket, calls/s (0 = off)")
+    args = parser.parse_args()
+    for governed in (False, True):
+        result = asyncio.run(_run(
+            args.model, governed, args.waves, args.burst, args.interval, args.retries, args.enrichment_share, args.rate
+        ))
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+# intake.py
+import re
+from typing import Optional
+
+from google.genai.types import Content, Part
+
+try:
+    from .context_window import PATIENT_STATE_KEY, SYMPTOM_RE, extract_patient_slots
+except ImportError:
+    from context_window import PATIENT_STATE_KEY, SYMPTOM_RE, extract_patient_slots
+
+# ================= PHASE 1 + PHASE 2 WITHOUT THE MODEL =================
+# The fixed interview runs here, in code: one question per turn, answers are
+# validated and stored in session state. The model is only called when the
+# patient asks something / gives an answer we cannot parse twice, and once
+# the interview is confirmed (PHASE 4 onwards).
+INTAKE_STATE_KEY = "intake"
+
+GREETING = (
+    "Hello — I'm Tara, MediFlow's triage assistant. I'll ask a few questions to understand your "
+    "symptoms and suggest next steps. Your information stays in this conversation and will not be published."
+)
+
+# (step, question) in PHASE 2 order
+INTAKE_STEPS = [
+    ("name", "What's your name?"),
+    ("location", "Which city or area are you in? (If it's a big city, your pincode helps.)"),
+    ("age", "How old are you? (A number, or Child / Teen / Adult / Elderly.)"),
+    ("gender", "What is your gender?"),
+    ("symptoms", "What symptoms are you having?"),
+    ("duration", "How long have you had these symptoms?"),
+    ("diet", "Any recent changes in your diet or food (eating out, new foods, skipped meals)?"),
+    ("conditions", "Do you have any existing medical conditions or allergies?"),
+    ("meds", "Are you taking any medications right now?"),
+    ("trigger", "Is there anything you think triggered this (travel, work, weather, an activity)? You can say \"skip\"."),
+    ("confirm", "Thanks for sharing. Are you satisfied with the information provided, or would you like to add anything else?"),
+]
+QUESTIONS = dict(INTAKE_STEPS)
+STEP_ORDER = [step for step, _ in INTAKE_STEPS]
+
+MORE_SYMPTOMS_QUESTION = "Noted. Anything else? (Say \"done\" when you have shared all your symptoms.)"
+RETRY_PREFIX = "Sorry, I didn't quite get that. "
+MAX_RETRIES = 1  # a second unparseable answer goes to the model
+
+DONE_RE = re.compile(r"^\W*(?:done|no more|nothing(?: else)?|no|nope|that'?s (?:all|it)|that is all|finished|none)\W*$", re.IGNORECASE)
+NONE_RE = re.compile(r"^\W*(?:no|none|nope|nothing|nil|na|n/a|not really|no changes?|skip|not sure)\W*$", re.IGNORECASE)
+SATISFIED_RE = re.compile(r"\b(?:satisfied|yes|yeah|yep|done|ok(?:ay)?|that'?s all|go ahead|proceed|continue)\b", re.IGNORECASE)
+ADD_MORE_RE = re.compile(r"\b(?:not satisfied|add(?: more)?|more|another|forgot|also)\b", re.IGNORECASE)
+AGE_GROUPS = {"child": "Child", "kid": "Child", "teen": "Teen", "teenager": "Teen", "adult": "Adult", "elderly": "Elderly", "senior": "Elderly", "old": "Elderly"}
+GENDERS = {
+    "male": "Male", "m": "Male", "man": "Male", "boy": "Male",
+    "female": "Female", "f": "Female", "woman": "Female", "girl": "Female",
+    "other": "Other", "non-binary": "Non-binary", "nonbinary": "Non-binary",
+    "prefer not to say": "Prefer not to say", "rather not say": "Prefer not to say",
+}
+NAME_ONLY_RE = re.compile(r"^\s*([A-Za-z][A-Za-z'.-]*(?: [A-Za-z][A-Za-z'.-]*){0,3})\s*[.!]?\s*$")
+FREE_TEXT_MAX_WORDS = 40
+
+# ================= DETAILS THE PATIENT VOLUNTEERS =================
+# "Name: Priya, Age: 28" (labelled) or "Priya, 28, female, Delhi" (a comma list with at least two
+# fields we recognise as age/gender/labelled) fill the matching steps, which are then skipped.
+FIELD_LABELS = {
+    "name": "name", "location": "location", "city": "location", "place": "location", "area": "location",
+    "pincode": "location", "age": "age", "gender": "gender", "sex": "gender", "symptoms": "symptoms",
+    "symptom": "symptoms", "duration": "duration", "diet": "diet", "conditions": "conditions",
+    "condition": "conditions", "allergies": "conditions", "medications": "meds", "medication": "meds",
+    "medicines": "meds", "meds": "meds", "trigger": "trigger",
+}
+LABELLED_RE = re.compile(r"^\s*(" + "|".join(FIELD_LABELS) + r")\s*[:=-]\s*(.+?)\s*$", re.IGNORECASE)
+SENTENCE_SPLIT_RE = re.compile(r"[.;\n]+(?:\s+|$)")
+LIST_AGE_RE = re.compile(r"^(\d{1,3})(?:\s*(?:years?|yrs?|y)(?:\s*old)?)?$", re.IGNORECASE)
+PROPER_NOUN_RE = re.compile(r"^[A-Z][a-zA-Z'-]+(?: [A-Z][a-zA-Z'-]+){0,2}$")
+NOT_LIST_NAMES = {"Hi", "Hello", "Hey", "Namaste", "Thanks", "Ok", "Okay", "Yes", "No", "Doctor", "Sir", "Madam"}
+CONDITION_RE = re.compile(
+    r"\b(?:I have|I've got|I am|I'm|known case of|history of|suffering from)\s+"
+    r"((?:type [12] )?diabetes|diabetic|hypertension|high (?:blood pressure|bp)|bp|asthma|asthmatic|thyroid|"
+    r"hypothyroidism|hyperthyroidism|heart disease|kidney disease|copd|arthritis|epilepsy|"
+    r"an? allergy to [a-z ]{2,30}?|allergic to [a-z ]{2,30}?)(?=[.,;!?]| and |$)",
+    re.IGNORECASE,
+)
+# the steps a first message must cover to skip the form entirely (together with CONFIRMED_RE)
+REQUIRED_STEPS = ("name", "location", "age", "gender", "symptoms", "duration")
+CONFIRMED_RE = re.compile(
+    r"(?<!not )\b(?:satisfied|that'?s all|that is all|nothing else|no other (?:issues?|symptoms?|problems?|complaints?))\b",
+    re.IGNORECASE,
+)
+
+
+def _none_or_text(answer: str) -> Optional[str]:
+    answer = answer.strip()
+    if not answer:
+        return None
+    return "none" if NONE_RE.match(answer) else answer
+
+
+def _parse_name(answer: str, patient: dict) -> Optional[str]:
+    labelled = LABELLED_RE.match(answer)
+    if labelled and FIELD_LABELS[labelled.group(1).lower()] == "name":
+        answer = labelled.group(2)
+    slots = extract_patient_slots(answer)
+    if slots.get("name"):
+        return slots["name"]
+    match = NAME_ONLY_RE.match(answer)
+    return match.group(1).title() if match else None
+
+
+def _parse_location(answer: str, patient: dict) -> Optional[str]:
+    slots = extract_patient_slots(answer)
+    if slots.get("location"):
+        return slots["location"]
+    answer = answer.strip().strip(".")
+    return answer if 2 <= len(answer) <= 80 and not NONE_RE.match(answer) else None
+
+
+def _parse_age(answer: str, patient: dict):
+    digits = re.search(r"\b(\d{1,3})\b", answer)
+    if digits and 0 < int(digits.group(1)) < 120:
+        return int(digits.group(1))
+    for word in re.findall(r"[a-z]+", answer.lower()):
+        if word in AGE_GROUPS:
+            return AGE_GROUPS[word]
+    return None
+
+
+def _parse_gender(answer: str, patient: dict) -> Optional[str]:
+    lowered = answer.strip().lower().strip(".")
+    if lowered in GENDERS:
+        return GENDERS[lowered]
+    for word in re.findall(r"[a-z-]+", lowered):
+        if word in GENDERS and len(word) > 1:
+            return GENDERS[word]
+    return None
+
+
+def _parse_duration(answer: str, patient: dict) -> Optional[str]:
+    slots = extract_patient_slots(answer)
+    if slots.get("duration"):
+        return slots["duration"]
+    answer = answer.strip().strip(".")
+    return answer if answer and re.search(r"\d|day|week|month|year|hour|yesterday|today|morning|night", answer, re.IGNORECASE) else None
+
+
+PARSERS = {
+    "name": _parse_name,
+    "location": _parse_location,
+    "age": _parse_age,
+    "gender": _parse_gender,
+    "duration": _parse_duration,
+    "diet": lambda answer, patient: _none_or_text(answer),
+    "conditions": lambda answer, patient: _none_or_text(answer),
+    "meds": lambda answer, patient: _none_or_text(answer),
+    "trigger": lambda answer, patient: _none_or_text(answer),
+}
+
+
+def _list_field(chunk: str) -> Optional[tuple[str, object]]:
+    """(step, value) of one comma separated field, or None when it is not one we recognise."""
+    labelled = LABELLED_RE.match(chunk)
+    if labelled:
+        step, value = FIELD_LABELS[labelled.group(1).lower()], labelled.group(2).strip()
+        if step == "symptoms":
+            return step, value
+        parsed = PARSERS[step](value, {})
+        return (step, parsed) if parsed is not None else None
+    lowered = chunk.lower()
+    age = LIST_AGE_RE.match(chunk)
+    if age and 0 < int(age.group(1)) < 120:
+        return "age", int(age.group(1))
+    if lowered in AGE_GROUPS:
+        return "age", AGE_GROUPS[lowered]
+    if lowered in GENDERS:
+        return "gender", GENDERS[lowered]
+    return None
+
+
+def volunteered_slots(text: str, patient: Optional[dict] = None) -> dict:
+    """
+    Merge the details list / labelled fields in text into patient (a new dict is returned).
+    In a list, the first bare proper noun is the name (unless one was labelled) and the next
+    one the location: "Priya, 28, female, Delhi" or "Name: Priya, 28, female, Delhi".
+    """
+    patient = dict(patient or {})
+    for sentence in SENTENCE_SPLIT_RE.split(text or ""):
+        chunks = [chunk.strip() for chunk in sentence.split(",") if chunk.strip()]
+        fields = [(chunk, _list_field(chunk)) for chunk in chunks]
+        # any labelled field ("Age: 28") is deliberate; an unlabelled list needs two recognised fields
+        if not any(LABELLED_RE.match(chunk) for chunk in chunks) and sum(field is not None for _, field in fields) < 2:
+            continue
+        found: dict = {}
+        for chunk, field in fields:
+            if field is not None:
+                step, value = field
+                if step == "symptoms":
+                    found.setdefault("symptoms", []).append(value)
+                else:
+                    found.setdefault(step, value)
+            elif (
+                PROPER_NOUN_RE.match(chunk)
+                and chunk.split()[0] not in NOT_LIST_NAMES
+                and not SYMPTOM_RE.search(chunk.lower())
+            ):
+                found.setdefault("name" if "name" not in found else "location", chunk.title())
+        if found.get("symptoms"):
+            found["symptoms"] = list(dict.fromkeys([*patient.get("symptoms", []), *found["symptoms"]]))
+        patient.update(found)
+    condition = CONDITION_RE.search(text or "")
+    if condition and "conditions" not in patient:
+        patient["conditions"] = condition.group(1).strip()
+    return patient
+
+
+def _intake_covered(patient: dict) -> bool:
+    return all(patient.get(step) not in (None, "", []) for step in REQUIRED_STEPS)
+
+
+def _next_step(patient: dict, after: Optional[str] = None) -> str:
+    """First step (in order, after `after`) whose slot is still empty. The symptom loop is always visited."""
+    start = STEP_ORDER.index(after) + 1 if after else 0
+    for step in STEP_ORDER[start:]:
+        if step in ("symptoms", "confirm") or step not in patient:
+            return step
+    return "confirm"
+
+
+def _question(step: str, patient: dict) -> str:
+    if step == "symptoms" and patient.get("symptoms"):
+        return f"I've noted: {', '.join(patient['symptoms'])}. Any other symptoms? (Say \"done\" when you have shared them all.)"
+    return QUESTIONS[step]
+
+
+def _retry(intake: dict, state, step: str, patient: dict) -> Optional[Content]:
+    """Ask the same question once more; after MAX_RETRIES the model takes the turn."""
+    if intake.get("retries", 0) >= MAX_RETRIES:
+        state[INTAKE_STATE_KEY] = {**intake, "retries": 0, "handoff": True}
+        return None
+    state[INTAKE_STATE_KEY] = {**intake, "retries": intake.get("retries", 0) + 1, "handoff": False}
+    return _reply(RETRY_PREFIX + _question(step, patient))
+
+
+def _reply(text: str) -> Content:
+    return Content(role="model", parts=[Part(text=text)])
+
+
+def _is_free_text(answer: str) -> bool:
+    """A question back to Tara or a long story: let the model handle this turn."""
+    return "?" in answer or len(answer.split()) > FREE_TEXT_MAX_WORDS
+
+
+# ================= BEFORE AGENT CALLBACK =================
+def intake_before_agent_callback(callback_context) -> Optional[Content]:
+    """
+    Answers PHASE 1/2 turns itself (returns the next question, no model call)
+    or returns None to let Tara's model handle the turn.
+    """
+    state = callback_context.state
+    intake = dict(state.get(INTAKE_STATE_KEY) or {})
+    if intake.get("step") == "complete":
+        return None
+
+    user_content = callback_context.user_content
+    answer = " ".join(p.text for p in (user_content.parts if user_content else []) or [] if p.text).strip()
+    patient = dict(state.get(PATIENT_STATE_KEY) or {})
+
+    # PHASE 1: greet, and keep anything useful from the opening message ("Hi, I'm Asha from Pune",
+    # "Name: Priya, 28, female, Delhi, fever for 3 days"); answered steps are skipped
+    if not intake.get("step"):
+        patient = volunteered_slots(answer, extract_patient_slots(answer, patient))
+        if _intake_covered(patient) and CONFIRMED_RE.search(answer):
+            # everything PHASE 2 needs, already confirmed: the model takes this turn (PHASE 4)
+            state[PATIENT_STATE_KEY] = patient
+            state[INTAKE_STATE_KEY] = {"step": "complete", "retries": 0, "handoff": False}
+            return None
+        step = _next_step(patient)
+        state[PATIENT_STATE_KEY] = patient
+        state[INTAKE_STATE_KEY] = {"step": step, "retries": 0, "handoff": False}
+        return _reply(f"{GREETING}\n\n{_question(step, patient)}")
+
+    step = intake["step"]
+    if _is_free_text(answer) and step != "symptoms":
+        # the model answers; the form stays on the same question
+        state[INTAKE_STATE_KEY] = {**intake, "handoff": True}
+        return None
+
+    if step == "symptoms":
+        if DONE_RE.match(answer) and patient.get("symptoms"):
+            next_step = _next_step(patient, after="symptoms")
+            state[INTAKE_STATE_KEY] = {"step": next_step, "retries": 0, "handoff": False}
+            return _reply(_question(next_step, patient))
+        if not answer or DONE_RE.match(answer):
+            return _retry(intake, state, step, patient)
+        # the answer itself is the symptom entry; duration/meds mentioned on the way are kept too
+        symptoms = [*patient.get("symptoms", []), answer.strip().rstrip(".")]
+        patient = {**extract_patient_slots(answer, patient), "symptoms": list(dict.fromkeys(symptoms))}
+        state[PATIENT_STATE_KEY] = patient
+        state[INTAKE_STATE_KEY] = {"step": "symptoms", "retries": 0, "handoff": False}
+        return _reply(MORE_SYMPTOMS_QUESTION)
+
+    if step == "confirm":
+        if not DONE_RE.match(answer) and ADD_MORE_RE.search(answer):
+            state[INTAKE_STATE_KEY] = {"step": "symptoms", "retries": 0, "handoff": False}
+            return _reply("Sure. " + _question("symptoms", patient))
+        if DONE_RE.match(answer) or SATISFIED_RE.search(answer):
+            # PHASE 2 done: from here on every turn goes to the model (PHASE 4+)
+            state[INTAKE_STATE_KEY] = {"step": "complete", "retries": 0, "handoff": False}
+            return None
+        return _retry(intake, state, step, patient)
+
+    # "Asha, 34, F" to the name question answers the age and gender questions too
+    value = volunteered_slots(answer).get(step)
+    patient = volunteered_slots(answer, patient)
+    if value is None:
+        value = PARSERS[step](answer, patient)
+    if value is None:
+        return _retry(intake, state, step, patient)
+
+    patient[step] = value
+    next_step = _next_step(patient, after=step)
+    state[PATIENT_STATE_KEY] = patient
+    state[INTAKE_STATE_KEY] = {"step": next_step, "retries": 0, "handoff": False}
+    return _reply(_question(next_step, patient))
+
+
+# ================= WHAT THE MODEL IS TOLD =================
+def intake_summary(patient: dict) -> str:
+    lines = []
+    for step in STEP_ORDER[:-1]:
+        value = patient.get(step)
+        if value in (None, "", []):
+            continue
+        lines.append(f"- {step}: {', '.join(map(str, value)) if isinstance(value, list) else value}")
+    return "\n".join(lines) or "- nothing collected yet"
+
+
+def intake_before_model_callback(callback_context, llm_request) -> None:
+    """Tell the model where the intake form is, so it does not re-ask PHASE 2 questions."""
+    intake = callback_context.state.get(INTAKE_STATE_KEY) or {}
+    step = intake.get("step")
+    if not step:
+        return None
+    patient = callback_context.state.get(PATIENT_STATE_KEY) or {}
+    if step == "complete":
+        note = (
+            "PHASE 1 and PHASE 2 were completed by the intake form; the patient confirmed the details below. "
+            "Do not ask these questions again — continue with PHASE 4.\n" + intake_summary(patient)
+        )
+    elif intake.get("handoff"):
+        note = (
+            "The intake form (PHASE 2) is in progress and collected:\n" + intake_summary(patient) +
+            f"\nAnswer the patient's last message briefly, then ask again: \"{_question(step, patient)}\""
+        )
+    else:
+        return None
+    # in the contents, not the system instruction: that one stays static so it can be cached (prompt_cache.py)
+    llm_request.contents.insert(0, Content(role="user", parts=[Part(text=f"[Intake form]\n{note}")]))
+    return None
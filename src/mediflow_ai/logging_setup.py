@@ -0,0 +1,126 @@
+# logging_setup.py
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from typing import Optional
+
+# ================= ONE FILE PER LEVEL (SAME FILES AS BEFORE) =================
+LOG_FILES = [
+    ("debug.log", logging.DEBUG),
+    ("info.log", logging.INFO),
+    ("warning.log", logging.WARNING),
+    ("error.log", logging.ERROR),
+    ("critical.log", logging.CRITICAL),
+]
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+
+# chatty libraries are capped unless MEDIFLOW_LOG_LEVELS says otherwise
+DEFAULT_LOGGER_LEVELS = {
+    "httpx": "WARNING",
+    "httpcore": "WARNING",
+    "urllib3": "WARNING",
+    "aiosqlite": "INFO",
+    "google_genai": "INFO",
+    "asyncio": "WARNING",
+}
+
+# ================= ENVIRONMENT VARIABLES =================
+# MEDIFLOW_LOG_DIR           directory for the log files (default: logs)
+# MEDIFLOW_LOG_LEVEL         root level (default: DEBUG)
+# MEDIFLOW_LOG_LEVELS        per-logger caps, e.g. "httpx=WARNING,google_adk=INFO"
+# MEDIFLOW_LOG_ROTATION      size | time | none (default: size)
+# MEDIFLOW_LOG_MAX_BYTES     size rotation threshold (default: 10 MB)
+# MEDIFLOW_LOG_BACKUP_COUNT  rotated files to keep (default: 5)
+# MEDIFLOW_LOG_WHEN          time rotation interval, TimedRotatingFileHandler 'when' (default: midnight)
+# MEDIFLOW_LOG_MODE          'a' append / 'w' overwrite at startup, every rotation mode (default: a)
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+
+
+def _parse_logger_levels(spec: str) -> dict[str, str]:
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def _file_handler(path: str, rotation: str, mode: str, max_bytes: int, backup_count: int, when: str) -> logging.Handler:
+    if mode not in ("a", "w"):
+        raise ValueError(f"MEDIFLOW_LOG_MODE must be 'a' or 'w', got {mode!r}")
+    if mode == "w" and rotation in ("time", "size"):
+        # TimedRotatingFileHandler always appends and RotatingFileHandler switches to 'a' when
+        # maxBytes > 0, so overwrite means truncating the current file here; backups are kept
+        open(path, "w").close()
+    if rotation == "time":
+        return TimedRotatingFileHandler(path, when=when, backupCount=backup_count, delay=True)
+    if rotation == "size":
+        return RotatingFileHandler(path, mode=mode, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+    return logging.FileHandler(path, mode=mode, delay=True)
+
+
+def configure_logging(log_dir: Optional[str] = None, level: Optional[str] = None) -> QueueListener:
+    """
+    Install the non-blocking logging pipeline on the root logger (once per process).
+
+    Callers only pay for QueueHandler: the record is formatted once and put on a
+    queue. A QueueListener thread routes it to the per-level files (debug.log
+    gets everything, critical.log only CRITICAL), with size or time rotation.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return _listener
+
+    log_dir = log_dir or os.environ.get("MEDIFLOW_LOG_DIR", "logs")
+    level = (level or os.environ.get("MEDIFLOW_LOG_LEVEL", "DEBUG")).upper()
+    rotation = os.environ.get("MEDIFLOW_LOG_ROTATION", "size").lower()
+    max_bytes = int(os.environ.get("MEDIFLOW_LOG_MAX_BYTES", 10 * 1024 * 1024))
+    backup_count = int(os.environ.get("MEDIFLOW_LOG_BACKUP_COUNT", 5))
+    when = os.environ.get("MEDIFLOW_LOG_WHEN", "midnight")
+    mode = os.environ.get("MEDIFLOW_LOG_MODE", "a")
+
+    os.makedirs(log_dir, exist_ok=True)
+
+    # the listener's handlers write the already formatted line as-is
+    passthrough = logging.Formatter("%(message)s")
+    handlers = []
+    for filename, file_level in LOG_FILES:
+        handler = _file_handler(os.path.join(log_dir, filename), rotation, mode, max_bytes, backup_count, when)
+        handler.setLevel(file_level)
+        handler.setFormatter(passthrough)
+        handlers.append(handler)
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    _queue_handler = QueueHandler(log_queue)
+    _queue_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(_queue_handler)
+
+    logger_levels = {**DEFAULT_LOGGER_LEVELS, **_parse_logger_levels(os.environ.get("MEDIFLOW_LOG_LEVELS", ""))}
+    for name, logger_level in logger_levels.items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def shutdown_logging():
+    """Drain the queue, close the files and detach the handler."""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener = None
+    _queue_handler = None
@@ -0,0 +1,317 @@
+# maintenance.py
+# ================= RETENTION AND COMPACTION FOR chat_history.db =================
+# One pass (run_once), every maintenance_interval seconds while the server runs:
+#   1. archive: sessions idle longer than archive_after_days move into session_archive,
+#      one compressed blob per session (reads rehydrate them transparently, see sqlite_store)
+#   2. retention: archived sessions idle longer than delete_after_days are deleted (0 = keep forever)
+#   3. doctor searches are parsed into the provider directory, then expired search_cache rows are purged
+#   4. incremental vacuum hands the freed pages back to the file system
+#   5. WAL checkpoint (TRUNCATE) so the -wal file does not keep the old pages around
+# Archived sessions stay in the preload_memory FTS index (memory_service.py); deleting them drops them.
+# A sharded store (sharding.py) gets steps 1-2 on every shard file and 4-5 on every file.
+#
+# From cron / by hand: python -m mediflow_ai.maintenance [--db PATH] [--archive-after-days 30]
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Optional, Union
+
+try:
+    from .sqlite_store import SessionStore
+except ImportError:
+    from sqlite_store import SessionStore
+
+logger = logging.getLogger(__name__)
+
+DAY_SECONDS = 86400
+ARCHIVE_BATCH_SESSIONS = 200      # sessions archived per pass, one short write transaction each
+VACUUM_CHUNK_PAGES = 2000         # pages freed per incremental_vacuum call, the write lock is released in between
+MAX_VACUUM_PAGES = 250_000        # per pass (~1 GB with 4 KiB pages)
+AUTO_VACUUM_INCREMENTAL = 2
+
+SELECT_IDLE_SESSIONS_SQL = """
+SELECT s.session_id FROM sessions s
+WHERE s.last_update_time < ?
+  AND EXISTS (SELECT 1 FROM messages m WHERE m.session_id = s.session_id)
+ORDER BY s.last_update_time
+LIMIT ?
+"""
+
+# a session written to after it was archived is not expired, whatever its archive says
+SELECT_EXPIRED_ARCHIVES_SQL = """
+SELECT a.session_id, s.app_name, s.user_id FROM session_archive a
+LEFT JOIN sessions s ON s.session_id = a.session_id
+WHERE a.last_event_time < ? AND (s.last_update_time IS NULL OR s.last_update_time < ?)
+LIMIT ?
+"""
+
+ARCHIVE_STATS_SQL = "SELECT COUNT(*), SUM(event_count), SUM(raw_bytes), SUM(stored_bytes) FROM session_archive"
+
+
+@dataclass
+class MaintenanceReport:
+    archived_sessions: int = 0
+    archived_events: int = 0
+    archive_raw_bytes: int = 0       # JSON size of what was archived this pass
+    archive_stored_bytes: int = 0    # compressed size
+    deleted_sessions: int = 0
+    search_cache_purged: int = 0
+    directory_providers: int = 0     # providers added / updated from doctor searches
+    freed_pages: int = 0
+    checkpoint: Optional[tuple] = None  # (busy, wal frames, frames checkpointed)
+    file_bytes_before: int = 0       # database + -wal file
+    file_bytes_after: int = 0
+    elapsed_ms: float = 0.0
+
+    @property
+    def bytes_reclaimed(self) -> int:
+        return max(0, self.file_bytes_before - self.file_bytes_after)
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "bytes_reclaimed": self.bytes_reclaimed}
+
+
+async def _pragma(db, sql: str):
+    cursor = await db.execute(sql)
+    row = await cursor.fetchone()
+    await cursor.close()
+    return row
+
+
+# ================= SCHEDULED MAINTENANCE =================
+class DatabaseMaintenance:
+    """
+    Archives idle sessions, applies the retention policy and compacts the database.
+
+        maintenance = DatabaseMaintenance(store, archive_after_days=30)
+        report = await maintenance.run_once()
+        print(report.bytes_reclaimed)
+
+    start() runs a pass every interval_seconds in the background, stop() ends it.
+    """
+
+    def __init__(
+        self,
+        store: Union[SessionStore, str],
+        archive_after_days: float = 30.0,
+        delete_after_days: float = 0.0,
+        interval_seconds: float = 3600.0,
+        search_cache: Any = None,
+        codec: Optional[str] = None,
+        batch_sessions: int = ARCHIVE_BATCH_SESSIONS,
+        directory: Any = None,
+    ):
+        self.store = store if isinstance(store, SessionStore) else SessionStore(store)
+        self.archive_after_days = archive_after_days
+        self.delete_after_days = delete_after_days
+        self.interval_seconds = interval_seconds
+        self.search_cache = search_cache
+        self.directory = directory
+        self.codec = codec  # None: zstd if installed, else gzip
+        self.batch_sessions = batch_sessions
+        self.last_report: Optional[MaintenanceReport] = None
+        self.runs = 0
+        self._task: Optional[asyncio.Task] = None
+        self._warned_auto_vacuum: set[str] = set()
+
+    def _files(self) -> list[SessionStore]:
+        """Every database file: the store itself plus its shards (sessions live in the shards)."""
+        return [self.store] + [shard for shard in self.store.shards if shard is not self.store]
+
+    def _file_bytes(self) -> int:
+        paths = [p for store in self._files() if store.db_path != ":memory:" for p in (store.db_path, store.db_path + "-wal")]
+        return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+    # ================= STEPS =================
+    async def archive_idle_sessions(self, report: MaintenanceReport):
+        if self.archive_after_days <= 0:
+            return
+        cutoff = time.time() - self.archive_after_days * DAY_SECONDS
+        # queued group-commit rows belong in the hot table before their session is archived
+        await self.store.flush()
+        for shard in self.store.shards:
+            async with shard.read() as db:
+                cursor = await db.execute(SELECT_IDLE_SESSIONS_SQL, (cutoff, self.batch_sessions))
+                session_ids = [row[0] for row in await cursor.fetchall()]
+                await cursor.close()
+            for session_id in session_ids:
+                archived = await shard.archive_session(session_id, codec=self.codec)
+                if archived is None:
+                    continue
+                report.archived_sessions += 1
+                report.archived_events += archived["events"]
+                report.archive_raw_bytes += archived["raw_bytes"]
+                report.archive_stored_bytes += archived["stored_bytes"]
+
+    async def delete_expired_sessions(self, report: MaintenanceReport):
+        if self.delete_after_days <= 0:
+            return
+        cutoff = time.time() - self.delete_after_days * DAY_SECONDS
+        for shard in self.store.shards:
+            async with shard.read() as db:
+                cursor = await db.execute(SELECT_EXPIRED_ARCHIVES_SQL, (cutoff, cutoff, self.batch_sessions))
+                rows = await cursor.fetchall()
+                await cursor.close()
+            for session_id, app_name, user_id in rows:
+                # archives without a sessions row (saved by save_session_to_db) go the same way
+                await shard.delete_session(app_name or "", user_id or "", session_id)
+                report.deleted_sessions += 1
+
+    async def incremental_vacuum(self, report: MaintenanceReport):
+        for store in self._files():
+            await self._vacuum_file(store, report)
+
+    async def _vacuum_file(self, store: SessionStore, report: MaintenanceReport):
+        async with store.write() as db:
+            (auto_vacuum,) = await _pragma(db, "PRAGMA auto_vacuum")
+            (free_pages,) = await _pragma(db, "PRAGMA freelist_count")
+        if auto_vacuum != AUTO_VACUUM_INCREMENTAL:
+            if store.db_path not in self._warned_auto_vacuum:
+                logger.warning(
+                    "%s was created without auto_vacuum=INCREMENTAL, freed pages are reused but never returned; "
+                    "run enable_incremental_vacuum() (python -m mediflow_ai.maintenance --enable-incremental-vacuum) once",
+                    store.db_path,
+                )
+                self._warned_auto_vacuum.add(store.db_path)
+            return
+        while free_pages > 0 and report.freed_pages < MAX_VACUUM_PAGES:
+            async with store.write() as db:
+                cursor = await db.execute(f"PRAGMA incremental_vacuum({VACUUM_CHUNK_PAGES})")
+                await cursor.fetchall()  # every page freed is one step
+                await cursor.close()
+                await db.commit()
+                (remaining,) = await _pragma(db, "PRAGMA freelist_count")
+            if remaining >= free_pages:
+                break
+            report.freed_pages += free_pages - remaining
+            free_pages = remaining
+
+    async def checkpoint(self, report: MaintenanceReport, mode: str = "TRUNCATE"):
+        for store in self._files():
+            if store.db_path == ":memory:":
+                continue
+            async with store.write() as db:
+                result = tuple(await _pragma(db, f"PRAGMA wal_checkpoint({mode})"))
+            # summed over the files of a sharded store
+            report.checkpoint = result if report.checkpoint is None else tuple(map(sum, zip(report.checkpoint, result)))
+
+    async def run_once(self) -> MaintenanceReport:
+        """One full pass; each step only holds the write lock for short transactions."""
+        started = time.perf_counter()
+        report = MaintenanceReport(file_bytes_before=self._file_bytes())
+        await self.archive_idle_sessions(report)
+        await self.delete_expired_sessions(report)
+        # before the purge: an expired doctor search still lists providers worth keeping
+        if self.directory is not None:
+            report.directory_providers = await self.directory.ingest_search_results()
+        if self.search_cache is not None:
+            report.search_cache_purged = await self.search_cache.purge_expired()
+        await self.incremental_vacuum(report)
+        await self.checkpoint(report)
+        report.file_bytes_after = self._file_bytes()
+        report.elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+        self.last_report = report
+        self.runs += 1
+        logger.info(
+            "Maintenance: archived %d sessions (%d events, %d -> %d bytes), deleted %d, freed %d pages, reclaimed %d bytes in %.0f ms",
+            report.archived_sessions, report.archived_events, report.archive_raw_bytes, report.archive_stored_bytes,
+            report.deleted_sessions, report.freed_pages, report.bytes_reclaimed, report.elapsed_ms,
+        )
+        return report
+
+    async def enable_incremental_vacuum(self) -> int:
+        """
+        Switch an older database to auto_vacuum=INCREMENTAL. That needs one full VACUUM,
+        which rewrites the whole file and blocks writers while it runs. Returns bytes reclaimed.
+        """
+        before = self._file_bytes()
+        await self.store.flush()
+        for store in self._files():
+            async with store.write() as db:
+                (auto_vacuum,) = await _pragma(db, "PRAGMA auto_vacuum")
+                if auto_vacuum == AUTO_VACUUM_INCREMENTAL:
+                    continue
+                await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                await db.execute("VACUUM")
+                await _pragma(db, "PRAGMA wal_checkpoint(TRUNCATE)")
+            self._warned_auto_vacuum.discard(store.db_path)
+        return max(0, before - self._file_bytes())
+
+    async def archive_stats(self) -> dict:
+        stats = {"sessions": 0, "events": 0, "raw_bytes": 0, "stored_bytes": 0}
+        for shard in self.store.shards:
+            async with shard.read() as db:
+                row = await _pragma(db, ARCHIVE_STATS_SQL)
+            for name, value in zip(stats, row):
+                stats[name] += value or 0
+        return stats
+
+    # ================= BACKGROUND SCHEDULE =================
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Run a pass every interval_seconds (the first one after one interval). No-op when the interval is 0."""
+        if self.interval_seconds > 0 and not self.running:
+            self._task = asyncio.create_task(self._run(), name="sqlite-maintenance")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Database maintenance pass failed")
+
+
+def main():
+    try:
+        from .config import MediFlowConfig
+        from .sharding import session_store
+    except ImportError:
+        from config import MediFlowConfig
+        from sharding import session_store
+
+    config = MediFlowConfig.from_env()
+    parser = argparse.ArgumentParser(description="Archive idle sessions and compact the chat database.")
+    parser.add_argument("--db", default=config.db_path)
+    parser.add_argument("--shards", type=int, default=config.db_shards)
+    parser.add_argument("--archive-after-days", type=float, default=config.archive_after_days)
+    parser.add_argument("--delete-after-days", type=float, default=config.delete_after_days)
+    parser.add_argument("--codec", choices=["zstd", "gzip"], default=None)
+    parser.add_argument("--enable-incremental-vacuum", action="store_true", help="one-time full VACUUM of an older database")
+    parser.add_argument("--restore", metavar="SESSION_ID", help="move one archived session back into the hot tables")
+    args = parser.parse_args()
+
+    async def run():
+        async with session_store(args.db, args.shards) as store:
+            maintenance = DatabaseMaintenance(
+                store, archive_after_days=args.archive_after_days, delete_after_days=args.delete_after_days, codec=args.codec
+            )
+            if args.restore:
+                print(json.dumps({"restored_events": await store.restore_session(args.restore)}))
+                return
+            if args.enable_incremental_vacuum:
+                print(json.dumps({"vacuum_bytes_reclaimed": await maintenance.enable_incremental_vacuum()}))
+            report = await maintenance.run_once()
+            print(json.dumps({**report.to_dict(), "archive": await maintenance.archive_stats()}, indent=2))
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+# memory_service.py
+import asyncio
+import re
+import time
+from typing import Optional, Union
+
+from google.adk.errors.already_exists_error import AlreadyExistsError
+from google.adk.memory import BaseMemoryService
+from google.adk.memory.base_memory_service import SearchMemoryResponse
+from google.adk.memory.memory_entry import MemoryEntry
+from google.genai.types import Content, Part
+
+try:
+    from .sqlite_store import SessionStore, _replay_archived_events
+except ImportError:
+    from sqlite_store import SessionStore, _replay_archived_events
+
+# ================= FTS5 TABLES AND TRIGGERS =================
+# rowid of memory_fts == messages.id. scope is one token per (app_name, user_id),
+# so "only this user's memories" is resolved by the index instead of a post-filter.
+CREATE_MEMORY_FTS_SQL = """
+CREATE VIRTUAL TABLE memory_fts USING fts5(
+    scope,
+    text,
+    session_id UNINDEXED,
+    event_index UNINDEXED,
+    role UNINDEXED,
+    timestamp UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+SCOPE_SQL = "hex({app} || char(0) || {user})"
+
+# scope of a message = its session's owner. A session_id has one owner (sqlite_store refuses a
+# second one); databases from before that rule may hold two, and then the message gets no scope
+# at all rather than an arbitrary user's. NULL scope never matches a search.
+OWNER_SCOPE_SQL = (
+    f"SELECT CASE WHEN COUNT(*) = 1 THEN {SCOPE_SQL.format(app='MAX(app_name)', user='MAX(user_id)')} END "
+    "FROM sessions WHERE session_id = {session_id}"
+)
+
+# Archived sessions stay recallable: archive_session() writes the archive row before it deletes
+# the hot messages, so a deleted message that its archive covers keeps its memory_fts row
+# (remembered in memory_archived). Deleting the archive (restore_session re-inserts the events,
+# delete_session / retention drop them) removes those rows.
+CREATE_MEMORY_ARCHIVED_SQL = """
+CREATE TABLE IF NOT EXISTS memory_archived (
+    session_id TEXT NOT NULL,
+    fts_rowid INTEGER NOT NULL,
+    PRIMARY KEY (session_id, fts_rowid)
+) WITHOUT ROWID;
+"""
+
+ARCHIVED_EVENT_SQL = (
+    "EXISTS (SELECT 1 FROM session_archive a "
+    "WHERE a.session_id = old.session_id AND a.last_event_index >= old.event_index)"
+)
+
+# messages are indexed inside the same transaction that saves them (group commit included)
+CREATE_MEMORY_TRIGGERS_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS messages_memory_insert AFTER INSERT ON messages
+    WHEN new.text IS NOT NULL AND new.text <> ''
+    BEGIN
+        INSERT INTO memory_fts (rowid, scope, text, session_id, event_index, role, timestamp)
+        VALUES (
+            new.id,
+            ({OWNER_SCOPE_SQL.format(session_id="new.session_id")}),
+            new.text, new.session_id, new.event_index, new.role, new.timestamp
+        );
+    END;
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS messages_memory_delete AFTER DELETE ON messages
+    WHEN NOT ({ARCHIVED_EVENT_SQL})
+    BEGIN
+        DELETE FROM memory_fts WHERE rowid = old.id;
+    END;
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS messages_memory_archive AFTER DELETE ON messages
+    WHEN {ARCHIVED_EVENT_SQL}
+    BEGIN
+        INSERT OR IGNORE INTO memory_archived (session_id, fts_rowid) VALUES (old.session_id, old.id);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS session_archive_memory_delete AFTER DELETE ON session_archive
+    BEGIN
+        DELETE FROM memory_fts WHERE rowid IN (SELECT fts_rowid FROM memory_archived WHERE session_id = old.session_id);
+        DELETE FROM memory_archived WHERE session_id = old.session_id;
+    END;
+    """,
+]
+
+# first setup only: index what was saved before the triggers existed
+BACKFILL_MEMORY_SQL = f"""
+INSERT INTO memory_fts (rowid, scope, text, session_id, event_index, role, timestamp)
+SELECT m.id,
+       ({OWNER_SCOPE_SQL.format(session_id="m.session_id")}),
+       m.text, m.session_id, m.event_index, m.role, m.timestamp
+FROM messages m
+WHERE m.text IS NOT NULL AND m.text <> ''
+"""
+
+# triggers are recreated on every setup so an older definition is replaced
+DROP_MEMORY_TRIGGERS_SQL = [
+    "DROP TRIGGER IF EXISTS messages_memory_insert;",
+    "DROP TRIGGER IF EXISTS messages_memory_delete;",
+    "DROP TRIGGER IF EXISTS messages_memory_archive;",
+    "DROP TRIGGER IF EXISTS session_archive_memory_delete;",
+]
+
+# archives whose events were never indexed: made before memory_fts existed (or before archived
+# sessions kept their rows), replayed through the triggers once
+UNINDEXED_ARCHIVES_SQL = """
+SELECT session_id FROM session_archive
+WHERE session_id NOT IN (SELECT session_id FROM memory_archived)
+"""
+
+# older triggers took the first of several owners; their rows lose the scope they may not have
+SHARED_SESSION_IDS_SQL = "SELECT session_id FROM sessions GROUP BY session_id HAVING COUNT(*) > 1"
+UNSCOPE_MEMORY_SQL = "UPDATE memory_fts SET scope = NULL WHERE session_id = ?"
+
+# rank comes back too: a sharded store merges the per-shard top_k by it
+SEARCH_MEMORY_SQL = """
+SELECT text, role, session_id, event_index, timestamp, rank FROM memory_fts
+WHERE memory_fts MATCH ?
+ORDER BY rank
+LIMIT ?
+"""
+
+# cap on query terms, keeps MATCH cost bounded for pasted paragraphs
+MAX_QUERY_TERMS = 16
+
+
+def _scope_token(app_name: str, user_id: str) -> str:
+    """Same value as SCOPE_SQL computes inside SQLite."""
+    return (app_name + "\0" + user_id).encode("utf-8").hex().upper()
+
+
+def _match_expression(app_name: str, user_id: str, query: str) -> Optional[str]:
+    """Build 'scope:<token> AND text:("a" OR "b" ...)' from free text."""
+    terms = []
+    for word in re.findall(r"\w+", query.lower()):
+        if len(word) > 1 and word not in terms:
+            terms.append(word)
+        if len(terms) >= MAX_QUERY_TERMS:
+            break
+    if not terms:
+        return None
+    quoted = " OR ".join(f'"{t}"' for t in terms)
+    return f'scope:"{_scope_token(app_name, user_id)}" AND text:({quoted})'
+
+
+# ================= SQLITE FTS5 MEMORY SERVICE =================
+class SqliteMemoryService(BaseMemoryService):
+    """
+    ADK MemoryService backed by an SQLite FTS5 index over messages.text.
+
+    Every message saved through sqlite_store is indexed by a trigger in the same
+    transaction, scoped to the (app_name, user_id) that owns its session, and stays
+    indexed when maintenance archives the session. search_memory() returns the
+    top_k best BM25 matches for that user only. With a sharded store every shard
+    file has its own index and a search asks all of them.
+    """
+
+    def __init__(self, store: Union[SessionStore, str], top_k: int = 10):
+        self.store = store if isinstance(store, SessionStore) else SessionStore(store)
+        self.top_k = top_k
+        self._ready = False
+
+    async def setup(self):
+        """
+        Create the FTS table and triggers once, index any older messages, and replay archives
+        not indexed yet (archived before this index existed, or moved here by sharding.migrate).
+        """
+        if self._ready:
+            return
+        for shard in self.store.shards:
+            async with shard.write() as db:
+                cursor = await db.execute("SELECT 1 FROM sqlite_master WHERE name = 'memory_fts'")
+                exists = await cursor.fetchone() is not None
+                await cursor.close()
+                if not exists:
+                    await db.execute(CREATE_MEMORY_FTS_SQL)
+                    await db.execute(BACKFILL_MEMORY_SQL)
+                else:
+                    cursor = await db.execute(SHARED_SESSION_IDS_SQL)
+                    shared = await cursor.fetchall()
+                    await cursor.close()
+                    await db.executemany(UNSCOPE_MEMORY_SQL, shared)
+                await db.execute(CREATE_MEMORY_ARCHIVED_SQL)
+                for trigger_sql in DROP_MEMORY_TRIGGERS_SQL + CREATE_MEMORY_TRIGGERS_SQL:
+                    await db.execute(trigger_sql)
+                cursor = await db.execute(UNINDEXED_ARCHIVES_SQL)
+                for (session_id,) in await cursor.fetchall():
+                    await _replay_archived_events(db, session_id)
+                await cursor.close()
+                await db.commit()
+        self._ready = True
+
+    async def _search_shard(self, shard: SessionStore, expression: str) -> list[tuple]:
+        async with shard.read() as db:
+            cursor = await db.execute(SEARCH_MEMORY_SQL, (expression, self.top_k))
+            rows = await cursor.fetchall()
+            await cursor.close()
+        return rows
+
+    async def add_session_to_memory(self, session) -> None:
+        """
+        Make sure the session's events are indexed. Events already stored by
+        SqliteSessionService were indexed on insert, so this only writes what is new.
+        """
+        await self.setup()
+        await self.store.flush()
+        now = time.time()
+        if not await self.store.create_session_row(session.app_name, session.user_id, session.id, {}, now):
+            if await self.store.get_session_row(session.app_name, session.user_id, session.id) is None:
+                raise AlreadyExistsError(f"Session with id {session.id} belongs to another user.")
+        await self.store.save_session(session, incremental=True)
+
+    async def search_memory(self, *, app_name: str, user_id: str, query: str) -> SearchMemoryResponse:
+        await self.setup()
+        expression = _match_expression(app_name, user_id, query)
+        if expression is None:
+            return SearchMemoryResponse()
+        shards = self.store.shards
+        if len(shards) == 1:
+            rows = await self._search_shard(shards[0], expression)
+        else:
+            # bm25 is computed per shard file, close enough to rank the union
+            per_shard = await asyncio.gather(*(self._search_shard(shard, expression) for shard in shards))
+            rows = sorted((row for rows in per_shard for row in rows), key=lambda row: row[5])[: self.top_k]
+        return SearchMemoryResponse(
+            memories=[
+                MemoryEntry(
+                    content=Content(role=role, parts=[Part(text=text)]),
+                    author=role,
+                    timestamp=timestamp,
+                    custom_metadata={"session_id": session_id, "event_index": event_index},
+                )
+                for text, role, session_id, event_index, timestamp, _ in rows
+            ]
+        )
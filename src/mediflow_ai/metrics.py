@@ -0,0 +1,342 @@
+# metrics.py
+# ================= IN-PROCESS METRICS (PROMETHEUS TEXT) + OPTIONAL OPENTELEMETRY SPANS =================
+# Everything is recorded into REGISTRY; the chat server serves REGISTRY.render() on GET /metrics.
+#   turns        mediflow_turn_seconds, mediflow_turn_queue_seconds, mediflow_turn_first_token_seconds, mediflow_turns_total
+#   model calls  mediflow_model_call_seconds, mediflow_model_calls_total, mediflow_tokens_total (per agent)
+#   tools        mediflow_tool_seconds, mediflow_tool_calls_total (per tool and PHASE)
+#   database     mediflow_db_seconds (per SessionStore call), mediflow_db_lock_wait_seconds,
+#                mediflow_db_group_commit_rows, mediflow_db_write_queue_depth
+#   caches       mediflow_cache_lookup_seconds, mediflow_cache_lookups_total (search / prompt cache)
+# Spans (MEDIFLOW_OTEL_SPANS=1) go to the globally configured OpenTelemetry tracer provider,
+# next to the spans ADK already emits for agents, model calls and tools.
+# Standard library only: sqlite_store imports this module and must stay cheap to import.
+import functools
+import math
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Iterator, Optional
+
+# seconds; covers a cached lookup (sub-ms) up to a slow PHASE 4-8 turn
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+ROW_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+TRACER_NAME = "mediflow_ai"
+MAX_OPEN_MODEL_CALLS = 10_000
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict) -> tuple:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """Set directly, or computed at scrape time from a callback (set_function)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple, float] = {}
+        self._functions: dict[tuple, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float], **labels):
+        """Read function() on every scrape (replaces an earlier function for the same labels)."""
+        self._functions[self._key(labels)] = function
+
+    def value(self, **labels) -> float:
+        key = self._key(labels)
+        return self._functions[key]() if key in self._functions else self._values.get(key, 0)
+
+    def _samples(self):
+        values = dict(self._values)
+        for key, function in self._functions.items():
+            try:
+                values[key] = function()
+            except Exception:
+                continue
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """Upper bucket bound holding the q-quantile (what histogram_quantile() would interpolate towards)."""
+        series = self._series.get(self._key(labels))
+        if not series or not series[2]:
+            return None
+        rank, seen = q * series[2], 0
+        for bound, bucket_count in zip((*self.buckets, math.inf), series[0]):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return math.inf
+
+    def _samples(self):
+        for key, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                raise ValueError(f"metric {metric.name} already registered differently")
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Prometheus text exposition format 0.0.4."""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ================= THE INSTRUMENTS =================
+TURN_SECONDS = REGISTRY.histogram("mediflow_turn_seconds", "Chat turn latency, admission to final reply", ("mode", "outcome"))
+TURN_QUEUE_SECONDS = REGISTRY.histogram("mediflow_turn_queue_seconds", "Time a turn waited for its session lock and a slot")
+TURN_FIRST_TOKEN_SECONDS = REGISTRY.histogram("mediflow_turn_first_token_seconds", "Streaming turns: time to the first reply text")
+TURNS = REGISTRY.counter("mediflow_turns_total", "Chat turns by outcome", ("outcome",))
+
+MODEL_CALL_SECONDS = REGISTRY.histogram("mediflow_model_call_seconds", "LLM call latency per agent", ("agent",))
+MODEL_CALLS = REGISTRY.counter("mediflow_model_calls_total", "LLM calls per agent and result", ("agent", "result"))
+TOKENS = REGISTRY.counter("mediflow_tokens_total", "Tokens reported by the model per agent", ("agent", "kind"))
+# model_routing.RoutedLlm: every attempt on every tier, and the routing decisions around them
+MODEL_ATTEMPT_SECONDS = REGISTRY.histogram("mediflow_model_attempt_seconds", "Routed LLM attempt latency per tier", ("agent", "model"))
+MODEL_ATTEMPTS = REGISTRY.counter("mediflow_model_attempts_total", "Routed LLM attempts per tier and outcome", ("agent", "model", "outcome"))
+MODEL_ROUTING = REGISTRY.counter(
+    "mediflow_model_routing_total", "Hedges launched / won / shed, tiers skipped, fallbacks, deadlines missed", ("agent", "event")
+)
+# governor.OutboundGovernor: the shared gate in front of every model call
+GOVERNOR_LIMIT = REGISTRY.gauge("mediflow_governor_limit", "Adaptive outbound concurrency limit")
+GOVERNOR_IN_FLIGHT = REGISTRY.gauge("mediflow_governor_in_flight", "Outbound model calls holding a slot")
+GOVERNOR_QUEUED = REGISTRY.gauge("mediflow_governor_queued", "Outbound model calls waiting for a slot")
+GOVERNOR_WAIT_SECONDS = REGISTRY.histogram("mediflow_governor_wait_seconds", "Time queued for an outbound slot", ("priority",))
+GOVERNOR_ADMISSIONS = REGISTRY.counter(
+    "mediflow_governor_admissions_total", "Outbound slot requests per priority: immediate, queued, rejected, displaced, timeout, shed",
+    ("priority", "outcome"),
+)
+GOVERNOR_SIGNALS = REGISTRY.counter("mediflow_governor_signals_total", "Congestion signals: 429s seen (rate_limited), latency backoffs (latency)", ("signal",))
+
+TOOL_SECONDS = REGISTRY.histogram("mediflow_tool_seconds", "Tool invocation latency", ("tool", "phase"))
+TOOL_CALLS = REGISTRY.counter("mediflow_tool_calls_total", "Tool invocations per PHASE and outcome", ("tool", "phase", "outcome"))
+
+DB_SECONDS = REGISTRY.histogram("mediflow_db_seconds", "SessionStore call latency", ("op",))
+DB_ERRORS = REGISTRY.counter("mediflow_db_errors_total", "SessionStore calls that raised", ("op",))
+DB_LOCK_WAIT_SECONDS = REGISTRY.histogram("mediflow_db_lock_wait_seconds", "Wait for the writer lock / a pooled reader", ("lock",))
+DB_GROUP_COMMIT_ROWS = REGISTRY.histogram("mediflow_db_group_commit_rows", "Event rows per group commit", buckets=ROW_BUCKETS)
+DB_QUEUE_DEPTH = REGISTRY.gauge("mediflow_db_write_queue_depth", "Batches waiting for the group-commit writer")
+
+CACHE_LOOKUP_SECONDS = REGISTRY.histogram("mediflow_cache_lookup_seconds", "Cache lookup latency", ("cache",))
+CACHE_LOOKUPS = REGISTRY.counter("mediflow_cache_lookups_total", "Cache lookups by result", ("cache", "result"))
+
+CHAT_TURNS_RUNNING = REGISTRY.gauge("mediflow_turns_running", "Turns holding a concurrency slot")
+CHAT_TURNS_PENDING = REGISTRY.gauge("mediflow_turns_pending", "Admitted turns (running + waiting)")
+
+# ================= OPENTELEMETRY SPANS (OPTIONAL) =================
+_tracer = None
+
+
+def enable_tracing(enabled: bool = True):
+    """Emit spans around turns, tools, cache lookups and SessionStore calls (needs opentelemetry-api)."""
+    global _tracer
+    if not enabled:
+        _tracer = None
+        return
+    try:
+        from opentelemetry import trace
+    except ImportError as exc:
+        raise RuntimeError("MEDIFLOW_OTEL_SPANS needs opentelemetry-api (pip install opentelemetry-api)") from exc
+    _tracer = trace.get_tracer(TRACER_NAME)
+
+
+def tracing_enabled() -> bool:
+    return _tracer is not None
+
+
+def span(name: str, **attributes):
+    """A current span when tracing is on, otherwise a no-op context manager."""
+    if _tracer is None:
+        return nullcontext()
+    return _tracer.start_as_current_span(name, attributes={k: v for k, v in attributes.items() if v is not None})
+
+
+@contextmanager
+def timed(histogram: Histogram, span_name: Optional[str] = None, **labels):
+    """Observe the block's duration in histogram (and wrap it in a span when tracing is on)."""
+    started = time.perf_counter()
+    with span(span_name or histogram.name, **labels):
+        try:
+            yield
+        finally:
+            histogram.observe(time.perf_counter() - started, **labels)
+
+
+def instrumented_db(op: str):
+    """Decorator for SessionStore coroutines: latency in mediflow_db_seconds{op}, errors counted."""
+
+    def decorate(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            with span(f"sqlite_store.{op}", op=op):
+                try:
+                    return await function(*args, **kwargs)
+                except Exception:
+                    DB_ERRORS.inc(op=op)
+                    raise
+                finally:
+                    DB_SECONDS.observe(time.perf_counter() - started, op=op)
+
+        return wrapper
+
+    return decorate
+
+
+# ================= MODEL CALL CALLBACKS =================
+def make_model_metrics_callbacks():
+    """
+    (before_model_callback, after_model_callback) that time every LLM call and count its tokens.
+    The before callback goes first in an agent's list so it runs even when a later one answers.
+    """
+    # (invocation_id, agent) -> start; an agent's model calls within one invocation are sequential
+    started: dict[tuple[str, str], float] = {}
+
+    def before_model_metrics(callback_context, llm_request) -> None:
+        if len(started) > MAX_OPEN_MODEL_CALLS:
+            # calls that failed never reach after_model; do not let them pile up
+            started.clear()
+        started[(callback_context.invocation_id, callback_context.agent_name)] = time.perf_counter()
+        return None
+
+    def after_model_metrics(callback_context, llm_response) -> None:
+        if llm_response.partial:
+            return None
+        agent = callback_context.agent_name
+        began = started.pop((callback_context.invocation_id, agent), None)
+        if began is not None:
+            MODEL_CALL_SECONDS.observe(time.perf_counter() - began, agent=agent)
+        MODEL_CALLS.inc(agent=agent, result="error" if llm_response.error_code else "ok")
+        usage = llm_response.usage_metadata
+        if usage is not None:
+            for kind, value in (
+                ("prompt", usage.prompt_token_count),
+                ("candidates", usage.candidates_token_count),
+                ("cached", usage.cached_content_token_count),
+                ("thoughts", usage.thoughts_token_count),
+                ("total", usage.total_token_count),
+            ):
+                if value:
+                    TOKENS.inc(value, agent=agent, kind=kind)
+        return None
+
+    return before_model_metrics, after_model_metrics
@@ -0,0 +1,406 @@
+# model_routing.py
+# ================= PER-AGENT MODEL TIERS, DEADLINES AND HEDGED CALLS =================
+# A route is a comma separated chain of models, primary first, faster fallbacks after it:
+#
+#   MEDIFLOW_SEARCH_MODEL="gemini-2.0-flash,gemini-2.0-flash-lite"   (google_search_agent)
+#   GOOGLE_GENAI_MODEL="gemini-2.0-flash"                           (Tara; a chain works here too)
+#
+# RoutedLlm wraps the chain as one BaseLlm. Every call gets a deadline (seconds, 0 = none):
+#   - a tier gets what is left of the deadline minus a reserve for the next tier (twice its p90
+#     latency, or FALLBACK_RESERVE of the deadline before there are samples); on timeout or
+#     error the call drops to the next, faster tier
+#   - a tier whose median latency no longer fits what is left is skipped outright (timeouts count
+#     as samples of the budget they ran out of); every PROBE_EVERY-th skip still tries it, so a
+#     tier that got fast again is noticed
+#   - hedging (search agent): once a call runs past the tier's hedge_percentile latency,
+#     one duplicate request is sent and whichever answers first wins, the other is cancelled
+#   - streaming calls fall back only before their first chunk and are never hedged
+# Requests that carry a prompt-cache name are sent to a fallback tier with the full prompt again
+# (cached contents belong to one model). Latencies are kept per tier over the last LATENCY_WINDOW calls.
+# With a governor (governor.py) every tier call first waits for an outbound slot, inside the deadline;
+# a hedge only goes out when a slot is free right away, and a refused call is not retried on the next tier.
+#
+# Against the stub with injected latency (10% of primary calls stall for 2 s):
+#   python -m mediflow_ai.model_routing --tiers "stub:50+2000@0.1,stub:20" --deadline 0.5 --hedge-percentile 0.9
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncGenerator, Optional
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from pydantic import PrivateAttr
+
+try:
+    from . import metrics
+    from .governor import GovernorOverloaded, is_rate_limited
+except ImportError:
+    import metrics
+    from governor import GovernorOverloaded, is_rate_limited
+
+logger = logging.getLogger(__name__)
+
+LATENCY_WINDOW = 200          # successful calls remembered per tier
+HEDGE_MIN_SAMPLES = 20        # no hedging until the percentile means something
+FALLBACK_RESERVE = 0.3        # share of the deadline kept for the next tier while it has no samples
+RESERVE_PERCENTILE = 0.9
+RESERVE_MARGIN = 2.0
+SKIP_PERCENTILE = 0.5
+PROBE_EVERY = 20
+
+
+class ModelDeadlineExceeded(TimeoutError):
+    """No tier of a RoutedLlm answered within the call's deadline."""
+
+
+class LatencyWindow:
+    """Latencies (seconds) of one tier's last successful calls."""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self.samples: deque = deque(maxlen=size)
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float, min_samples: int = 1) -> Optional[float]:
+        if len(self.samples) < max(1, min_samples):
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def parse_route(route: str) -> list[str]:
+    """ "a, b ,c" -> ["a", "b", "c"]"""
+    return [name.strip() for name in (route or "").split(",") if name.strip()]
+
+
+def _copy_request(llm_request: LlmRequest) -> LlmRequest:
+    """Contents and config copied (models may edit them in place), tools_dict shared."""
+    return llm_request.model_copy(update={
+        "contents": [content.model_copy(deep=True) for content in llm_request.contents or []],
+        "config": llm_request.config.model_copy(deep=True) if llm_request.config is not None else None,
+    })
+
+
+# ================= ROUTED MODEL =================
+class RoutedLlm(BaseLlm):
+    """
+    One BaseLlm over a chain of tiers (primary first), with a per-call deadline,
+    fallback to the faster tiers and hedged duplicate requests.
+
+        llm = RoutedLlm.from_route("gemini-2.0-flash,gemini-2.0-flash-lite", agent="google_search_agent",
+                                   deadline_seconds=6.0, hedge_percentile=0.95)
+        LlmAgent(name="google_search_agent", model=llm, ...)
+    """
+
+    tiers: list[BaseLlm]
+    agent: str = ""
+    deadline_seconds: float = 0.0
+    hedge_percentile: float = 0.0     # 0 = never hedge
+    hedge_min_samples: int = HEDGE_MIN_SAMPLES
+    prompt_cache: Any = None          # PromptCacheRegistry, to un-cache requests for a fallback tier
+    governor: Any = None              # OutboundGovernor every tier call waits on
+    _latency: list = PrivateAttr(default_factory=list)
+    _skips: list = PrivateAttr(default_factory=list)
+
+    def model_post_init(self, __context: Any) -> None:
+        if not self.tiers:
+            raise ValueError("RoutedLlm needs at least one tier")
+        self._latency = [LatencyWindow() for _ in self.tiers]
+        self._skips = [0] * len(self.tiers)
+
+    @classmethod
+    def from_route(cls, route: str, **kwargs) -> "RoutedLlm":
+        tiers = [resolve_llm(name) for name in parse_route(route)]
+        return cls(model=tiers[0].model if tiers else route, tiers=tiers, **kwargs)
+
+    def latency(self, tier: int) -> LatencyWindow:
+        return self._latency[tier]
+
+    # ---------- budgets ----------
+    def _reserve(self, tier: int) -> float:
+        """Time kept back for tier (the next one) while an earlier tier runs."""
+        p90 = self._latency[tier].percentile(RESERVE_PERCENTILE)
+        return p90 * RESERVE_MARGIN if p90 is not None else self.deadline_seconds * FALLBACK_RESERVE
+
+    def _budget(self, tier: int, deadline_at: Optional[float]) -> tuple[Optional[float], bool]:
+        """(seconds this tier may take or None for no limit, whether to skip it)."""
+        if deadline_at is None:
+            return None, False
+        remaining = deadline_at - time.perf_counter()
+        if tier == len(self.tiers) - 1:
+            return remaining, remaining <= 0
+        budget = remaining - self._reserve(tier + 1)
+        if budget <= 0:
+            return budget, True
+        typical = self._latency[tier].percentile(SKIP_PERCENTILE)
+        if typical is None or typical <= budget:
+            return budget, False
+        self._skips[tier] += 1
+        return budget, self._skips[tier] % PROBE_EVERY != 0
+
+    def _request_for(self, tier: int, llm_request: LlmRequest) -> LlmRequest:
+        if tier == 0:
+            return llm_request
+        request = _copy_request(llm_request)
+        request.model = self.tiers[tier].model
+        config = request.config
+        if config is not None and config.cached_content:
+            # a cached content is bound to the model it was created for
+            prefix = self.prompt_cache.prefix_for(config.cached_content) if self.prompt_cache is not None else None
+            if prefix is not None:
+                config.cached_content = None
+                config.system_instruction, config.tools, config.tool_config = prefix
+        return request
+
+    # ---------- one tier ----------
+    def _slot(self, hedge: bool = False):
+        if self.governor is None:
+            return contextlib.nullcontext()
+        # a hedge is extra load: only on a free slot, never queued behind other calls
+        return self.governor.slot(timeout=0 if hedge else None)
+
+    async def _call(self, tier: int, llm_request: LlmRequest, hedge: bool = False) -> tuple[list[LlmResponse], float]:
+        async with self._slot(hedge):
+            started = time.perf_counter()
+            responses = [response async for response in self.tiers[tier].generate_content_async(llm_request, stream=False)]
+            return responses, time.perf_counter() - started
+
+    async def _attempt(self, tier: int, llm_request: LlmRequest, budget: Optional[float]) -> list[LlmResponse]:
+        """
+        Call one tier, with one hedged duplicate once the call runs past the tier's
+        hedge_percentile latency. Raises ModelDeadlineExceeded when the budget runs out.
+        """
+        model = self.tiers[tier].model
+        started = time.perf_counter()
+        ends_at = None if budget is None else started + budget
+        hedge_at = None
+        if self.hedge_percentile:
+            hedge_after = self._latency[tier].percentile(self.hedge_percentile, self.hedge_min_samples)
+            hedge_at = None if hedge_after is None else started + hedge_after
+        tasks = {asyncio.ensure_future(self._call(tier, llm_request))}
+        hedge = None
+        error: Optional[BaseException] = None
+        try:
+            while tasks:
+                now = time.perf_counter()
+                waits = [at - now for at in (ends_at, hedge_at if hedge is None else None) if at is not None]
+                done, _ = await asyncio.wait(tasks, timeout=max(0.0, min(waits)) if waits else None, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.discard(task)
+                    if task is hedge and isinstance(task.exception(), GovernorOverloaded):
+                        metrics.MODEL_ROUTING.inc(agent=self.agent, event="hedge_shed")
+                        continue
+                    if task.exception() is not None:
+                        error = task.exception()
+                        metrics.MODEL_ATTEMPTS.inc(agent=self.agent, model=model, outcome="error")
+                        continue
+                    responses, seconds = task.result()
+                    self._latency[tier].observe(seconds)
+                    metrics.MODEL_ATTEMPT_SECONDS.observe(seconds, agent=self.agent, model=model)
+                    metrics.MODEL_ATTEMPTS.inc(agent=self.agent, model=model, outcome="ok")
+                    if task is hedge:
+                        metrics.MODEL_ROUTING.inc(agent=self.agent, event="hedge_won")
+                    return responses
+                if done:
+                    continue
+                if ends_at is not None and time.perf_counter() >= ends_at:
+                    self._latency[tier].observe(budget)
+                    metrics.MODEL_ATTEMPTS.inc(len(tasks), agent=self.agent, model=model, outcome="timeout")
+                    raise ModelDeadlineExceeded(f"{model} did not answer within {budget:.2f}s")
+                if hedge is None and hedge_at is not None and time.perf_counter() >= hedge_at:
+                    # models may edit the request in place, the duplicate gets its own copy
+                    hedge = asyncio.ensure_future(self._call(tier, _copy_request(llm_request), hedge=True))
+                    tasks.add(hedge)
+                    metrics.MODEL_ROUTING.inc(agent=self.agent, event="hedge")
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _log_failure(self, tier: int, error: BaseException):
+        # running out of budget and 429s are routine (metrics count them), anything else is worth a warning
+        log = logger.info if isinstance(error, TimeoutError) or is_rate_limited(error) else logger.warning
+        log("%s: %s failed (%s)%s", self.agent, self.tiers[tier].model, error,
+            ", falling back" if tier < len(self.tiers) - 1 else "")
+
+    # ---------- the chain ----------
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        deadline_at = time.perf_counter() + self.deadline_seconds if self.deadline_seconds > 0 else None
+        error: Optional[BaseException] = None
+        for tier in range(len(self.tiers)):
+            budget, skip = self._budget(tier, deadline_at)
+            if skip:
+                if tier < len(self.tiers) - 1:
+                    metrics.MODEL_ROUTING.inc(agent=self.agent, event="skip")
+                continue
+            request = self._request_for(tier, llm_request)
+            if tier > 0:
+                metrics.MODEL_ROUTING.inc(agent=self.agent, event="fallback")
+            if stream:
+                stream_iter = self._stream(tier, request, budget)
+                try:
+                    first = await stream_iter.__anext__()
+                except StopAsyncIteration:
+                    return
+                except GovernorOverloaded:
+                    metrics.MODEL_ROUTING.inc(agent=self.agent, event="shed")
+                    raise
+                except Exception as exc:
+                    error = exc
+                    self._log_failure(tier, exc)
+                    continue
+                yield first
+                async for response in stream_iter:
+                    yield response
+                return
+            try:
+                responses = await self._attempt(tier, request, budget)
+            except GovernorOverloaded:
+                # the next tier would wait on the same governor
+                metrics.MODEL_ROUTING.inc(agent=self.agent, event="shed")
+                raise
+            except Exception as exc:
+                error = exc
+                self._log_failure(tier, exc)
+                continue
+            for response in responses:
+                yield response
+            return
+        metrics.MODEL_ROUTING.inc(agent=self.agent, event="deadline_missed" if isinstance(error, TimeoutError) or error is None else "failed")
+        if error is None:
+            raise ModelDeadlineExceeded(f"{self.agent or self.model}: no tier fits the {self.deadline_seconds:.2f}s deadline")
+        raise error
+
+    async def _stream(self, tier: int, llm_request: LlmRequest, budget: Optional[float]) -> AsyncGenerator[LlmResponse, None]:
+        """
+        The tier's stream; only the wait for the first chunk (governor slot included) is bounded
+        by the budget. The slot is held until the stream ends.
+        """
+        model = self.tiers[tier].model
+        responses = self.tiers[tier].generate_content_async(llm_request, stream=True)
+        async with contextlib.AsyncExitStack() as stack:
+
+            async def first_chunk():
+                await stack.enter_async_context(self._slot())
+                return await responses.__anext__(), time.perf_counter()
+
+            try:
+                first, started = await asyncio.wait_for(first_chunk(), timeout=budget)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                self._latency[tier].observe(budget)
+                metrics.MODEL_ATTEMPTS.inc(agent=self.agent, model=model, outcome="timeout")
+                await responses.aclose()
+                raise ModelDeadlineExceeded(f"{model} sent nothing within {budget:.2f}s")
+            except GovernorOverloaded:
+                await responses.aclose()
+                raise
+            except Exception:
+                metrics.MODEL_ATTEMPTS.inc(agent=self.agent, model=model, outcome="error")
+                raise
+            self._latency[tier].observe(time.perf_counter() - started)
+            metrics.MODEL_ATTEMPTS.inc(agent=self.agent, model=model, outcome="ok")
+            yield first
+            async for response in responses:
+                yield response
+
+
+# ================= BUILDING ROUTES FROM CONFIG =================
+def resolve_llm(name: str) -> BaseLlm:
+    """Model name -> BaseLlm instance ("stub" / "stub:<ms>" is the local StubLlm)."""
+    try:
+        from .stub_model import StubLlm, is_stub_model
+    except ImportError:
+        from stub_model import StubLlm, is_stub_model
+    if is_stub_model(name):
+        return StubLlm.from_name(name)
+    from google.adk.models.registry import LLMRegistry
+
+    return LLMRegistry.new_llm(name)
+
+
+def build_model(
+    route: str, agent: str = "", deadline_seconds: float = 0.0, hedge_percentile: float = 0.0, prompt_cache=None, governor=None
+):
+    """
+    What LlmAgent(model=...) takes for a route: the plain model (name) for one tier without
+    deadline, hedging or governor, a RoutedLlm otherwise.
+    """
+    names = parse_route(route)
+    if len(names) == 1 and deadline_seconds <= 0 and hedge_percentile <= 0 and governor is None:
+        try:
+            from .stub_model import StubLlm, is_stub_model
+        except ImportError:
+            from stub_model import StubLlm, is_stub_model
+        return StubLlm.from_name(names[0]) if is_stub_model(names[0]) else names[0]
+    return RoutedLlm.from_route(
+        route, agent=agent, deadline_seconds=deadline_seconds, hedge_percentile=hedge_percentile,
+        prompt_cache=prompt_cache, governor=governor,
+    )
+
+
+# ================= CLI: A ROUTE AGAINST INJECTED LATENCY =================
+async def _probe(route: str, calls: int, deadline: float, hedge_percentile: float, concurrency: int) -> dict:
+    from google.genai.types import Content, Part
+
+    llm = RoutedLlm.from_route(route, agent="probe", deadline_seconds=deadline, hedge_percentile=hedge_percentile)
+    latencies: list[float] = []
+    failed = 0
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(n: int):
+        nonlocal failed
+        request = LlmRequest(model=llm.model, contents=[Content(role="user", parts=[Part(text=f"pollen count in Pune, call {n}")])])
+        async with slots:
+            started = time.perf_counter()
+            try:
+                async for _ in llm.generate_content_async(request):
+                    pass
+            except Exception:
+                failed += 1
+                return
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(one(n) for n in range(calls)))
+    latencies.sort()
+    return {
+        "route": route,
+        "calls": calls,
+        "failed": failed,
+        "p50_ms": round(latencies[len(latencies) // 2], 1) if latencies else None,
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 1) if latencies else None,
+        "max_ms": round(latencies[-1], 1) if latencies else None,
+        "attempts": {
+            f"{tier.model} {outcome}": metrics.MODEL_ATTEMPTS.value(agent="probe", model=tier.model, outcome=outcome)
+            for tier in llm.tiers
+            for outcome in ("ok", "timeout", "error")
+        },
+        "routing": {
+            event: metrics.MODEL_ROUTING.value(agent="probe", event=event)
+            for event in ("hedge", "hedge_won", "hedge_shed", "skip", "fallback", "deadline_missed", "failed", "shed")
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive a model route (deadline, fallback, hedging) and report latencies.")
+    parser.add_argument("--tiers", required=True, help='comma separated chain, e.g. "stub:400,stub:20"')
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--deadline", type=float, default=0.0, help="seconds per call, 0 = none")
+    parser.add_argument("--hedge-percentile", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(_probe(args.tiers, args.calls, args.deadline, args.hedge_percentile, args.concurrency)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+# prompt_cache.py
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Optional, Union
+
+try:
+    from . import metrics
+    from .governor import GovernorOverloaded, is_rate_limited
+    from .sqlite_store import SessionStore
+except ImportError:
+    import metrics
+    from governor import GovernorOverloaded, is_rate_limited
+    from sqlite_store import SessionStore
+
+logger = logging.getLogger(__name__)
+
+# ================= STATIC PREFIX CACHING =================
+# Tara's and google_search_agent's system instruction + tool declarations are
+# the same on every call. They are uploaded once as a cached content per
+# (agent, model, prompt fingerprint), and every request from every session only
+# sends the cache name plus its own conversation. Editing a prompt changes the
+# fingerprint, so a new cache is made and the old one dropped.
+DEFAULT_TTL_SECONDS = 3600
+REFRESH_MARGIN_SECONDS = 300      # extend the TTL when less than this is left
+RETRY_AFTER_FAILURE_SECONDS = 300  # after a failed create, send the full prompt for a while
+MIN_PREFIX_TOKENS = 1024          # providers refuse tiny caches; ~4 characters per token
+CHARS_PER_TOKEN = 4
+
+CREATE_PROMPT_CACHE_SQL = """
+CREATE TABLE IF NOT EXISTS prompt_cache (
+    fingerprint TEXT PRIMARY KEY,
+    agent_name TEXT NOT NULL,
+    model TEXT NOT NULL,
+    cache_name TEXT NOT NULL,
+    prefix_chars INTEGER,
+    created_at REAL,
+    expires_at REAL
+);
+"""
+CREATE_PROMPT_CACHE_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_prompt_cache_agent ON prompt_cache (agent_name, model);"
+
+SELECT_PROMPT_CACHE_SQL = "SELECT cache_name, expires_at FROM prompt_cache WHERE fingerprint = ? AND expires_at > ?"
+SELECT_STALE_PROMPT_CACHES_SQL = "SELECT fingerprint, cache_name FROM prompt_cache WHERE agent_name = ? AND model = ? AND fingerprint <> ?"
+UPSERT_PROMPT_CACHE_SQL = """
+INSERT INTO prompt_cache (fingerprint, agent_name, model, cache_name, prefix_chars, created_at, expires_at)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (fingerprint) DO UPDATE SET
+    cache_name = excluded.cache_name,
+    created_at = excluded.created_at,
+    expires_at = excluded.expires_at
+"""
+UPDATE_PROMPT_CACHE_EXPIRY_SQL = "UPDATE prompt_cache SET expires_at = ? WHERE fingerprint = ?"
+
+
+def _dump(value: Any) -> Any:
+    return value.model_dump(mode="json", exclude_none=True) if hasattr(value, "model_dump") else value
+
+
+def prompt_fingerprint(model: str, system_instruction: Any, tools: Any = None, tool_config: Any = None) -> str:
+    """Stable hash of everything that goes into the cached prefix."""
+    payload = {
+        "model": model,
+        "system_instruction": _dump(system_instruction),
+        "tools": [_dump(tool) for tool in tools or []],
+        "tool_config": _dump(tool_config),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _prefix_chars(system_instruction: Any, tools: Any) -> int:
+    text = system_instruction if isinstance(system_instruction, str) else json.dumps(_dump(system_instruction), default=str)
+    return len(text) + sum(len(json.dumps(_dump(tool), default=str)) for tool in tools or [])
+
+
+# ================= BACKENDS =================
+class GenaiCacheBackend:
+    """Gemini explicit caching (client.aio.caches). The client is built from the environment on first use."""
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google import genai
+
+            self._client = genai.Client()
+        return self._client
+
+    async def create(self, model: str, system_instruction: Any, tools: Any, tool_config: Any, ttl_seconds: int, display_name: str) -> tuple[str, float]:
+        from google.genai import types
+
+        cached = await self.client.aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_instruction,
+                tools=tools or None,
+                tool_config=tool_config,
+                ttl=f"{ttl_seconds}s",
+                display_name=display_name,
+            ),
+        )
+        expire_time = getattr(cached, "expire_time", None)
+        return cached.name, expire_time.timestamp() if expire_time else time.time() + ttl_seconds
+
+    async def refresh(self, cache_name: str, ttl_seconds: int) -> float:
+        from google.genai import types
+
+        cached = await self.client.aio.caches.update(
+            name=cache_name, config=types.UpdateCachedContentConfig(ttl=f"{ttl_seconds}s")
+        )
+        expire_time = getattr(cached, "expire_time", None)
+        return expire_time.timestamp() if expire_time else time.time() + ttl_seconds
+
+    async def delete(self, cache_name: str):
+        await self.client.aio.caches.delete(name=cache_name)
+
+
+# ================= REGISTRY =================
+class PromptCacheRegistry:
+    """
+    Maps a prompt fingerprint to a live provider cache name.
+    Tier 1: in-process dict. Tier 2: prompt_cache table, so restarts and other
+    workers on the same database reuse the cache instead of creating another.
+    Any backend error means "no cache": the caller sends the full prompt.
+    """
+
+    def __init__(
+        self,
+        store: Union[SessionStore, str],
+        backend,
+        ttl_seconds: int = DEFAULT_TTL_SECONDS,
+        refresh_margin: float = REFRESH_MARGIN_SECONDS,
+        min_prefix_tokens: int = MIN_PREFIX_TOKENS,
+    ):
+        self.store = store if isinstance(store, SessionStore) else SessionStore(store)
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = refresh_margin
+        self.min_prefix_tokens = min_prefix_tokens
+        # fingerprint -> (cache_name, expires_at)
+        self._memory: dict[str, tuple[str, float]] = {}
+        # fingerprint -> time before which we do not try again
+        self._failed_until: dict[str, float] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        # cache_name -> (system_instruction, tools, tool_config), to resend the prompt if the cache vanished
+        self._prefixes: dict[str, tuple[Any, Any, Any]] = {}
+        self._ready = False
+        self.stats = {"hits": 0, "creates": 0, "refreshes": 0, "fallbacks": 0, "invalidated": 0, "skipped_small": 0}
+
+    async def setup(self):
+        if self._ready:
+            return
+        async with self.store.write() as db:
+            await db.execute(CREATE_PROMPT_CACHE_SQL)
+            await db.execute(CREATE_PROMPT_CACHE_INDEX_SQL)
+            await db.commit()
+        self._ready = True
+
+    async def get_cache_name(
+        self, agent_name: str, model: str, system_instruction: Any, tools: Any = None, tool_config: Any = None
+    ) -> Optional[str]:
+        """Cache name for this prefix (created or refreshed as needed), or None to send the prompt uncached."""
+        if not system_instruction:
+            return None
+        started = time.perf_counter()
+        cache_name, outcome = await self._lookup(agent_name, model, system_instruction, tools, tool_config)
+        metrics.CACHE_LOOKUPS.inc(cache="prompt", result=outcome)
+        metrics.CACHE_LOOKUP_SECONDS.observe(time.perf_counter() - started, cache="prompt")
+        return cache_name
+
+    async def _lookup(self, agent_name, model, system_instruction, tools, tool_config) -> tuple[Optional[str], str]:
+        prefix_chars = _prefix_chars(system_instruction, tools)
+        if prefix_chars < self.min_prefix_tokens * CHARS_PER_TOKEN:
+            self.stats["skipped_small"] += 1
+            return None, "skipped_small"
+
+        fingerprint = prompt_fingerprint(model, system_instruction, tools, tool_config)
+        now = time.time()
+        entry = self._memory.get(fingerprint)
+        if entry is not None and entry[1] - now > self.refresh_margin:
+            self.stats["hits"] += 1
+            return entry[0], "memory_hit"
+        if self._failed_until.get(fingerprint, 0) > now:
+            self.stats["fallbacks"] += 1
+            return None, "fallback"
+
+        # one create/refresh per prefix even when many sessions arrive at once
+        lock = self._locks.setdefault(fingerprint, asyncio.Lock())
+        async with lock:
+            try:
+                cache_name, outcome = await self._resolve(
+                    fingerprint, agent_name, model, system_instruction, tools, tool_config, prefix_chars
+                )
+                self._prefixes[cache_name] = (system_instruction, tools, tool_config)
+                return cache_name, outcome
+            except Exception as exc:
+                logger.warning("Prompt cache unavailable for %s (%s): %s", agent_name, model, exc)
+                self._memory.pop(fingerprint, None)
+                self._failed_until[fingerprint] = time.time() + RETRY_AFTER_FAILURE_SECONDS
+                self.stats["fallbacks"] += 1
+                return None, "fallback"
+
+    def prefix_for(self, cache_name: str) -> Optional[tuple[Any, Any, Any]]:
+        return self._prefixes.get(cache_name)
+
+    async def invalidate(self, cache_name: str):
+        """Forget a cache the provider no longer knows (deleted or expired early)."""
+        self._prefixes.pop(cache_name, None)
+        for fingerprint, (name, _) in list(self._memory.items()):
+            if name == cache_name:
+                del self._memory[fingerprint]
+        await self.setup()
+        async with self.store.write() as db:
+            await db.execute("DELETE FROM prompt_cache WHERE cache_name = ?", (cache_name,))
+            await db.commit()
+        self.stats["invalidated"] += 1
+
+    async def _resolve(self, fingerprint, agent_name, model, system_instruction, tools, tool_config, prefix_chars) -> tuple[str, str]:
+        """(cache_name, how it was found: memory_hit / sqlite_hit / refresh / create)."""
+        now = time.time()
+        entry = self._memory.get(fingerprint)
+        if entry is not None and entry[1] - now > self.refresh_margin:
+            self.stats["hits"] += 1
+            return entry[0], "memory_hit"
+
+        await self.setup()
+        if entry is None:
+            async with self.store.read() as db:
+                cursor = await db.execute(SELECT_PROMPT_CACHE_SQL, (fingerprint, now))
+                row = await cursor.fetchone()
+                await cursor.close()
+            entry = (row[0], row[1]) if row else None
+
+        if entry is not None:
+            cache_name, expires_at = entry
+            outcome = "sqlite_hit"
+            if expires_at - now <= self.refresh_margin:
+                outcome = "refresh"
+                expires_at = await self.backend.refresh(cache_name, self.ttl_seconds)
+                self.stats["refreshes"] += 1
+                async with self.store.write() as db:
+                    await db.execute(UPDATE_PROMPT_CACHE_EXPIRY_SQL, (expires_at, fingerprint))
+                    await db.commit()
+            else:
+                self.stats["hits"] += 1
+            self._memory[fingerprint] = (cache_name, expires_at)
+            return cache_name, outcome
+
+        cache_name, expires_at = await self.backend.create(
+            model, system_instruction, tools, tool_config, self.ttl_seconds,
+            display_name=f"mediflow-{agent_name}-{fingerprint[:12]}",
+        )
+        self.stats["creates"] += 1
+        self._memory[fingerprint] = (cache_name, expires_at)
+        async with self.store.write() as db:
+            await db.execute(
+                UPSERT_PROMPT_CACHE_SQL, (fingerprint, agent_name, model, cache_name, prefix_chars, now, expires_at)
+            )
+            cursor = await db.execute(SELECT_STALE_PROMPT_CACHES_SQL, (agent_name, model, fingerprint))
+            stale = await cursor.fetchall()
+            await cursor.close()
+            if stale:
+                await db.executemany("DELETE FROM prompt_cache WHERE fingerprint = ?", [(fp,) for fp, _ in stale])
+            await db.commit()
+        # the prompt was edited: the old caches are never used again
+        for old_fingerprint, old_cache_name in stale:
+            self._memory.pop(old_fingerprint, None)
+            self.stats["invalidated"] += 1
+            try:
+                await self.backend.delete(old_cache_name)
+            except Exception as exc:
+                logger.info("Could not delete stale prompt cache %s: %s", old_cache_name, exc)
+        return cache_name, "create"
+
+
+# ================= MODEL CALLBACKS =================
+def make_prompt_cache_callbacks(registry: PromptCacheRegistry, model):
+    """
+    (before_model_callback, on_model_error_callback) for one agent.
+
+    The before callback (register it last) swaps the static system instruction /
+    tools for the cached content name; per-turn notes must travel in
+    llm_request.contents, never in the system instruction. If the provider
+    rejects the cache, the error callback drops it and re-sends this request
+    with the full prompt, so the turn still succeeds. Overload (429s, the
+    outbound governor, deadlines) says nothing about the cache and is not retried.
+    """
+
+    async def prompt_cache_callback(callback_context, llm_request) -> None:
+        config = llm_request.config
+        if config is None or config.cached_content or not llm_request.model:
+            return None
+        cache_name = await registry.get_cache_name(
+            callback_context.agent_name, llm_request.model, config.system_instruction, config.tools, config.tool_config
+        )
+        if cache_name is None:
+            return None
+        config.system_instruction = None
+        config.tools = None
+        config.tool_config = None
+        config.cached_content = cache_name
+        return None
+
+    async def prompt_cache_error_callback(callback_context, llm_request, error):
+        if isinstance(error, (GovernorOverloaded, TimeoutError)) or is_rate_limited(error):
+            return None
+        config = llm_request.config
+        cache_name = config.cached_content if config is not None else None
+        prefix = registry.prefix_for(cache_name) if cache_name else None
+        if prefix is None:
+            return None
+        logger.warning("Model call with prompt cache %s failed (%s), retrying uncached", cache_name, error)
+        await registry.invalidate(cache_name)
+        config.cached_content = None
+        config.system_instruction, config.tools, config.tool_config = prefix
+        if isinstance(model, str):
+            from google.adk.models.registry import LLMRegistry
+
+            llm = LLMRegistry.new_llm(model)
+        else:
+            llm = model
+        response = None
+        async for response in llm.generate_content_async(llm_request, stream=False):
+            pass
+        return response
+
+    return prompt_cache_callback, prompt_cache_error_callback
@@ -0,0 +1,275 @@
+# search_cache.py
+import json
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Optional, Union
+
+from google.adk.tools.agent_tool import AgentTool
+
+try:
+    from . import metrics
+    from .sqlite_store import SessionStore
+except ImportError:
+    import metrics
+    from sqlite_store import SessionStore
+
+# ================= TTL PER QUERY CATEGORY (SECONDS) =================
+HOUR = 3600
+DAY = 24 * HOUR
+
+CATEGORY_TTLS = {
+    "weather": 1 * HOUR,       # weather / humidity / AQI
+    "pollen": 6 * HOUR,
+    "outbreak": 1 * DAY,
+    "doctor": 7 * DAY,         # doctor / clinic listings
+    "remedy": 7 * DAY,
+    "symptom_causes": 7 * DAY,
+    "general": 1 * HOUR,
+}
+
+# checked in order, first match wins
+CATEGORY_PATTERNS = [
+    ("weather", re.compile(r"\b(weather|temperature|humidity|aqi|air quality|rain|rainfall|forecast)\b")),
+    ("pollen", re.compile(r"\b(pollen|allergen|allergens)\b")),
+    ("outbreak", re.compile(r"\b(outbreak|outbreaks|epidemic|cases)\b")),
+    ("doctor", re.compile(r"\b(doctor|doctors|clinic|clinics|hospital|hospitals|specialist|near|\w+ologist|\w+iatrician)\b")),
+    ("remedy", re.compile(r"\b(remedy|remedies|relief|home care)\b")),
+    ("symptom_causes", re.compile(r"\b(symptom|symptoms|causes|cause)\b")),
+]
+
+# words that change the wording but not the answer
+FILLER_WORDS = {"current", "currently", "today", "now", "latest", "recent", "in", "at", "for", "the", "of", "a", "an", "what", "is"}
+YEAR_RE = re.compile(r"^(19|20)\d\d$")
+
+# old / alternate city names -> one spelling, so both share a cache entry
+LOCATION_ALIASES = {
+    "bombay": "mumbai",
+    "bangalore": "bengaluru",
+    "calcutta": "kolkata",
+    "madras": "chennai",
+    "gurgaon": "gurugram",
+    "poona": "pune",
+    "new delhi": "delhi",
+    "nyc": "new york",
+}
+# metrics label: which part of Tara's flow a search belongs to
+CATEGORY_PHASES = {
+    "weather": "PHASE 4",
+    "pollen": "PHASE 4",
+    "outbreak": "PHASE 4",
+    "symptom_causes": "PHASE 4",
+    "remedy": "PHASE 6",
+    "doctor": "PHASE 7",
+}
+_ALIAS_RE = re.compile(r"\b(" + "|".join(re.escape(a) for a in sorted(LOCATION_ALIASES, key=len, reverse=True)) + r")\b")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Cache key for a search query: case, accents, punctuation, whitespace, filler
+    words, year tokens and word order do not matter; city aliases are unified.
+    "Current weather Bombay temperature humidity AQI" == "aqi humidity temperature weather mumbai"
+    """
+    text = unicodedata.normalize("NFKC", query).lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    text = " ".join(text.split())
+    text = _ALIAS_RE.sub(lambda m: LOCATION_ALIASES[m.group(1)], text)
+    tokens = {t for t in text.split() if t not in FILLER_WORDS and not YEAR_RE.match(t)}
+    return " ".join(sorted(tokens))
+
+
+def classify_query(normalized_query: str) -> str:
+    for category, pattern in CATEGORY_PATTERNS:
+        if pattern.search(normalized_query):
+            return category
+    return "general"
+
+
+CREATE_SEARCH_CACHE_SQL = """
+CREATE TABLE IF NOT EXISTS search_cache (
+    cache_key TEXT PRIMARY KEY,
+    category TEXT,
+    query TEXT,
+    result TEXT,
+    created_at REAL,
+    expires_at REAL
+);
+"""
+CREATE_SEARCH_CACHE_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_search_cache_expires ON search_cache (expires_at);"
+
+SELECT_SEARCH_CACHE_SQL = "SELECT result, expires_at FROM search_cache WHERE cache_key = ? AND expires_at > ?"
+UPSERT_SEARCH_CACHE_SQL = """
+INSERT INTO search_cache (cache_key, category, query, result, created_at, expires_at)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (cache_key) DO UPDATE SET
+    category = excluded.category,
+    query = excluded.query,
+    result = excluded.result,
+    created_at = excluded.created_at,
+    expires_at = excluded.expires_at
+"""
+
+
+# ================= TWO TIER SEARCH CACHE =================
+class SearchCache:
+    """
+    Cache for google_search_agent results.
+    Tier 1: in-process LRU (max_entries). Tier 2: search_cache table in SQLite,
+    shared by every worker on the same database and kept across restarts.
+    """
+
+    def __init__(self, store: Union[SessionStore, str], max_entries: int = 1024, ttls: Optional[dict[str, float]] = None):
+        self.store = store if isinstance(store, SessionStore) else SessionStore(store)
+        self.max_entries = max_entries
+        self.ttls = {**CATEGORY_TTLS, **(ttls or {})}
+        # cache_key -> (result, expires_at)
+        self._memory: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+        self._ready = False
+        self.stats = {"memory_hits": 0, "sqlite_hits": 0, "misses": 0, "stores": 0}
+
+    async def setup(self):
+        if self._ready:
+            return
+        async with self.store.write() as db:
+            await db.execute(CREATE_SEARCH_CACHE_SQL)
+            await db.execute(CREATE_SEARCH_CACHE_INDEX_SQL)
+            await db.commit()
+        self._ready = True
+
+    def _remember(self, key: str, result: str, expires_at: float):
+        self._memory[key] = (result, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, query: str) -> Optional[str]:
+        started = time.perf_counter()
+        result, outcome = await self._lookup(normalize_query(query))
+        metrics.CACHE_LOOKUPS.inc(cache="search", result=outcome)
+        metrics.CACHE_LOOKUP_SECONDS.observe(time.perf_counter() - started, cache="search")
+        return result
+
+    async def _lookup(self, key: str) -> tuple[Optional[str], str]:
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            if entry[1] > now:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return entry[0], "memory_hit"
+            del self._memory[key]
+
+        await self.setup()
+        async with self.store.read() as db:
+            cursor = await db.execute(SELECT_SEARCH_CACHE_SQL, (key, now))
+            row = await cursor.fetchone()
+            await cursor.close()
+        if row is None:
+            self.stats["misses"] += 1
+            return None, "miss"
+        self.stats["sqlite_hits"] += 1
+        self._remember(key, row[0], row[1])
+        return row[0], "sqlite_hit"
+
+    async def put(self, query: str, result: str) -> str:
+        """Store a result under the query's normalized key. Returns the category used for the TTL."""
+        key = normalize_query(query)
+        category = classify_query(key)
+        now = time.time()
+        expires_at = now + self.ttls.get(category, self.ttls["general"])
+        self._remember(key, result, expires_at)
+        await self.setup()
+        async with self.store.write() as db:
+            await db.execute(UPSERT_SEARCH_CACHE_SQL, (key, category, query, result, now, expires_at))
+            await db.commit()
+        self.stats["stores"] += 1
+        return category
+
+    async def purge_expired(self) -> int:
+        """Delete expired rows from the SQLite tier. Returns rows removed."""
+        await self.setup()
+        async with self.store.write() as db:
+            cursor = await db.execute("DELETE FROM search_cache WHERE expires_at <= ?", (time.time(),))
+            removed = cursor.rowcount
+            await cursor.close()
+            await db.commit()
+        return removed
+
+    @property
+    def hit_ratio(self) -> float:
+        hits = self.stats["memory_hits"] + self.stats["sqlite_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+
+# ================= AGENT TOOL WITH CACHE IN FRONT =================
+# outcome of the CachedAgentTool call running in this context, filled in by the wrapped agent's
+# after_model_callback; a dict, so tasks the nested runner starts write into the same one
+_search_outcome: ContextVar[Optional[dict]] = ContextVar("mediflow_search_outcome", default=None)
+
+
+def search_outcome_callback(callback_context, llm_response) -> None:
+    """after_model_callback: whether the wrapped agent's last model response is an answer worth caching."""
+    outcome = _search_outcome.get()
+    if outcome is None or llm_response.partial:
+        return None
+    content = llm_response.content
+    text = "".join(part.text or "" for part in content.parts if not part.thought) if content and content.parts else ""
+    finish_reason = llm_response.finish_reason
+    outcome["answered"] = bool(
+        text.strip()
+        and not llm_response.error_code
+        and not llm_response.error_message
+        and (finish_reason is None or finish_reason.name == "STOP")
+    )
+    return None
+
+
+class CachedAgentTool(AgentTool):
+    """
+    AgentTool that answers repeated search requests from SearchCache instead of re-running the agent.
+    Every call is timed into mediflow_tool_seconds, labelled with the phase its query belongs to;
+    without a cache it is a plain, instrumented AgentTool.
+    Only answers that came from a successful final model response are cached: AgentTool returns
+    error messages (429s, safety blocks, ...) as plain strings too, and those must not be replayed.
+    """
+
+    def __init__(self, agent, cache: Optional[SearchCache] = None, **kwargs):
+        super().__init__(agent=agent, **kwargs)
+        self.cache = cache
+        callbacks = agent.after_model_callback
+        callbacks = [] if callbacks is None else list(callbacks) if isinstance(callbacks, list) else [callbacks]
+        if search_outcome_callback not in callbacks:
+            agent.after_model_callback = [*callbacks, search_outcome_callback]
+
+    async def run_async(self, *, args: dict[str, Any], tool_context) -> Any:
+        query = args["request"] if "request" in args else json.dumps(args, ensure_ascii=False, sort_keys=True)
+        phase = CATEGORY_PHASES.get(classify_query(normalize_query(query)), "other")
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            with metrics.span("tool." + self.name, phase=phase):
+                result = await self.cache.get(query) if self.cache is not None else None
+                if result is not None:
+                    outcome = "cache_hit"
+                    return result
+                answer = {"answered": False}
+                token = _search_outcome.set(answer)
+                try:
+                    result = await super().run_async(args=args, tool_context=tool_context)
+                finally:
+                    _search_outcome.reset(token)
+                if not answer["answered"] or not isinstance(result, str) or not result.strip():
+                    # an error message or an empty answer: passed on, never cached
+                    outcome = "no_answer"
+                    return result
+                outcome = "ok"
+                if self.cache is not None:
+                    await self.cache.put(query, result)
+                return result
+        finally:
+            metrics.TOOL_CALLS.inc(tool=self.name, phase=phase, outcome=outcome)
+            metrics.TOOL_SECONDS.observe(time.perf_counter() - started, tool=self.name, phase=phase)
@@ -0,0 +1,159 @@
+# server.py
+# ================= TO SERVE MANY CHAT SESSIONS (python -m mediflow_ai.server) =================
+# uvicorn: uvicorn mediflow_ai.server:server --host 0.0.0.0 --port 8000
+# One process owns one SQLite database; scale out with one process per database/shard.
+import asyncio
+import json
+import os
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException
+from google.adk.errors.already_exists_error import AlreadyExistsError
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
+
+try:
+    from .agent import MediFlowApp, create_app
+    from .chat_service import ChatOverloaded, ChatService
+    from .metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY
+except ImportError:
+    from agent import MediFlowApp, create_app
+    from chat_service import ChatOverloaded, ChatService
+    from metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY
+
+RETRY_AFTER_SECONDS = 1
+
+
+class ChatRequest(BaseModel):
+    message: str = Field(min_length=1)
+    user_id: Optional[str] = None
+
+
+class NewSessionRequest(BaseModel):
+    user_id: Optional[str] = None
+
+
+def create_server(app: Optional[MediFlowApp] = None) -> FastAPI:
+    """
+    ASGI app around one ChatService (one Runner, one database).
+    The MediFlowApp is built on startup when not given and closed on shutdown;
+    database maintenance runs on its schedule in between.
+    """
+
+    @asynccontextmanager
+    async def lifespan(api: FastAPI):
+        api.state.chat = ChatService(app or create_app())
+        if api.state.chat.app.maintenance is not None:
+            api.state.chat.app.maintenance.start()
+        try:
+            yield
+        finally:
+            await api.state.chat.close()
+
+    api = FastAPI(title="MediFlow AI", lifespan=lifespan)
+
+    def chat_service() -> ChatService:
+        return api.state.chat
+
+    @api.post("/sessions")
+    async def new_session(body: NewSessionRequest):
+        chat = chat_service()
+        user_id = body.user_id or chat.app.config.user_id
+        session = await chat.ensure_session(user_id, uuid.uuid4().hex)
+        return {"user_id": user_id, "session_id": session.id}
+
+    @api.post("/sessions/{session_id}/messages")
+    async def send_message(session_id: str, body: ChatRequest):
+        chat = chat_service()
+        user_id = body.user_id or chat.app.config.user_id
+        try:
+            result = await chat.chat(user_id, session_id, body.message)
+        except ChatOverloaded as exc:
+            raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+        except AlreadyExistsError as exc:
+            # the session_id belongs to another user
+            raise HTTPException(status_code=409, detail=str(exc))
+        return asdict(result)
+
+    @api.post("/sessions/{session_id}/messages/stream")
+    async def stream_message(session_id: str, body: ChatRequest):
+        """
+        Server-Sent Events: one "delta" event per partial chunk of Tara's reply,
+        then a "final" event with the stored reply and timings.
+        """
+        chat = chat_service()
+        user_id = body.user_id or chat.app.config.user_id
+        # the whole turn runs in one task (the runner's tracing context must not hop tasks);
+        # the response drains its queue
+        items: asyncio.Queue = asyncio.Queue()
+
+        async def produce():
+            try:
+                async for item in chat.stream_chat(user_id, session_id, body.message):
+                    items.put_nowait(item)
+            except Exception as exc:
+                items.put_nowait(exc)
+
+        producer = asyncio.create_task(produce())
+        first = await items.get()
+        # admission happens before the first item, so overload is still a plain 503
+        if isinstance(first, ChatOverloaded):
+            raise HTTPException(status_code=503, detail=str(first), headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+        if isinstance(first, AlreadyExistsError):
+            raise HTTPException(status_code=409, detail=str(first))
+        if isinstance(first, Exception):
+            raise first
+
+        async def sse():
+            item, finished = first, False
+            try:
+                while not finished:
+                    if isinstance(item, Exception):
+                        raise item
+                    yield f"event: {item['type']}\ndata: {json.dumps(item)}\n\n"
+                    finished = item["type"] == "final"
+                    if not finished:
+                        item = await items.get()
+            finally:
+                if not finished:
+                    # client went away mid-turn
+                    producer.cancel()
+
+        return StreamingResponse(sse(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    @api.get("/healthz")
+    async def healthz():
+        return {"status": "ok", **chat_service().snapshot()}
+
+    @api.get("/metrics")
+    async def prometheus_metrics():
+        """Turn / model / tool / DB / cache latencies and counters in the Prometheus text format."""
+        return Response(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+    return api
+
+
+def __getattr__(name: str):
+    # "uvicorn mediflow_ai.server:server" builds the app from the environment on first access
+    if name == "server":
+        globals()["server"] = create_server()
+        return globals()["server"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def main():
+    import uvicorn
+
+    uvicorn.run(
+        create_server(),
+        host=os.environ.get("MEDIFLOW_HOST", "127.0.0.1"),
+        port=int(os.environ.get("MEDIFLOW_PORT", 8000)),
+        log_config=None,  # keep the QueueHandler pipeline from logging_setup
+    )
+
+
+if __name__ == "__main__":
+    main()
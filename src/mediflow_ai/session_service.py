@@ -0,0 +1,299 @@
+# session_service.py
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Optional, Union
+
+from google.adk.errors.already_exists_error import AlreadyExistsError
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+from google.adk.sessions.state import State
+from google.genai.types import Content, Part
+
+try:
+    from .sqlite_store import SessionStore
+except ImportError:
+    from sqlite_store import SessionStore
+
+
+def _light_copy(session: Session) -> Session:
+    """Copy a session so callers can append to events/state without touching the cached one."""
+    copied = session.model_copy(deep=False)
+    copied.events = list(session.events)
+    copied.state = dict(session.state)
+    return copied
+
+
+_SESSION_ONLY_SKIP = (State.TEMP_PREFIX, State.APP_PREFIX, State.USER_PREFIX)
+
+
+def _persistable_state(state: dict) -> dict:
+    """The session's own state: temp: is never stored, app:/user: live in their shared rows."""
+    return {k: v for k, v in state.items() if not k.startswith(_SESSION_ONLY_SKIP)}
+
+
+def _shared_deltas(delta: Optional[dict]) -> tuple[dict, dict]:
+    """(app delta, user delta) of a state delta, keys without their prefix."""
+    app_delta, user_delta = {}, {}
+    for key, value in (delta or {}).items():
+        if key.startswith(State.APP_PREFIX):
+            app_delta[key[len(State.APP_PREFIX):]] = value
+        elif key.startswith(State.USER_PREFIX):
+            user_delta[key[len(State.USER_PREFIX):]] = value
+    return app_delta, user_delta
+
+
+def _event_from_payload(row: tuple) -> Event:
+    """Rebuild an ADK Event from a messages row (full JSON when we have it, role/text for legacy rows)."""
+    _, role, text, event_json = row
+    if event_json:
+        return Event.model_validate_json(event_json)
+    return Event(
+        author="user" if role == "user" else "model",
+        content=Content(role=role, parts=[Part(text=text)]) if text is not None else None,
+    )
+
+
+# ================= SQLITE SESSION SERVICE WITH LRU HOT CACHE =================
+class SqliteSessionService(BaseSessionService):
+    """
+    ADK SessionService that persists sessions in sqlite_store and keeps recently
+    active ones in an in-process LRU cache.
+
+    - cache hit: no SQL at all
+    - cache miss: session row + events are loaded lazily from SQLite
+    - append_event: only the new event (and the session state) is written
+    - at most max_sessions are cached, and any session idle longer than
+      max_idle_seconds is dropped from memory (it stays on disk)
+
+    A session_id has one owner: create_session raises AlreadyExistsError when
+    another user (or app) already stored a session under the same id.
+
+    app:/user: prefixed state keys follow ADK's semantics: they are stored once
+    per app / per (app, user) in the store's app_states / user_states tables and
+    merged into every session returned by create_session / get_session. The
+    shared state of recently seen apps and users is cached too.
+    """
+
+    def __init__(
+        self,
+        store: Union[SessionStore, str],
+        max_sessions: int = 1000,
+        max_idle_seconds: float = 1800.0,
+        write_behind: bool = True,
+    ):
+        self.store = store if isinstance(store, SessionStore) else SessionStore(store)
+        self.max_sessions = max_sessions
+        self.max_idle_seconds = max_idle_seconds
+        self.write_behind = write_behind
+        # (app_name, user_id, session_id) -> (session, last access time)
+        self._cache: "OrderedDict[tuple[str, str, str], tuple[Session, float]]" = OrderedDict()
+        # shared state, keys without prefix: app_name -> app state, (app_name, user_id) -> user state (LRU)
+        self._app_states: dict[str, dict] = {}
+        self._user_states: "OrderedDict[tuple[str, str], dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def _ensure_store(self) -> SessionStore:
+        if not self.store.is_open:
+            await self.store.open()
+            if self.write_behind:
+                self.store.enable_write_behind()
+        return self.store
+
+    # ---------- cache helpers ----------
+    def _cache_get(self, key: tuple[str, str, str]) -> Optional[Session]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        session, last_access = entry
+        now = time.monotonic()
+        if now - last_access > self.max_idle_seconds:
+            del self._cache[key]
+            return None
+        self._cache[key] = (session, now)
+        self._cache.move_to_end(key)
+        return session
+
+    def _cache_put(self, key: tuple[str, str, str], session: Session):
+        self._cache[key] = (session, time.monotonic())
+        self._cache.move_to_end(key)
+        self._evict()
+
+    def _evict(self):
+        now = time.monotonic()
+        # oldest entries sit at the front, so stop at the first one that is still fresh
+        while self._cache:
+            key, (_, last_access) = next(iter(self._cache.items()))
+            if len(self._cache) > self.max_sessions or now - last_access > self.max_idle_seconds:
+                self._cache.popitem(last=False)
+            else:
+                break
+
+    # ---------- app:/user: state ----------
+    async def _shared_state(self, app_name: str, user_id: str) -> tuple[dict, dict]:
+        key = (app_name, user_id)
+        if key not in self._user_states or app_name not in self._app_states:
+            store = await self._ensure_store()
+            app_state, user_state = await store.get_shared_state(app_name, user_id)
+            # setdefault: a concurrent load may have filled (and since updated) them during the await
+            self._app_states.setdefault(app_name, app_state)
+            self._user_states.setdefault(key, user_state)
+        self._user_states.move_to_end(key)
+        user_state = self._user_states[key]
+        while len(self._user_states) > self.max_sessions:
+            self._user_states.popitem(last=False)
+        return self._app_states[app_name], user_state
+
+    async def _merge_shared_state(self, session: Session) -> Session:
+        """Overlay the current app:/user: state on a copy handed out to a caller."""
+        app_state, user_state = await self._shared_state(session.app_name, session.user_id)
+        session.state.update({State.APP_PREFIX + k: v for k, v in app_state.items()})
+        session.state.update({State.USER_PREFIX + k: v for k, v in user_state.items()})
+        return session
+
+    async def _save_shared_state(self, app_name: str, user_id: str, delta: Optional[dict], update_time: float):
+        app_delta, user_delta = _shared_deltas(delta)
+        if not app_delta and not user_delta:
+            return
+        app_state, user_state = await self._shared_state(app_name, user_id)
+        store = await self._ensure_store()
+        await store.update_shared_state(app_name, user_id, app_delta, user_delta, update_time)
+        app_state.update(app_delta)
+        user_state.update(user_delta)
+
+    async def _load(self, app_name: str, user_id: str, session_id: str) -> Optional[Session]:
+        key = (app_name, user_id, session_id)
+        session = self._cache_get(key)
+        if session is not None:
+            self.hits += 1
+            return session
+        self.misses += 1
+        store = await self._ensure_store()
+        stored = await store.get_session_row(app_name, user_id, session_id)
+        if stored is None:
+            return None
+        state, _, last_update_time = stored
+        events = [_event_from_payload(row) for row in await store.get_event_payloads(session_id)]
+        session = Session(
+            id=session_id,
+            app_name=app_name,
+            user_id=user_id,
+            state=state,
+            events=events,
+            last_update_time=last_update_time or 0.0,
+        )
+        self._cache_put(key, session)
+        return session
+
+    # ---------- BaseSessionService ----------
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        session_id = session_id.strip() if session_id else str(uuid.uuid4())
+        store = await self._ensure_store()
+        now = time.time()
+        state = dict(state or {})
+        if not await store.create_session_row(app_name, user_id, session_id, _persistable_state(state), now):
+            raise AlreadyExistsError(f"Session with id {session_id} already exists.")
+        await self._save_shared_state(app_name, user_id, state, now)
+        session = Session(id=session_id, app_name=app_name, user_id=user_id, state=state, last_update_time=now)
+        self._cache_put((app_name, user_id, session_id), session)
+        return await self._merge_shared_state(_light_copy(session))
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        session = await self._load(app_name, user_id, session_id)
+        if session is None:
+            return None
+        copied = _light_copy(session)
+        if config:
+            if config.num_recent_events is not None:
+                copied.events = copied.events[-config.num_recent_events:] if config.num_recent_events else []
+            if config.after_timestamp:
+                copied.events = [e for e in copied.events if e.timestamp >= config.after_timestamp]
+        return await self._merge_shared_state(copied)
+
+    async def get_or_create_session(self, *, app_name: str, user_id: str, session_id: str, state: Optional[dict[str, Any]] = None) -> Session:
+        """Resume a stored session or start it if it was never created."""
+        session = await self.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        if session is not None:
+            return session
+        return await self.create_session(app_name=app_name, user_id=user_id, session_id=session_id, state=state)
+
+    async def list_sessions(self, *, app_name: str, user_id: Optional[str] = None) -> ListSessionsResponse:
+        store = await self._ensure_store()
+        rows = await store.list_session_rows(app_name, user_id)
+        return ListSessionsResponse(
+            sessions=[
+                Session(id=sid, app_name=app_name, user_id=uid, state={}, events=[], last_update_time=last_update or 0.0)
+                for uid, sid, last_update in rows
+            ]
+        )
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        store = await self._ensure_store()
+        self._cache.pop((app_name, user_id, session_id), None)
+        await store.delete_session(app_name, user_id, session_id)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        key = (session.app_name, session.user_id, session.id)
+        cached = await self._load(*key)
+        if cached is not None and cached is not session and any(e == event for e in cached.events if e.id == event.id):
+            return event
+        if cached is None:
+            # not on disk under this user: recreate the row first, which fails when the
+            # session_id belongs to another user (their events must never be appended to)
+            store = await self._ensure_store()
+            if not await store.create_session_row(*key, _persistable_state(session.state), time.time()):
+                raise AlreadyExistsError(f"Session with id {session.id} belongs to another user.")
+
+        event = await super().append_event(session=session, event=event)
+        session.last_update_time = event.timestamp
+
+        if cached is None:
+            # the session was evicted and is not on disk either, keep working from the caller's copy
+            cached = _light_copy(session)
+            self._cache_put(key, cached)
+        elif cached is not session:
+            cached.events.append(event)
+            self._update_session_state(cached, event)
+            cached.last_update_time = event.timestamp
+
+        if event.actions and event.actions.state_delta:
+            await self._save_shared_state(session.app_name, session.user_id, event.actions.state_delta, event.timestamp)
+        store = await self._ensure_store()
+        await store.append_event(
+            session.app_name,
+            session.user_id,
+            session.id,
+            event,
+            _persistable_state(cached.state),
+            event.timestamp,
+        )
+        return event
+
+    async def flush(self) -> None:
+        """Wait until every appended event is on disk."""
+        await self.store.flush()
+
+    async def close(self):
+        """Flush pending writes and close the store."""
+        await self.store.close()
+        self._cache.clear()
+        self._app_states.clear()
+        self._user_states.clear()
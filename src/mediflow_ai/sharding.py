@@ -0,0 +1,344 @@
+# sharding.py
+# ================= SESSIONS SPREAD OVER N SQLITE FILES =================
+# SQLite has one writer per file, WAL or not, so every save of every session queues on the same
+# lock (and the same group-commit writer). With db_shards > 1 a session's rows live in one of N
+# files picked by a stable hash of its session_id, each file with its own SessionStore: its own
+# writer connection and thread, its own group-commit queue, its own WAL.
+#
+#   database/chat_history.db              primary: search_cache, prompt_cache, provider directory,
+#                                         app_states / user_states
+#   database/chat_history.shard0of4.db    sessions, messages, message_parts, session_archive, memory_fts
+#   database/chat_history.shard1of4.db    ...
+#
+# Per-session calls go to the owning shard; list_session_rows, the analytics reads, memory search,
+# maintenance and export fan out over every shard. ShardedSessionStore is a SessionStore (the primary
+# file), so write()/read() and everything built on them (caches, directory,
+# get_shared_state / update_shared_state) work unchanged.
+# The shard count is part of the file names, so changing it never mixes layouts; move the data with
+#
+#   python -m mediflow_ai.sharding migrate --db database/chat_history.db --shards 4 [--from-shards 1]
+#
+# which copies one session at a time (sessions row, events, parts, archive), commits it on the
+# target and only then deletes it from the source. Stop the server first; a rerun picks up
+# where an interrupted one stopped.
+import argparse
+import asyncio
+import heapq
+import json
+import os
+import time
+import zlib
+from typing import Any, AsyncIterator, Optional
+
+try:
+    from .sqlite_store import (
+        MESSAGE_COLUMNS, UPSERT_ARCHIVE_SQL, EventRecord, GroupCommitWriter, SessionStore,
+        _session_id_of,
+    )
+except ImportError:
+    from sqlite_store import (
+        MESSAGE_COLUMNS, UPSERT_ARCHIVE_SQL, EventRecord, GroupCommitWriter, SessionStore,
+        _session_id_of,
+    )
+
+MIGRATE_BATCH_SESSIONS = 100
+
+PART_COLUMNS = "session_id, event_index, part_index, kind, text, function_name, function_call_id, mime_type, payload"
+ARCHIVE_COLUMNS = (
+    "session_id, codec, event_count, last_event_index, first_event_time, last_event_time, "
+    "raw_bytes, stored_bytes, archived_at, blob"
+)
+
+# messages saved by save_session_to_db have no sessions row, archived sessions may have no messages
+SELECT_SESSION_IDS_SQL = """
+SELECT session_id FROM (
+    SELECT session_id FROM sessions
+    UNION SELECT session_id FROM messages
+    UNION SELECT session_id FROM session_archive
+)
+WHERE session_id > ?
+ORDER BY session_id
+LIMIT ?
+"""
+
+COUNT_SESSIONS_SQL = """
+SELECT COUNT(*) FROM (
+    SELECT session_id FROM sessions
+    UNION SELECT session_id FROM messages
+    UNION SELECT session_id FROM session_archive
+)
+"""
+
+
+# ================= ROUTING =================
+def shard_index(session_id: str, shards: int) -> int:
+    """Stable across processes and restarts (unlike hash()), so a session always finds its file."""
+    return zlib.crc32(session_id.encode("utf-8")) % shards
+
+
+def shard_paths(db_path: str, shards: int) -> list[str]:
+    """File of every shard: chat_history.db -> chat_history.shard0of4.db, ... (the file itself for 1)."""
+    if shards <= 1:
+        return [db_path]
+    if db_path == ":memory:":
+        return [db_path] * shards
+    root, ext = os.path.splitext(db_path)
+    return [f"{root}.shard{i}of{shards}{ext}" for i in range(shards)]
+
+
+def session_store(db_path: str, shards: int = 1, **kwargs) -> SessionStore:
+    """A plain SessionStore for one shard, a ShardedSessionStore otherwise (not opened yet)."""
+    if shards <= 1:
+        return SessionStore(db_path, **kwargs)
+    return ShardedSessionStore(db_path, shards, **kwargs)
+
+
+# ================= SHARDED STORE =================
+class ShardedSessionStore(SessionStore):
+    """
+    SessionStore over a primary file plus `shards` session files, one writer each.
+
+        async with ShardedSessionStore("database/chat_history.db", shards=4) as store:
+            await store.append_event(app_name, user_id, session_id, event, state, now)
+            rows = await store.list_session_rows(app_name, user_id)   # every shard
+
+    write()/read() borrow the primary's connections; session data never goes there.
+    """
+
+    def __init__(self, db_path: str, shards: int, readers: int = 2, **kwargs):
+        if shards < 2:
+            raise ValueError("ShardedSessionStore needs at least 2 shards, use SessionStore for one file")
+        super().__init__(db_path, readers=readers, **kwargs)
+        self._shards = [SessionStore(path, readers=readers, **kwargs) for path in shard_paths(db_path, shards)]
+
+    @property
+    def shards(self) -> list[SessionStore]:
+        return list(self._shards)
+
+    def shard_for(self, session_id: str) -> SessionStore:
+        return self._shards[shard_index(session_id, len(self._shards))]
+
+    async def _fan_out(self, method: str, *args, **kwargs) -> list:
+        return await asyncio.gather(*(getattr(shard, method)(*args, **kwargs) for shard in self._shards))
+
+    # ---------- lifecycle ----------
+    async def open(self) -> "ShardedSessionStore":
+        # the primary last: is_open (checked by write()/read()) means every shard is open too
+        await asyncio.gather(*(shard.open() for shard in self._shards))
+        await super().open()
+        return self
+
+    async def close(self):
+        # every shard is closed even if one of them reports lost rows
+        results = await asyncio.gather(*(shard.close() for shard in self._shards), return_exceptions=True)
+        await super().close()
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    def enable_write_behind(self, max_batch_rows: int = 500, flush_interval: float = 0.05, max_queue: int = 1000) -> list[GroupCommitWriter]:
+        """One group-commit writer per shard, they commit in parallel."""
+        return [shard.enable_write_behind(max_batch_rows, flush_interval, max_queue) for shard in self._shards]
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(shard.queue_depth for shard in self._shards)
+
+    async def flush(self):
+        await asyncio.gather(*(shard.flush() for shard in self._shards), super().flush())
+
+    # ---------- one session: its shard ----------
+    async def save_session(self, completed_session: Any, incremental: bool = True) -> int:
+        return await self.shard_for(_session_id_of(completed_session)).save_session(completed_session, incremental=incremental)
+
+    async def enqueue_session(self, completed_session: Any) -> int:
+        return await self.shard_for(_session_id_of(completed_session)).enqueue_session(completed_session)
+
+    async def append_event(self, app_name: str, user_id: str, session_id: str, event: Any, state: dict, last_update_time: float) -> int:
+        return await self.shard_for(session_id).append_event(app_name, user_id, session_id, event, state, last_update_time)
+
+    async def create_session_row(self, app_name: str, user_id: str, session_id: str, state: dict, create_time: float) -> bool:
+        return await self.shard_for(session_id).create_session_row(app_name, user_id, session_id, state, create_time)
+
+    async def get_session_row(self, app_name: str, user_id: str, session_id: str) -> Optional[tuple[dict, float, float]]:
+        return await self.shard_for(session_id).get_session_row(app_name, user_id, session_id)
+
+    async def delete_session(self, app_name: str, user_id: str, session_id: str):
+        await self.shard_for(session_id).delete_session(app_name, user_id, session_id)
+
+    async def get_event_payloads(self, session_id: str) -> list[tuple]:
+        return await self.shard_for(session_id).get_event_payloads(session_id)
+
+    async def get_session_events(self, session_id: str, after_index: Optional[int] = None, limit: Optional[int] = None) -> list[dict]:
+        return await self.shard_for(session_id).get_session_events(session_id, after_index=after_index, limit=limit)
+
+    async def iter_session_events(self, session_id: str, chunk_size: int = 200, after_index: Optional[int] = None) -> AsyncIterator[EventRecord]:
+        async for record in self.shard_for(session_id).iter_session_events(session_id, chunk_size=chunk_size, after_index=after_index):
+            yield record
+
+    async def get_event_parts(self, session_id: str, after_index: Optional[int] = None) -> list[dict]:
+        return await self.shard_for(session_id).get_event_parts(session_id, after_index=after_index)
+
+    async def archive_session(self, session_id: str, codec: Optional[str] = None) -> Optional[dict]:
+        return await self.shard_for(session_id).archive_session(session_id, codec=codec)
+
+    async def restore_session(self, session_id: str) -> int:
+        return await self.shard_for(session_id).restore_session(session_id)
+
+    # ---------- across sessions: every shard, merged in the single-file order ----------
+    async def list_session_rows(self, app_name: str, user_id: Optional[str] = None) -> list[tuple[str, str, float]]:
+        per_shard = await self._fan_out("list_session_rows", app_name, user_id)
+        return list(heapq.merge(*per_shard, key=lambda row: (row[2], row[0], row[1])))
+
+    async def get_events_between(self, start: float, end: float, author: Optional[str] = None, limit: Optional[int] = None) -> list[dict]:
+        per_shard = await self._fan_out("get_events_between", start, end, author=author, limit=limit)
+        merged = list(heapq.merge(*per_shard, key=lambda event: event["event_time"]))
+        return merged if limit is None else merged[:limit]
+
+    async def get_invocation_events(self, invocation_id: str) -> list[dict]:
+        # an invocation belongs to one session, so at most one shard answers
+        for events in await self._fan_out("get_invocation_events", invocation_id):
+            if events:
+                return events
+        return []
+
+    async def get_token_usage(self, start: float, end: float) -> dict[str, dict]:
+        usage: dict[str, dict] = {}
+        for per_author in await self._fan_out("get_token_usage", start, end):
+            for author, counts in per_author.items():
+                total = usage.setdefault(author, dict.fromkeys(counts, 0))
+                for name, value in counts.items():
+                    total[name] += value
+        return dict(sorted(usage.items(), key=lambda item: (item[0] is not None, item[0] or "")))
+
+    async def get_function_calls(self, function_name: str, limit: Optional[int] = None) -> list[dict]:
+        per_shard = await self._fan_out("get_function_calls", function_name, limit=limit)
+        merged = list(heapq.merge(*per_shard, key=lambda call: (call["session_id"], call["event_index"], call["part_index"])))
+        return merged if limit is None else merged[:limit]
+
+
+# ================= MIGRATION / REBALANCING =================
+async def _copy_session(source: SessionStore, target: SessionStore, session_id: str) -> int:
+    """Copy one session's rows to target and commit there. Returns the number of events copied."""
+    async with source.read() as db:
+        rows = {}
+        for name, sql in (
+            ("sessions", "SELECT app_name, user_id, session_id, state, create_time, last_update_time FROM sessions WHERE session_id = ?"),
+            ("messages", f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE session_id = ? ORDER BY event_index"),
+            ("parts", f"SELECT {PART_COLUMNS} FROM message_parts WHERE session_id = ?"),
+            ("archive", f"SELECT {ARCHIVE_COLUMNS} FROM session_archive WHERE session_id = ?"),
+        ):
+            cursor = await db.execute(sql, (session_id,))
+            rows[name] = await cursor.fetchall()
+            await cursor.close()
+    async with target.write() as db:
+        await db.executemany(
+            "INSERT OR IGNORE INTO sessions (app_name, user_id, session_id, state, create_time, last_update_time) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows["sessions"],
+        )
+        # the sessions row goes first so the memory_fts trigger (if the target has one) finds its scope
+        placeholders = ", ".join("?" * len(MESSAGE_COLUMNS.split(", ")))
+        await db.executemany(f"INSERT OR IGNORE INTO messages ({MESSAGE_COLUMNS}) VALUES ({placeholders})", rows["messages"])
+        await db.executemany(f"INSERT OR IGNORE INTO message_parts ({PART_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows["parts"])
+        await db.executemany(UPSERT_ARCHIVE_SQL, rows["archive"])
+        await db.commit()
+    async with source.write() as db:
+        for table in ("sessions", "messages", "message_parts", "session_archive"):
+            await db.execute(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+        await db.commit()
+    archived_events = sum(row[2] for row in rows["archive"])
+    return len(rows["messages"]) + archived_events
+
+
+async def migrate(db_path: str, shards: int, from_shards: int = 1, batch_sessions: int = MIGRATE_BATCH_SESSIONS) -> dict:
+    """
+    Move every session from the from_shards layout of db_path into the shards layout
+    (1 -> N splits the single file, N -> M rebalances, N -> 1 merges back). Run it with the server stopped.
+    """
+    if shards == from_shards:
+        return {"sessions": 0, "events": 0, "elapsed_ms": 0.0, "note": "source and target layouts are the same"}
+    if db_path == ":memory:":
+        raise ValueError("an in-memory database cannot be migrated")
+    started = time.perf_counter()
+    sources = [SessionStore(path) for path in shard_paths(db_path, from_shards) if os.path.exists(path)]
+    targets = [SessionStore(path) for path in shard_paths(db_path, shards)]
+    moved = events = 0
+    per_target = [0] * len(targets)
+    try:
+        for store in (*sources, *targets):
+            await store.open()
+        for source in sources:
+            last = ""
+            while True:
+                async with source.read() as db:
+                    cursor = await db.execute(SELECT_SESSION_IDS_SQL, (last, batch_sessions))
+                    session_ids = [row[0] for row in await cursor.fetchall()]
+                    await cursor.close()
+                for session_id in session_ids:
+                    index = shard_index(session_id, shards)
+                    events += await _copy_session(source, targets[index], session_id)
+                    per_target[index] += 1
+                    moved += 1
+                if len(session_ids) < batch_sessions:
+                    break
+                last = session_ids[-1]
+    finally:
+        for store in (*sources, *targets):
+            await store.close()
+    # from_shards > 1: the old shard files are empty now; the primary (from_shards == 1) keeps the caches
+    leftovers = [store.db_path for store in sources if store.db_path != db_path]
+    return {
+        "sessions": moved,
+        "events": events,
+        "per_shard": dict(zip((t.db_path for t in targets), per_target)),
+        "empty_files_to_remove": leftovers,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+async def shard_stats(db_path: str, shards: int) -> dict:
+    """Sessions per shard file, to check the hash spreads them evenly."""
+    stats = {}
+    for path in shard_paths(db_path, shards):
+        if not os.path.exists(path):
+            stats[path] = None
+            continue
+        async with SessionStore(path, readers=0) as store:
+            async with store.read() as db:
+                cursor = await db.execute(COUNT_SESSIONS_SQL)
+                (stats[path],) = await cursor.fetchone()
+                await cursor.close()
+    return stats
+
+
+def main():
+    try:
+        from .config import MediFlowConfig
+    except ImportError:
+        from config import MediFlowConfig
+
+    config = MediFlowConfig.from_env()
+    parser = argparse.ArgumentParser(description="Move chat sessions between single-file and sharded layouts.")
+    parser.add_argument("--db", default=config.db_path, help="primary file (defaults to MEDIFLOW_DB_PATH)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate_cmd = commands.add_parser("migrate", help="move every session into the --shards layout")
+    migrate_cmd.add_argument("--shards", type=int, required=True)
+    migrate_cmd.add_argument("--from-shards", type=int, default=config.db_shards)
+    migrate_cmd.add_argument("--batch-sessions", type=int, default=MIGRATE_BATCH_SESSIONS)
+    stats_cmd = commands.add_parser("stats", help="sessions per shard file")
+    stats_cmd.add_argument("--shards", type=int, default=config.db_shards)
+    args = parser.parse_args()
+
+    async def run():
+        if args.command == "migrate":
+            result = await migrate(args.db, args.shards, from_shards=args.from_shards, batch_sessions=args.batch_sessions)
+        else:
+            result = await shard_stats(args.db, args.shards)
+        print(json.dumps(result, indent=2))
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,18 @@
 # sqlite_store.py
 import aiosqlite
+import asyncio
+import gzip
 import json
-from datetime import datetime
-from typing import Any
+import logging
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Optional
+
+try:
+    from . import metrics
+except ImportError:
+    import metrics
 
 # ================= CREATING SQL TABLE =================
 
@@ -18,81 +28,1420 @@ CREATE TABLE IF NOT EXISTS messages (
 );
 """
 
+# one row per ADK session, events live in messages
+CREATE_SESSIONS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS sessions (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    state TEXT,
+    create_time REAL,
+    last_update_time REAL,
+    PRIMARY KEY (app_name, user_id, session_id)
+);
+"""
+
+# ================= SCHEMA VERSIONS (PRAGMA user_version) =================
+# 0: the first releases (schema built ad hoc by CREATE IF NOT EXISTS / ALTER TABLE)
+# 1: messages + sessions, full event_json, unique (session_id, event_index)
+# 2: typed event columns (event time, author, invocation, token usage) + message_parts
+# 3: session_archive (compressed cold sessions, see maintenance.py)
+# 4: app_states + user_states (ADK app:/user: state shared across sessions)
+# 5: sessions (session_id) index, a session_id has one owner (see CREATE_SESSION_ROW_SQL)
+# Every migration runs in one transaction together with its user_version bump.
+SCHEMA_VERSION = 5
+
+# columns added after the first release, (name, type) -> ALTER TABLE on older databases
+MESSAGES_EXTRA_COLUMNS = [
+    ("event_json", "TEXT"),  # full ADK event, lets SqliteSessionService rebuild sessions on restart
+]
+
+# one row per (session_id, event_index) -> re-saving the same event is a no-op
+UNIQUE_EVENT_INDEX_NAME = "idx_messages_session_event"
+CREATE_UNIQUE_EVENT_INDEX_SQL = f"""
+CREATE UNIQUE INDEX IF NOT EXISTS {UNIQUE_EVENT_INDEX_NAME}
+ON messages (session_id, event_index);
+"""
+
+# read paths: recent activity for dashboards, per-role transcript reads for audits
+CREATE_INDEXES_SQL = [
+    "CREATE INDEX IF NOT EXISTS idx_messages_timestamp_session ON messages (timestamp, session_id);",
+    "CREATE INDEX IF NOT EXISTS idx_messages_session_role ON messages (session_id, role, event_index);",
+]
+
+# older databases re-inserted the whole transcript on every turn, keep the first copy only
+DEDUPE_MESSAGES_SQL = """
+DELETE FROM messages
+WHERE id NOT IN (SELECT MIN(id) FROM messages GROUP BY session_id, event_index);
+"""
+
+# version 2: what used to be parsed out of event_json / metadata, as columns
+MESSAGES_V2_COLUMNS = [
+    ("event_time", "REAL"),  # the event's own time (epoch seconds), not the time it was saved
+    ("author", "TEXT"),  # "user", "triage_doctor_finder_agent", "google_search_agent", ...
+    ("invocation_id", "TEXT"),
+    ("prompt_tokens", "INTEGER"),
+    ("candidates_tokens", "INTEGER"),
+    ("cached_tokens", "INTEGER"),
+    ("total_tokens", "INTEGER"),
+]
+
+# one row per content part: text, thoughts, function calls/responses, inline data, ...
+# payload is JSON (call args, tool response, code outcome); binary data stays in event_json only
+CREATE_PARTS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS message_parts (
+    session_id TEXT NOT NULL,
+    event_index INTEGER NOT NULL,
+    part_index INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    text TEXT,
+    function_name TEXT,
+    function_call_id TEXT,
+    mime_type TEXT,
+    payload TEXT,
+    PRIMARY KEY (session_id, event_index, part_index)
+) WITHOUT ROWID;
+"""
+
+# analytics/audit read paths, all index range scans:
+#   events in a time window, one author's events in a time window, everything of one invocation,
+#   every call of one tool
+CREATE_V2_INDEXES_SQL = [
+    "CREATE INDEX IF NOT EXISTS idx_messages_event_time ON messages (event_time, session_id);",
+    "CREATE INDEX IF NOT EXISTS idx_messages_author_time ON messages (author, event_time);",
+    "CREATE INDEX IF NOT EXISTS idx_messages_invocation ON messages (invocation_id, event_index);",
+    "CREATE INDEX IF NOT EXISTS idx_parts_function ON message_parts (function_name, session_id, event_index) "
+    "WHERE function_name IS NOT NULL;",
+]
+# the text timestamp index is superseded by idx_messages_event_time
+DROP_V2_INDEXES_SQL = ["DROP INDEX IF EXISTS idx_messages_timestamp_session;"]
+
+BACKFILL_CHUNK_ROWS = 1000
+
+# version 3: sessions idle past the retention age move here, one compressed blob per session.
+# A session's events are its archived events (lower event_index) followed by any hot rows
+# saved after it was archived; reads merge both, new events keep numbering after last_event_index.
+CREATE_ARCHIVE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS session_archive (
+    session_id TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    event_count INTEGER NOT NULL,
+    last_event_index INTEGER NOT NULL,
+    first_event_time REAL,
+    last_event_time REAL,
+    raw_bytes INTEGER NOT NULL,
+    stored_bytes INTEGER NOT NULL,
+    archived_at REAL NOT NULL,
+    blob BLOB NOT NULL
+);
+"""
+
+CREATE_V3_INDEXES_SQL = [
+    # idle-session scan of the archiver
+    "CREATE INDEX IF NOT EXISTS idx_sessions_last_update ON sessions (last_update_time);",
+    # retention: archives older than delete_after_days
+    "CREATE INDEX IF NOT EXISTS idx_archive_last_event_time ON session_archive (last_event_time);",
+]
+
+# version 4: ADK's app: and user: state keys are shared by every session of the app / of the user,
+# so they live in their own rows (keys stored without the prefix) and not in sessions.state.
+CREATE_SHARED_STATE_TABLES_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS app_states (
+        app_name TEXT PRIMARY KEY,
+        state TEXT NOT NULL,
+        update_time REAL NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_states (
+        app_name TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        state TEXT NOT NULL,
+        update_time REAL NOT NULL,
+        PRIMARY KEY (app_name, user_id)
+    );
+    """,
+]
+
 DB_PRAGMAS = [
+    # before journal_mode, which initializes a new file; only takes effect on a new database,
+    # older files are converted by maintenance.DatabaseMaintenance.enable_incremental_vacuum()
+    "PRAGMA auto_vacuum=INCREMENTAL;",
     "PRAGMA journal_mode=WAL;",
     "PRAGMA synchronous=NORMAL;",
 ]
 
-# ================= INITIALIZNG DATABASE =================
-async def init_db(db_path: str):
-    """Create DB file and messages table if not exists."""
-    async with aiosqlite.connect(db_path) as db:
-        for p in DB_PRAGMAS:
-            await db.execute(p)
-        await db.execute(CREATE_TABLE_SQL)
-        await db.commit()
+MESSAGE_COLUMNS = (
+    "session_id, event_index, role, text, timestamp, metadata, event_json, "
+    "event_time, author, invocation_id, prompt_tokens, candidates_tokens, cached_tokens, total_tokens"
+)
 
-# ================= SAVING SESSION TO DB =================
-async def save_session_to_db(db_path: str, completed_session: Any):
+INSERT_EVENT_SQL = f"""
+INSERT OR IGNORE INTO messages ({MESSAGE_COLUMNS})
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+UPSERT_EVENT_SQL = f"""
+INSERT INTO messages ({MESSAGE_COLUMNS})
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (session_id, event_index) DO UPDATE SET
+    role = excluded.role,
+    text = excluded.text,
+    timestamp = excluded.timestamp,
+    metadata = excluded.metadata,
+    event_json = excluded.event_json,
+    event_time = excluded.event_time,
+    author = excluded.author,
+    invocation_id = excluded.invocation_id,
+    prompt_tokens = excluded.prompt_tokens,
+    candidates_tokens = excluded.candidates_tokens,
+    cached_tokens = excluded.cached_tokens,
+    total_tokens = excluded.total_tokens
+"""
+
+INSERT_PART_SQL = """
+INSERT OR IGNORE INTO message_parts
+    (session_id, event_index, part_index, kind, text, function_name, function_call_id, mime_type, payload)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+DELETE_EVENT_PARTS_SQL = "DELETE FROM message_parts WHERE session_id = ? AND event_index = ?"
+
+UPSERT_SESSION_SQL = """
+INSERT INTO sessions (app_name, user_id, session_id, state, create_time, last_update_time)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (app_name, user_id, session_id) DO UPDATE SET
+    state = excluded.state,
+    last_update_time = excluded.last_update_time
+"""
+
+SELECT_SESSION_ROW_SQL = """
+SELECT state, create_time, last_update_time FROM sessions
+WHERE app_name = ? AND user_id = ? AND session_id = ?
+"""
+
+# version 5: messages, message_parts and session_archive are keyed by session_id alone, so a
+# session_id belongs to exactly one (app_name, user_id). A new sessions row is refused when the
+# id already has an owner or stored events (rows saved by save_session_to_db have no owner).
+CREATE_SESSIONS_BY_ID_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_sessions_session_id ON sessions (session_id);"
+
+CREATE_SESSION_ROW_SQL = """
+INSERT OR IGNORE INTO sessions (app_name, user_id, session_id, state, create_time, last_update_time)
+SELECT ?, ?, ?, ?, ?, ?
+WHERE NOT EXISTS (SELECT 1 FROM sessions WHERE session_id = ?)
+  AND NOT EXISTS (SELECT 1 FROM messages WHERE session_id = ?)
+  AND NOT EXISTS (SELECT 1 FROM session_archive WHERE session_id = ?)
+"""
+
+SELECT_APP_STATE_SQL = "SELECT state FROM app_states WHERE app_name = ?"
+SELECT_USER_STATE_SQL = "SELECT state FROM user_states WHERE app_name = ? AND user_id = ?"
+
+UPSERT_APP_STATE_SQL = """
+INSERT INTO app_states (app_name, state, update_time) VALUES (?, ?, ?)
+ON CONFLICT (app_name) DO UPDATE SET state = excluded.state, update_time = excluded.update_time
+"""
+
+UPSERT_USER_STATE_SQL = """
+INSERT INTO user_states (app_name, user_id, state, update_time) VALUES (?, ?, ?, ?)
+ON CONFLICT (app_name, user_id) DO UPDATE SET state = excluded.state, update_time = excluded.update_time
+"""
+
+SELECT_EVENT_PAYLOADS_SQL = """
+SELECT event_index, role, text, event_json FROM messages
+WHERE session_id = ? ORDER BY event_index ASC
+"""
+
+# archived events count too: a session that is written to again continues after its archive
+HIGH_WATER_SQL = """
+SELECT MAX(idx) FROM (
+    SELECT MAX(event_index) AS idx FROM messages WHERE session_id = ?
+    UNION ALL
+    SELECT last_event_index FROM session_archive WHERE session_id = ?
+)
+"""
+
+# keyset pagination on the unique (session_id, event_index) index, LIMIT -1 means no limit
+SELECT_SESSION_EVENTS_SQL = """
+SELECT event_index, role, text, timestamp, metadata, event_time, author, invocation_id FROM messages
+WHERE session_id = ? AND event_index > ?
+ORDER BY event_index ASC
+LIMIT ?
+"""
+
+# time-window reads, served by idx_messages_event_time / idx_messages_author_time
+EVENT_SUMMARY_COLUMNS = (
+    "session_id, event_index, author, invocation_id, event_time, text, "
+    "prompt_tokens, candidates_tokens, cached_tokens, total_tokens"
+)
+SELECT_EVENTS_BETWEEN_SQL = f"""
+SELECT {EVENT_SUMMARY_COLUMNS} FROM messages
+WHERE event_time >= ? AND event_time < ?
+ORDER BY event_time
+LIMIT ?
+"""
+SELECT_AUTHOR_EVENTS_BETWEEN_SQL = f"""
+SELECT {EVENT_SUMMARY_COLUMNS} FROM messages
+WHERE author = ? AND event_time >= ? AND event_time < ?
+ORDER BY event_time
+LIMIT ?
+"""
+SELECT_INVOCATION_EVENTS_SQL = f"""
+SELECT {EVENT_SUMMARY_COLUMNS} FROM messages
+WHERE invocation_id = ?
+ORDER BY event_index
+"""
+TOKEN_USAGE_SQL = """
+SELECT author, COUNT(*), SUM(prompt_tokens), SUM(candidates_tokens), SUM(cached_tokens), SUM(total_tokens)
+FROM messages
+WHERE event_time >= ? AND event_time < ? AND total_tokens IS NOT NULL
+GROUP BY author
+ORDER BY author
+"""
+SELECT_EVENT_PARTS_SQL = """
+SELECT event_index, part_index, kind, text, function_name, function_call_id, mime_type, payload
+FROM message_parts
+WHERE session_id = ? AND event_index > ?
+ORDER BY event_index, part_index
+"""
+SELECT_FUNCTION_CALLS_SQL = """
+SELECT session_id, event_index, part_index, kind, function_call_id, payload
+FROM message_parts
+WHERE function_name = ?
+ORDER BY session_id, event_index, part_index
+LIMIT ?
+"""
+
+# archive blobs hold the messages / message_parts rows without their session_id
+ARCHIVE_MESSAGE_COLUMNS = MESSAGE_COLUMNS.split(", ", 1)[1]
+ARCHIVE_PART_COLUMNS = "event_index, part_index, kind, text, function_name, function_call_id, mime_type, payload"
+SELECT_ARCHIVE_SQL = "SELECT codec, blob FROM session_archive WHERE session_id = ?"
+UPSERT_ARCHIVE_SQL = """
+INSERT INTO session_archive (session_id, codec, event_count, last_event_index, first_event_time, last_event_time,
+                             raw_bytes, stored_bytes, archived_at, blob)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (session_id) DO UPDATE SET
+    codec = excluded.codec,
+    event_count = excluded.event_count,
+    last_event_index = excluded.last_event_index,
+    first_event_time = excluded.first_event_time,
+    last_event_time = excluded.last_event_time,
+    raw_bytes = excluded.raw_bytes,
+    stored_bytes = excluded.stored_bytes,
+    archived_at = excluded.archived_at,
+    blob = excluded.blob
+"""
+
+# sqlite3 keeps this many compiled statements per connection, the constant SQL above always hits it
+CACHED_STATEMENTS = 128
+
+logger = logging.getLogger(__name__)
+
+# ================= BUILDING A ROW FROM AN EVENT =================
+def _session_id_of(completed_session: Any) -> str:
+    return getattr(completed_session, "session_id", None) or getattr(completed_session, "id", None) or "unknown_session"
+
+
+def _event_data(event: Any) -> tuple[dict, Optional[str]]:
     """
-    Save all events in 'completed_session' to messages table.
-    completed_session must have: session_id and events (iterable),
-    and each event should have event.content.role and event.content.parts[0].text
-    (as in your example).
+    The event as plain JSON data, plus the event_json to store.
+    Pydantic ADK events round-trip through JSON; anything else only keeps
+    what the flat columns need (and no event_json).
     """
-    session_id = getattr(completed_session, "session_id", None) or getattr(completed_session, "id", None) or "unknown_session"
-    events = getattr(completed_session, "events", []) or []
+    if hasattr(event, "model_dump_json"):
+        try:
+            event_json = event.model_dump_json(exclude_none=True)
+            return json.loads(event_json), event_json
+        except Exception:
+            pass
+    content = getattr(event, "content", None)
+    parts = []
+    for part in getattr(content, "parts", None) or []:
+        text = getattr(part, "text", None)
+        if text is not None:
+            parts.append({"text": text})
+    data = {
+        "author": getattr(event, "author", None),
+        "invocation_id": getattr(event, "invocation_id", None),
+        "timestamp": getattr(event, "timestamp", None),
+        "content": {"role": getattr(content, "role", None), "parts": parts} if content is not None else None,
+    }
+    return data, None
 
-    async with aiosqlite.connect(db_path) as db:
-        insert_sql = """
-        INSERT INTO messages (session_id, event_index, role, text, timestamp, metadata)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """
-        async with db.execute("BEGIN"):
-            for idx, event in enumerate(events):
-                try:
-                    role = event.content.role if event.content and hasattr(event.content, "role") else None
-                except Exception:
-                    role = None
-                try:
-                    text = (
-                        event.content.parts[0].text
-                        if event.content and event.content.parts and len(event.content.parts) > 0
-                        else None
-                    )
-                except Exception:
-                    text = None
 
-                # metadata: store any other useful attributes in json (safe fallback)
-                metadata = {}
-                # try to put a timestamp if the event has one
-                if hasattr(event, "timestamp"):
-                    metadata["event_timestamp"] = str(event.timestamp)
-                # optionally you could add other attributes here
+def _utc_iso(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).replace(tzinfo=None).isoformat() + "Z"
 
-                timestamp = datetime.utcnow().isoformat() + "Z"
 
-                await db.execute(insert_sql, (session_id, idx, role, text, timestamp, json.dumps(metadata)))
-        await db.commit()
+def _part_row(session_id: str, idx: int, part_index: int, part: dict) -> tuple:
+    """(session_id, event_index, part_index, kind, text, function_name, function_call_id, mime_type, payload)"""
+    text = function_name = call_id = mime_type = payload = None
+    if part.get("text") is not None:
+        kind, text = ("thought" if part.get("thought") else "text"), part["text"]
+    elif part.get("function_call"):
+        call = part["function_call"]
+        kind, function_name, call_id = "function_call", call.get("name"), call.get("id")
+        payload = json.dumps(call.get("args") or {})
+    elif part.get("function_response"):
+        response = part["function_response"]
+        kind, function_name, call_id = "function_response", response.get("name"), response.get("id")
+        payload = json.dumps(response.get("response") or {})
+    elif part.get("executable_code"):
+        kind, text = "executable_code", part["executable_code"].get("code")
+        payload = json.dumps({"language": part["executable_code"].get("language")})
+    elif part.get("code_execution_result"):
+        kind, text = "code_execution_result", part["code_execution_result"].get("output")
+        payload = json.dumps({"outcome": part["code_execution_result"].get("outcome")})
+    elif part.get("inline_data"):
+        # the bytes stay in event_json
+        kind, mime_type = "inline_data", part["inline_data"].get("mime_type")
+        payload = json.dumps({"display_name": part["inline_data"].get("display_name")})
+    elif part.get("file_data"):
+        kind, mime_type = "file_data", part["file_data"].get("mime_type")
+        payload = json.dumps({"file_uri": part["file_data"].get("file_uri")})
+    else:
+        kind = next((key for key in part if key != "thought_signature"), "empty")
+        payload = json.dumps(part.get(kind), default=str) if kind in part else None
+    return (session_id, idx, part_index, kind, text, function_name, call_id, mime_type, payload)
 
 
-# ================= RETRIEVING SAVED EVENTS  =================
-async def get_session_events(db_path: str, session_id: str):
-    """Retrieve saved events for a session_id ordered by event_index."""
-    async with aiosqlite.connect(db_path) as db:
+def _data_rows(session_id: str, idx: int, data: dict, event_json: Optional[str], saved_at: Optional[str] = None) -> tuple[tuple, list[tuple]]:
+    """messages row + message_parts rows for one event given as JSON data."""
+    content = data.get("content") or {}
+    parts = content.get("parts") or []
+    texts = [part["text"] for part in parts if part.get("text") is not None and not part.get("thought")]
+    usage = data.get("usage_metadata") or {}
+    event_time = data.get("timestamp")
+
+    # metadata: store any other useful attributes in json (safe fallback)
+    metadata = {}
+    if event_time is not None:
+        metadata["event_timestamp"] = str(event_time)
+
+    message = (
+        session_id,
+        idx,
+        content.get("role"),
+        "\n".join(texts) if texts else None,
+        saved_at or _utc_iso(event_time if event_time is not None else time.time()),
+        json.dumps(metadata),
+        event_json,
+        event_time,
+        data.get("author"),
+        data.get("invocation_id"),
+        usage.get("prompt_token_count"),
+        usage.get("candidates_token_count"),
+        usage.get("cached_content_token_count"),
+        usage.get("total_token_count"),
+    )
+    return message, [_part_row(session_id, idx, i, part) for i, part in enumerate(parts)]
+
+
+def _event_row(session_id: str, idx: int, event: Any) -> tuple[tuple, list[tuple]]:
+    """Flatten one ADK event into a messages row and its message_parts rows."""
+    data, event_json = _event_data(event)
+    return _data_rows(session_id, idx, data, event_json)
+
+
+async def _insert_rows(db: aiosqlite.Connection, rows: list[tuple[tuple, list[tuple]]], upsert: bool = False):
+    """Write _event_row() results; a message that is already stored keeps its parts too."""
+    await db.executemany(UPSERT_EVENT_SQL if upsert else INSERT_EVENT_SQL, [message for message, _ in rows])
+    if upsert:
+        await db.executemany(DELETE_EVENT_PARTS_SQL, [message[:2] for message, _ in rows])
+    await db.executemany(INSERT_PART_SQL, [part for _, parts in rows for part in parts])
+
+
+EVENT_SUMMARY_FIELDS = tuple(EVENT_SUMMARY_COLUMNS.split(", "))
+
+
+def _part_to_dict(row: tuple) -> dict:
+    idx, part_index, kind, text, function_name, call_id, mime_type, payload = row
+    return {
+        "event_index": idx, "part_index": part_index, "kind": kind, "text": text, "function_name": function_name,
+        "function_call_id": call_id, "mime_type": mime_type, "payload": json.loads(payload) if payload else None,
+    }
+
+
+def _archived_event_row(m: tuple) -> tuple:
+    """Archived messages row -> the SELECT_SESSION_EVENTS_SQL row shape."""
+    return (m[0], m[1], m[2], m[3], m[4], m[6], m[7], m[8])
+
+
+def _row_to_dict(row: tuple) -> dict:
+    idx, role, text, timestamp, metadata_json, event_time, author, invocation_id = row
+    try:
+        metadata = json.loads(metadata_json) if metadata_json else {}
+    except Exception:
+        metadata = {}
+    return {
+        "event_index": idx, "role": role, "text": text, "timestamp": timestamp, "metadata": metadata,
+        "event_time": event_time, "author": author, "invocation_id": invocation_id,
+    }
+
+class EventRecord:
+    """
+    One saved event as returned by iter_session_events().
+    The metadata JSON is only decoded the first time .metadata is read.
+    Supports record["text"] style access like the dicts from get_session_events().
+    """
+
+    __slots__ = ("event_index", "role", "text", "timestamp", "event_time", "author", "invocation_id", "_metadata_json", "_metadata")
+
+    def __init__(
+        self,
+        event_index: int,
+        role: Optional[str],
+        text: Optional[str],
+        timestamp: Optional[str],
+        metadata_json: Optional[str],
+        event_time: Optional[float] = None,
+        author: Optional[str] = None,
+        invocation_id: Optional[str] = None,
+    ):
+        self.event_index = event_index
+        self.role = role
+        self.text = text
+        self.timestamp = timestamp
+        self.event_time = event_time
+        self.author = author
+        self.invocation_id = invocation_id
+        self._metadata_json = metadata_json
+        self._metadata: Optional[dict] = None
+
+    @property
+    def metadata(self) -> dict:
+        if self._metadata is None:
+            try:
+                self._metadata = json.loads(self._metadata_json) if self._metadata_json else {}
+            except Exception:
+                self._metadata = {}
+        return self._metadata
+
+    def __getitem__(self, key: str):
+        if key not in self.__slots__ or key.startswith("_"):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def to_dict(self) -> dict:
+        return {
+            "event_index": self.event_index, "role": self.role, "text": self.text, "timestamp": self.timestamp,
+            "metadata": self.metadata, "event_time": self.event_time, "author": self.author, "invocation_id": self.invocation_id,
+        }
+
+    def __repr__(self):
+        return f"EventRecord(event_index={self.event_index!r}, role={self.role!r}, text={(self.text or '')[:40]!r})"
+
+# ================= ARCHIVE BLOBS =================
+# zstd when the zstandard package (or Python 3.14's compression.zstd) is installed, gzip otherwise.
+# The codec is stored with every blob, so archives written either way stay readable.
+ARCHIVE_ZSTD_LEVEL = 10
+ARCHIVE_GZIP_LEVEL = 6
+
+
+def _zstd_module():
+    try:
+        from compression import zstd  # Python 3.14+
+        return zstd
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+def default_archive_codec() -> str:
+    return "zstd" if _zstd_module() is not None else "gzip"
+
+
+def compress_archive(raw: bytes, codec: Optional[str] = None) -> tuple[str, bytes]:
+    """Returns (codec, blob); codec None picks default_archive_codec()."""
+    codec = codec or default_archive_codec()
+    if codec == "gzip":
+        return codec, gzip.compress(raw, compresslevel=ARCHIVE_GZIP_LEVEL, mtime=0)
+    if codec == "zstd":
+        zstd = _zstd_module()
+        if zstd is None:
+            raise RuntimeError("zstd archives need the zstandard package (pip install zstandard)")
+        if zstd.__name__ == "zstandard":
+            return codec, zstd.ZstdCompressor(level=ARCHIVE_ZSTD_LEVEL).compress(raw)
+        return codec, zstd.compress(raw, level=ARCHIVE_ZSTD_LEVEL)
+    raise ValueError(f"Unknown archive codec {codec!r}")
+
+
+def decompress_archive(codec: str, blob: bytes) -> bytes:
+    if codec == "gzip":
+        return gzip.decompress(blob)
+    if codec == "zstd":
+        zstd = _zstd_module()
+        if zstd is None:
+            raise RuntimeError("this archive is zstd compressed, install the zstandard package to read it")
+        if zstd.__name__ == "zstandard":
+            return zstd.ZstdDecompressor().decompress(blob)
+        return zstd.decompress(blob)
+    raise ValueError(f"Unknown archive codec {codec!r}")
+
+
+def _encode_archive(messages: list, parts: list) -> bytes:
+    return json.dumps({"messages": messages, "parts": parts}, separators=(",", ":")).encode()
+
+
+def _decode_archive(codec: str, blob: bytes) -> tuple[list[tuple], list[tuple]]:
+    """(messages rows in ARCHIVE_MESSAGE_COLUMNS order, parts rows in ARCHIVE_PART_COLUMNS order)"""
+    data = json.loads(decompress_archive(codec, blob))
+    return [tuple(row) for row in data["messages"]], [tuple(row) for row in data["parts"]]
+
+
+async def _replay_archived_events(db: aiosqlite.Connection, session_id: str) -> int:
+    """
+    Insert a session's archived events into messages and delete them again, inside the
+    caller's transaction, so the AFTER INSERT / AFTER DELETE triggers on messages (the
+    memory_fts index) see events that only exist in session_archive. Returns the events replayed.
+    """
+    cursor = await db.execute(SELECT_ARCHIVE_SQL, (session_id,))
+    row = await cursor.fetchone()
+    await cursor.close()
+    if row is None:
+        return 0
+    messages, _ = _decode_archive(*row)
+    await db.executemany(INSERT_EVENT_SQL, [(session_id, *m) for m in messages])
+    # hot rows saved after the archive have higher event_index values and stay
+    await db.execute("DELETE FROM messages WHERE session_id = ? AND event_index <= ?", (session_id, messages[-1][0]))
+    return len(messages)
+
+
+# ================= MIGRATIONS =================
+async def _schema_version(db: aiosqlite.Connection) -> int:
+    cursor = await db.execute("PRAGMA user_version")
+    row = await cursor.fetchone()
+    await cursor.close()
+    return row[0]
+
+
+async def _migrate_v1(db: aiosqlite.Connection):
+    """Tables, event_json column and indexes; idempotent so unversioned databases take it too."""
+    await db.execute(CREATE_TABLE_SQL)
+    await db.execute(CREATE_SESSIONS_TABLE_SQL)
+    cursor = await db.execute("PRAGMA table_info(messages)")
+    existing_columns = {row[1] for row in await cursor.fetchall()}
+    await cursor.close()
+    for name, column_type in MESSAGES_EXTRA_COLUMNS:
+        if name not in existing_columns:
+            await db.execute(f"ALTER TABLE messages ADD COLUMN {name} {column_type}")
+    cursor = await db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+        (UNIQUE_EVENT_INDEX_NAME,),
+    )
+    has_unique_index = await cursor.fetchone() is not None
+    await cursor.close()
+    if not has_unique_index:
+        await db.execute(DEDUPE_MESSAGES_SQL)
+        await db.execute(CREATE_UNIQUE_EVENT_INDEX_SQL)
+    for index_sql in CREATE_INDEXES_SQL:
+        await db.execute(index_sql)
+
+
+def _legacy_data(role: Optional[str], text: Optional[str], metadata_json: Optional[str]) -> dict:
+    """What a row saved without event_json still tells us (role, text, metadata.event_timestamp)."""
+    try:
+        event_time = float(json.loads(metadata_json or "{}").get("event_timestamp"))
+    except (TypeError, ValueError):
+        event_time = None
+    return {
+        "author": "user" if role == "user" else None,
+        "timestamp": event_time,
+        "content": {"role": role, "parts": [{"text": text}] if text is not None else []},
+    }
+
+
+async def _migrate_v2(db: aiosqlite.Connection):
+    """Typed event columns + message_parts, backfilled from event_json (or the legacy columns)."""
+    cursor = await db.execute("PRAGMA table_info(messages)")
+    existing_columns = {row[1] for row in await cursor.fetchall()}
+    await cursor.close()
+    for name, column_type in MESSAGES_V2_COLUMNS:
+        if name not in existing_columns:
+            await db.execute(f"ALTER TABLE messages ADD COLUMN {name} {column_type}")
+    await db.execute(CREATE_PARTS_TABLE_SQL)
+
+    # text/timestamp are left as stored: memory_fts keeps its own copy of both
+    last_id = 0
+    while True:
         cursor = await db.execute(
-            "SELECT event_index, role, text, timestamp, metadata FROM messages WHERE session_id = ? ORDER BY event_index ASC",
-            (session_id,),
+            "SELECT id, session_id, event_index, role, text, timestamp, metadata, event_json FROM messages "
+            "WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, BACKFILL_CHUNK_ROWS),
         )
         rows = await cursor.fetchall()
         await cursor.close()
-    # Return as list of dicts
-    results = []
-    for row in rows:
-        idx, role, text, timestamp, metadata_json = row
+        if not rows:
+            break
+        updates, parts = [], []
+        for row_id, session_id, idx, role, text, timestamp, metadata_json, event_json in rows:
+            data = json.loads(event_json) if event_json else _legacy_data(role, text, metadata_json)
+            message, part_rows = _data_rows(session_id, idx, data, event_json, saved_at=timestamp)
+            updates.append((*message[7:], row_id))
+            parts.extend(part_rows)
+        await db.executemany(
+            "UPDATE messages SET event_time = ?, author = ?, invocation_id = ?, prompt_tokens = ?, "
+            "candidates_tokens = ?, cached_tokens = ?, total_tokens = ? WHERE id = ?",
+            updates,
+        )
+        await db.executemany(INSERT_PART_SQL, parts)
+        last_id = rows[-1][0]
+
+    for index_sql in DROP_V2_INDEXES_SQL + CREATE_V2_INDEXES_SQL:
+        await db.execute(index_sql)
+
+
+async def _migrate_v3(db: aiosqlite.Connection):
+    """session_archive for the maintenance archiver."""
+    await db.execute(CREATE_ARCHIVE_TABLE_SQL)
+    for index_sql in CREATE_V3_INDEXES_SQL:
+        await db.execute(index_sql)
+
+
+async def _migrate_v4(db: aiosqlite.Connection):
+    """app_states / user_states for state shared across sessions."""
+    for table_sql in CREATE_SHARED_STATE_TABLES_SQL:
+        await db.execute(table_sql)
+
+
+async def _migrate_v5(db: aiosqlite.Connection):
+    """Look sessions up by session_id alone (ownership check, memory scope)."""
+    await db.execute(CREATE_SESSIONS_BY_ID_INDEX_SQL)
+
+
+# (version, migration) in order; append new versions here and bump SCHEMA_VERSION
+MIGRATIONS = [
+    (1, _migrate_v1),
+    (2, _migrate_v2),
+    (3, _migrate_v3),
+    (4, _migrate_v4),
+    (5, _migrate_v5),
+]
+
+# ================= GROUP COMMIT WRITE-BEHIND QUEUE =================
+COMMIT_RETRIES = 3            # extra attempts for a group commit that raised (e.g. "database is locked")
+COMMIT_RETRY_BACKOFF = 0.05   # seconds before the first retry, doubled for each further one
+
+
+class GroupCommitError(Exception):
+    """Queued rows could not be committed, even after retrying; raised by flush() / close()."""
+
+
+class GroupCommitWriter:
+    """
+    Background writer that coalesces event inserts from every session into one
+    transaction per flush window (whichever comes first: max_batch_rows rows or
+    flush_interval seconds). submit() only blocks when max_queue batches are
+    already pending, which is the backpressure on the chat loop.
+
+    A commit that raises is rolled back and retried COMMIT_RETRIES times with backoff.
+    A batch that still fails is dropped, and the next flush() / close() raises
+    GroupCommitError for it, so the loss is never silent.
+    """
+
+    def __init__(self, store: "SessionStore", max_batch_rows: int = 500, flush_interval: float = 0.05, max_queue: int = 1000):
+        self.store = store
+        self.max_batch_rows = max_batch_rows
+        self.flush_interval = flush_interval
+        # (session_id, _event_row() results, session row or None)
+        self._queue: "asyncio.Queue[tuple[str, list[tuple[tuple, list[tuple]]], Optional[tuple]]]" = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self.last_error: Optional[BaseException] = None
+        self.failed_batches = 0
+        self.lost_rows = 0
+        # a failure no flush() has raised yet
+        self._unreported: Optional[BaseException] = None
+
+    @property
+    def depth(self) -> int:
+        """Batches waiting to be written."""
+        return self._queue.qsize()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run(), name="sqlite-group-commit")
+
+    async def submit(self, session_id: str, rows: list[tuple[tuple, list[tuple]]], session_row: Optional[tuple] = None):
+        """
+        Queue rows (and optionally the session's UPSERT_SESSION_SQL row) for the
+        next group commit. Waits only when the queue is full.
+        """
+        if not rows and session_row is None:
+            return
+        if not self.running:
+            self.start()
+        await self._queue.put((session_id, rows, session_row))
+
+    async def flush(self):
+        """Wait until everything submitted so far is committed. Raises GroupCommitError if rows were lost."""
+        failed = self.failed_batches
+        if self.running:
+            await self._queue.join()
+        if self.failed_batches > failed or self._unreported is not None:
+            error, self._unreported = self.last_error, None
+            raise GroupCommitError(
+                f"group commit failed after retries ({self.failed_batches} so far, {self.lost_rows} event rows not stored): {error}"
+            ) from error
+
+    async def close(self):
+        """Flush what is pending, then stop the background task (raises like flush() after stopping)."""
         try:
-            metadata = json.loads(metadata_json) if metadata_json else {}
+            await self.flush()
+        finally:
+            if self._task is not None:
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+                self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            row_count = len(batch[0][1])
+            deadline = loop.time() + self.flush_interval
+            while row_count < self.max_batch_rows:
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = self._queue.get_nowait()
+                batch.append(item)
+                row_count += len(item[1])
+            try:
+                await self._commit(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _commit(self, batch: list[tuple[str, list[tuple[tuple, list[tuple]]], Optional[tuple]]]):
+        rows = [row for _, session_rows, _ in batch for row in session_rows]
+        # only the latest state of each session needs to hit the disk
+        session_rows = {item[2][:3]: item[2] for item in batch if item[2] is not None}
+        metrics.DB_GROUP_COMMIT_ROWS.observe(len(rows))
+        for attempt in range(COMMIT_RETRIES + 1):
+            try:
+                with metrics.timed(metrics.DB_SECONDS, "sqlite_store.group_commit", op="group_commit"):
+                    async with self.store.write() as db:
+                        await _insert_rows(db, rows)
+                        if session_rows:
+                            await db.executemany(UPSERT_SESSION_SQL, list(session_rows.values()))
+                        await db.commit()
+                return
+            except Exception as exc:
+                metrics.DB_ERRORS.inc(op="group_commit")
+                self.last_error = exc
+                try:
+                    async with self.store.write() as db:
+                        await db.rollback()
+                except Exception:
+                    pass
+                if attempt < COMMIT_RETRIES:
+                    logger.warning("Group commit of %d rows failed (%s), retry %d/%d", len(rows), exc, attempt + 1, COMMIT_RETRIES)
+                    await asyncio.sleep(COMMIT_RETRY_BACKOFF * 2 ** attempt)
+                    continue
+                logger.exception("Group commit of %d rows failed after %d retries, rows dropped", len(rows), COMMIT_RETRIES)
+                self.failed_batches += 1
+                self.lost_rows += len(rows)
+                self._unreported = exc
+                # forget the optimistic high-water marks so the next save re-reads them from disk
+                for session_id, _, _ in batch:
+                    self.store._high_water.pop(session_id, None)
+
+# ================= SESSION STORE (POOLED CONNECTIONS) =================
+class SessionStore:
+    """
+    Long-lived connections to one chat_history.db.
+
+    One writer connection (SQLite only allows one writer at a time) guarded by a lock,
+    and a small pool of read-only connections that WAL lets run next to the writer.
+    PRAGMAs and schema setup run once in open(), not on every call.
+
+        async with SessionStore(DB_PATH) as store:
+            await store.save_session(completed_session)
+            rows = await store.get_session_events("chat001")
+    """
+
+    def __init__(self, db_path: str, readers: int = 2, cached_statements: int = CACHED_STATEMENTS):
+        self.db_path = db_path
+        # every ":memory:" connection is its own database, so reads have to go through the writer
+        self.readers = 0 if db_path == ":memory:" else readers
+        self.cached_statements = cached_statements
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        # concurrent first callers must not run schema setup twice
+        self._open_lock = asyncio.Lock()
+        self._reader_pool: "asyncio.Queue[aiosqlite.Connection]" = asyncio.Queue()
+        self._reader_conns: list[aiosqlite.Connection] = []
+        # session_id -> last event_index known to be stored (or queued for the writer)
+        self._high_water: dict[str, int] = {}
+        self._group_writer: Optional[GroupCommitWriter] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    @property
+    def shards(self) -> list["SessionStore"]:
+        """The stores holding session data: just this one (see sharding.ShardedSessionStore)."""
+        return [self]
+
+    async def _connect(self) -> aiosqlite.Connection:
+        db = await aiosqlite.connect(self.db_path, cached_statements=self.cached_statements)
+        for p in DB_PRAGMAS:
+            await db.execute(p)
+        return db
+
+    async def open(self) -> "SessionStore":
+        """Open the writer, run schema setup once, then open the readers."""
+        async with self._open_lock:
+            if self.is_open:
+                return self
+            writer = await self._connect()
+            try:
+                await self._create_schema(writer)
+            except BaseException:
+                # a failed migration must not leave the connection (and its thread) behind
+                await writer.close()
+                raise
+            for _ in range(self.readers):
+                reader = await self._connect()
+                await reader.execute("PRAGMA query_only=ON;")
+                self._reader_conns.append(reader)
+                self._reader_pool.put_nowait(reader)
+            # is_open only once the readers are in the pool
+            self._writer = writer
+        return self
+
+    async def close(self):
+        """
+        Flush the write-behind queue (if any) and close every pooled connection.
+        Raises GroupCommitError (after closing) if queued rows could not be stored.
+        """
+        try:
+            if self._group_writer is not None:
+                writer, self._group_writer = self._group_writer, None
+                await writer.close()
+        finally:
+            for reader in self._reader_conns:
+                await reader.close()
+            self._reader_conns.clear()
+            self._reader_pool = asyncio.Queue()
+            if self._writer is not None:
+                await self._writer.close()
+                self._writer = None
+            self._high_water.clear()
+
+    async def __aenter__(self) -> "SessionStore":
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _create_schema(self, db: aiosqlite.Connection):
+        """Bring the database up to SCHEMA_VERSION, one transaction per migration."""
+        version = await _schema_version(db)
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(
+                f"{self.db_path} has schema version {version}, this code only knows up to {SCHEMA_VERSION}"
+            )
+        for target, migrate in MIGRATIONS:
+            if version >= target:
+                continue
+            await db.execute("BEGIN IMMEDIATE")
+            try:
+                await migrate(db)
+                await db.execute(f"PRAGMA user_version = {target}")
+                await db.commit()
+            except BaseException:
+                await db.rollback()
+                raise
+            logger.info("Migrated %s to schema version %d", self.db_path, target)
+            version = target
+
+    @asynccontextmanager
+    async def write(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Borrow the writer connection. Commit inside the block."""
+        if not self.is_open:
+            await self.open()
+        waited = time.perf_counter()
+        async with self._write_lock:
+            metrics.DB_LOCK_WAIT_SECONDS.observe(time.perf_counter() - waited, lock="write")
+            yield self._writer
+
+    @asynccontextmanager
+    async def read(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Borrow a read-only connection from the pool (the writer when there are no readers)."""
+        if not self.is_open:
+            await self.open()
+        waited = time.perf_counter()
+        if not self.readers:
+            async with self._write_lock:
+                metrics.DB_LOCK_WAIT_SECONDS.observe(time.perf_counter() - waited, lock="write")
+                yield self._writer
+            return
+        reader = await self._reader_pool.get()
+        metrics.DB_LOCK_WAIT_SECONDS.observe(time.perf_counter() - waited, lock="read")
+        try:
+            yield reader
+        finally:
+            self._reader_pool.put_nowait(reader)
+
+    async def _load_high_water(self, db: aiosqlite.Connection, session_id: str) -> int:
+        if session_id not in self._high_water:
+            cursor = await db.execute(HIGH_WATER_SQL, (session_id, session_id))
+            row = await cursor.fetchone()
+            await cursor.close()
+            self._high_water[session_id] = row[0] if row and row[0] is not None else -1
+        return self._high_water[session_id]
+
+    @metrics.instrumented_db("save_session")
+    async def save_session(self, completed_session: Any, incremental: bool = True) -> int:
+        """
+        Save events in 'completed_session' to messages table.
+
+        incremental=True only inserts events past the session's stored high-water
+        mark (one executemany per call). incremental=False rewrites every event in
+        place. Both are idempotent thanks to the unique (session_id, event_index) key.
+        Returns the number of rows sent to the database.
+        """
+        session_id = _session_id_of(completed_session)
+        events = list(getattr(completed_session, "events", []) or [])
+
+        async with self.write() as db:
+            start = (await self._load_high_water(db, session_id)) + 1 if incremental else 0
+            rows = [_event_row(session_id, idx, events[idx]) for idx in range(start, len(events))]
+            if not rows:
+                return 0
+            await _insert_rows(db, rows, upsert=not incremental)
+            await db.commit()
+            self._high_water[session_id] = max(self._high_water.get(session_id, -1), len(events) - 1)
+        return len(rows)
+
+    def enable_write_behind(self, max_batch_rows: int = 500, flush_interval: float = 0.05, max_queue: int = 1000) -> GroupCommitWriter:
+        """Route enqueue_session() through a shared group-commit writer."""
+        if self._group_writer is None:
+            self._group_writer = GroupCommitWriter(self, max_batch_rows, flush_interval, max_queue)
+        return self._group_writer
+
+    @property
+    def queue_depth(self) -> int:
+        return self._group_writer.depth if self._group_writer is not None else 0
+
+    @metrics.instrumented_db("enqueue_session")
+    async def enqueue_session(self, completed_session: Any) -> int:
+        """
+        Snapshot the session's new events and hand them to the write-behind queue.
+        Returns as soon as the rows are queued; use flush() to wait for the disk.
+        Returns the number of rows queued.
+        """
+        writer = self.enable_write_behind()
+        session_id = _session_id_of(completed_session)
+        events = list(getattr(completed_session, "events", []) or [])
+
+        if session_id in self._high_water:
+            high_water = self._high_water[session_id]
+        else:
+            async with self.read() as db:
+                high_water = await self._load_high_water(db, session_id)
+        rows = [_event_row(session_id, idx, events[idx]) for idx in range(high_water + 1, len(events))]
+        if not rows:
+            return 0
+        # advance optimistically so the next turn only queues its own events
+        self._high_water[session_id] = len(events) - 1
+        await writer.submit(session_id, rows)
+        return len(rows)
+
+    async def flush(self):
+        """Wait until every queued write is committed."""
+        if self._group_writer is not None:
+            await self._group_writer.flush()
+
+    async def _next_event_index(self, session_id: str) -> int:
+        """Reserve the next event_index for a session (high-water mark + 1)."""
+        if session_id not in self._high_water:
+            async with self.read() as db:
+                await self._load_high_water(db, session_id)
+        self._high_water[session_id] += 1
+        return self._high_water[session_id]
+
+    @metrics.instrumented_db("append_event")
+    async def append_event(self, app_name: str, user_id: str, session_id: str, event: Any, state: dict, last_update_time: float) -> int:
+        """
+        Store one new event plus the session's current state.
+        Goes through the write-behind queue when it is enabled, otherwise commits right away.
+        Returns the event_index the event was stored under.
+        """
+        idx = await self._next_event_index(session_id)
+        row = _event_row(session_id, idx, event)
+        session_row = (app_name, user_id, session_id, json.dumps(state, default=str), last_update_time, last_update_time)
+        if self._group_writer is not None:
+            await self._group_writer.submit(session_id, [row], session_row)
+            return idx
+        try:
+            async with self.write() as db:
+                await _insert_rows(db, [row])
+                await db.execute(UPSERT_SESSION_SQL, session_row)
+                await db.commit()
+        except Exception:
+            self._high_water.pop(session_id, None)
+            raise
+        return idx
+
+    @metrics.instrumented_db("create_session_row")
+    async def create_session_row(self, app_name: str, user_id: str, session_id: str, state: dict, create_time: float) -> bool:
+        """
+        Insert a sessions row. Returns False when the session already exists, or when the
+        session_id is taken by another app/user or by stored events without an owner.
+        """
+        async with self.write() as db:
+            cursor = await db.execute(
+                CREATE_SESSION_ROW_SQL,
+                (app_name, user_id, session_id, json.dumps(state, default=str), create_time, create_time,
+                 session_id, session_id, session_id),
+            )
+            created = cursor.rowcount == 1
+            await cursor.close()
+            await db.commit()
+        return created
+
+    @metrics.instrumented_db("get_session_row")
+    async def get_session_row(self, app_name: str, user_id: str, session_id: str) -> Optional[tuple[dict, float, float]]:
+        """(state, create_time, last_update_time) of a stored session, or None."""
+        async with self.read() as db:
+            cursor = await db.execute(SELECT_SESSION_ROW_SQL, (app_name, user_id, session_id))
+            row = await cursor.fetchone()
+            await cursor.close()
+        if row is None:
+            return None
+        try:
+            state = json.loads(row[0]) if row[0] else {}
         except Exception:
-            metadata = {}
-        results.append({"event_index": idx, "role": role, "text": text, "timestamp": timestamp, "metadata": metadata})
-    return results
+            state = {}
+        return state, row[1], row[2]
+
+    @metrics.instrumented_db("get_shared_state")
+    async def get_shared_state(self, app_name: str, user_id: str) -> tuple[dict, dict]:
+        """(app state, user state) shared by the user's sessions, keys without their app:/user: prefix."""
+        async with self.read() as db:
+            cursor = await db.execute(SELECT_APP_STATE_SQL, (app_name,))
+            app_row = await cursor.fetchone()
+            await cursor.close()
+            cursor = await db.execute(SELECT_USER_STATE_SQL, (app_name, user_id))
+            user_row = await cursor.fetchone()
+            await cursor.close()
+        return (
+            json.loads(app_row[0]) if app_row else {},
+            json.loads(user_row[0]) if user_row else {},
+        )
+
+    @metrics.instrumented_db("update_shared_state")
+    async def update_shared_state(self, app_name: str, user_id: str, app_delta: dict, user_delta: dict, update_time: float):
+        """
+        Merge deltas into the app and user state rows in one transaction.
+        Committed right away, not through the write-behind queue: other sessions read these rows.
+        """
+        if not app_delta and not user_delta:
+            return
+        async with self.write() as db:
+            for delta, select_sql, upsert_sql, key in (
+                (app_delta, SELECT_APP_STATE_SQL, UPSERT_APP_STATE_SQL, (app_name,)),
+                (user_delta, SELECT_USER_STATE_SQL, UPSERT_USER_STATE_SQL, (app_name, user_id)),
+            ):
+                if not delta:
+                    continue
+                cursor = await db.execute(select_sql, key)
+                row = await cursor.fetchone()
+                await cursor.close()
+                state = json.loads(row[0]) if row else {}
+                state.update(delta)
+                await db.execute(upsert_sql, (*key, json.dumps(state, default=str), update_time))
+            await db.commit()
+
+    @metrics.instrumented_db("list_session_rows")
+    async def list_session_rows(self, app_name: str, user_id: Optional[str] = None) -> list[tuple[str, str, float]]:
+        """(user_id, session_id, last_update_time) of stored sessions, oldest update first."""
+        await self.flush()
+        if user_id is None:
+            sql, params = "SELECT user_id, session_id, last_update_time FROM sessions WHERE app_name = ?", (app_name,)
+        else:
+            sql, params = "SELECT user_id, session_id, last_update_time FROM sessions WHERE app_name = ? AND user_id = ?", (app_name, user_id)
+        async with self.read() as db:
+            cursor = await db.execute(sql + " ORDER BY last_update_time, user_id, session_id", params)
+            rows = await cursor.fetchall()
+            await cursor.close()
+        return [tuple(row) for row in rows]
+
+    @metrics.instrumented_db("delete_session")
+    async def delete_session(self, app_name: str, user_id: str, session_id: str):
+        """
+        Remove a session row and all of its events. The events stay when the session_id
+        belongs to another app/user: only its owner (or an ownerless row) can delete them.
+        """
+        await self.flush()
+        async with self.write() as db:
+            await db.execute("DELETE FROM sessions WHERE app_name = ? AND user_id = ? AND session_id = ?", (app_name, user_id, session_id))
+            cursor = await db.execute("SELECT 1 FROM sessions WHERE session_id = ? LIMIT 1", (session_id,))
+            owned_elsewhere = await cursor.fetchone() is not None
+            await cursor.close()
+            if owned_elsewhere:
+                await db.commit()
+                return
+            await db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            await db.execute("DELETE FROM message_parts WHERE session_id = ?", (session_id,))
+            await db.execute("DELETE FROM session_archive WHERE session_id = ?", (session_id,))
+            await db.commit()
+        self._high_water.pop(session_id, None)
+
+    @metrics.instrumented_db("get_event_payloads")
+    async def get_event_payloads(self, session_id: str) -> list[tuple]:
+        """(event_index, role, text, event_json) rows of a session, used to rebuild ADK events."""
+        archived, _ = await self._archived_rows(session_id)
+        async with self.read() as db:
+            cursor = await db.execute(SELECT_EVENT_PAYLOADS_SQL, (session_id,))
+            rows = await cursor.fetchall()
+            await cursor.close()
+        return [(m[0], m[1], m[2], m[5]) for m in archived] + list(rows)
+
+    @metrics.instrumented_db("get_session_events")
+    async def get_session_events(self, session_id: str, after_index: Optional[int] = None, limit: Optional[int] = None) -> list[dict]:
+        """
+        Retrieve saved events for a session_id ordered by event_index.
+        Pass the last event_index you have as after_index and a page size as limit
+        to page through long sessions without OFFSET scans.
+        Archived sessions are read back from their archive blob.
+        """
+        after_index = -1 if after_index is None else after_index
+        archived, _ = await self._archived_rows(session_id)
+        rows = [_archived_event_row(m) for m in archived if m[0] > after_index][:limit]
+        if limit is not None and len(rows) >= limit:
+            return [_row_to_dict(row) for row in rows]
+        if rows:
+            after_index = rows[-1][0]
+        params = (session_id, after_index, -1 if limit is None else limit - len(rows))
+        async with self.read() as db:
+            cursor = await db.execute(SELECT_SESSION_EVENTS_SQL, params)
+            rows += await cursor.fetchall()
+            await cursor.close()
+        return [_row_to_dict(row) for row in rows]
+
+    async def iter_session_events(self, session_id: str, chunk_size: int = 200, after_index: Optional[int] = None) -> AsyncIterator[EventRecord]:
+        """
+        Stream a session's events as EventRecords, chunk_size rows per query.
+        Each chunk borrows a reader only for its own query, so a slow consumer never pins a connection.
+        Archived events (decoded once) come first.
+        """
+        last_index = -1 if after_index is None else after_index
+        archived, _ = await self._archived_rows(session_id)
+        for m in archived:
+            if m[0] > last_index:
+                yield EventRecord(*_archived_event_row(m))
+                last_index = m[0]
+        while True:
+            async with self.read() as db:
+                cursor = await db.execute(SELECT_SESSION_EVENTS_SQL, (session_id, last_index, chunk_size))
+                rows = await cursor.fetchall()
+                await cursor.close()
+            for row in rows:
+                yield EventRecord(*row)
+            if len(rows) < chunk_size:
+                return
+            last_index = rows[-1][0]
+
+    # ================= COLD ARCHIVE =================
+    async def _archived_rows(self, session_id: str) -> tuple[list[tuple], list[tuple]]:
+        """Decoded archive of a session (messages rows, parts rows), empty lists when it has none."""
+        async with self.read() as db:
+            cursor = await db.execute(SELECT_ARCHIVE_SQL, (session_id,))
+            row = await cursor.fetchone()
+            await cursor.close()
+        if row is None:
+            return [], []
+        return _decode_archive(*row)
+
+    @metrics.instrumented_db("archive_session")
+    async def archive_session(self, session_id: str, codec: Optional[str] = None) -> Optional[dict]:
+        """
+        Move a session's hot messages/message_parts rows into its compressed archive blob
+        (merged with an older archive of the same session). One short write transaction.
+        Returns {"events", "raw_bytes", "stored_bytes", "codec"} for the new blob, or None when
+        the session had no hot rows.
+        """
+        async with self.write() as db:
+            cursor = await db.execute(
+                f"SELECT {ARCHIVE_MESSAGE_COLUMNS} FROM messages WHERE session_id = ? ORDER BY event_index", (session_id,)
+            )
+            hot = await cursor.fetchall()
+            await cursor.close()
+            if not hot:
+                return None
+            cursor = await db.execute(
+                f"SELECT {ARCHIVE_PART_COLUMNS} FROM message_parts WHERE session_id = ? ORDER BY event_index, part_index",
+                (session_id,),
+            )
+            hot_parts = await cursor.fetchall()
+            await cursor.close()
+            cursor = await db.execute(SELECT_ARCHIVE_SQL, (session_id,))
+            existing = await cursor.fetchone()
+            await cursor.close()
+            messages, parts = _decode_archive(*existing) if existing else ([], [])
+            archived_indexes = {m[0] for m in messages}
+            messages += [tuple(m) for m in hot if m[0] not in archived_indexes]
+            parts += [tuple(p) for p in hot_parts if p[0] not in archived_indexes]
+
+            raw = _encode_archive(messages, parts)
+            codec, blob = compress_archive(raw, codec)
+            event_times = [m[6] for m in messages if m[6] is not None]
+            await db.execute(UPSERT_ARCHIVE_SQL, (
+                session_id, codec, len(messages), messages[-1][0],
+                min(event_times, default=None), max(event_times, default=None),
+                len(raw), len(blob), time.time(), blob,
+            ))
+            await db.execute("DELETE FROM message_parts WHERE session_id = ?", (session_id,))
+            await db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            await db.commit()
+        return {"events": len(messages), "raw_bytes": len(raw), "stored_bytes": len(blob), "codec": codec}
+
+    @metrics.instrumented_db("restore_session")
+    async def restore_session(self, session_id: str) -> int:
+        """Move an archived session back into the hot tables (and the memory index). Returns events restored."""
+        async with self.write() as db:
+            cursor = await db.execute(SELECT_ARCHIVE_SQL, (session_id,))
+            existing = await cursor.fetchone()
+            await cursor.close()
+            if existing is None:
+                return 0
+            messages, parts = _decode_archive(*existing)
+            await db.executemany(INSERT_EVENT_SQL, [(session_id, *m) for m in messages])
+            await db.executemany(INSERT_PART_SQL, [(session_id, *p) for p in parts])
+            await db.execute("DELETE FROM session_archive WHERE session_id = ?", (session_id,))
+            await db.commit()
+        return len(messages)
+
+    # ================= ANALYTICS / AUDIT READS =================
+    @metrics.instrumented_db("analytics")
+    async def _fetch(self, sql: str, params: tuple) -> list[tuple]:
+        async with self.read() as db:
+            cursor = await db.execute(sql, params)
+            rows = await cursor.fetchall()
+            await cursor.close()
+        return rows
+
+    async def get_events_between(self, start: float, end: float, author: Optional[str] = None, limit: Optional[int] = None) -> list[dict]:
+        """Events with start <= event_time < end (epoch seconds), optionally of one author, oldest first."""
+        limit = -1 if limit is None else limit
+        if author is None:
+            rows = await self._fetch(SELECT_EVENTS_BETWEEN_SQL, (start, end, limit))
+        else:
+            rows = await self._fetch(SELECT_AUTHOR_EVENTS_BETWEEN_SQL, (author, start, end, limit))
+        return [dict(zip(EVENT_SUMMARY_FIELDS, row)) for row in rows]
+
+    async def get_invocation_events(self, invocation_id: str) -> list[dict]:
+        """Every event of one invocation (one user turn: model calls, tool calls and replies)."""
+        rows = await self._fetch(SELECT_INVOCATION_EVENTS_SQL, (invocation_id,))
+        return [dict(zip(EVENT_SUMMARY_FIELDS, row)) for row in rows]
+
+    async def get_token_usage(self, start: float, end: float) -> dict[str, dict]:
+        """Token usage per author for events with start <= event_time < end."""
+        rows = await self._fetch(TOKEN_USAGE_SQL, (start, end))
+        return {
+            author: {"events": events, "prompt_tokens": prompt or 0, "candidates_tokens": candidates or 0,
+                     "cached_tokens": cached or 0, "total_tokens": total or 0}
+            for author, events, prompt, candidates, cached, total in rows
+        }
+
+    async def get_event_parts(self, session_id: str, after_index: Optional[int] = None) -> list[dict]:
+        """Every stored content part of a session (text, thoughts, function calls/responses, ...), archived ones included."""
+        after_index = -1 if after_index is None else after_index
+        _, archived = await self._archived_rows(session_id)
+        rows = [p for p in archived if p[0] > after_index] + await self._fetch(SELECT_EVENT_PARTS_SQL, (session_id, after_index))
+        return [_part_to_dict(row) for row in rows]
+
+    async def get_function_calls(self, function_name: str, limit: Optional[int] = None) -> list[dict]:
+        """Calls and responses of one tool across all sessions."""
+        rows = await self._fetch(SELECT_FUNCTION_CALLS_SQL, (function_name, -1 if limit is None else limit))
+        return [
+            {"session_id": session_id, "event_index": idx, "part_index": part_index, "kind": kind,
+             "function_call_id": call_id, "payload": json.loads(payload) if payload else None}
+            for session_id, idx, part_index, kind, call_id, payload in rows
+        ]
+
+# ================= SHARED STORES FOR THE MODULE-LEVEL API =================
+# db_path -> open SessionStore, so init_db / save_session_to_db / get_session_events reuse connections
+_stores: dict[str, SessionStore] = {}
+_stores_lock: Optional[asyncio.Lock] = None
+
+
+async def get_store(db_path: str) -> SessionStore:
+    """Return the shared, already-open SessionStore for db_path."""
+    global _stores_lock
+    store = _stores.get(db_path)
+    if store is not None and store.is_open:
+        return store
+    if _stores_lock is None:
+        _stores_lock = asyncio.Lock()
+    async with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None or not store.is_open:
+            store = await SessionStore(db_path).open()
+            _stores[db_path] = store
+    return store
+
+
+async def close_stores():
+    """Close every shared SessionStore (call once on shutdown)."""
+    while _stores:
+        _, store = _stores.popitem()
+        await store.close()
+
+# ================= INITIALIZNG DATABASE =================
+async def init_db(db_path: str):
+    """Create DB file, messages table and the unique event index if not exists."""
+    await get_store(db_path)
+
+# ================= SAVING SESSION TO DB =================
+async def save_session_to_db(db_path: str, completed_session: Any, incremental: bool = True) -> int:
+    """Save events in 'completed_session' to messages table (see SessionStore.save_session)."""
+    store = await get_store(db_path)
+    return await store.save_session(completed_session, incremental=incremental)
+
+
+async def enqueue_session_to_db(db_path: str, completed_session: Any) -> int:
+    """Queue the session's new events for the background group-commit writer."""
+    store = await get_store(db_path)
+    return await store.enqueue_session(completed_session)
+
+
+async def flush_db(db_path: str):
+    """Wait until every write queued for db_path is on disk."""
+    store = await get_store(db_path)
+    await store.flush()
+
+
+# ================= RETRIEVING SAVED EVENTS  =================
+async def get_session_events(db_path: str, session_id: str, after_index: Optional[int] = None, limit: Optional[int] = None):
+    """Retrieve saved events for a session_id ordered by event_index (keyset-paginated with after_index/limit)."""
+    store = await get_store(db_path)
+    return await store.get_session_events(session_id, after_index=after_index, limit=limit)
+
+
+async def iter_session_events(db_path: str, session_id: str, chunk_size: int = 200, after_index: Optional[int] = None) -> AsyncIterator[EventRecord]:
+    """Stream saved events for a session_id in chunks, decoding metadata lazily."""
+    store = await get_store(db_path)
+    async for record in store.iter_session_events(session_id, chunk_size=chunk_size, after_index=after_index):
+        yield record
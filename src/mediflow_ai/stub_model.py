@@ -0,0 +1,154 @@
+# stub_model.py
+import asyncio
+import itertools
+import json
+import random
+import time
+from typing import Any, AsyncGenerator
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai.types import Content, GenerateContentResponseUsageMetadata, Part
+
+# ================= LOCAL STAND-IN FOR GEMINI (LOAD TESTS, OFFLINE RUNS) =================
+# Select it with MediFlowConfig(model="stub") or GOOGLE_GENAI_MODEL=stub.
+# "stub:<ms>" adds a fixed per-call latency, e.g. "stub:200" to mimic a real model round trip.
+# "stub:<ms>+<tail ms>@<share>" also stalls that share of the calls, e.g. "stub:50+2000@0.1"
+# (10% of calls take 2.05 s), the slow tail model_routing.py hedges and falls back from.
+# "stub:<ms>#<calls>" is a provider quota: calls beyond that many in flight (per model name) fail
+# with a 429 RESOURCE_EXHAUSTED after a short delay, what governor.py backs off from.
+STUB_MODEL_PREFIX = "stub"
+STREAM_CHUNK_WORDS = 3
+CHARS_PER_TOKEN = 4
+
+# ================= STUB CACHED CONTENTS (prompt_cache.py against the stub) =================
+# cache name -> {"tokens": prefix tokens, "expires_at": ...}; shared by StubCacheBackend and StubLlm
+STUB_CACHES: dict[str, dict] = {}
+_cache_ids = itertools.count(1)
+
+# model name -> calls in flight, for "#<calls>" quotas (tiers / agents with the same name share one)
+STUB_IN_FLIGHT: dict[str, int] = {}
+QUOTA_REJECT_SECONDS = 0.01
+
+
+def _tokens(value: Any) -> int:
+    if value is None:
+        return 0
+    if hasattr(value, "model_dump"):
+        value = value.model_dump(mode="json", exclude_none=True)
+    return len(value if isinstance(value, str) else json.dumps(value, default=str)) // CHARS_PER_TOKEN
+
+
+class StubCacheBackend:
+    """In-process stand-in for client.aio.caches, same interface as prompt_cache.GenaiCacheBackend."""
+
+    def __init__(self):
+        self.calls = {"create": 0, "refresh": 0, "delete": 0}
+
+    async def create(self, model, system_instruction, tools, tool_config, ttl_seconds, display_name):
+        self.calls["create"] += 1
+        name = f"cachedContents/stub-{next(_cache_ids)}"
+        tokens = _tokens(system_instruction) + sum(_tokens(tool) for tool in tools or []) + _tokens(tool_config)
+        STUB_CACHES[name] = {"tokens": tokens, "expires_at": time.time() + ttl_seconds, "display_name": display_name}
+        return name, STUB_CACHES[name]["expires_at"]
+
+    async def refresh(self, cache_name, ttl_seconds):
+        self.calls["refresh"] += 1
+        if cache_name not in STUB_CACHES:
+            raise KeyError(f"{cache_name} not found")
+        STUB_CACHES[cache_name]["expires_at"] = time.time() + ttl_seconds
+        return STUB_CACHES[cache_name]["expires_at"]
+
+    async def delete(self, cache_name):
+        self.calls["delete"] += 1
+        STUB_CACHES.pop(cache_name, None)
+
+
+class StubLlm(BaseLlm):
+    """Answers every request locally with a short canned reply that echoes the last user message."""
+
+    model: str = STUB_MODEL_PREFIX
+    latency_seconds: float = 0.0
+    tail_seconds: float = 0.0
+    tail_share: float = 0.0
+    max_in_flight: int = 0        # 0 = no quota
+
+    @classmethod
+    def from_name(cls, name: str) -> "StubLlm":
+        _, _, latency = name.partition(":")
+        latency, _, max_in_flight = latency.partition("#")
+        latency_ms, _, tail = latency.partition("+")
+        tail_ms, _, tail_share = tail.partition("@")
+        return cls(
+            model=name,
+            latency_seconds=float(latency_ms or 0) / 1000,
+            tail_seconds=float(tail_ms or 0) / 1000,
+            tail_share=float(tail_share or 0),
+            max_in_flight=int(max_in_flight or 0),
+        )
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        if not self.max_in_flight:
+            async for response in self._generate(llm_request, stream):
+                yield response
+            return
+        if STUB_IN_FLIGHT.get(self.model, 0) >= self.max_in_flight:
+            await asyncio.sleep(QUOTA_REJECT_SECONDS)
+            raise RuntimeError(f"429 RESOURCE_EXHAUSTED: more than {self.max_in_flight} concurrent requests for {self.model}")
+        STUB_IN_FLIGHT[self.model] = STUB_IN_FLIGHT.get(self.model, 0) + 1
+        try:
+            async for response in self._generate(llm_request, stream):
+                yield response
+        finally:
+            STUB_IN_FLIGHT[self.model] -= 1
+
+    async def _generate(self, llm_request: LlmRequest, stream: bool) -> AsyncGenerator[LlmResponse, None]:
+        usage = self._usage(llm_request)
+        latency = self.latency_seconds
+        if self.tail_share and random.random() < self.tail_share:
+            latency += self.tail_seconds
+        if latency:
+            await asyncio.sleep(latency)
+        last_text = ""
+        for content in reversed(llm_request.contents or []):
+            if content.role == "user" and content.parts and content.parts[0].text:
+                last_text = content.parts[0].text
+                break
+        reply = f"Thanks, I noted: {last_text[:200]}. Could you tell me how long you have had these symptoms?"
+        if stream:
+            # like Gemini SSE: partial chunks first, then the aggregated response
+            words = reply.split(" ")
+            for i in range(0, len(words), STREAM_CHUNK_WORDS):
+                chunk = " ".join(words[i:i + STREAM_CHUNK_WORDS]) + " "
+                yield LlmResponse(content=Content(role="model", parts=[Part(text=chunk)]), partial=True)
+                if self.latency_seconds:
+                    await asyncio.sleep(self.latency_seconds / 10)
+        yield LlmResponse(content=Content(role="model", parts=[Part(text=reply)]), usage_metadata=usage)
+
+    @staticmethod
+    def _usage(llm_request: LlmRequest) -> GenerateContentResponseUsageMetadata:
+        """Rough token accounting, including cached content tokens, like the real endpoint reports."""
+        config = llm_request.config
+        cached_tokens = 0
+        if config is not None and config.cached_content:
+            cache = STUB_CACHES.get(config.cached_content)
+            if cache is None or cache["expires_at"] < time.time():
+                raise ValueError(f"404 NOT_FOUND: {config.cached_content} not found or expired")
+            if config.system_instruction or config.tools:
+                raise ValueError("400 INVALID_ARGUMENT: cached content can not be used with system_instruction or tools")
+            cached_tokens = cache["tokens"]
+        prompt_tokens = cached_tokens + sum(_tokens(content) for content in llm_request.contents or [])
+        if config is not None:
+            prompt_tokens += _tokens(config.system_instruction) + sum(_tokens(tool) for tool in config.tools or [])
+        return GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_tokens,
+            cached_content_token_count=cached_tokens or None,
+            candidates_token_count=20,
+        )
+
+
+def is_stub_model(name) -> bool:
+    return isinstance(name, str) and (name == STUB_MODEL_PREFIX or name.startswith(STUB_MODEL_PREFIX + ":"))
@@ -0,0 +1,8 @@
+# conftest.py
+# the package lives in src/ (ADK Web layout); make "import mediflow_ai" work from the repo root
+import os
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
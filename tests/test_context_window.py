@@ -0,0 +1,45 @@
+# test_context_window.py
+# The context window callback: old turns folded into one summary, patient slots kept up to date.
+from types import SimpleNamespace
+
+from google.adk.models.llm_request import LlmRequest
+from google.genai.types import Content, Part
+
+from mediflow_ai.context_window import CONTEXT_STATE_KEY, PATIENT_STATE_KEY, make_context_window_callback
+
+
+def _turn(user_text: str, reply: str = "noted") -> list[Content]:
+    return [Content(role="user", parts=[Part(text=user_text)]), Content(role="model", parts=[Part(text=reply)])]
+
+
+def _fold(state: dict, *user_texts: str, keep_turns: int = 1) -> LlmRequest:
+    request = LlmRequest(contents=[content for text in user_texts for content in _turn(text)])
+    make_context_window_callback(keep_turns=keep_turns)(SimpleNamespace(state=state), request)
+    return request
+
+
+def test_newer_turns_override_older_slots():
+    # the intake form set these earlier
+    state = {PATIENT_STATE_KEY: {"location": "Pune", "age": 34, "symptoms": ["fever"]}}
+    request = _fold(state, "I am in Mumbai now", "I am 35 now and have a cough", "what should I do?")
+    patient = state[PATIENT_STATE_KEY]
+    assert patient["location"] == "Mumbai" and patient["age"] == 35
+    assert patient["symptoms"] == ["fever", "cough"]
+    assert state[CONTEXT_STATE_KEY]["folded_turns"] == 2
+    summary = request.contents[0].parts[0].text
+    assert "location: Mumbai" in summary and "age: 35" in summary
+    assert request.contents[1].parts[0].text == "what should I do?"
+
+
+def test_turns_without_a_slot_keep_the_known_value():
+    state = {PATIENT_STATE_KEY: {"location": "Pune", "duration": "2 days"}}
+    _fold(state, "hello", "thanks, that helps", "ok")
+    assert state[PATIENT_STATE_KEY] == {"location": "Pune", "duration": "2 days"}
+
+
+def test_later_folds_see_the_latest_mention():
+    state = {}
+    _fold(state, "I live in Pune", "ok", keep_turns=1)
+    assert state[PATIENT_STATE_KEY]["location"] == "Pune"
+    _fold(state, "I live in Pune", "ok", "I am in Delhi now", "and?", keep_turns=1)
+    assert state[PATIENT_STATE_KEY]["location"] == "Delhi"
@@ -0,0 +1,56 @@
+# test_emergency_screen.py
+# The PHASE 3 pre-screen (screen_text): danger signs with synonyms, negation that governs the match, third parties.
+import pytest
+
+from mediflow_ai.emergency_screen import screen_text
+
+
+@pytest.mark.parametrize(
+    "text, category",
+    [
+        ("I have severe chest pain and can't breathe properly", "chest_pain"),
+        ("I have no energy and chest pain", "chest_pain"),
+        ("no fever with chest pain since morning", "chest_pain"),
+        ("I have never had chest pain this bad", "chest_pain"),
+        ("never felt pressure in my chest like this", "chest_pain"),
+        ("no cough, but crushing pain in my chest", "chest_pain"),
+        ("my dad is having a heart attack", "chest_pain"),
+        ("my dad had a heart attack last year and now I have chest pain", "chest_pain"),
+        ("I can barely breathe", "breathing"),
+        ("I am not able to breathe", "breathing"),
+        ("I can hardly breathe at night", "breathing"),
+        ("I can't catch my breath", "breathing"),
+        ("I cannot get enough air", "breathing"),
+        ("struggling for air after climbing stairs", "breathing"),
+        ("I don't know why but I'm short of breath", "breathing"),
+        ("I fainted twice today", "consciousness"),
+        ("my face is drooping and my speech is slurred", "stroke"),
+        ("I don't think anyone cares, I want to die", "suicidal"),
+        ("coughing up blood", "bleeding"),
+    ],
+)
+def test_danger_signs_are_caught(text, category):
+    match = screen_text(text)
+    assert match is not None and match.category == category
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "my dad had a heart attack last year",
+        "family history of stroke",
+        "my mother passed out once years ago",
+        "no chest pain",
+        "I don't have any shortness of breath",
+        "denies chest pain",
+        "no signs of a stroke",
+        "never had any chest pain",
+        "I'm not suicidal",
+        "I haven't fainted",
+        "it is not a heart attack, just heartburn",
+        "mild sore throat and runny nose",
+        "Hello",
+    ],
+)
+def test_non_emergencies_pass(text):
+    assert screen_text(text) is None
@@ -0,0 +1,24 @@
+# test_evals.py
+# The evalset against the committed cassettes (python -m mediflow_ai.evals, replay mode): offline, every case passes.
+import asyncio
+import os
+
+from mediflow_ai.config import MediFlowConfig
+from mediflow_ai.evals import load_criteria, run_evalset
+
+TESTS_DIR = os.path.dirname(__file__)
+
+
+def test_evalset_passes_on_the_recorded_cassettes():
+    report = asyncio.run(
+        run_evalset(
+            os.path.join(TESTS_DIR, "mediflow_evalset.json"),
+            mode="replay",
+            cassette_dir=os.path.join(TESTS_DIR, "cassettes"),
+            config=MediFlowConfig(),
+            criteria=load_criteria(os.path.join(TESTS_DIR, "test_config.json")),
+        )
+    )
+    assert [(case.eval_id, case.error) for case in report.cases if not case.passed] == []
+    assert report.cassettes["misses"] == 0
+
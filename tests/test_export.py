@@ -0,0 +1,97 @@
+# test_export.py
+# export.py: a small session out through the exporter and back (Parquet needs the "export" extra, pyarrow).
+import asyncio
+import sys
+
+import pytest
+from google.adk.events import Event
+from google.genai.types import Content, FunctionCall, Part
+
+from mediflow_ai.export import decode_chunk, export_parquet, iter_message_chunks, read_watermark
+from mediflow_ai.session_service import SqliteSessionService
+from mediflow_ai.sqlite_store import SessionStore
+
+APP = "mediflow"
+DAY = 1_735_689_600.0  # 2025-01-01T00:00:00Z
+
+
+def _events() -> list[Event]:
+    return [
+        Event(author="user", timestamp=DAY + 10, content=Content(role="user", parts=[Part(text="fever since monday")])),
+        Event(
+            author="tara", timestamp=DAY + 11,
+            content=Content(role="model", parts=[Part(function_call=FunctionCall(name="enrich_patient_context", args={}))]),
+        ),
+        Event(
+            author="tara", timestamp=DAY + 86_400, custom_metadata={"emergency_prescreen": "breathing"},
+            content=Content(role="model", parts=[Part(text="call 112")]),
+        ),
+    ]
+
+
+async def _store_with_session(tmp_path, events: list[Event]) -> SqliteSessionService:
+    sessions = SqliteSessionService(SessionStore(str(tmp_path / "chat.db")), write_behind=False)
+    session = await sessions.create_session(app_name=APP, user_id="alice", session_id="s1")
+    for event in events:
+        await sessions.append_event(session, event)
+    return sessions
+
+
+def test_rows_decode_into_export_columns(tmp_path):
+    async def run():
+        sessions = await _store_with_session(tmp_path, _events())
+        chunks = [rows async for rows in iter_message_chunks(sessions.store, chunk_rows=2)]
+        await sessions.close()
+        return chunks
+
+    chunks = asyncio.run(run())
+    assert [len(rows) for rows in chunks] == [2, 1]
+    by_date = {}
+    for rows in chunks:
+        for date, columns in decode_chunk(rows).items():
+            for name, values in columns.items():
+                by_date.setdefault(date, {}).setdefault(name, []).extend(values)
+    assert sorted(by_date) == ["2025-01-01", "2025-01-02"]
+    first_day = by_date["2025-01-01"]
+    assert first_day["event_index"] == [0, 1] and first_day["text"] == ["fever since monday", None]
+    assert first_day["function_calls"] == [[], ["enrich_patient_context"]]
+    assert by_date["2025-01-02"]["emergency_category"] == ["breathing"]
+
+
+def test_parquet_round_trip_and_incremental_run(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    out_dir = str(tmp_path / "exports")
+
+    async def run():
+        sessions = await _store_with_session(tmp_path, _events())
+        first = await export_parquet(sessions.store, out_dir, chunk_rows=2)
+        session = await sessions.get_session(app_name=APP, user_id="alice", session_id="s1")
+        await sessions.append_event(
+            session, Event(author="user", timestamp=DAY + 86_401, content=Content(role="user", parts=[Part(text="ok")]))
+        )
+        second = await export_parquet(sessions.store, out_dir)
+        await sessions.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert (first.rows, second.rows) == (3, 1)
+    assert read_watermark(out_dir) == second.until_id
+    table = pq.read_table(out_dir).sort_by([("session_id", "ascending"), ("event_index", "ascending")])
+    assert table.column("text").to_pylist() == ["fever since monday", None, "call 112", "ok"]
+    assert table.column("event_index").to_pylist() == [0, 1, 2, 3]
+    assert table.column("emergency_category").to_pylist()[2] == "breathing"
+    assert {str(date) for date in table.column("event_date").to_pylist()} == {"2025-01-01", "2025-01-02"}
+
+
+def test_missing_pyarrow_names_the_export_extra(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+
+    async def run():
+        sessions = await _store_with_session(tmp_path, _events())
+        try:
+            await export_parquet(sessions.store, str(tmp_path / "exports"))
+        finally:
+            await sessions.close()
+
+    with pytest.raises(RuntimeError, match=r"mediflow_ai\[export\]"):
+        asyncio.run(run())
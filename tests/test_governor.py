@@ -0,0 +1,141 @@
+# test_governor.py
+# OutboundGovernor: AIMD concurrency limit, token bucket, priority queue, bounded waiting.
+import asyncio
+import time
+
+import pytest
+
+from mediflow_ai.governor import GovernorOverloaded, OutboundGovernor, Priority, priority
+
+
+class RateLimited(Exception):
+    code = 429
+
+
+def test_limit_grows_additively_only_while_it_is_used():
+    governor = OutboundGovernor(initial_limit=4, max_concurrency=5)
+    for _ in range(4):
+        governor.on_success(0.01, started=time.monotonic(), in_flight=1)
+    assert governor.limit == 4  # 1 call in flight never pressed against a limit of 4
+
+    for _ in range(4):
+        governor.on_success(0.01, started=time.monotonic(), in_flight=4)
+    assert 4.9 < governor.limit <= 5  # about +1 per limit's worth of calls
+    for _ in range(20):
+        governor.on_success(0.01, started=time.monotonic(), in_flight=5)
+    assert governor.limit == 5  # max_concurrency
+
+
+def test_429_halves_the_limit_once_per_round_trip():
+    governor = OutboundGovernor(initial_limit=16)
+    started = time.monotonic()
+    governor.on_rate_limited(started)
+    assert governor.limit == 8
+    # calls that were already in flight saw the old load
+    governor.on_rate_limited(started)
+    assert governor.limit == 8
+    governor.on_rate_limited(time.monotonic() + 1)
+    assert governor.limit == 4
+    for step in range(2, 10):
+        governor.on_rate_limited(time.monotonic() + step)
+    assert governor.limit == 1 and governor.stats["rate_limited"] == 11
+
+
+def test_rising_latency_backs_off_gently():
+    governor = OutboundGovernor(initial_limit=10)
+    for _ in range(20):
+        governor.on_success(0.02, started=time.monotonic(), in_flight=1)
+    governor.on_success(0.5, started=time.monotonic() + 1, in_flight=1)
+    assert governor.limit == pytest.approx(9.0)
+    assert governor.stats["latency_backoffs"] == 1
+    # jitter within LATENCY_SLACK of the baseline is not load
+    governor.on_success(0.06, started=time.monotonic() + 2, in_flight=1)
+    assert governor.limit == pytest.approx(9.0)
+
+
+def test_slot_feeds_429s_back_and_frees_the_slot():
+    async def run():
+        governor = OutboundGovernor(initial_limit=8)
+        with pytest.raises(RateLimited):
+            async with governor.slot():
+                raise RateLimited("429 RESOURCE_EXHAUSTED")
+        assert governor.limit == 4 and governor.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_token_bucket_spaces_calls_past_the_burst():
+    async def run():
+        governor = OutboundGovernor(rate=20, burst=2)
+        started = time.monotonic()
+        for _ in range(2):
+            async with governor.slot():
+                pass
+        assert time.monotonic() - started < 0.04
+        # bucket empty: a hedged call (timeout=0) is shed, a normal one waits for the next token
+        with pytest.raises(GovernorOverloaded):
+            await governor.acquire(timeout=0)
+        async with governor.slot():
+            pass
+        assert time.monotonic() - started >= 0.04
+        assert governor.stats["waited"] == 1
+
+    asyncio.run(run())
+
+
+def test_waiters_are_admitted_by_priority():
+    async def run():
+        governor = OutboundGovernor(initial_limit=1, max_concurrency=1)
+        admitted = []
+
+        async def call(level: Priority, name: str):
+            with priority(level):
+                async with governor.slot():
+                    admitted.append(name)
+
+        await governor.acquire()  # the one slot is busy
+        tasks = [asyncio.create_task(call(level, name)) for level, name in (
+            (Priority.ENRICHMENT, "pollen"), (Priority.INTERACTIVE, "turn"), (Priority.EMERGENCY, "chest pain"),
+            (Priority.ENRICHMENT, "weather"),
+        )]
+        await asyncio.sleep(0.01)
+        assert governor.queued == 4
+        governor._release()
+        await asyncio.gather(*tasks)
+        assert admitted == ["chest pain", "turn", "pollen", "weather"]
+
+    asyncio.run(run())
+
+
+def test_full_queue_turns_away_the_least_urgent_call():
+    async def run():
+        governor = OutboundGovernor(initial_limit=1, max_concurrency=1, max_queue=1, queue_timeout=5)
+        await governor.acquire()
+        enrichment = asyncio.create_task(governor.acquire(Priority.ENRICHMENT))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(governor.acquire(Priority.INTERACTIVE))
+        await asyncio.sleep(0)
+        with pytest.raises(GovernorOverloaded, match="displaced"):
+            await enrichment
+        # a call no more urgent than everything waiting is refused outright
+        with pytest.raises(GovernorOverloaded, match="waiting"):
+            await governor.acquire(Priority.ENRICHMENT)
+        governor._release()
+        await interactive
+        assert governor.in_flight == 1 and governor.queued == 0
+
+    asyncio.run(run())
+
+
+def test_waiting_past_the_queue_timeout_fails_and_leaves_the_queue():
+    async def run():
+        governor = OutboundGovernor(initial_limit=1, max_concurrency=1, queue_timeout=0.05)
+        await governor.acquire()
+        with pytest.raises(GovernorOverloaded, match="within"):
+            await governor.acquire()
+        assert governor.queued == 0 and governor.stats["timed_out"] == 1
+        governor._release()
+        async with governor.slot(timeout=0):
+            assert governor.in_flight == 1
+
+    asyncio.run(run())
@@ -0,0 +1,117 @@
+# test_intake.py
+# The PHASE 1/2 intake state machine (intake_before_agent_callback) turn by turn, no model involved.
+from types import SimpleNamespace
+
+from google.genai.types import Content, Part
+
+from mediflow_ai.context_window import PATIENT_STATE_KEY
+from mediflow_ai.intake import (
+    GREETING, INTAKE_STATE_KEY, QUESTIONS, intake_before_agent_callback, volunteered_slots,
+)
+
+
+class Conversation:
+    """One session's state, fed one user message at a time."""
+
+    def __init__(self):
+        self.state: dict = {}
+
+    def say(self, text: str):
+        context = SimpleNamespace(state=self.state, user_content=Content(role="user", parts=[Part(text=text)]))
+        reply = intake_before_agent_callback(context)
+        return reply.parts[0].text if reply is not None else None
+
+    @property
+    def step(self):
+        return self.state[INTAKE_STATE_KEY]["step"]
+
+    @property
+    def patient(self) -> dict:
+        return self.state[PATIENT_STATE_KEY]
+
+
+def test_greeting_then_questions_in_order():
+    chat = Conversation()
+    assert chat.say("Hello") == f"{GREETING}\n\n{QUESTIONS['name']}"
+    assert chat.say("Asha") == QUESTIONS["location"]
+    assert chat.say("Pune") == QUESTIONS["age"]
+    assert chat.say("34") == QUESTIONS["gender"]
+    assert chat.say("female") == QUESTIONS["symptoms"]
+    assert chat.step == "symptoms"
+    assert chat.say("fever since yesterday") is not None
+    assert chat.say("done") == QUESTIONS["diet"]
+    assert chat.say("no") == QUESTIONS["conditions"]
+    assert chat.say("none") == QUESTIONS["meds"]
+    assert chat.say("paracetamol") == QUESTIONS["trigger"]
+    assert chat.say("skip") == QUESTIONS["confirm"]
+    assert chat.say("satisfied") is None
+    assert chat.step == "complete"
+    assert chat.patient["name"] == "Asha" and chat.patient["age"] == 34 and chat.patient["gender"] == "Female"
+    # every later turn belongs to the model
+    assert chat.say("what could it be?") is None
+
+
+def test_complete_confirmed_first_message_goes_straight_to_the_model():
+    chat = Conversation()
+    reply = chat.say(
+        "Name: Priya, 28, female, Delhi. Slight sore throat and mild headache for 1 day. No other issues. Satisfied."
+    )
+    assert reply is None
+    assert chat.step == "complete"
+    patient = chat.patient
+    assert (patient["name"], patient["age"], patient["gender"], patient["location"]) == ("Priya", 28, "Female", "Delhi")
+    assert {"sore throat", "headache"} <= set(patient["symptoms"])
+    assert patient["duration"] == "1 day"
+
+
+def test_first_message_with_details_skips_answered_questions():
+    chat = Conversation()
+    reply = chat.say("Name: Priya, 28, female, Delhi, fever for 3 days")
+    assert reply.startswith(GREETING)
+    assert QUESTIONS["name"] not in reply and QUESTIONS["age"] not in reply
+    # straight to the symptom loop, with what was already said
+    assert chat.step == "symptoms"
+    assert "fever" in reply
+    assert chat.patient["location"] == "Delhi" and chat.patient["duration"] == "3 days"
+    assert chat.say("no more") == QUESTIONS["diet"]
+
+
+def test_unlabelled_details_list_and_conditions():
+    chat = Conversation()
+    reply = chat.say("Suresh, 65, male, Bangalore. High fever 103F for 5 days, severe cough, weakness. I have diabetes. Taking metformin.")
+    assert chat.step == "symptoms"
+    patient = chat.patient
+    assert (patient["name"], patient["age"], patient["gender"], patient["location"]) == ("Suresh", 65, "Male", "Bangalore")
+    assert patient["conditions"] == "diabetes" and patient["meds"] == "metformin"
+    assert chat.say("done") == QUESTIONS["diet"]
+    assert chat.say("no") == QUESTIONS["trigger"]
+
+
+def test_volunteered_answer_to_one_question_answers_the_next_ones():
+    chat = Conversation()
+    chat.say("Hi")
+    assert chat.say("Asha, 34, F") == QUESTIONS["location"]
+    assert chat.patient["age"] == 34 and chat.patient["gender"] == "Female"
+    assert chat.say("Pune") == QUESTIONS["symptoms"]
+
+    labelled = Conversation()
+    labelled.say("Hi")
+    assert labelled.say("Name: Ravi Kumar") == QUESTIONS["location"]
+    assert labelled.patient["name"] == "Ravi Kumar"
+
+
+def test_greetings_and_symptom_lists_are_not_details():
+    assert volunteered_slots("Hi, I'm Asha") == {}
+    assert volunteered_slots("Fever, Cough, Headache") == {}
+    assert volunteered_slots("Hello, 40, male") == {"age": 40, "gender": "Male"}
+
+
+def test_unparseable_answer_is_retried_then_handed_to_the_model():
+    chat = Conversation()
+    chat.say("Hello")
+    chat.say("Asha")
+    chat.say("Pune")
+    assert chat.say("dunno").startswith("Sorry")
+    assert chat.say("still dunno") is None
+    assert chat.state[INTAKE_STATE_KEY]["handoff"] is True
+    assert chat.step == "age"
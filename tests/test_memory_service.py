@@ -0,0 +1,128 @@
+# test_memory_service.py
+# SqliteMemoryService recall over SqliteSessionService-stored events: per-user scope.
+import asyncio
+
+from google.adk.events import Event
+from google.genai.types import Content, Part
+
+from mediflow_ai.memory_service import SqliteMemoryService
+from mediflow_ai.session_service import SqliteSessionService
+from mediflow_ai.sqlite_store import SessionStore
+
+APP = "mediflow"
+
+
+def _event(text: str) -> Event:
+    return Event(author="user", content=Content(role="user", parts=[Part(text=text)]))
+
+
+async def _services(tmp_path):
+    store = SessionStore(str(tmp_path / "chat.db"))
+    sessions = SqliteSessionService(store, write_behind=False)
+    memory = SqliteMemoryService(store)
+    await store.open()
+    await memory.setup()
+    return sessions, memory
+
+
+async def _recall(memory: SqliteMemoryService, user_id: str, query: str) -> list[str]:
+    response = await memory.search_memory(app_name=APP, user_id=user_id, query=query)
+    return [m.content.parts[0].text for m in response.memories]
+
+
+def test_recall_is_isolated_per_user(tmp_path):
+    async def run():
+        sessions, memory = await _services(tmp_path)
+        alice = await sessions.create_session(app_name=APP, user_id="alice", session_id="a1")
+        bob = await sessions.create_session(app_name=APP, user_id="bob", session_id="b1")
+        await sessions.append_event(alice, _event("I have asthma and chest pain"))
+        await sessions.append_event(bob, _event("mild chest pain after running"))
+
+        assert await _recall(memory, "alice", "chest pain") == ["I have asthma and chest pain"]
+        assert await _recall(memory, "bob", "chest pain") == ["mild chest pain after running"]
+        assert await _recall(memory, "bob", "asthma") == []
+        assert await _recall(memory, "carol", "chest pain") == []
+        await sessions.close()
+
+    asyncio.run(run())
+
+
+def test_session_id_with_two_owners_is_not_recalled_by_either(tmp_path):
+    async def run():
+        sessions, memory = await _services(tmp_path)
+        alice = await sessions.create_session(app_name=APP, user_id="alice", session_id="s1")
+        await sessions.append_event(alice, _event("I have HIV"))
+        # a database from before session ids had one owner
+        async with sessions.store.write() as db:
+            await db.execute(
+                "INSERT INTO sessions (app_name, user_id, session_id, state, create_time, last_update_time) "
+                "VALUES (?, 'bob', 's1', '{}', 0, 0)",
+                (APP,),
+            )
+            await db.commit()
+        await sessions.append_event(alice, _event("HIV test results came back"))
+
+        assert await _recall(memory, "bob", "HIV") == []
+        # the row indexed while alice was the only owner keeps her scope until setup runs again
+        assert await _recall(memory, "alice", "HIV") == ["I have HIV"]
+
+        restarted = SqliteMemoryService(sessions.store)
+        await restarted.setup()
+        assert await _recall(restarted, "alice", "HIV") == []
+        assert await _recall(restarted, "bob", "HIV") == []
+        await sessions.close()
+
+    asyncio.run(run())
+
+
+def test_archived_sessions_stay_recallable(tmp_path):
+    async def run():
+        sessions, memory = await _services(tmp_path)
+        alice = await sessions.create_session(app_name=APP, user_id="alice", session_id="s1")
+        await sessions.append_event(alice, _event("migraine with aura every month"))
+        store = sessions.store
+
+        assert (await store.archive_session("s1"))["events"] == 1
+        assert await _recall(memory, "alice", "migraine") == ["migraine with aura every month"]
+
+        # new hot rows after the archive, then a second archive pass merges them
+        await sessions.append_event(alice, _event("migraine is worse today"))
+        await store.archive_session("s1")
+        assert sorted(await _recall(memory, "alice", "migraine")) == [
+            "migraine is worse today", "migraine with aura every month",
+        ]
+
+        # restoring re-indexes the hot rows without leaving duplicates behind
+        assert await store.restore_session("s1") == 2
+        assert len(await _recall(memory, "alice", "migraine")) == 2
+        await store.archive_session("s1")
+
+        await sessions.delete_session(app_name=APP, user_id="alice", session_id="s1")
+        assert await _recall(memory, "alice", "migraine") == []
+        async with store.read() as db:
+            cursor = await db.execute("SELECT COUNT(*) FROM memory_fts")
+            assert (await cursor.fetchone())[0] == 0
+            await cursor.close()
+        await sessions.close()
+
+    asyncio.run(run())
+
+
+def test_archives_made_before_the_index_are_replayed_once(tmp_path):
+    async def run():
+        store = SessionStore(str(tmp_path / "chat.db"))
+        sessions = SqliteSessionService(store, write_behind=False)
+        alice = await sessions.create_session(app_name=APP, user_id="alice", session_id="s1")
+        await sessions.append_event(alice, _event("penicillin allergy"))
+        await store.archive_session("s1")
+
+        memory = SqliteMemoryService(store)
+        await memory.setup()
+        assert await _recall(memory, "alice", "penicillin") == ["penicillin allergy"]
+        # a later setup finds nothing left to replay
+        again = SqliteMemoryService(store)
+        await again.setup()
+        assert await _recall(again, "alice", "penicillin") == ["penicillin allergy"]
+        await sessions.close()
+
+    asyncio.run(run())
@@ -0,0 +1,184 @@
+# test_model_routing.py
+# RoutedLlm against the local stub (injected latency) and scripted tiers: deadlines, fallback,
+# hedging, the skip / probe rule, streaming fallback and governor refusals.
+import asyncio
+import itertools
+
+import pytest
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai.types import Content, Part
+
+from mediflow_ai import metrics
+from mediflow_ai.governor import GovernorOverloaded, OutboundGovernor
+from mediflow_ai.model_routing import PROBE_EVERY, ModelDeadlineExceeded, RoutedLlm, resolve_llm
+
+_agents = itertools.count()
+
+
+def _agent() -> str:
+    """A fresh agent label per test, so metric counters start at 0."""
+    return f"test_agent_{next(_agents)}"
+
+
+class ScriptedLlm(BaseLlm):
+    """Sleeps `delays[n]` (or `delay`) on its n-th call, raises `error` if set, counts calls and cancellations."""
+
+    model: str = "scripted"
+    delay: float = 0.0
+    delays: list[float] = []
+    error: str = ""
+    chunks_before_error: int = 0
+    calls: int = 0
+    cancelled: int = 0
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False):
+        call = self.calls
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delays[call] if call < len(self.delays) else self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        for n in range(self.chunks_before_error if stream else 0):
+            yield LlmResponse(content=Content(role="model", parts=[Part(text=f"chunk {n} ")]), partial=True)
+        if self.error:
+            raise RuntimeError(self.error)
+        yield LlmResponse(content=Content(role="model", parts=[Part(text=f"{self.model} answer {call}")]))
+
+
+def _request() -> LlmRequest:
+    return LlmRequest(model="test", contents=[Content(role="user", parts=[Part(text="pollen count in Pune")])])
+
+
+async def _generate(llm: RoutedLlm, stream: bool = False) -> list[LlmResponse]:
+    return [response async for response in llm.generate_content_async(_request(), stream=stream)]
+
+
+def _text(responses: list[LlmResponse]) -> str:
+    return responses[-1].content.parts[0].text
+
+
+def test_deadline_exceeded_on_the_last_tier():
+    llm = RoutedLlm(model="stub:300", tiers=[resolve_llm("stub:300")], agent=_agent(), deadline_seconds=0.1)
+    with pytest.raises(ModelDeadlineExceeded):
+        asyncio.run(_generate(llm))
+    assert metrics.MODEL_ROUTING.value(agent=llm.agent, event="deadline_missed") == 1
+    assert metrics.MODEL_ATTEMPTS.value(agent=llm.agent, model="stub:300", outcome="timeout") == 1
+
+
+def test_timeout_falls_back_to_the_next_tier():
+    llm = RoutedLlm.from_route("stub:1000,stub:10", agent=_agent(), deadline_seconds=0.4)
+    responses = asyncio.run(_generate(llm))
+    assert _text(responses).startswith("Thanks, I noted")
+    assert metrics.MODEL_ATTEMPTS.value(agent=llm.agent, model="stub:1000", outcome="timeout") == 1
+    assert metrics.MODEL_ATTEMPTS.value(agent=llm.agent, model="stub:10", outcome="ok") == 1
+    assert metrics.MODEL_ROUTING.value(agent=llm.agent, event="fallback") == 1
+
+
+def test_error_falls_back_to_the_next_tier():
+    broken, backup = ScriptedLlm(model="broken", error="500 INTERNAL"), ScriptedLlm(model="backup")
+    llm = RoutedLlm(model="broken", tiers=[broken, backup], agent=_agent())
+    assert _text(asyncio.run(_generate(llm))) == "backup answer 0"
+    assert (broken.calls, backup.calls) == (1, 1)
+    assert metrics.MODEL_ATTEMPTS.value(agent=llm.agent, model="broken", outcome="error") == 1
+
+
+def test_every_tier_failing_raises_the_last_error():
+    tiers = [ScriptedLlm(model="a", error="first"), ScriptedLlm(model="b", error="second")]
+    llm = RoutedLlm(model="a", tiers=tiers, agent=_agent())
+    with pytest.raises(RuntimeError, match="second"):
+        asyncio.run(_generate(llm))
+    assert metrics.MODEL_ROUTING.value(agent=llm.agent, event="failed") == 1
+
+
+def test_hedge_past_the_percentile_wins_and_the_slow_request_is_cancelled():
+    # first call stalls, the duplicate answers at once
+    tier = ScriptedLlm(model="tail", delays=[2.0, 0.0])
+    llm = RoutedLlm(model="tail", tiers=[tier], agent=_agent(), hedge_percentile=0.9, hedge_min_samples=5)
+    for _ in range(10):
+        llm.latency(0).observe(0.02)
+    responses = asyncio.run(_generate(llm))
+    assert _text(responses) == "tail answer 1"
+    assert tier.calls == 2 and tier.cancelled == 1
+    assert metrics.MODEL_ROUTING.value(agent=llm.agent, event="hedge") == 1
+    assert metrics.MODEL_ROUTING.value(agent=llm.agent, event="hedge_won") == 1
+
+
+def test_no_hedge_before_enough_samples():
+    tier = ScriptedLlm(model="tail", delays=[0.2])
+    llm = RoutedLlm(model="tail", tiers=[tier], agent=_agent(), hedge_percentile=0.9, hedge_min_samples=5)
+    llm.latency(0).observe(0.01)
+    asyncio.run(_generate(llm))
+    assert tier.calls == 1
+    assert metrics.MODEL_ROUTING.value(agent=llm.agent, event="hedge") == 0
+
+
+def test_tier_slower_than_the_budget_is_skipped_and_probed_periodically():
+    slow, fast = ScriptedLlm(model="slow"), ScriptedLlm(model="fast")
+    llm = RoutedLlm(model="slow", tiers=[slow, fast], agent=_agent(), deadline_seconds=0.5)
+    # the median of slow is far past what a 0.5 s deadline leaves it
+    for _ in range(100):
+        llm.latency(0).observe(5.0)
+    llm.latency(1).observe(0.01)
+
+    async def run_calls():
+        for _ in range(PROBE_EVERY):
+            await _generate(llm)
+
+    asyncio.run(run_calls())
+    assert slow.calls == 1, "only the periodic probe reaches a skipped tier"
+    assert fast.calls == PROBE_EVERY - 1
+    assert metrics.MODEL_ROUTING.value(agent=llm.agent, event="skip") == PROBE_EVERY - 1
+
+
+def test_stream_falls_back_before_the_first_chunk():
+    broken, backup = ScriptedLlm(model="broken", error="503 UNAVAILABLE"), ScriptedLlm(model="backup", chunks_before_error=2)
+    llm = RoutedLlm(model="broken", tiers=[broken, backup], agent=_agent())
+    responses = asyncio.run(_generate(llm, stream=True))
+    assert [response.partial for response in responses] == [True, True, None]
+    assert _text(responses) == "backup answer 0"
+
+
+def test_stream_does_not_fall_back_after_the_first_chunk():
+    flaky, backup = ScriptedLlm(model="flaky", error="connection reset", chunks_before_error=1), ScriptedLlm(model="backup")
+    llm = RoutedLlm(model="flaky", tiers=[flaky, backup], agent=_agent())
+    with pytest.raises(RuntimeError, match="connection reset"):
+        asyncio.run(_generate(llm, stream=True))
+    assert backup.calls == 0
+
+
+def test_stream_deadline_only_bounds_the_first_chunk():
+    slow, backup = ScriptedLlm(model="slow", delay=1.0), ScriptedLlm(model="backup", chunks_before_error=1)
+    llm = RoutedLlm(model="slow", tiers=[slow, backup], agent=_agent(), deadline_seconds=0.3)
+    responses = asyncio.run(_generate(llm, stream=True))
+    assert _text(responses) == "backup answer 0"
+    assert slow.calls == 1
+    assert metrics.MODEL_ATTEMPTS.value(agent=llm.agent, model="slow", outcome="timeout") == 1
+
+
+def test_governor_refusal_is_not_retried_on_the_next_tier():
+    primary, backup = ScriptedLlm(model="primary"), ScriptedLlm(model="backup")
+    governor = OutboundGovernor(max_concurrency=1, initial_limit=1, max_queue=0)
+    llm = RoutedLlm(model="primary", tiers=[primary, backup], agent=_agent(), governor=governor)
+
+    async def refused_while_busy():
+        async with governor.slot():
+            await _generate(llm)
+
+    with pytest.raises(GovernorOverloaded):
+        asyncio.run(refused_while_busy())
+    assert (primary.calls, backup.calls) == (0, 0)
+    assert metrics.MODEL_ROUTING.value(agent=llm.agent, event="shed") == 1
+    assert metrics.MODEL_ROUTING.value(agent=llm.agent, event="fallback") == 0
+
+
+def test_hedge_is_shed_when_the_governor_has_no_free_slot():
+    tier = ScriptedLlm(model="tail", delays=[0.3, 0.0])
+    governor = OutboundGovernor(max_concurrency=1, initial_limit=1)
+    llm = RoutedLlm(model="tail", tiers=[tier], agent=_agent(), hedge_percentile=0.9, hedge_min_samples=1, governor=governor)
+    llm.latency(0).observe(0.01)
+    assert _text(asyncio.run(_generate(llm))) == "tail answer 0"
+    assert tier.calls == 1
+    assert metrics.MODEL_ROUTING.value(agent=llm.agent, event="hedge_shed") == 1
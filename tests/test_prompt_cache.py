@@ -0,0 +1,140 @@
+# test_prompt_cache.py
+# PromptCacheRegistry and the agent callbacks against the local StubCacheBackend / StubLlm.
+import asyncio
+import time
+from types import SimpleNamespace
+
+from google.adk.models.llm_request import LlmRequest
+from google.genai.types import Content, GenerateContentConfig, Part
+
+from mediflow_ai.governor import GovernorOverloaded
+from mediflow_ai.prompt_cache import PromptCacheRegistry, make_prompt_cache_callbacks
+from mediflow_ai.sqlite_store import SessionStore
+from mediflow_ai.stub_model import STUB_CACHES, StubCacheBackend, StubLlm
+
+INSTRUCTION = "You are Tara, MediFlow's triage assistant. " * 200  # well past MIN_PREFIX_TOKENS
+
+
+class FailingBackend(StubCacheBackend):
+    async def create(self, *args, **kwargs):
+        self.calls["create"] += 1
+        raise RuntimeError("503 UNAVAILABLE")
+
+
+def _registry(tmp_path, backend=None, **kwargs) -> PromptCacheRegistry:
+    return PromptCacheRegistry(SessionStore(str(tmp_path / "cache.db")), backend or StubCacheBackend(), **kwargs)
+
+
+def _request(model: str = "stub") -> LlmRequest:
+    return LlmRequest(
+        model=model,
+        contents=[Content(role="user", parts=[Part(text="I have a headache")])],
+        config=GenerateContentConfig(system_instruction=INSTRUCTION),
+    )
+
+
+def _context(agent_name: str = "triage_doctor_finder_agent"):
+    return SimpleNamespace(agent_name=agent_name)
+
+
+def test_one_create_per_fingerprint_shared_by_sessions_and_restarts(tmp_path):
+    async def run():
+        registry = _registry(tmp_path)
+        names = await asyncio.gather(*(registry.get_cache_name("tara", "stub", INSTRUCTION) for _ in range(10)))
+        assert len(set(names)) == 1 and names[0] in STUB_CACHES
+        assert registry.backend.calls["create"] == 1
+        await registry.store.close()
+
+        # a restarted worker finds the same cache in the prompt_cache table
+        restarted = _registry(tmp_path)
+        assert await restarted.get_cache_name("tara", "stub", INSTRUCTION) == names[0]
+        assert restarted.backend.calls["create"] == 0
+        await restarted.store.close()
+
+    asyncio.run(run())
+
+
+def test_refresh_inside_the_margin(tmp_path):
+    async def run():
+        # a TTL shorter than the margin: every later lookup is inside it
+        registry = _registry(tmp_path, ttl_seconds=200, refresh_margin=300)
+        name = await registry.get_cache_name("tara", "stub", INSTRUCTION)
+        before = STUB_CACHES[name]["expires_at"]
+        time.sleep(0.01)
+        assert await registry.get_cache_name("tara", "stub", INSTRUCTION) == name
+        assert registry.backend.calls == {"create": 1, "refresh": 1, "delete": 0}
+        assert STUB_CACHES[name]["expires_at"] > before
+        await registry.store.close()
+
+    asyncio.run(run())
+
+
+def test_fingerprint_change_deletes_the_old_cache(tmp_path):
+    async def run():
+        registry = _registry(tmp_path)
+        old = await registry.get_cache_name("tara", "stub", INSTRUCTION)
+        new = await registry.get_cache_name("tara", "stub", INSTRUCTION + " Always answer in English.")
+        assert new != old
+        assert registry.backend.calls["delete"] == 1
+        assert old not in STUB_CACHES and new in STUB_CACHES
+        await registry.store.close()
+
+    asyncio.run(run())
+
+
+def test_backend_failure_falls_back_to_the_uncached_request(tmp_path):
+    async def run():
+        registry = _registry(tmp_path, backend=FailingBackend())
+        before_cache, _ = make_prompt_cache_callbacks(registry, StubLlm())
+        request = _request()
+        await before_cache(_context(), request)
+        assert request.config.cached_content is None
+        assert request.config.system_instruction == INSTRUCTION
+        # no new create attempt while the failure is recent
+        assert await registry.get_cache_name("tara", "stub", INSTRUCTION) is None
+        assert registry.backend.calls["create"] == 1
+        assert registry.stats["fallbacks"] == 2
+        await registry.store.close()
+
+    asyncio.run(run())
+
+
+def test_not_found_error_invalidates_and_resends_the_full_prompt(tmp_path):
+    async def run():
+        registry = _registry(tmp_path)
+        model = StubLlm()
+        before_cache, on_error = make_prompt_cache_callbacks(registry, model)
+        request = _request()
+        await before_cache(_context(), request)
+        name = request.config.cached_content
+        assert name and request.config.system_instruction is None
+
+        del STUB_CACHES[name]  # expired early on the provider side
+        try:
+            async for _ in model.generate_content_async(request):
+                pass
+        except ValueError as exc:
+            error = exc
+        response = await on_error(_context(), request, error)
+        assert response is not None and response.content.parts[0].text
+        assert request.config.cached_content is None and request.config.system_instruction == INSTRUCTION
+        assert registry.prefix_for(name) is None and registry.stats["invalidated"] == 1
+        await registry.store.close()
+
+    asyncio.run(run())
+
+
+def test_no_uncached_retry_after_a_429_or_a_governor_refusal(tmp_path):
+    async def run():
+        registry = _registry(tmp_path)
+        before_cache, on_error = make_prompt_cache_callbacks(registry, StubLlm())
+        request = _request()
+        await before_cache(_context(), request)
+        name = request.config.cached_content
+        for error in (RuntimeError("429 RESOURCE_EXHAUSTED: quota"), GovernorOverloaded("256 outbound calls waiting")):
+            assert await on_error(_context(), request, error) is None
+        assert request.config.cached_content == name
+        assert registry.prefix_for(name) is not None and registry.stats["invalidated"] == 0
+        await registry.store.close()
+
+    asyncio.run(run())
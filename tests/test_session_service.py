@@ -0,0 +1,105 @@
+# test_session_service.py
+# SqliteSessionService: session ownership, shared app:/user: state, reload after a cache miss.
+import asyncio
+
+import pytest
+from google.adk.errors.already_exists_error import AlreadyExistsError
+from google.adk.events import Event, EventActions
+from google.adk.sessions import Session
+from google.genai.types import Content, Part
+
+from mediflow_ai.session_service import SqliteSessionService
+from mediflow_ai.sharding import session_store
+
+APP = "mediflow"
+
+
+def _service(tmp_path, shards: int = 1) -> SqliteSessionService:
+    return SqliteSessionService(session_store(str(tmp_path / "chat.db"), shards=shards))
+
+
+def _user_event(text: str, **state_delta) -> Event:
+    return Event(
+        author="user",
+        content=Content(role="user", parts=[Part(text=text)]),
+        actions=EventActions(state_delta=state_delta),
+    )
+
+
+def _texts(session: Session) -> list[str]:
+    return [e.content.parts[0].text for e in session.events if e.content and e.content.parts]
+
+
+@pytest.mark.parametrize("shards", [1, 2])
+def test_two_users_cannot_share_a_session_id(tmp_path, shards):
+    async def run():
+        service = _service(tmp_path, shards)
+        alice = await service.create_session(app_name=APP, user_id="alice", session_id="s1")
+        await service.append_event(alice, _user_event("I have HIV and chest pain"))
+        await service.flush()
+
+        with pytest.raises(AlreadyExistsError):
+            await service.create_session(app_name=APP, user_id="bob", session_id="s1")
+        with pytest.raises(AlreadyExistsError):
+            await service.get_or_create_session(app_name=APP, user_id="bob", session_id="s1")
+        # a Session object bob made up himself cannot be appended to alice's transcript either
+        forged = Session(id="s1", app_name=APP, user_id="bob", state={}, events=[])
+        with pytest.raises(AlreadyExistsError):
+            await service.append_event(forged, _user_event("hello"))
+        # bob deleting "his" s1 leaves alice's messages alone
+        await service.delete_session(app_name=APP, user_id="bob", session_id="s1")
+        await service.close()
+
+        # cache miss: everything comes from disk
+        reloaded = _service(tmp_path, shards)
+        assert await reloaded.get_session(app_name=APP, user_id="bob", session_id="s1") is None
+        session = await reloaded.get_session(app_name=APP, user_id="alice", session_id="s1")
+        assert _texts(session) == ["I have HIV and chest pain"]
+        await reloaded.close()
+
+    asyncio.run(run())
+
+
+def test_owner_can_delete_and_reuse_after_delete(tmp_path):
+    async def run():
+        service = _service(tmp_path)
+        alice = await service.create_session(app_name=APP, user_id="alice", session_id="s1")
+        await service.append_event(alice, _user_event("fever"))
+        await service.delete_session(app_name=APP, user_id="alice", session_id="s1")
+        bob = await service.create_session(app_name=APP, user_id="bob", session_id="s1")
+        assert bob.events == []
+        await service.close()
+
+        reloaded = _service(tmp_path)
+        session = await reloaded.get_session(app_name=APP, user_id="bob", session_id="s1")
+        assert session.events == []
+        await reloaded.close()
+
+    asyncio.run(run())
+
+
+def test_app_and_user_state_are_shared_across_sessions(tmp_path):
+    async def run():
+        service = _service(tmp_path)
+        first = await service.create_session(app_name=APP, user_id="u1", state={"user:name": "Priya", "step": 1})
+        second = await service.create_session(app_name=APP, user_id="u1")
+        other = await service.create_session(app_name=APP, user_id="u2")
+        assert second.state == {"user:name": "Priya"}
+        assert other.state == {}
+
+        await service.append_event(first, _user_event("hi", **{"user:name": "Priya S", "app:version": 2, "temp:x": 1}))
+        second = await service.get_session(app_name=APP, user_id="u1", session_id=second.id)
+        other = await service.get_session(app_name=APP, user_id="u2", session_id=other.id)
+        assert second.state == {"user:name": "Priya S", "app:version": 2}
+        assert other.state == {"app:version": 2}
+        await service.close()
+
+        reloaded = _service(tmp_path)
+        first = await reloaded.get_session(app_name=APP, user_id="u1", session_id=first.id)
+        assert first.state == {"step": 1, "user:name": "Priya S", "app:version": 2}
+        # the sessions row only keeps the session's own keys
+        state, _, _ = await reloaded.store.get_session_row(APP, "u1", first.id)
+        assert state == {"step": 1}
+        await reloaded.close()
+
+    asyncio.run(run())
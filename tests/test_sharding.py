@@ -0,0 +1,114 @@
+# test_sharding.py
+# Session routing over shard files and `sharding migrate`: split, rebalance, merge back, resume.
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+from google.adk.events import Event
+from google.genai.types import Content, Part
+
+from mediflow_ai import sharding
+from mediflow_ai.session_service import SqliteSessionService
+from mediflow_ai.sharding import migrate, session_store, shard_index, shard_paths
+from mediflow_ai.sqlite_store import SessionStore
+
+APP = "mediflow"
+SESSION_IDS = [f"s{i}" for i in range(12)]
+
+
+def _event(text: str) -> Event:
+    return Event(author="user", content=Content(role="user", parts=[Part(text=text)]))
+
+
+async def _seed(db_path: str):
+    """Owned sessions with events, one archived session and one saved by save_session_to_db (no owner)."""
+    sessions = SqliteSessionService(SessionStore(db_path), write_behind=False)
+    for session_id in SESSION_IDS:
+        session = await sessions.create_session(app_name=APP, user_id="alice", session_id=session_id)
+        await sessions.append_event(session, _event(f"{session_id} fever"))
+        await sessions.append_event(session, _event(f"{session_id} cough"))
+    await sessions.store.archive_session("s0")
+    await sessions.store.save_session(SimpleNamespace(id="loose", events=[_event("loose rash")]))
+    await sessions.close()
+
+
+async def _transcripts(db_path: str, shards: int) -> dict:
+    async with session_store(db_path, shards) as store:
+        return {
+            session_id: [e["text"] for e in await store.get_session_events(session_id)]
+            for session_id in [*SESSION_IDS, "loose"]
+        }
+
+
+def _expected() -> dict:
+    return {**{s: [f"{s} fever", f"{s} cough"] for s in SESSION_IDS}, "loose": ["loose rash"]}
+
+
+def test_routing_is_stable_and_files_are_named_by_layout(tmp_path):
+    assert [shard_index("chat001", 4) for _ in range(3)] == [shard_index("chat001", 4)] * 3
+    assert {shard_index(s, 3) for s in SESSION_IDS} == {0, 1, 2}
+    db_path = str(tmp_path / "chat_history.db")
+    assert shard_paths(db_path, 1) == [db_path]
+    assert shard_paths(db_path, 2) == [str(tmp_path / "chat_history.shard0of2.db"), str(tmp_path / "chat_history.shard1of2.db")]
+    with pytest.raises(ValueError):
+        sharding.ShardedSessionStore(db_path, shards=1)
+
+
+def test_migrate_splits_rebalances_and_merges_back(tmp_path):
+    db_path = str(tmp_path / "chat_history.db")
+
+    async def run():
+        await _seed(db_path)
+        split = await migrate(db_path, shards=3)
+        assert split["sessions"] == len(SESSION_IDS) + 1
+        assert split["events"] == 2 * len(SESSION_IDS) + 1
+        assert sum(split["per_shard"].values()) == split["sessions"] and split["empty_files_to_remove"] == []
+        assert await _transcripts(db_path, 3) == _expected()
+        # the primary keeps no session data
+        assert (await _transcripts(db_path, 1))["s1"] == []
+
+        # owners and the archive came along
+        async with session_store(db_path, 3) as store:
+            assert await store.get_session_row(APP, "alice", "s5") is not None
+            assert await store.create_session_row(APP, "bob", "s5", {}, 0.0) is False
+            assert await store.restore_session("s0") == 2
+
+        rebalance = await migrate(db_path, shards=2, from_shards=3)
+        assert rebalance["sessions"] == len(SESSION_IDS) + 1
+        assert len(rebalance["empty_files_to_remove"]) == 3
+        assert await _transcripts(db_path, 2) == _expected()
+
+        await migrate(db_path, shards=1, from_shards=2)
+        assert await _transcripts(db_path, 1) == _expected()
+        assert (await migrate(db_path, shards=1, from_shards=1))["sessions"] == 0
+
+    asyncio.run(run())
+
+
+def test_interrupted_migrate_resumes_without_duplicates(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "chat_history.db")
+    copy_session = sharding._copy_session
+    copied = []
+
+    async def stops_after_five(source, target, session_id):
+        if len(copied) == 5:
+            raise KeyboardInterrupt
+        copied.append(session_id)
+        return await copy_session(source, target, session_id)
+
+    async def run():
+        await _seed(db_path)
+        monkeypatch.setattr(sharding, "_copy_session", stops_after_five)
+        with pytest.raises(KeyboardInterrupt):
+            await migrate(db_path, shards=2)
+        monkeypatch.setattr(sharding, "_copy_session", copy_session)
+
+        rerun = await migrate(db_path, shards=2)
+        assert rerun["sessions"] == len(SESSION_IDS) + 1 - 5
+        assert await _transcripts(db_path, 2) == _expected()
+        stats = await sharding.shard_stats(db_path, 2)
+        assert sum(stats.values()) == len(SESSION_IDS) + 1
+        assert all(os.path.exists(path) for path in stats)
+
+    asyncio.run(run())
@@ -0,0 +1,360 @@
+# test_sqlite_store.py
+# SessionStore: incremental, idempotent saves, the pooled connections, the module-level API, the
+# group-commit write-behind queue, paginated / streamed transcript reads and the schema migrations.
+import asyncio
+import json
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+from google.adk.events import Event
+from google.genai.types import Content, FunctionCall, Part
+
+from mediflow_ai import sqlite_store
+from mediflow_ai.sqlite_store import GroupCommitError, SessionStore
+
+
+def _event(text: str, role: str = "user", timestamp: float = 1_700_000_000.0) -> Event:
+    return Event(author="user" if role == "user" else "tara", timestamp=timestamp, content=Content(role=role, parts=[Part(text=text)]))
+
+
+def _session(session_id: str, *texts: str) -> SimpleNamespace:
+    """What save_session takes: anything with an id and events."""
+    return SimpleNamespace(id=session_id, events=[_event(text, timestamp=1_700_000_000.0 + i) for i, text in enumerate(texts)])
+
+
+async def _count(store: SessionStore, session_id: str) -> int:
+    async with store.read() as db:
+        cursor = await db.execute("SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,))
+        count = (await cursor.fetchone())[0]
+        await cursor.close()
+    return count
+
+
+def test_incremental_save_writes_only_new_events(tmp_path):
+    async def run():
+        session = _session("s1", "fever", "since monday", "no cough")
+        async with SessionStore(str(tmp_path / "chat.db")) as store:
+            assert await store.save_session(session) == 3
+            assert await store.save_session(session) == 0
+            session.events += [_event("headache"), _event("thanks")]
+            assert await store.save_session(session) == 2
+            assert await _count(store, "s1") == 5
+
+        # a new process reads the high-water mark back from disk
+        async with SessionStore(str(tmp_path / "chat.db")) as store:
+            assert await store.save_session(session) == 0
+            events = await store.get_session_events("s1")
+            assert [e["event_index"] for e in events] == [0, 1, 2, 3, 4]
+            assert [e["text"] for e in events][-2:] == ["headache", "thanks"]
+
+    asyncio.run(run())
+
+
+def test_full_resave_rewrites_in_place(tmp_path):
+    async def run():
+        async with SessionStore(str(tmp_path / "chat.db")) as store:
+            await store.save_session(_session("s1", "fever", "cough"))
+            corrected = _session("s1", "high fever", "cough")
+            assert await store.save_session(corrected, incremental=False) == 2
+            assert await _count(store, "s1") == 2
+            assert [e["text"] for e in await store.get_session_events("s1")] == ["high fever", "cough"]
+            # another session's rows are untouched
+            await store.save_session(_session("s2", "rash"))
+            assert await _count(store, "s2") == 1
+
+    asyncio.run(run())
+
+
+def test_retried_save_after_a_lost_high_water_mark_is_a_no_op(tmp_path):
+    async def run():
+        async with SessionStore(str(tmp_path / "chat.db")) as store:
+            session = _session("s1", "fever", "cough")
+            await store.save_session(session)
+            # a retry that does not know the first attempt was committed sends every row again
+            store._high_water["s1"] = -1
+            assert await store.save_session(session) == 2
+            assert await _count(store, "s1") == 2
+
+    asyncio.run(run())
+
+
+def test_readers_are_pooled_read_only_and_run_next_to_the_writer(tmp_path):
+    async def run():
+        store = SessionStore(str(tmp_path / "chat.db"), readers=2)
+        # concurrent first callers share one open()
+        await asyncio.gather(store.open(), store.open(), store.open())
+        writer = store._writer
+        async with store.read() as first, store.read() as second:
+            assert first is not second and writer not in (first, second)
+            with pytest.raises(sqlite3.OperationalError):
+                await first.execute("DELETE FROM messages")
+            # the writer is free while both readers are out
+            async with store.write() as db:
+                assert db is writer
+        async with store.read() as again:
+            assert again in (first, second)
+        await store.close()
+        assert not store.is_open
+
+        # reusable after close: the next call reopens
+        await store.save_session(_session("s1", "fever"))
+        assert store.is_open and await _count(store, "s1") == 1
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_in_memory_store_reads_through_the_writer():
+    async def run():
+        async with SessionStore(":memory:") as store:
+            await store.save_session(_session("s1", "fever"))
+            async with store.read() as db:
+                assert db is store._writer
+            assert await _count(store, "s1") == 1
+
+    asyncio.run(run())
+
+
+def test_module_functions_share_one_store_per_path(tmp_path):
+    async def run():
+        db_path = str(tmp_path / "chat.db")
+        try:
+            await sqlite_store.init_db(db_path)
+            store = await sqlite_store.get_store(db_path)
+            assert await sqlite_store.save_session_to_db(db_path, _session("s1", "fever", "cough")) == 2
+            assert await sqlite_store.get_store(db_path) is store
+            assert [e["text"] for e in await sqlite_store.get_session_events(db_path, "s1")] == ["fever", "cough"]
+        finally:
+            await sqlite_store.close_stores()
+        assert not store.is_open
+
+    asyncio.run(run())
+
+
+def _failing_inserts(monkeypatch, failures: int) -> list:
+    """Make the next `failures` group commits raise "database is locked"; returns the attempt log."""
+    attempts = []
+    insert_rows = sqlite_store._insert_rows
+
+    async def flaky(db, rows, upsert=False):
+        attempts.append(len(rows))
+        if len(attempts) <= failures:
+            raise sqlite3.OperationalError("database is locked")
+        await insert_rows(db, rows, upsert)
+
+    monkeypatch.setattr(sqlite_store, "_insert_rows", flaky)
+    monkeypatch.setattr(sqlite_store, "COMMIT_RETRY_BACKOFF", 0)
+    return attempts
+
+
+def test_write_behind_coalesces_sessions_into_one_commit(tmp_path, monkeypatch):
+    attempts = _failing_inserts(monkeypatch, failures=0)
+
+    async def run():
+        async with SessionStore(str(tmp_path / "chat.db")) as store:
+            store.enable_write_behind(flush_interval=0.2)
+            for session_id in ("s1", "s2", "s3"):
+                assert await store.enqueue_session(_session(session_id, "fever", "cough")) == 2
+            await store.flush()
+            assert attempts == [6]
+            assert [await _count(store, s) for s in ("s1", "s2", "s3")] == [2, 2, 2]
+
+    asyncio.run(run())
+
+
+def test_group_commit_is_retried_until_it_succeeds(tmp_path, monkeypatch):
+    attempts = _failing_inserts(monkeypatch, failures=sqlite_store.COMMIT_RETRIES)
+
+    async def run():
+        async with SessionStore(str(tmp_path / "chat.db")) as store:
+            writer = store.enable_write_behind()
+            await store.enqueue_session(_session("s1", "fever", "cough"))
+            await store.flush()
+            assert len(attempts) == sqlite_store.COMMIT_RETRIES + 1
+            assert writer.failed_batches == 0 and writer.lost_rows == 0
+            assert await _count(store, "s1") == 2
+
+    asyncio.run(run())
+
+
+def test_group_commit_that_keeps_failing_is_reported_and_resent(tmp_path, monkeypatch):
+    attempts = _failing_inserts(monkeypatch, failures=sqlite_store.COMMIT_RETRIES + 1)
+
+    async def run():
+        store = SessionStore(str(tmp_path / "chat.db"))
+        writer = store.enable_write_behind()
+        session = _session("s1", "fever", "cough")
+        await store.enqueue_session(session)
+        with pytest.raises(GroupCommitError, match="2 event rows not stored"):
+            await store.flush()
+        assert (writer.failed_batches, writer.lost_rows) == (1, 2)
+        # reported once; the high-water mark was reset, so the next enqueue sends the rows again
+        await store.flush()
+        assert await store.enqueue_session(session) == 2
+        await store.close()
+        assert len(attempts) == sqlite_store.COMMIT_RETRIES + 2
+
+        async with SessionStore(str(tmp_path / "chat.db")) as reopened:
+            assert await _count(reopened, "s1") == 2
+
+    asyncio.run(run())
+
+
+def test_close_raises_for_rows_it_could_not_store(tmp_path, monkeypatch):
+    _failing_inserts(monkeypatch, failures=100)
+
+    async def run():
+        store = SessionStore(str(tmp_path / "chat.db"))
+        await store.enqueue_session(_session("s1", "fever"))
+        with pytest.raises(GroupCommitError):
+            await store.close()
+        assert not store.is_open
+
+    asyncio.run(run())
+
+
+def test_transcript_pages_follow_event_index_across_the_archive(tmp_path):
+    async def run():
+        async with SessionStore(str(tmp_path / "chat.db")) as store:
+            session = _session("s1", *(f"message {i}" for i in range(5)))
+            await store.save_session(session)
+            await store.archive_session("s1")
+            session.events += [_event(f"message {i}") for i in range(5, 8)]
+            await store.save_session(session)
+
+            pages, after = [], None
+            while True:
+                page = await store.get_session_events("s1", after_index=after, limit=3)
+                if not page:
+                    break
+                pages.append([e["event_index"] for e in page])
+                after = page[-1]["event_index"]
+            assert pages == [[0, 1, 2], [3, 4, 5], [6, 7]]
+            assert len(await store.get_session_events("s1")) == 8
+
+            records = [r async for r in store.iter_session_events("s1", chunk_size=2, after_index=3)]
+            assert [r.event_index for r in records] == [4, 5, 6, 7]
+            assert records[0]["text"] == "message 4"
+            # metadata is decoded on first access only
+            assert records[1]._metadata is None
+            assert records[1].metadata == records[1].to_dict()["metadata"]
+
+    asyncio.run(run())
+
+
+def test_session_reads_use_the_session_event_index(tmp_path):
+    async def run():
+        async with SessionStore(str(tmp_path / "chat.db")) as store:
+            async with store.read() as db:
+                cursor = await db.execute(f"EXPLAIN QUERY PLAN {sqlite_store.SELECT_SESSION_EVENTS_SQL}", ("s1", -1, 10))
+                plan = " ".join(row[-1] for row in await cursor.fetchall())
+                await cursor.close()
+        assert sqlite_store.UNIQUE_EVENT_INDEX_NAME in plan and "SCAN messages" not in plan
+        assert "TEMP B-TREE" not in plan
+
+    asyncio.run(run())
+
+
+def _legacy_database(path: str, version: int):
+    """A chat_history.db as an older release left it: version 0 (first release) or 1 (event_json)."""
+    db = sqlite3.connect(path)
+    db.execute(sqlite_store.CREATE_TABLE_SQL)
+    if version == 0:
+        # every turn re-inserted the whole transcript
+        for _turn in range(2):
+            for idx, text in enumerate(["fever", "cough"]):
+                db.execute(
+                    "INSERT INTO messages (session_id, event_index, role, text, timestamp, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                    ("old", idx, "user", text, "2023-11-14T22:13:20Z", json.dumps({"event_timestamp": str(1_700_000_000.0 + idx)})),
+                )
+    else:
+        db.execute("ALTER TABLE messages ADD COLUMN event_json TEXT")
+        db.execute(sqlite_store.CREATE_SESSIONS_TABLE_SQL)
+        db.execute(sqlite_store.CREATE_UNIQUE_EVENT_INDEX_SQL)
+        event = Event(
+            author="tara", invocation_id="inv-1", timestamp=1_700_000_100.0,
+            content=Content(role="model", parts=[
+                Part(text="checking"),
+                Part(function_call=FunctionCall(id="call-1", name="enrich_patient_context", args={"location": "Pune"})),
+            ]),
+        )
+        db.execute(
+            "INSERT INTO messages (session_id, event_index, role, text, timestamp, metadata, event_json) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ("v1", 0, "model", "checking", "2023-11-14T22:15:00Z", "{}", event.model_dump_json(exclude_none=True)),
+        )
+    db.execute(f"PRAGMA user_version = {version}")
+    db.commit()
+    db.close()
+
+
+def _user_version(path: str) -> int:
+    db = sqlite3.connect(path)
+    try:
+        return db.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        db.close()
+
+
+def test_first_release_database_migrates_to_the_current_schema(tmp_path):
+    path = str(tmp_path / "chat.db")
+    _legacy_database(path, version=0)
+
+    async def run():
+        async with SessionStore(path) as store:
+            events = await store.get_session_events("old")
+            assert [(e["event_index"], e["text"]) for e in events] == [(0, "fever"), (1, "cough")]
+            # event_time backfilled from metadata.event_timestamp, author from the role
+            assert [e["event_time"] for e in events] == [1_700_000_000.0, 1_700_000_001.0]
+            assert {e["author"] for e in events} == {"user"}
+            assert [p["text"] for p in await store.get_event_parts("old")] == ["fever", "cough"]
+            # tables of later versions are there and usable
+            assert await store.create_session_row("app", "alice", "new", {}, 0.0)
+            assert await store.get_shared_state("app", "alice") == ({}, {})
+            assert (await store.archive_session("old"))["events"] == 2
+
+    asyncio.run(run())
+    assert _user_version(path) == sqlite_store.SCHEMA_VERSION
+
+
+def test_version_1_event_json_is_backfilled_into_typed_columns_and_parts(tmp_path):
+    path = str(tmp_path / "chat.db")
+    _legacy_database(path, version=1)
+
+    async def run():
+        async with SessionStore(path) as store:
+            [event] = await store.get_session_events("v1")
+            assert (event["author"], event["invocation_id"], event["event_time"]) == ("tara", "inv-1", 1_700_000_100.0)
+            parts = await store.get_event_parts("v1")
+            assert [p["kind"] for p in parts] == ["text", "function_call"]
+            [call] = await store.get_function_calls("enrich_patient_context")
+            assert call["session_id"] == "v1" and call["payload"] == {"location": "Pune"}
+
+    asyncio.run(run())
+    assert _user_version(path) == sqlite_store.SCHEMA_VERSION
+
+
+def test_failed_migration_leaves_the_previous_version(tmp_path, monkeypatch):
+    path = str(tmp_path / "chat.db")
+    _legacy_database(path, version=1)
+
+    async def broken(db):
+        await db.execute("CREATE TABLE half_done (x)")
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(sqlite_store, "MIGRATIONS", [*sqlite_store.MIGRATIONS[:2], (3, broken)])
+    with pytest.raises(RuntimeError, match="disk full"):
+        asyncio.run(SessionStore(path).open())
+    assert _user_version(path) == 2
+    db = sqlite3.connect(path)
+    assert db.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'half_done'").fetchone()[0] == 0
+    db.close()
+
+
+def test_database_from_a_newer_release_is_refused(tmp_path):
+    path = str(tmp_path / "chat.db")
+    db = sqlite3.connect(path)
+    db.execute(f"PRAGMA user_version = {sqlite_store.SCHEMA_VERSION + 1}")
+    db.close()
+    with pytest.raises(RuntimeError, match="schema version"):
+        asyncio.run(SessionStore(path).open())